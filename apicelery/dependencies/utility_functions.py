@@ -2,6 +2,7 @@ import logging
 import sys
 from logging.handlers import RotatingFileHandler
 from .config import LoggerConfig
+from .logging_utils import start_queue_logging
 
 
 def get_logger(logger_config: LoggerConfig) -> logging.Logger:
@@ -28,6 +29,9 @@ def get_logger(logger_config: LoggerConfig) -> logging.Logger:
     if not isinstance(numeric_level, int):
         raise ValueError(f"Invalid log level: {logger_config.loglevel}")
     logger.setLevel(numeric_level)
+    if logger.handlers:
+        # Already set up, the handlers are shared by every caller
+        return logger
 
     # Configure log file handler
     try:
@@ -39,11 +43,16 @@ def get_logger(logger_config: LoggerConfig) -> logging.Logger:
     except IOError as e:
         raise IOError(f"Error opening log file: {e}")
     log_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s: %(message)s"))
-    logger.addHandler(log_handler)
 
     # Configure console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
-    logger.addHandler(console_handler)
+
+    if logger_config.async_logging:
+        # Formatting and writing happen in a background thread, off the hot paths
+        start_queue_logging(logger, [log_handler, console_handler], logger_config.queue_size)
+    else:
+        logger.addHandler(log_handler)
+        logger.addHandler(console_handler)
 
     return logger
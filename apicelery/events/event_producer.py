@@ -1,10 +1,38 @@
-import time
-
-import pika
-import uuid
 import json
-
-timeout = 9000
+import os
+import threading
+from typing import Optional
+
+from dependencies.metrics import registry
+from dependencies.transport import NoConsumerError, RabbitMQTransport, RPCTimeoutError, RpcClient
+
+timeout = float(os.getenv("RPC_TIMEOUT", "9000"))
+
+RPC_CALL_SECONDS = registry.histogram(
+    "rpc_call_seconds", "Round trip time of the RPC calls, by queue", ["queue"]
+)
+RPC_CALL_ERRORS = registry.counter(
+    "rpc_call_errors", "RPC calls without a response, by queue and reason", ["queue", "reason"]
+)
+RPC_CALLS_IN_FLIGHT = registry.gauge("rpc_calls_in_flight", "RPC calls waiting for their reply")
+
+rpc_client: Optional[RpcClient] = None
+rpc_client_pid: Optional[int] = None
+rpc_client_lock = threading.Lock()
+
+
+def get_rpc_client(username, password, host, port, logger) -> RpcClient:
+    """
+    The RPC client of the process, shared by all the tasks it runs. A process forked by the worker
+    creates its own, as the connections of its parent cannot be used from it.
+    """
+    global rpc_client, rpc_client_pid
+    with rpc_client_lock:
+        if rpc_client is None or rpc_client_pid != os.getpid():
+            rpc_client = RpcClient(RabbitMQTransport(host, username, password, port=port, logger=logger))
+            rpc_client_pid = os.getpid()
+            RPC_CALLS_IN_FLIGHT.set_function(rpc_client.in_flight)
+        return rpc_client
 
 
 class NoSubscriberAvailableError(Exception):
@@ -13,60 +41,23 @@ class NoSubscriberAvailableError(Exception):
 
 
 class EventProducer(object):
-    def __init__(self, username, password, host, port, logger):
-        self.corr_id = None
-        self.response = None
+    def __init__(self, username, password, host, port, logger, rpc_client: RpcClient = None):
         self.logger = logger
-        self.credentials = pika.PlainCredentials(username, password)
-        self.connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=host, port=port, credentials=self.credentials)
-        )
-        self.channel = self.connection.channel()
-
-        result = self.channel.queue_declare(queue="", exclusive=True)
-        self.callback_queue = result.method.queue
-
-        self.channel.basic_consume(
-            queue=self.callback_queue, on_message_callback=self.on_response, auto_ack=True
-        )
+        self.rpc_client = rpc_client or get_rpc_client(username, password, host, port, logger)
         self.logger.debug(f"__init__ EventProducer")
 
-    def on_response(self, ch, method, props, body):
-        self.logger.debug(f"on_response EventProducer")
-        if self.corr_id == props.correlation_id:
-            self.response = body
-
     def call(self, queue_name, payload):
         self.logger.debug(f"call EventProducer")
-        self.response = None
-        self.corr_id = str(uuid.uuid4())
-
         try:
-            queue_state = self.channel.queue_declare(queue_name, passive=True, durable=True)
-            if queue_state.method.consumer_count == 0:
-                self.logger.debug(f"call Exception No subscriber available ")
-                raise NoSubscriberAvailableError()
-        except Exception as e:
+            with RPC_CALL_SECONDS.labels(queue_name).time():
+                return self.rpc_client.call(queue_name, payload, timeout)
+        except NoConsumerError as e:
+            RPC_CALL_ERRORS.labels(queue_name, "no_consumer").inc()
             self.logger.error(f"Error checking for subscribers: {str(e)}")
             raise NoSubscriberAvailableError()
-
-        self.channel.basic_publish(
-            exchange="",
-            routing_key=queue_name,
-            properties=pika.BasicProperties(
-                reply_to=self.callback_queue, correlation_id=self.corr_id
-            ),
-            body=payload,
-        )
-
-        start_time = time.time()
-        while self.response is None:
-            self.connection.process_data_events()
-            elapsed_time = time.time() - start_time
-            if elapsed_time > timeout:
-                self.logger.error("Timeout waiting for response")
-                response = {"error": "Timeout waiting for response"}
-                result = json.dumps(response)
-                return result
-
-        return self.response
+        except RPCTimeoutError:
+            RPC_CALL_ERRORS.labels(queue_name, "timeout").inc()
+            self.logger.error("Timeout waiting for response")
+            response = {"error": "Timeout waiting for response"}
+            result = json.dumps(response)
+            return result
@@ -1,49 +1,176 @@
 import json
-import pika
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Optional, Tuple
+
+from dependencies.metrics import registry
+from dependencies.transport import Message, RabbitMQTransport, Transport
+
+RPC_REQUEST_SECONDS = registry.histogram(
+    "rpc_request_seconds", "Time to serve one RPC request, by queue", ["queue"]
+)
+RPC_REQUEST_ERRORS = registry.counter(
+    "rpc_request_errors", "RPC requests answered with an error, by queue", ["queue"]
+)
+RPC_REQUEST_WAIT_SECONDS = registry.histogram(
+    "rpc_request_wait_seconds",
+    "Time from the delivery of an RPC request to the start of its service, by queue",
+    ["queue"],
+)
+RPC_REQUESTS_WAITING = registry.gauge(
+    "rpc_requests_waiting", "RPC requests delivered and not started yet, by queue", ["queue"]
+)
+RPC_REQUESTS_IN_PROGRESS = registry.gauge(
+    "rpc_requests_in_progress", "RPC requests being served, by queue", ["queue"]
+)
+RPC_REQUESTS_REQUEUED = registry.counter(
+    "rpc_requests_requeued",
+    "RPC requests over their concurrency limit returned to the queue, by queue",
+    ["queue"],
+)
 
 
 class EventReceiver(object):
-    def __init__(self, username, password, host, port, queue_name, service, logger):
+    """
+    Serves the RPC requests of ``queue_name`` with ``service``.
+
+    With a single worker the requests are served one at a time on the consuming thread. With
+    ``workers`` above 1 the consuming thread only dispatches them to a pool of that many threads,
+    and up to ``prefetch_count`` requests (twice the workers by default) are delivered
+    unacknowledged. A request whose function (the ``func_name`` of its body) already runs
+    ``concurrency_limits[func_name]`` times waits for one of them to finish without holding a
+    worker, so a long synchronization does not block the other requests. At most ``max_held``
+    requests (the workers by default) wait so, the next ones are returned to the queue after
+    ``requeue_delay`` seconds: the requests waiting never fill the prefetch window, which stays
+    open to the other functions. The transport hands the replies and acknowledgements of the
+    workers over to the consuming connection.
+    """
+
+    def __init__(self, username, password, host, port, queue_name, service, logger,
+                 transport: Transport = None, workers: int = 1,
+                 concurrency_limits: Optional[Dict[str, int]] = None,
+                 prefetch_count: Optional[int] = None, max_held: Optional[int] = None,
+                 requeue_delay: float = 0.5):
         self.service_worker = service
         self.queue_name = queue_name
         self.logger = logger
-
-        credentials = pika.PlainCredentials(username, password)
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=host, port=port, credentials=credentials)
+        self.transport = transport or RabbitMQTransport(
+            host, username, password, port=port, logger=logger
         )
+        self.concurrency_limits = dict(concurrency_limits or {})
+        self.executor = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rpc_worker")
+            if workers > 1 else None
+        )
+        self.lock = threading.Lock()
+        # Function name -> number of requests running, and requests held by its concurrency limit
+        self.running: Counter = Counter()
+        self.held: Dict[Optional[str], Deque[Tuple[Message, float]]] = {}
+        self.waiting = 0
+        self.max_held = workers if max_held is None else max_held
+        self.requeue_delay = requeue_delay
+        RPC_REQUESTS_WAITING.labels(queue_name).set_function(lambda: self.waiting)
+        RPC_REQUESTS_IN_PROGRESS.labels(queue_name).set_function(lambda: sum(self.running.values()))
 
-        channel = connection.channel()
-        channel.queue_declare(queue=queue_name)
+        if prefetch_count is None:
+            prefetch_count = 2 * workers if self.executor is not None else 1
+        self.transport.consume(
+            queue_name, self.on_request, prefetch_count=prefetch_count, durable=False
+        )
 
-        channel.basic_qos(prefetch_count=1)
-        channel.basic_consume(queue=queue_name, on_message_callback=self.on_request)
+        self.logger.debug(f"__init__ EventReceiver, queue_name = {queue_name}, workers = {workers}")
+        try:
+            self.transport.start_consuming()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
 
-        self.logger.debug(f"__init__ EventReceiver, queue_name = {queue_name}")
-        channel.start_consuming()
+    @staticmethod
+    def function_name(message: Message) -> Optional[str]:
+        try:
+            return json.loads(message.body).get("func_name")
+        except Exception:
+            return None
 
-    def on_request(self, ch, method, props, body):
+    def on_request(self, message: Message):
         self.logger.debug(f"on_request EventReceiver")
+        if self.executor is None:
+            self.serve(message)
+            return
+        received = time.perf_counter()
+        function = self.function_name(message) if self.concurrency_limits else None
+        with self.lock:
+            limit = self.concurrency_limits.get(function)
+            at_limit = limit is not None and self.running[function] >= limit
+            requeue = at_limit and sum(map(len, self.held.values())) >= self.max_held
+            if not requeue:
+                self.waiting += 1
+                if at_limit:
+                    self.held.setdefault(function, deque()).append((message, received))
+                    return
+                self.running[function] += 1
+        if requeue:
+            self.requeue(message)
+        else:
+            self.executor.submit(self.run, function, message, received)
+
+    def requeue(self, message: Message) -> None:
+        """
+        Publishes the request again at the end of its queue, then acknowledges it, after
+        ``requeue_delay`` seconds so that it is not redelivered at once while its function is still
+        at its limit.
+        """
+        RPC_REQUESTS_REQUEUED.labels(self.queue_name).inc()
+
+        def republish():
+            self.transport.publish(
+                self.queue_name, message.body, correlation_id=message.correlation_id,
+                reply_to=message.reply_to, headers=message.headers or None, persistent=False,
+            )
+            self.transport.ack(message)
+
+        timer = threading.Timer(self.requeue_delay, self.transport.run_threadsafe, (republish,))
+        timer.daemon = True
+        timer.start()
+
+    def run(self, function: Optional[str], message: Message, received: float) -> None:
+        """Serves a request on a worker, then starts the next request its concurrency limit held."""
+        with self.lock:
+            self.waiting -= 1
+        RPC_REQUEST_WAIT_SECONDS.labels(self.queue_name).observe(time.perf_counter() - received)
+        try:
+            self.serve(message)
+        except Exception as e:
+            self.logger.error(f"Error answering the request {message.correlation_id}: {str(e)}")
+        finally:
+            with self.lock:
+                held = self.held.get(function)
+                next_request = held.popleft() if held else None
+                if next_request is None:
+                    self.running[function] -= 1
+            if next_request is not None:
+                self.executor.submit(self.run, function, *next_request)
+
+    def serve(self, message: Message):
         service_instance = self.service_worker()
 
         response = None
         try:
-            response = service_instance.call(body)
+            with RPC_REQUEST_SECONDS.labels(self.queue_name).time():
+                response = service_instance.call(message.body)
         except Exception as e:
             self.logger.error(f"Error calling service: {str(e)}")
 
         if response is None:
+            RPC_REQUEST_ERRORS.labels(self.queue_name).inc()
             response = {
                 "error": "Receiver exception",
                 "queue": self.queue_name,
-                "correlation_id": props.correlation_id,
+                "correlation_id": message.correlation_id,
             }
 
         result = json.dumps(response)
-        ch.basic_publish(
-            exchange="",
-            routing_key=props.reply_to,
-            properties=pika.BasicProperties(correlation_id=props.correlation_id),
-            body=result,
-        )
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        self.transport.reply(message, result)
+        self.transport.ack(message)
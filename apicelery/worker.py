@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.signals import worker_init
 import os
 
 celery_app = Celery(
@@ -7,3 +8,12 @@ celery_app = Celery(
     backend="rpc://",
     include=["apicelery.tasks"],
 )
+
+
+@worker_init.connect
+def start_worker_metrics_server(**kwargs):
+    # Imported here: the backend imports this module for ``celery_app`` with its own dependencies.
+    # The metrics live in the worker process, so they cover the tasks with the solo or threads pool.
+    from dependencies.metrics import start_metrics_server
+
+    start_metrics_server()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database.db import get_async_session
+from dependencies.exceptions import DatabaseError, EntityAlreadyExists, ValidationError
+from schemas.schemas import BulkDelete
+from services.collection_services import EntityCollection, bulk_create, bulk_delete, bulk_upsert, list_page
+
+
+def etag_response(request: Request, content) -> Response:
+    """
+    The JSON response of ``content`` with its ETag, or an empty 304 response if the request
+    already holds it in If-None-Match.
+    """
+    body = json.dumps(content, separators=(",", ":"), default=str).encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+def add_collection_routes(router: APIRouter, collection: EntityCollection, create_schema) -> None:
+    """
+    Adds to ``router`` the listing and the bulk create, upsert and delete endpoints of ``collection``.
+    They must be added before the routes of a single entity, whose path would match "/bulk".
+    """
+
+    @router.get("/")
+    async def list_entities_endpoint(
+            request: Request,
+            after: Optional[int] = None,
+            limit: int = 100,
+            fields: Optional[str] = None,
+            db: AsyncSession = Depends(get_async_session),
+    ):
+        """
+        Endpoint to list the entities by pages of at most ``limit``. The next page starts after the
+        ``next_after`` of the previous one; ``fields`` is a comma separated list of the fields returned.
+        """
+        field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+        try:
+            page = await db.run_sync(lambda session: list_page(session, collection, after, limit, field_list))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except DatabaseError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        return etag_response(request, page)
+
+    @router.post("/bulk", status_code=201)
+    async def bulk_create_endpoint(
+            items: List[create_schema], db: AsyncSession = Depends(get_async_session)
+    ):
+        """
+        Endpoint to create entities in one transaction, none of them is created if one already exists.
+        """
+        rows = [item.dict() for item in items]
+        try:
+            return await db.run_sync(lambda session: bulk_create(session, collection, rows))
+        except EntityAlreadyExists as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except DatabaseError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @router.put("/bulk")
+    async def bulk_upsert_endpoint(
+            items: List[create_schema], db: AsyncSession = Depends(get_async_session)
+    ):
+        """
+        Endpoint to create or replace entities in one transaction.
+        """
+        rows = [item.dict() for item in items]
+        try:
+            return await db.run_sync(lambda session: bulk_upsert(session, collection, rows))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except DatabaseError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @router.post("/bulk/delete")
+    async def bulk_delete_endpoint(
+            request: BulkDelete, db: AsyncSession = Depends(get_async_session)
+    ):
+        """
+        Endpoint to delete entities by their ids in one transaction.
+        """
+        try:
+            return await db.run_sync(lambda session: bulk_delete(session, collection, request.ids))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except DatabaseError as e:
+            raise HTTPException(status_code=500, detail=str(e))
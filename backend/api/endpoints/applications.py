@@ -1,25 +1,31 @@
 from fastapi import APIRouter, Depends
 from fastapi import Response, status
 from fastapi.exceptions import HTTPException
-from sqlmodel import Session
-from database.db import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from api.collection_routes import add_collection_routes
+from database.db import get_async_session
 from dependencies.exceptions import EntityAlreadyExists, DatabaseError, EntityNotFound
 from schemas.schemas import ApplicationCreate, ApplicationRead, ApplicationUpdate
 from services.application_services import ApplicationService
+from services.collection_services import APPLICATIONS
 
 router = APIRouter(prefix="/applications")
 
+add_collection_routes(router, APPLICATIONS, ApplicationCreate)
+
 
 @router.post("/", response_model=ApplicationRead, status_code=201)
-def create_application_handler(
+async def create_application_handler(
     application: ApplicationCreate,
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_async_session),
 ):
     """
     Endpoint to create a new application.
     """
     try:
-        created_application = ApplicationService.create_application(db, application)
+        created_application = await db.run_sync(
+            lambda session: ApplicationService.create_application(session, application)
+        )
     except EntityAlreadyExists as e:
         raise HTTPException(status_code=400, detail=str(e))
     except DatabaseError as e:
@@ -29,12 +35,14 @@ def create_application_handler(
 
 
 @router.get("/{application_id}", response_model=ApplicationRead)
-def read_application_handler(application_id: str, db: Session = Depends(get_session)):
+async def read_application_handler(application_id: str, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to read an existing application by ID.
     """
     try:
-        application = ApplicationService.read_application(db, application_id)
+        application = await db.run_sync(
+            lambda session: ApplicationService.read_application(session, application_id)
+        )
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -44,16 +52,18 @@ def read_application_handler(application_id: str, db: Session = Depends(get_sess
 
 
 @router.put("/{application_id}", response_model=ApplicationRead)
-def update_application_handler(
+async def update_application_handler(
     application_id: str,
     application: ApplicationUpdate,
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_async_session),
 ):
     """
     Endpoint to update an existing application.
     """
     try:
-        updated_application = ApplicationService.update_application(db, application_id, application)
+        updated_application = await db.run_sync(
+            lambda session: ApplicationService.update_application(session, application_id, application)
+        )
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -63,15 +73,15 @@ def update_application_handler(
 
 
 @router.delete("/{application_id}", status_code=204)
-def delete_application_handler(
+async def delete_application_handler(
     application_id: str,
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_async_session),
 ):
     """
     Endpoint to delete an existing application.
     """
     try:
-        ApplicationService.delete_application(db, application_id)
+        await db.run_sync(lambda session: ApplicationService.delete_application(session, application_id))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -2,9 +2,10 @@ from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import Response, status
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database.db import get_session
+from api.collection_routes import add_collection_routes
+from database.db import get_async_session
 from schemas.schemas import ClusterCreate
 from schemas.schemas import ClusterRead
 from schemas.schemas import ClusterUpdate
@@ -14,12 +15,15 @@ from services.cluster_services import (
     EntityNotFound,
     EntityAlreadyExists,
 )
+from services.collection_services import CLUSTERS
 
 router = APIRouter(prefix="/clusters")
 
+add_collection_routes(router, CLUSTERS, ClusterCreate)
+
 
 @router.post("/", response_model=ClusterRead, status_code=status.HTTP_201_CREATED)
-def create_cluster(cluster: ClusterCreate, db: Session = Depends(get_session)):
+async def create_cluster(cluster: ClusterCreate, db: AsyncSession = Depends(get_async_session)):
     """
     Create a new cluster.
 
@@ -28,7 +32,7 @@ def create_cluster(cluster: ClusterCreate, db: Session = Depends(get_session)):
     :return: ClusterRead schema or HTTPException
     """
     try:
-        created_cluster = cluster_services.create_cluster(db, cluster)
+        created_cluster = await db.run_sync(lambda session: cluster_services.create_cluster(session, cluster))
         return created_cluster
     except EntityAlreadyExists as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -37,7 +41,7 @@ def create_cluster(cluster: ClusterCreate, db: Session = Depends(get_session)):
 
 
 @router.get("/{cluster_id}", response_model=ClusterRead)
-def read_cluster(cluster_id: str, db: Session = Depends(get_session)):
+async def read_cluster(cluster_id: str, db: AsyncSession = Depends(get_async_session)):
     """
     Retrieve a specific cluster by ID.
 
@@ -46,7 +50,7 @@ def read_cluster(cluster_id: str, db: Session = Depends(get_session)):
     :return: ClusterRead schema or HTTPException
     """
     try:
-        cluster = cluster_services.read_cluster(cluster_id, db)
+        cluster = await db.run_sync(lambda session: cluster_services.read_cluster(cluster_id, session))
         return cluster
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -55,7 +59,7 @@ def read_cluster(cluster_id: str, db: Session = Depends(get_session)):
 
 
 @router.patch("/{cluster_id}", response_model=ClusterRead)
-def update_cluster(cluster_id: str, cluster: ClusterUpdate, db: Session = Depends(get_session)):
+async def update_cluster(cluster_id: str, cluster: ClusterUpdate, db: AsyncSession = Depends(get_async_session)):
     """
     Update an existing cluster by ID.
 
@@ -66,7 +70,9 @@ def update_cluster(cluster_id: str, cluster: ClusterUpdate, db: Session = Depend
     """
 
     try:
-        updated_cluster = cluster_services.update_cluster(db, cluster_id, cluster)
+        updated_cluster = await db.run_sync(
+            lambda session: cluster_services.update_cluster(session, cluster_id, cluster)
+        )
         return updated_cluster
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -75,7 +81,7 @@ def update_cluster(cluster_id: str, cluster: ClusterUpdate, db: Session = Depend
 
 
 @router.delete("/{cluster_id}", status_code=204)
-def delete_cluster(cluster_id: str, db: Session = Depends(get_session)):
+async def delete_cluster(cluster_id: str, db: AsyncSession = Depends(get_async_session)):
     """
     Delete an existing cluster by ID.
 
@@ -84,7 +90,7 @@ def delete_cluster(cluster_id: str, db: Session = Depends(get_session)):
     :return: Status message or HTTPException
     """
     try:
-        cluster_services.delete_cluster(cluster_id, db)
+        await db.run_sync(lambda session: cluster_services.delete_cluster(cluster_id, session))
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import Session
 
 from database.db import get_session
@@ -12,7 +13,7 @@ router = APIRouter(prefix="/cmt_connector")
 
 @router.get("/update_data_architecture_from_cmt/", response_model=ResponseInfo)
 async def update_data_architecture_from_cmt(
-    x_authorization_cmt: str, x_authorization_tb: str, db: Session = Depends(get_session)
+    x_authorization_cmt: str, x_authorization_tb: str, incremental: bool = False, db: Session = Depends(get_session)
 ):
     """
     This route updates data architecture from CMT to TB.
@@ -21,12 +22,18 @@ async def update_data_architecture_from_cmt(
         db: the database session
         x_authorization_cmt: the CMT authorization token
         x_authorization_tb: the TB authorization token
+        incremental: also apply the changes of the clusters already synchronized
     Returns:
         A CmtConnectorInfo object with a 'TASK_COMPLETED' description
     """
     try:
-        cmt_connector_services.update_data_architecture_from_cmt(
-            db, cmt_auth=x_authorization_cmt, tb_auth=x_authorization_tb
+        # The synchronization blocks on the API calls and the database, keep it off the event loop
+        await run_in_threadpool(
+            cmt_connector_services.update_data_architecture_from_cmt,
+            db,
+            cmt_auth=x_authorization_cmt,
+            tb_auth=x_authorization_tb,
+            incremental=incremental,
         )
         return ResponseInfo(description="TASK_COMPLETED")
     except Exception as e:
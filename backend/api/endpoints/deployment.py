@@ -1,23 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from api.collection_routes import add_collection_routes
 from dependencies.exceptions import EntityNotFound, EntityAlreadyExists, DatabaseError
-from database.db import get_session
+from database.db import get_async_session
 from schemas.schemas import DeploymentCreate, DeploymentRead, DeploymentUpdate
 from services import deployment_services
+from services.collection_services import DEPLOYMENTS
 
 router = APIRouter(prefix="/deployments")
 
+add_collection_routes(router, DEPLOYMENTS, DeploymentCreate)
+
 
 @router.post("/", response_model=DeploymentRead, status_code=201)
-def create_deployment_endpoint(
-        deployment: DeploymentCreate, db: Session = Depends(get_session)
+async def create_deployment_endpoint(
+        deployment: DeploymentCreate, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to create a new deployment.
     """
     try:
-        created_deployment = deployment_services.create_deployment(db, deployment)
+        created_deployment = await db.run_sync(
+            lambda session: deployment_services.create_deployment(session, deployment)
+        )
     except EntityAlreadyExists as e:
         raise HTTPException(status_code=409, detail=str(e))
     except DatabaseError as e:
@@ -27,14 +33,16 @@ def create_deployment_endpoint(
 
 
 @router.get("/{deployment_id}", response_model=DeploymentRead)
-def read_deployment_endpoint(
-        deployment_id: str, db: Session = Depends(get_session)
+async def read_deployment_endpoint(
+        deployment_id: str, db: AsyncSession = Depends(get_async_session)
 ) -> DeploymentRead:
     """
     Endpoint to read an existing deployment.
     """
     try:
-        deployment = deployment_services.read_deployment(deployment_id, db)
+        deployment = await db.run_sync(
+            lambda session: deployment_services.read_deployment(deployment_id, session)
+        )
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -44,14 +52,16 @@ def read_deployment_endpoint(
 
 
 @router.patch("/{deployment_id}", response_model=DeploymentRead)
-def update_deployment_endpoint(
-        deployment_id: str, deployment: DeploymentUpdate, db: Session = Depends(get_session)
+async def update_deployment_endpoint(
+        deployment_id: str, deployment: DeploymentUpdate, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to update an existing deployment.
     """
     try:
-        updated_deployment = deployment_services.update_deployment(deployment_id, deployment, db)
+        updated_deployment = await db.run_sync(
+            lambda session: deployment_services.update_deployment(deployment_id, deployment, session)
+        )
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -61,14 +71,14 @@ def update_deployment_endpoint(
 
 
 @router.delete("/{deployment_id}", status_code=204)
-def delete_deployment_endpoint(
-        deployment_id: str, db: Session = Depends(get_session)
+async def delete_deployment_endpoint(
+        deployment_id: str, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to delete an existing deployment.
     """
     try:
-        deployment_services.delete_deployment(deployment_id, db)
+        await db.run_sync(lambda session: deployment_services.delete_deployment(deployment_id, session))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -1,23 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database.db import get_session
+from api.collection_routes import add_collection_routes
+from database.db import get_async_session
 from dependencies.exceptions import EntityNotFound, EntityAlreadyExists, DatabaseError
 from schemas.schemas import GatewayCreate, GatewayRead, GatewayUpdate
 from services.gateway_services import create_gateway, delete_gateway, update_gateway, read_gateway
+from services.collection_services import GATEWAYS
 
 router = APIRouter(prefix="/gateways")
 
+add_collection_routes(router, GATEWAYS, GatewayCreate)
+
 
 @router.post("/", response_model=GatewayRead, status_code=201)
-def create_gateway_endpoint(
-        gateway: GatewayCreate, db: Session = Depends(get_session)
+async def create_gateway_endpoint(
+        gateway: GatewayCreate, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to create a new gateway.
     """
     try:
-        created_gateway = create_gateway(db, gateway)
+        created_gateway = await db.run_sync(lambda session: create_gateway(session, gateway))
     except EntityAlreadyExists as e:
         raise HTTPException(status_code=409, detail=str(e))
     except DatabaseError as e:
@@ -27,14 +31,14 @@ def create_gateway_endpoint(
 
 
 @router.get("/{gateway_id}", response_model=GatewayRead)
-def read_gateway_endpoint(
-        gateway_id: str, db: Session = Depends(get_session)
+async def read_gateway_endpoint(
+        gateway_id: str, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to read an existing gateway.
     """
     try:
-        gateway = read_gateway(gateway_id, db)
+        gateway = await db.run_sync(lambda session: read_gateway(gateway_id, session))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -44,14 +48,14 @@ def read_gateway_endpoint(
 
 
 @router.patch("/{gateway_id}", response_model=GatewayRead)
-def update_gateway_endpoint(
-        gateway_id: str, gateway: GatewayUpdate, db: Session = Depends(get_session)
+async def update_gateway_endpoint(
+        gateway_id: str, gateway: GatewayUpdate, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to update an existing gateway.
     """
     try:
-        updated_gateway = update_gateway(gateway_id, gateway, db)
+        updated_gateway = await db.run_sync(lambda session: update_gateway(gateway_id, gateway, session))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -61,14 +65,14 @@ def update_gateway_endpoint(
 
 
 @router.delete("/{gateway_id}")
-def delete_gateway_endpoint(
-        gateway_id: str, db: Session = Depends(get_session)
+async def delete_gateway_endpoint(
+        gateway_id: str, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to delete an existing gateway.
     """
     try:
-        delete_gateway(gateway_id, db)
+        await db.run_sync(lambda session: delete_gateway(gateway_id, session))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -3,9 +3,9 @@ from typing import List
 from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException, status
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database.db import get_session
+from database.db import get_async_session
 from dependencies.exceptions import EntityNotFound, DatabaseError, QueueSendError
 from schemas.help_schemas import MonitoringTaskResult
 from services import kpi_monitoring_services
@@ -14,12 +14,12 @@ router = APIRouter(prefix="/monitoring")
 
 
 @router.patch("/gateway/start/{gw_id}", response_model=MonitoringTaskResult)
-def start_monitor_gateway(*, gw_id: str, db: Session = Depends(get_session)):
+async def start_monitor_gateway(*, gw_id: str, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to start monitoring a gateway.
     """
     try:
-        return kpi_monitoring_services.start_monitor_gateway(gw_id, db)
+        return await kpi_monitoring_services.start_monitor_gateway(gw_id, db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to start monitoring gateway: {str(e)}")
@@ -35,12 +35,12 @@ def start_monitor_gateway(*, gw_id: str, db: Session = Depends(get_session)):
 
 
 @router.patch("/gateway/stop/{gw_id}", response_model=MonitoringTaskResult)
-def stop_monitor_gateway(*, gw_id: str, db: Session = Depends(get_session)):
+async def stop_monitor_gateway(*, gw_id: str, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to stop_ monitoring a gateway.
     """
     try:
-        return kpi_monitoring_services.stop_monitor_gateway(gw_id, db)
+        return await kpi_monitoring_services.stop_monitor_gateway(gw_id, db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to stop monitoring gateway: {str(e)}")
@@ -56,12 +56,12 @@ def stop_monitor_gateway(*, gw_id: str, db: Session = Depends(get_session)):
 
 
 @router.patch("/gateway/start_all/", response_model=MonitoringTaskResult)
-def start_all_gateway(*, db: Session = Depends(get_session)):
+async def start_all_gateway(*, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to start_all_gateway
     """
     try:
-        return kpi_monitoring_services.start_monitor_all_gateway(db)
+        return await kpi_monitoring_services.start_monitor_all_gateway(db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to start_all_gateway: {str(e)}")
@@ -77,12 +77,12 @@ def start_all_gateway(*, db: Session = Depends(get_session)):
 
 
 @router.patch("/gateway/stop_all/", response_model=MonitoringTaskResult)
-def stop_all_gateway(*, db: Session = Depends(get_session)):
+async def stop_all_gateway(*, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to stop_all_gateway
     """
     try:
-        return kpi_monitoring_services.stop_monitor_all_gateway(db)
+        return await kpi_monitoring_services.stop_monitor_all_gateway(db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to stop_all_gateway: {str(e)}")
@@ -98,12 +98,12 @@ def stop_all_gateway(*, db: Session = Depends(get_session)):
 
 
 @router.patch("/network/start/{network_id}", response_model=MonitoringTaskResult)
-def start_monitor_network(*, network_id: str, db: Session = Depends(get_session)):
+async def start_monitor_network(*, network_id: str, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to start_monitor_network
     """
     try:
-        return kpi_monitoring_services.start_monitor_network(network_id, db)
+        return await kpi_monitoring_services.start_monitor_network(network_id, db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to start_monitor_network: {str(e)}")
@@ -119,12 +119,12 @@ def start_monitor_network(*, network_id: str, db: Session = Depends(get_session)
 
 
 @router.patch("/network/stop/{network_id}", response_model=MonitoringTaskResult)
-def stop_monitor_network(*, network_id: str, db: Session = Depends(get_session)):
+async def stop_monitor_network(*, network_id: str, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to stop_monitor_network
     """
     try:
-        return kpi_monitoring_services.stop_monitor_network(network_id, db)
+        return await kpi_monitoring_services.stop_monitor_network(network_id, db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to stop_monitor_network: {str(e)}")
@@ -140,12 +140,12 @@ def stop_monitor_network(*, network_id: str, db: Session = Depends(get_session))
 
 
 @router.patch("/application/start/{application_id}", response_model=MonitoringTaskResult)
-def start_monitor_application(*, application_id: str, db: Session = Depends(get_session)):
+async def start_monitor_application(*, application_id: str, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to start_monitor_application
     """
     try:
-        return kpi_monitoring_services.start_monitor_application(application_id, db)
+        return await kpi_monitoring_services.start_monitor_application(application_id, db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to start_monitor_application: {str(e)}")
@@ -161,12 +161,12 @@ def start_monitor_application(*, application_id: str, db: Session = Depends(get_
 
 
 @router.patch("/application/stop/{application_id}", response_model=MonitoringTaskResult)
-def stop_monitor_application(*, application_id: str, db: Session = Depends(get_session)):
+async def stop_monitor_application(*, application_id: str, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to stop_monitor_application
     """
     try:
-        return kpi_monitoring_services.stop_monitor_application(application_id, db)
+        return await kpi_monitoring_services.stop_monitor_application(application_id, db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to stop_monitor_application: {str(e)}")
@@ -182,14 +182,14 @@ def stop_monitor_application(*, application_id: str, db: Session = Depends(get_s
 
 
 @router.patch("/application/start_gateways/{application_id}", response_model=MonitoringTaskResult)
-def start_monitor_gateways_of_application(
-        *, application_id: str, db: Session = Depends(get_session)
+async def start_monitor_gateways_of_application(
+        *, application_id: str, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to start_monitor_gateways_of_application
     """
     try:
-        return kpi_monitoring_services.start_monitor_gateways_of_application(application_id, db)
+        return await kpi_monitoring_services.start_monitor_gateways_of_application(application_id, db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to start_monitor_gateways_of_application: {str(e)}")
@@ -205,14 +205,14 @@ def start_monitor_gateways_of_application(
 
 
 @router.patch("/application/stop_gateways/{application_id}", response_model=MonitoringTaskResult)
-def stop_monitor_gateways_of_application(
-        *, application_id: str, db: Session = Depends(get_session)
+async def stop_monitor_gateways_of_application(
+        *, application_id: str, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to stop_monitor_gateways_of_application
     """
     try:
-        return kpi_monitoring_services.stop_monitor_gateways_of_application(application_id, db)
+        return await kpi_monitoring_services.stop_monitor_gateways_of_application(application_id, db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to stop_monitor_gateways_of_application: {str(e)}")
@@ -228,12 +228,12 @@ def stop_monitor_gateways_of_application(
 
 
 @router.patch("/application/start_all/", response_model=MonitoringTaskResult)
-def start_monitor_all_application(*, db: Session = Depends(get_session)):
+async def start_monitor_all_application(*, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to start_monitor_all_application
     """
     try:
-        return kpi_monitoring_services.start_monitor_all_application(db)
+        return await kpi_monitoring_services.start_monitor_all_application(db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to start_monitor_all_application: {str(e)}")
@@ -249,12 +249,12 @@ def start_monitor_all_application(*, db: Session = Depends(get_session)):
 
 
 @router.patch("/application/stop_all/", response_model=MonitoringTaskResult)
-def stop_monitor_all_application(*, db: Session = Depends(get_session)):
+async def stop_monitor_all_application(*, db: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to stop_monitor_all_application
     """
     try:
-        return kpi_monitoring_services.stop_monitor_all_application(db)
+        return await kpi_monitoring_services.stop_monitor_all_application(db)
     except DatabaseError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to stop_monitor_all_application: {str(e)}")
@@ -272,14 +272,14 @@ def stop_monitor_all_application(*, db: Session = Depends(get_session)):
 @router.patch(
     "/application/start_gateways_of_all_applications/", response_model=MonitoringTaskResult
 )
-def start_monitor_gateways_of_all_applications(
-        *, application_ids: List[str], db: Session = Depends(get_session)
+async def start_monitor_gateways_of_all_applications(
+        *, application_ids: List[str], db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to start_monitor_gateways_of_all_applications
     """
     try:
-        return kpi_monitoring_services.start_monitor_gateways_of_all_applications(
+        return await kpi_monitoring_services.start_monitor_gateways_of_all_applications(
             application_ids, db
         )
     except DatabaseError as e:
@@ -299,14 +299,14 @@ def start_monitor_gateways_of_all_applications(
 @router.patch(
     "/application/stop_gateways_of_all_applications/", response_model=MonitoringTaskResult
 )
-def stop_monitor_gateways_of_all_applications(
-        *, application_ids: List[str], db: Session = Depends(get_session)
+async def stop_monitor_gateways_of_all_applications(
+        *, application_ids: List[str], db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to stop_monitor_gateways_of_all_applications
     """
     try:
-        return kpi_monitoring_services.stop_monitor_gateways_of_all_applications(
+        return await kpi_monitoring_services.stop_monitor_gateways_of_all_applications(
             application_ids, db
         )
     except DatabaseError as e:
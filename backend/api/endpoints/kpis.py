@@ -0,0 +1,66 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database.db import get_async_session
+from dependencies.exceptions import DatabaseError, EntityNotFound, ValidationError
+from services.kpi_services import DEFAULT_QUANTILES, get_distinct_devices, get_quantiles
+
+router = APIRouter(prefix="/kpis")
+
+
+@router.get("/quantiles/{metric}")
+async def read_quantiles_endpoint(
+        metric: str,
+        start_time: datetime,
+        end_time: datetime,
+        q: List[float] = Query(DEFAULT_QUANTILES),
+        entity_type: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        device_id: Optional[List[str]] = Query(None),
+        db: AsyncSession = Depends(get_async_session),
+):
+    """
+    Endpoint to read the approximate percentiles of the SNR, RSSI or latency of the uplinks over a
+    range, e.g. /kpis/quantiles/snr?start_time=...&end_time=...&q=0.05&entity_type=network&entity_id=<id>.
+    """
+    if (entity_type is None) != (entity_id is None):
+        raise HTTPException(status_code=422, detail="entity_type and entity_id go together")
+    try:
+        return await db.run_sync(lambda session: get_quantiles(
+            session, metric, start_time, end_time, q, entity_type, entity_id, device_id
+        ))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except EntityNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/distinct-devices")
+async def read_distinct_devices_endpoint(
+        start_time: datetime,
+        end_time: datetime,
+        entity_type: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_session),
+):
+    """
+    Endpoint to read the approximate number of distinct end devices heard over a range, e.g.
+    /kpis/distinct-devices?start_time=...&end_time=...&entity_type=network&entity_id=<id>.
+    """
+    if (entity_type is None) != (entity_id is None):
+        raise HTTPException(status_code=422, detail="entity_type and entity_id go together")
+    try:
+        return await db.run_sync(lambda session: get_distinct_devices(
+            session, start_time, end_time, entity_type, entity_id
+        ))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except EntityNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi import Response
+
+from dependencies.cache import caches
+from dependencies.metrics import CONTENT_TYPE
+from dependencies.metrics import registry
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
+@router.get("/metrics/caches", include_in_schema=False)
+def cache_stats():
+    """The hits, misses, coalesced calls, size and hit rate of the caches of the upstream APIs."""
+    return {cache.name: cache.stats() for cache in caches}
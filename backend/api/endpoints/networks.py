@@ -2,25 +2,29 @@ from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import Response, status
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database.db import get_session
+from api.collection_routes import add_collection_routes
+from database.db import get_async_session
 from dependencies.exceptions import EntityAlreadyExists, DatabaseError, EntityNotFound
 from schemas.schemas import NetworkCreate
 from schemas.schemas import NetworkRead
 from schemas.schemas import NetworkUpdate
 from services.network_services import create_network, read_network, update_network, delete_network
+from services.collection_services import NETWORKS
 
 router = APIRouter(prefix="/networks")
 
+add_collection_routes(router, NETWORKS, NetworkCreate)
+
 
 @router.post("/", response_model=NetworkRead, status_code=201)
-def create_network_endpoint(*, db: Session = Depends(get_session), network: NetworkCreate):
+async def create_network_endpoint(*, db: AsyncSession = Depends(get_async_session), network: NetworkCreate):
     """
     Endpoint to create a new network.
     """
     try:
-        created_network = create_network(db, network)
+        created_network = await db.run_sync(lambda session: create_network(session, network))
     except EntityAlreadyExists as e:
         raise HTTPException(status_code=409, detail=str(e))
     except DatabaseError as e:
@@ -30,12 +34,12 @@ def create_network_endpoint(*, db: Session = Depends(get_session), network: Netw
 
 
 @router.get("/{network_id}", response_model=NetworkRead)
-def read_network_endpoint(*, db: Session = Depends(get_session), network_id: str):
+async def read_network_endpoint(*, db: AsyncSession = Depends(get_async_session), network_id: str):
     """
     Endpoint to read an existing network.
     """
     try:
-        network = read_network(network_id, db)
+        network = await db.run_sync(lambda session: read_network(network_id, session))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -45,12 +49,12 @@ def read_network_endpoint(*, db: Session = Depends(get_session), network_id: str
 
 
 @router.patch("/{network_id}", response_model=NetworkRead)
-def update_network_endpoint(*, db: Session = Depends(get_session), network_id: str, network: NetworkUpdate):
+async def update_network_endpoint(*, db: AsyncSession = Depends(get_async_session), network_id: str, network: NetworkUpdate):
     """
     Endpoint to update an existing network.
     """
     try:
-        updated_network = update_network(network_id, network, db)
+        updated_network = await db.run_sync(lambda session: update_network(network_id, network, session))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -59,12 +63,12 @@ def update_network_endpoint(*, db: Session = Depends(get_session), network_id: s
 
 
 @router.delete("/{network_id}", status_code=204)
-def delete_network_endpoint(*, db: Session = Depends(get_session), network_id: str):
+async def delete_network_endpoint(*, db: AsyncSession = Depends(get_async_session), network_id: str):
     """
     Endpoint to delete an existing network.
     """
     try:
-        delete_network(network_id, db)
+        await db.run_sync(lambda session: delete_network(network_id, session))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -1,23 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from api.collection_routes import add_collection_routes
 from backend.dependencies.exceptions import EntityNotFound, EntityAlreadyExists, DatabaseError
-from database.db import get_session
+from database.db import get_async_session
 from schemas.schemas import NodeCreate, NodeRead, NodeUpdate
 from services.node_services import delete_node, update_node, read_node, create_node
+from services.collection_services import NODES
 
 router = APIRouter(prefix="/nodes")
 
+add_collection_routes(router, NODES, NodeCreate)
+
 
 @router.post("/", response_model=NodeRead, status_code=201)
-def create_node_endpoint(
-        node: NodeCreate, db: Session = Depends(get_session)
+async def create_node_endpoint(
+        node: NodeCreate, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to create a new node.
     """
     try:
-        created_node = create_node(db, node)
+        created_node = await db.run_sync(lambda session: create_node(session, node))
     except EntityAlreadyExists as e:
         raise HTTPException(status_code=409, detail=str(e))
     except DatabaseError as e:
@@ -27,14 +31,14 @@ def create_node_endpoint(
 
 
 @router.get("/{node_id}", response_model=NodeRead)
-def read_node_endpoint(
-        node_id: str, db: Session = Depends(get_session)
+async def read_node_endpoint(
+        node_id: str, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to read an existing node.
     """
     try:
-        node = read_node(node_id, db)
+        node = await db.run_sync(lambda session: read_node(node_id, session))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -44,14 +48,14 @@ def read_node_endpoint(
 
 
 @router.patch("/{node_id}", response_model=NodeRead)
-def update_node_endpoint(
-        node_id: str, node: NodeUpdate, db: Session = Depends(get_session)
+async def update_node_endpoint(
+        node_id: str, node: NodeUpdate, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to update an existing node.
     """
     try:
-        updated_node = update_node(node_id, node, db)
+        updated_node = await db.run_sync(lambda session: update_node(node_id, node, session))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -61,14 +65,14 @@ def update_node_endpoint(
 
 
 @router.delete("/{node_id}", status_code=204)
-def delete_node_endpoint(
-        node_id: str, db: Session = Depends(get_session)
+async def delete_node_endpoint(
+        node_id: str, db: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint to delete an existing node.
     """
     try:
-        delete_node(node_id, db)
+        await db.run_sync(lambda session: delete_node(node_id, session))
     except EntityNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except DatabaseError as e:
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database.db import get_async_session
+from dependencies.exceptions import DatabaseError, EntityNotFound, ValidationError
+from schemas.schemas import ResolveIds
+from services.topology_services import get_hierarchy, resolve_ids
+
+router = APIRouter(prefix="/topology")
+
+
+@router.post("/resolve")
+async def resolve_ids_endpoint(request: ResolveIds, db: AsyncSession = Depends(get_async_session)):
+    """
+    Endpoint to resolve ids of any type (network id, gateway TTI or TB id, node EUI or dev_addr, ...)
+    to their entities and the ancestors of these entities.
+    """
+    try:
+        return await db.run_sync(lambda session: resolve_ids(session, request.ids))
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{entity_type}/{entity_id}")
+async def read_hierarchy_endpoint(entity_type: str, entity_id: str, db: AsyncSession = Depends(get_async_session)):
+    """
+    Endpoint to read an entity with its ancestors and descendants, e.g. /topology/cluster/<cluster_id>.
+    """
+    try:
+        return await db.run_sync(lambda session: get_hierarchy(session, entity_type, entity_id))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except EntityNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,3 +1,4 @@
+import json
 import os
 
 from celery.result import AsyncResult
@@ -20,17 +21,19 @@ router = APIRouter(prefix="/tti_connection")
 
 
 @router.get("/all-registered-tti-gateways/", response_model=ResponseInfo)
-async def all_registered_tti_gateways(db: Session = Depends(get_session)):
+async def all_registered_tti_gateways(incremental: bool = False, db: Session = Depends(get_session)):
     try:
-        return ResponseInfo(description=tti_connection_services.get_all_registered_tti_gateways(db))
+        return ResponseInfo(description=tti_connection_services.get_all_registered_tti_gateways(db, incremental))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/all-registered-tti-application/", response_model=ResponseInfo)
-async def all_registered_tti_application(db: Session = Depends(get_session)):
+async def all_registered_tti_application(incremental: bool = False, db: Session = Depends(get_session)):
     try:
-        return ResponseInfo(description=tti_connection_services.get_all_registered_tti_application(db))
+        return ResponseInfo(
+            description=tti_connection_services.get_all_registered_tti_application(db, incremental)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -46,11 +49,12 @@ async def get_registered_tti_application(
 
 
 @router.get("/all-registered-tti-gateways-celery/", response_model=WorkflowTask)
-async def all_registered_tti_gateways():
+async def all_registered_tti_gateways(incremental: bool = False):
     try:
         workflow_task_data = WorkflowTaskDataMonitoring()
         workflow_task_data.task_type = TaskTypeCelery.Monitoring
         workflow_task_data.func_name = "get_all_registered_tti_gateways"
+        workflow_task_data.payload = json.dumps({"incremental": incremental})
         queue_name = os.getenv("ASYNCQUEUE_NAME", "async_queue")
         result = celery_app.send_task(
             "process_workflow", args=[workflow_task_data.json(), queue_name]
@@ -64,11 +68,12 @@ async def all_registered_tti_gateways():
 
 
 @router.get("/registered-all-tti-application-celery/", response_model=WorkflowTask)
-async def all_registered_tti_application():
+async def all_registered_tti_application(incremental: bool = False):
     try:
         workflow_task_data = WorkflowTaskDataMonitoring()
         workflow_task_data.task_type = TaskTypeCelery.Monitoring
         workflow_task_data.func_name = "get_all_registered_tti_application"
+        workflow_task_data.payload = json.dumps({"incremental": incremental})
         queue_name = os.getenv("ASYNCQUEUE_NAME", "async_queue")
         result = celery_app.send_task(
             "process_workflow", args=[workflow_task_data.json(), queue_name]
@@ -1,14 +1,70 @@
+import logging
 import os
+from typing import AsyncIterator
 
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import SQLModel
 from sqlmodel import Session
 from sqlmodel import create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from models import models
+from dependencies.config import database_config, logger_config
+from dependencies.logging_utils import log_slow_queries
 
 POSTGRES_URL = os.getenv("POSTGRES_URL")
+
+# Async drivers of the databases the backend runs on
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def get_async_database_url(database_url: str) -> str:
+    """
+    Return the URL of ``database_url`` with the async driver of its database, e.g.
+    ``postgresql://`` -> ``postgresql+asyncpg://``.
+    """
+    url = make_url(database_url)
+    return str(url.set(drivername=f"{url.get_backend_name()}+{ASYNC_DRIVERS[url.get_backend_name()]}"))
+
+
+def get_pool_options(database_url: str, is_async: bool = False) -> dict:
+    """
+    Return the connection pool settings of the engines. SQLite keeps the pool of its dialect,
+    except for the async engine on a database file: SQLite allows a single writer and the async
+    endpoints are not bounded by the threadpool, so their requests queue for one connection
+    instead of failing with "database is locked".
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        if is_async and url.database not in (None, "", ":memory:"):
+            return {
+                "poolclass": AsyncAdaptedQueuePool,
+                "pool_size": 1,
+                "max_overflow": 0,
+                "pool_timeout": database_config.pool_timeout,
+            }
+        return {}
+    return {
+        "pool_size": database_config.pool_size,
+        "max_overflow": database_config.max_overflow,
+        "pool_timeout": database_config.pool_timeout,
+        "pool_recycle": database_config.pool_recycle,
+        "pool_pre_ping": True,
+    }
+
+
 # Create a new engine with the given database URL
-db_engine = create_engine(POSTGRES_URL, echo=True)
+db_engine = create_engine(POSTGRES_URL, echo=database_config.sql_echo, **get_pool_options(POSTGRES_URL))
+# Engine of the async endpoints, on the same database
+async_db_engine = create_async_engine(
+    get_async_database_url(POSTGRES_URL), echo=database_config.sql_echo, **get_pool_options(POSTGRES_URL, is_async=True)
+)
+# Log the statements slower than SLOW_QUERY_MS instead of echoing every statement
+sql_logger = logging.getLogger(f"{logger_config.logger_name}.sql")
+log_slow_queries(db_engine, sql_logger, database_config.slow_query_ms)
+log_slow_queries(async_db_engine.sync_engine, sql_logger, database_config.slow_query_ms)
 
 
 def create_db_and_tables(engine) -> None:
@@ -17,6 +73,14 @@ def create_db_and_tables(engine) -> None:
     """
     # Create all tables defined in the SQLModel metadata
     SQLModel.metadata.create_all(engine)
+    # create_all only creates the indexes of the tables it creates, add the ones declared since
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(engine, checkfirst=True)
+            except Exception as e:
+                # e.g. duplicated keys in an existing table, the upserts on that key fail until they are removed
+                logging.getLogger(logger_config.logger_name).error(f"Error creating the index {index.name}: {str(e)}")
 
 
 def drop_db_and_tables(engine) -> None:
@@ -34,3 +98,14 @@ def get_session() -> Session:
     # Open a new database session with the engine and yield it to the caller
     with Session(db_engine) as session:
         yield session
+
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """
+    Return a new async database session, for the endpoints running on the event loop.
+
+    The services work on a ``Session``; the endpoints run them with ``await db.run_sync(...)``,
+    which executes them on the async connection without blocking the event loop.
+    """
+    async with AsyncSession(async_db_engine, expire_on_commit=False) as session:
+        yield session
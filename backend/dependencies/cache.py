@@ -0,0 +1,147 @@
+"""
+Caches of the results of the calls to the upstream APIs (CMT, ThingsBoard, TTI).
+
+Every cached function has its own time to live and is bounded to ``max_size`` entries, the least
+recently used ones being evicted first. Concurrent calls with the same arguments are coalesced:
+the first one calls the API and the others wait for its result (single flight), so a synchronization
+running on many threads sends one request per key. Errors are not cached.
+
+The hits, misses and coalesced calls of each cache are counted in ``upstream_cache_requests_total``
+and its size is exposed in ``upstream_cache_entries``; ``stats()`` gives the hit rate of a cache.
+"""
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from dependencies.config import cache_config
+from dependencies.metrics import MetricsRegistry, registry
+
+HIT = "hit"
+MISS = "miss"
+COALESCED = "coalesced"
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl: float, max_size: int = cache_config.max_size,
+                 metrics_registry: MetricsRegistry = registry, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        # Key -> (expiry time, value), from the least to the most recently used
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.in_flight: Dict[Hashable, Future] = {}
+        # Incremented by every invalidation, a load started before one is not stored
+        self.generation = 0
+        self.counts = {HIT: 0, MISS: 0, COALESCED: 0}
+        self.lock = threading.Lock()
+        self.requests = metrics_registry.counter(
+            "upstream_cache_requests", "Calls to the cached upstream APIs by cache and result",
+            ["cache", "result"],
+        )
+        metrics_registry.gauge(
+            "upstream_cache_entries", "Entries held by the caches of the upstream APIs", ["cache"]
+        ).labels(name).set_function(lambda: len(self.entries))
+
+    def count(self, result: str) -> None:
+        self.counts[result] += 1
+        self.requests.labels(self.name, result).inc()
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        """The cached value of ``key``, or the result of ``load``, called once for concurrent calls."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > self.clock():
+                    self.entries.move_to_end(key)
+                    self.count(HIT)
+                    return entry[1]
+                del self.entries[key]
+            future = self.in_flight.get(key)
+            loading = future is None
+            if loading:
+                future = self.in_flight[key] = Future()
+                generation = self.generation
+                self.count(MISS)
+            else:
+                self.count(COALESCED)
+        if not loading:
+            return future.result()
+        try:
+            value = load()
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.in_flight[key]
+            if generation == self.generation:
+                self.entries[key] = (self.clock() + self.ttl, value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+            self.generation += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            calls = sum(self.counts.values())
+            return dict(
+                self.counts,
+                entries=len(self.entries),
+                hit_rate=(self.counts[HIT] + self.counts[COALESCED]) / calls if calls else 0.0,
+            )
+
+
+caches: List[TTLCache] = []
+
+
+def cached(name: str, ttl: float, max_size: Optional[int] = None):
+    """
+    Decorator caching the results of a function by its arguments in a ``TTLCache``. The wrapper has
+    ``invalidate(*args, **kwargs)`` to drop the result of some arguments and ``cache_clear()`` to drop
+    them all. Calls go straight to the function while ``UPSTREAM_CACHE_ENABLED`` is false.
+    """
+
+    def decorator(func):
+        cache = TTLCache(name, ttl, max_size if max_size is not None else cache_config.max_size)
+        caches.append(cache)
+        signature = inspect.signature(func)
+
+        def cache_key(args: tuple, kwargs: dict) -> Hashable:
+            # The same arguments passed by position or by name share their entry
+            return tuple(signature.bind(*args, **kwargs).arguments.items())
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not cache_config.enabled:
+                return func(*args, **kwargs)
+            return cache.get_or_load(cache_key(args, kwargs), lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        wrapper.invalidate = lambda *args, **kwargs: cache.invalidate(cache_key(args, kwargs))
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
+
+
+def clear_caches() -> None:
+    """Drops the cached results of every upstream API."""
+    for cache in caches:
+        cache.clear()
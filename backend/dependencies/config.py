@@ -9,12 +9,20 @@ class LoggerConfig:
         logger_name: str = os.environ.get("LOGGER_NAME", "backend_Logger"),
         max_bytes: int = int(os.environ.get("MAX_BYTES", "100000")),
         backup_count: int = int(os.environ.get("BACKUP_COUNT", "10")),
+        async_logging: bool = os.environ.get("LOG_ASYNC", "true").lower() in ("1", "true", "yes"),
+        queue_size: int = int(os.environ.get("LOG_QUEUE_SIZE", "10000")),
+        hot_path_sample_every: int = int(os.environ.get("LOG_HOT_PATH_SAMPLE_EVERY", "1")),
+        hot_path_max_per_second: float = float(os.environ.get("LOG_HOT_PATH_MAX_PER_SECOND", "10")),
     ) -> None:
         self.loglevel = loglevel
         self.logfile = logfile
         self.max_bytes = max_bytes
         self.backup_count = backup_count
         self.logger_name = logger_name
+        self.async_logging = async_logging
+        self.queue_size = queue_size
+        self.hot_path_sample_every = hot_path_sample_every
+        self.hot_path_max_per_second = hot_path_max_per_second
 
 
 class RabbitConfig:
@@ -33,5 +41,111 @@ class RabbitConfig:
         self.routing_key = routing_key
 
 
+class DatabaseConfig:
+    def __init__(
+        self,
+        sql_echo: bool = os.environ.get("SQL_ECHO", "false").lower() in ("1", "true", "yes"),
+        slow_query_ms: float = float(os.environ.get("SLOW_QUERY_MS", "200")),
+        pool_size: int = int(os.environ.get("DB_POOL_SIZE", "20")),
+        max_overflow: int = int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+        pool_timeout: float = float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+        pool_recycle: int = int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+    ) -> None:
+        self.sql_echo = sql_echo
+        self.slow_query_ms = slow_query_ms
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+
+
+class MetricsConfig:
+    def __init__(
+        self,
+        enabled: bool = os.environ.get("METRICS_ENABLED", "false").lower() in ("1", "true", "yes"),
+        port: int = int(os.environ.get("METRICS_PORT", "9100")),
+    ) -> None:
+        self.enabled = enabled
+        self.port = port
+
+
+class SyncConfig:
+    def __init__(
+        self,
+        max_workers: int = int(os.environ.get("CMT_SYNC_MAX_WORKERS", "16")),
+        http_timeout: float = float(os.environ.get("HTTP_TIMEOUT", "30")),
+        tti_page_size: int = int(os.environ.get("TTI_PAGE_SIZE", "500")),
+        tti_end_device_field_mask: str = os.environ.get("TTI_END_DEVICE_FIELD_MASK", "created_at,updated_at"),
+    ) -> None:
+        self.max_workers = max_workers
+        self.http_timeout = http_timeout
+        self.tti_page_size = tti_page_size
+        self.tti_end_device_field_mask = tti_end_device_field_mask
+
+
+def parse_limits(value: str) -> dict:
+    """Parses "name=limit,name=limit" into {name: limit}."""
+    limits = {}
+    for item in value.split(","):
+        if item.strip():
+            name, limit = item.split("=")
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+class RpcWorkerConfig:
+    def __init__(
+        self,
+        workers: int = int(os.environ.get("RPC_WORKERS", "4")),
+        concurrency_limits: dict = parse_limits(os.environ.get(
+            "RPC_CONCURRENCY_LIMITS",
+            "get_all_registered_tti_resources=1,get_all_registered_tti_application=1,get_all_registered_tti_gateways=1",
+        )),
+    ) -> None:
+        self.workers = workers
+        self.concurrency_limits = concurrency_limits
+
+
+class CacheConfig:
+    def __init__(
+        self,
+        enabled: bool = os.environ.get("UPSTREAM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+        max_size: int = int(os.environ.get("UPSTREAM_CACHE_MAX_SIZE", "10000")),
+        application_id_ttl: float = float(os.environ.get("CACHE_TTL_APPLICATION_ID", "3600")),
+        dev_addr_ttl: float = float(os.environ.get("CACHE_TTL_DEV_ADDR", "300")),
+        things_board_ttl: float = float(os.environ.get("CACHE_TTL_THINGS_BOARD", "600")),
+    ) -> None:
+        self.enabled = enabled
+        self.max_size = max_size
+        self.application_id_ttl = application_id_ttl
+        self.dev_addr_ttl = dev_addr_ttl
+        self.things_board_ttl = things_board_ttl
+
+
+class CollectionConfig:
+    def __init__(
+        self,
+        page_max_size: int = int(os.environ.get("LIST_PAGE_MAX_SIZE", "1000")),
+        bulk_max_items: int = int(os.environ.get("BULK_MAX_ITEMS", "10000")),
+    ) -> None:
+        self.page_max_size = page_max_size
+        self.bulk_max_items = bulk_max_items
+
+
+class TopologyConfig:
+    def __init__(
+        self,
+        ttl: float = float(os.environ.get("TOPOLOGY_GRAPH_TTL", "300")),
+    ) -> None:
+        self.ttl = ttl
+
+
 logger_config = LoggerConfig()
 rabbit_config = RabbitConfig()
+database_config = DatabaseConfig()
+metrics_config = MetricsConfig()
+sync_config = SyncConfig()
+rpc_worker_config = RpcWorkerConfig()
+cache_config = CacheConfig()
+collection_config = CollectionConfig()
+topology_config = TopologyConfig()
@@ -1,15 +1,18 @@
 import os
 import threading
+import time
 
 import uvicorn
 from fastapi import FastAPI
 from fastapi import HTTPException
+from fastapi import Request
 
 from api.api import api_router
 from database.db import create_db_and_tables, drop_db_and_tables
 from database.db import db_engine
 from dependencies import utility_functions
-from dependencies.config import logger_config
+from dependencies.config import logger_config, rpc_worker_config
+from dependencies.metrics import registry
 from events.event_receiver import EventReceiver
 from services.async_services import AsyncServices
 from models import models
@@ -19,6 +22,23 @@ logger = utility_functions.get_logger(logger_config)
 app = FastAPI()
 app.include_router(api_router)
 
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_seconds", "Time to serve the API requests, by method, route and status", ["method", "route", "status"]
+)
+
+
+@app.middleware("http")
+async def observe_request_duration(request: Request, call_next):
+    if not registry.enabled:
+        return await call_next(request)
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        request.method, route.path if route is not None else "unmatched", response.status_code
+    ).observe(time.perf_counter() - started)
+    return response
+
 
 def main():
     try:
@@ -30,6 +50,8 @@ def main():
             service=AsyncServices,
             logger=logger,
             queue_name=os.getenv("ASYNCQUEUE_NAME", "async_queue"),
+            workers=rpc_worker_config.workers,
+            concurrency_limits=rpc_worker_config.concurrency_limits,
         )
     except Exception as e:
         logger.exception(e)
@@ -1,5 +1,7 @@
+from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field
 from sqlmodel import SQLModel
 
@@ -33,15 +35,15 @@ class NodeBase(SQLModel):
     updated_at: Optional[str] = None
     description: Optional[str] = None
     frequency_plan: Optional[str] = None
-    node_eui: Optional[str] = None
+    node_eui: Optional[str] = Field(default=None, index=True, unique=True)
     join_eui: Optional[str] = None
     lorawanVersion: Optional[str] = None
     sampling_period_sec: Optional[float] = None
     model: Optional[str] = None
     fw_version: Optional[str] = None
     location: Optional[str] = None
-    application_id: Optional[str] = None
-    network_id: Optional[str] = None
+    application_id: Optional[str] = Field(default=None, index=True)
+    network_id: Optional[str] = Field(default=None, index=True)
 
 
 class GatewayBase(SQLModel):
@@ -58,8 +60,8 @@ class GatewayBase(SQLModel):
         - network_id: The ID of the network the gateway is connected to.
     """
 
-    gateway_tti_id: Optional[str] = None
-    gateway_tb_id: Optional[str] = None
+    gateway_tti_id: Optional[str] = Field(default=None, index=True, unique=True)
+    gateway_tb_id: Optional[str] = Field(default=None, index=True)
     name: Optional[str] = None
     created_at: Optional[str] = None
     updated_at: Optional[str] = None
@@ -67,7 +69,7 @@ class GatewayBase(SQLModel):
     gateway_eui: Optional[str] = None
     frequency_plan: Optional[str] = None
     location: Optional[str] = None
-    network_id: Optional[str] = None
+    network_id: Optional[str] = Field(default=None, index=True)
 
 
 class NetworkBase(SQLModel):
@@ -82,7 +84,7 @@ class NetworkBase(SQLModel):
         - cluster_id: The ID of the cluster to which the network belongs.
     """
 
-    network_id: Optional[str] = None
+    network_id: Optional[str] = Field(default=None, index=True, unique=True)
     name: str = Field(index=True)
     description: Optional[str] = None
     location: Optional[str] = None
@@ -101,7 +103,7 @@ class ClusterBase(SQLModel):
         - deployment_id: The ID of the deployment that the cluster belongs to.
     """
 
-    cluster_id: Optional[str] = None
+    cluster_id: Optional[str] = Field(default=None, index=True, unique=True)
     name: str = Field(index=True)
     description: Optional[str] = None
     location: Optional[str] = None
@@ -118,7 +120,7 @@ class DeploymentBase(SQLModel):
         - description: A brief description of the deployment.
     """
 
-    deployment_id: Optional[str] = None
+    deployment_id: Optional[str] = Field(default=None, index=True, unique=True)
     name: str = Field(index=True)
     description: Optional[str] = None
 
@@ -132,11 +134,27 @@ class ApplicationBase(SQLModel):
         - updated_at: The timestamp indicating the last update time of the application.
     """
 
-    application_id: Optional[str] = None
+    application_id: Optional[str] = Field(default=None, index=True, unique=True)
     created_at: Optional[str] = None
     updated_at: Optional[str] = None
 
 
+class SyncCursorBase(SQLModel):
+    """
+    Schema class representing how far the incremental synchronization of a source has gone.
+    Fields:
+        - source: The synchronized source, e.g. "tti:gateways" or "cmt:network:<network_id>".
+        - cursor: The updated_at of the most recently updated entity synchronized from the source.
+        - digest: The content hash of the source, for the sources that cannot be filtered by update time.
+        - synced_at: The timestamp of the last synchronization of the source.
+    """
+
+    source: str = Field(index=True, unique=True)
+    cursor: Optional[str] = None
+    digest: Optional[str] = None
+    synced_at: Optional[str] = None
+
+
 class Node(NodeBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
 
@@ -161,6 +179,10 @@ class Application(ApplicationBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
 
 
+class SyncCursor(SyncCursorBase, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+
 class AllRelation(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     device_id: Optional[str] = None
@@ -168,3 +190,41 @@ class AllRelation(SQLModel, table=True):
     last_f_cnt: Optional[str] = None
     application_id: Optional[str] = None
     gateway_tti_id: Optional[str] = None
+
+
+class EndDeviceKPISketches(SQLModel, table=True):
+    """
+    The quantile sketches of the uplinks of an end device through a gateway over a KPI interval,
+    written by the KPI calculation service.
+    """
+
+    __table_args__ = (
+        Index("ix_enddevicekpisketches_gateway_interval", "gateway_id", "interval_start_time"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    interval_start_time: datetime = Field(index=True)
+    interval_end_time: datetime
+    device_id: str = Field(index=True)
+    gateway_id: str
+    snr_sketch: Optional[bytes] = None
+    rssi_sketch: Optional[bytes] = None
+    latency_sketch: Optional[bytes] = None
+
+
+class GatewayDeviceSketches(SQLModel, table=True):
+    """
+    The distinct count sketches of the end devices heard by a gateway over a KPI interval, written by
+    the KPI calculation service.
+    """
+
+    __table_args__ = (
+        Index("ix_gatewaydevicesketches_gateway_interval", "gateway_id", "interval_start_time"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    interval_start_time: datetime = Field(index=True)
+    interval_end_time: datetime
+    gateway_id: str
+    device_sketch: Optional[bytes] = None
+    dev_addr_sketch: Optional[bytes] = None
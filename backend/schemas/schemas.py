@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 from models.models import ApplicationBase
@@ -140,3 +140,15 @@ class ApplicationUpdate(ApplicationBase):
     """Schema for updating an existing Application."""
 
     pass
+
+
+class BulkDelete(BaseModel):
+    """Schema for deleting entities by their ids."""
+
+    ids: List[str]
+
+
+class ResolveIds(BaseModel):
+    """Schema for resolving ids of any entity type."""
+
+    ids: List[str]
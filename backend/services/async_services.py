@@ -31,6 +31,7 @@ class AsyncServices(object):
         logger.debug(f"body {body} ")
         body = json.loads(body)
         func_name = body.get("func_name")
+        incremental = json.loads(body.get("payload") or "{}").get("incremental", False)
 
         payload = {"result": "TASK_COMPLETED"}
         # Call the corresponding function with the provided data
@@ -38,17 +39,17 @@ class AsyncServices(object):
             try:
                 if func_name == "get_all_registered_tti_gateways":
                     logger.debug(f"get_all_registered_tti_gateways")
-                    get_all_registered_tti_gateways(db)
+                    get_all_registered_tti_gateways(db, incremental)
                     payload = {"result": "get_all_registered_tti_gateways TASK_COMPLETED"}
 
                 elif func_name == "get_all_registered_tti_application":
                     logger.debug(f"get_all_registered_tti_application")
-                    get_all_registered_tti_application(db)
+                    get_all_registered_tti_application(db, incremental)
                     payload = {"result": "get_all_registered_tti_application TASK_COMPLETED"}
 
                 elif func_name == "get_all_registered_tti_resources":
                     logger.debug(f"get_all_registered_tti_resources")
-                    get_all_registered_tti_resources(db)
+                    get_all_registered_tti_resources(db, incremental=incremental)
                     payload = {"result": "get_all_registered_tti_resources TASK_COMPLETED"}
 
                 else:
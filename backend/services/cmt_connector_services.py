@@ -1,110 +1,69 @@
 import json
 import os
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
 
+from sqlalchemy import update
 from sqlmodel import Session
+from sqlmodel import col
+from sqlmodel import select
 
 from dependencies import utility_functions
-from dependencies.config import logger_config
+from dependencies.config import logger_config, sync_config
+from dependencies.exceptions import DatabaseError, InternalServerError
 from models.models import Cluster
 from models.models import Gateway
 from models.models import Network
 from models.models import Node
-from .utility_services import CMT_INFRASTRUCTURE_MANAGER_BASE_URL, get_network_from_db, get_cluster_from_db, \
-    get_gateway_from_db, get_node_from_db, get_all_deployments_from_db
+from models.models import SyncCursor
+from .utility_services import CMT_INFRASTRUCTURE_MANAGER_BASE_URL
 from .utility_services import CMT_INFRASTRUCTURE_MANAGER_TAIL_URL
 from .utility_services import TB_BASE_URL
 from .utility_services import TB_TAIL_URL
+from .utility_services import content_digest
+from .utility_services import delete_rows
 from .utility_services import get_all_cmt_cluster_entity
 from .utility_services import get_all_cmt_clusters
 from .utility_services import get_all_cmt_network_entity
-from .utility_services import get_all_cmt_networks
 from .utility_services import get_gateway_data_from_things_board
 from .utility_services import get_node_data_from_things_board
 from .utility_services import get_node_device_addr
 from .utility_services import get_tti_application_id
+from .utility_services import save_sync_cursor
+from .utility_services import upsert_rows
 
 logger = utility_functions.get_logger(logger_config)
 
-
-def add_new_db_node(db: Session, network_id: str, node_data: dict, tb_auth: str) -> None:
-    """
-    Add a new node to the database.
-
-    :param db: The database session.
-    :param network_id: The ID of the network to which the node belongs.
-    :param node_data: The node data returned by TB API.
-    :param tb_auth: The authorization token for accessing TB API.
-    :raises ValueError: If any required input data is missing or invalid.
-    :raises Exception: If there was an error adding the node to the database.
-    """
-
-    if not isinstance(network_id, str):
-        raise ValueError("Network ID must be a string")
-    if not isinstance(tb_auth, str) or not tb_auth.strip():
-        raise ValueError("TB authorization token must be a non-empty string")
-
-    try:
-        tb_node_data = get_node_data_from_things_board(
-            CMT_INFRASTRUCTURE_MANAGER_BASE_URL,
-            CMT_INFRASTRUCTURE_MANAGER_TAIL_URL,
-            node_data["id"],
-            tb_auth,
-        )
-        tti_app_id = get_tti_application_id(network_id=network_id)
-        node_dev_addr = get_node_device_addr(tti_app_id, tb_node_data["node_id"])
-        new_node = Node(
-            node_tb_id=node_data["id"],
-            node_dev_id=tb_node_data["node_id"],
-            node_dev_addr=node_dev_addr,
-            tti_application_id=tti_app_id,
-            name=tb_node_data["node_name"],
-            description=tb_node_data["description"],
-            frequency_plan=tb_node_data["frequency_plan"],
-            node_eui=tb_node_data["node_eui"],
-            join_eui=tb_node_data["join_eui"],
-            lorawanVersion=tb_node_data["lorawanVersion"],
-            sampling_period_sec=tb_node_data["sampling_period_sec"],
-            model=tb_node_data["model"],
-            fw_version=tb_node_data["fw_version"],
-            location=tb_node_data["location"],
-            network_id=network_id,
-        )
-
-        db.add(new_node)
-        db.commit()
-        db.refresh(new_node)
-    except Exception as e:
-        raise Exception(f"Error adding node to database: {str(e)}")
-
-
-def update_node(db: Session, network_id, node_data, tb_auth):
-    logger.debug("update_node ")
-
-    db_node = get_node_from_db(node_data["id"])
-    if not db_node:
-        add_new_db_node(db, network_id, node_data, tb_auth)
-
-
-def update_network_nodes(db: Session, cmt_auth, tb_auth, network_id):
-    logger.debug("update_network_nodes ")
-    all_network_nodes = get_all_cmt_network_entity(network_id, "nodes", cmt_auth)
-    json_message = json.loads(all_network_nodes)
-    data = json_message["data"]
-    for node in data:
-        update_node(db, network_id, node, tb_auth)
-
-
-def add_new_gateway(db: Session, network_id, gateway_data, tb_auth):
-    logger.debug("add_new_gateway ")
-    tb_gateway_data = get_gateway_data_from_things_board(
-        TB_BASE_URL,
-        TB_TAIL_URL,
-        gateway_data["id"],
-        tb_auth,
+# The number of ids of one existence query
+DB_LOOKUP_CHUNK_SIZE = 500
+# The columns of the gateways and nodes set from the CMT and ThingsBoard
+GATEWAY_CMT_COLUMNS = ["gateway_tb_id", "name", "description", "gateway_eui", "frequency_plan", "location", "network_id"]
+NODE_CMT_COLUMNS = [
+    "node_tb_id", "node_dev_id", "node_dev_addr", "application_id", "name", "description", "frequency_plan",
+    "join_eui", "lorawanVersion", "sampling_period_sec", "model", "fw_version", "location", "network_id",
+]
+# The source of the synchronization cursor of a network, holding the content hash of its gateways and nodes
+NETWORK_SOURCE = "cmt:network:"
+
+
+def get_cmt_data(response: str) -> List[dict]:
+    return json.loads(response)["data"]
+
+
+def new_network_row(cluster_id: str, network_data: dict, tti_app_id: str) -> Network:
+    return Network(
+        network_id=network_data["id"],
+        name=network_data["name"],
+        application_id=tti_app_id,
+        description=network_data.get("description"),
+        location=network_data.get("location"),
+        cluster_id=cluster_id,
     )
 
-    new_gateway = Gateway(
-        gateway_tb_id=gateway_data["id"],
+
+def new_gateway_row(network_id: str, gateway_tb_id: str, tb_gateway_data: dict) -> Gateway:
+    return Gateway(
+        gateway_tb_id=gateway_tb_id,
         gateway_tti_id=tb_gateway_data["gateway_tti_id"],
         name=tb_gateway_data["gw_name"],
         description=tb_gateway_data["description"],
@@ -113,119 +72,345 @@ def add_new_gateway(db: Session, network_id, gateway_data, tb_auth):
         location=tb_gateway_data["location"],
         network_id=network_id,
     )
-    db.add(new_gateway)
-    db.commit()
-    db.refresh(new_gateway)
-
-
-def update_gateway(db: Session, network_id, gateway_data, tb_auth):
-    logger.debug("update_gateway")
-    db_gateway = get_gateway_from_db(gateway_data["id"])
-    if not db_gateway:
-        add_new_gateway(db, network_id, gateway_data, tb_auth)
-
-
-def update_network_gateways(db: Session, cmt_auth, tb_auth, network_id):
-    logger.debug("update_network_gateways")
-
-    all_network_gateways = get_all_cmt_network_entity(network_id, "gateways", cmt_auth)
-    json_message = json.loads(all_network_gateways)
-    data = json_message["data"]
-    for gateway in data:
-        update_gateway(db, network_id, gateway, tb_auth)
-
-
-def add_new_network(db: Session, network_data):
-    logger.debug("add_new_network ")
-    network = db.get(Network, network_data["id"])
-    if not network:
-        tti_app_id = get_tti_application_id(network_id=network_data["id"])
-        new_network = Network(
-            network_id=network_data["id"],
-            name=network_data["name"],
-            tti_application_id=tti_app_id,
-            description=network_data["description"],
-            locations=network_data["location"],
-            cluster_id=None,
-        )
-        db.add(new_network)
-        db.commit()
-        db.refresh(new_network)
-
-
-def update_network(db: Session, cmt_auth: str, tb_auth: str):
-    logger.debug("update_network")
-
-    cmt_networks = get_all_cmt_networks(cmt_auth)
-    json_message = json.loads(cmt_networks)
-    data = json_message["data"]
-    for network in data:
-        db_network = db.get(Network, network["id"])
-        if not db_network:
-            add_new_network(db, network)
-            update_network_gateways(db, cmt_auth, tb_auth, network["id"])
-            update_network_nodes(db, cmt_auth, tb_auth, network["id"])
-
-
-def add_new_network_to_cluster(db: Session, cluster_id, network_data):
-    logger.debug(f"add_new_network_to_cluster")
-    network = get_network_from_db(network_data["id"])
-    if not network:
-        tti_app_id = get_tti_application_id(network_id=network_data["id"])
-        new_network = Network(
-            network_id=network_data["id"],
-            name=network_data["name"],
-            tti_application_id=tti_app_id,
-            description=network_data["description"],
-            locations=network_data["location"],
-            cluster_id=cluster_id,
-        )
-        db.add(new_network)
-        db.commit()
-        db.refresh(new_network)
-
-
-def update_cluster_networks(db: Session, cmt_auth, tb_auth, cluster_id):
-    logger.debug(f"update_cluster_networks")
-    all_cluster_networks = get_all_cmt_cluster_entity(cluster_id, "networks", cmt_auth)
-    json_message = json.loads(all_cluster_networks)
-    data = json_message["data"]
-    for network in data:
-        # db_network = db.get(Network, network["id"])
-        db_network = get_network_from_db(network["id"])
-        if not db_network:
-            add_new_network_to_cluster(db, cluster_id, network)
-            update_network_gateways(db, cmt_auth, tb_auth, network["id"])
-            update_network_nodes(db, cmt_auth, tb_auth, network["id"])
-
-
-def add_new_cluster(db: Session, deployment_id, cluster_data):
-    new_cluster = Cluster(
-        cluster_id=cluster_data["id"],
-        name=cluster_data["name"],
-        description=cluster_data["description"],
-        locations=cluster_data["location"],
-        deployment_id=deployment_id,
+
+
+def new_node_row(network_id: str, node_tb_id: str, tb_node_data: dict, tti_app_id: str, node_dev_addr) -> Node:
+    return Node(
+        node_tb_id=node_tb_id,
+        node_dev_id=tb_node_data["node_id"],
+        node_dev_addr=node_dev_addr,
+        application_id=tti_app_id,
+        name=tb_node_data["node_name"],
+        description=tb_node_data["description"],
+        frequency_plan=tb_node_data["frequency_plan"],
+        node_eui=tb_node_data["node_eui"],
+        join_eui=tb_node_data["join_eui"],
+        lorawanVersion=tb_node_data["lorawan_version"],
+        sampling_period_sec=tb_node_data["sampling_period_sec"],
+        model=tb_node_data["model"],
+        fw_version=tb_node_data["fw_version"],
+        location=tb_node_data["location"],
+        network_id=network_id,
     )
-    db.add(new_cluster)
-    db.commit()
-    db.refresh(new_cluster)
 
 
-def update_cluster(db: Session, deployment_id: str, cmt_auth: str, tb_auth: str):
-    logger.debug(f"update_cluster")
+def completed(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
 
-    cmt_clusters = json.loads(get_all_cmt_clusters(cmt_auth))
-    data = cmt_clusters["data"]
-    for cluster in data:
-        db_cluster = get_cluster_from_db(cluster["id"])
-        if not db_cluster:
-            add_new_cluster(db, deployment_id, cluster)
-            update_cluster_networks(db, cmt_auth, tb_auth, cluster["id"])
 
+class NetworkSync:
+    """
+    The API calls of one network, and the rows built from their results. An ``existing`` network
+    is already in the database, with the gateways and nodes of the listings of ``digest``.
+    """
+
+    def __init__(self, cluster_id: str, network_data: dict, existing: bool = False):
+        self.cluster_id = cluster_id
+        self.network_data = network_data
+        self.network_id = network_data["id"]
+        self.existing = existing
+        self.application_id: Optional[Future] = None
+        self.gateways: Optional[Future] = None
+        self.nodes: Optional[Future] = None
+        self.digest: Optional[str] = None
+        # Entity id -> future of the data of the gateways and nodes missing from the database
+        self.gateways_data: Dict[str, Future] = {}
+        self.nodes_data: Dict[str, Future] = {}
+
+    def futures(self) -> List[Future]:
+        return [self.application_id, self.gateways, self.nodes] + list(self.gateways_data.values()) + list(
+            self.nodes_data.values()
+        )
+
+    def error(self) -> Optional[BaseException]:
+        for future in self.futures():
+            if future.done() and future.exception() is not None:
+                return future.exception()
+        return None
 
-def update_data_architecture_from_cmt(db: Session, cmt_auth: str, tb_auth: str):
+    def listing_digest(self) -> str:
+        return content_digest(
+            [["gateway", gateway["id"]] for gateway in self.gateways.result()]
+            + [["node", node["id"]] for node in self.nodes.result()]
+        )
+
+    def write(self, db: Session) -> None:
+        """
+        Writes the network with its gateways and nodes in one transaction. The gateways and nodes
+        already imported from TTI, with the same TTI id or EUI, get the data of the CMT. The gateways
+        and nodes an existing network lists are moved to it, and the ones it no longer lists are
+        detached from it.
+        """
+        try:
+            if not self.existing:
+                db.add(new_network_row(self.cluster_id, self.network_data, self.application_id.result()))
+            gateway_rows = [
+                new_gateway_row(self.network_id, gateway_tb_id, gateway_data.result()).dict(exclude={"id"})
+                for gateway_tb_id, gateway_data in self.gateways_data.items()
+            ]
+            upsert_rows(db, Gateway, gateway_rows, "gateway_tti_id", GATEWAY_CMT_COLUMNS)
+            node_rows = [
+                new_node_row(self.network_id, node_tb_id, *node_data.result()).dict(exclude={"id"})
+                for node_tb_id, node_data in self.nodes_data.items()
+            ]
+            upsert_rows(db, Node, node_rows, "node_eui", NODE_CMT_COLUMNS)
+            if self.existing:
+                for model, key, entities in (
+                        (Gateway, "gateway_tb_id", self.gateways.result()),
+                        (Node, "node_tb_id", self.nodes.result()),
+                ):
+                    entity_ids = [entity["id"] for entity in entities]
+                    db.exec(
+                        update(model)
+                        .where(col(getattr(model, key)).in_(entity_ids), col(model.network_id) != self.network_id)
+                        .values(network_id=self.network_id)
+                    )
+                    db.exec(
+                        update(model)
+                        .where(model.network_id == self.network_id, col(getattr(model, key)).not_in(entity_ids))
+                        .values(network_id=None)
+                    )
+            save_sync_cursor(db, NETWORK_SOURCE + self.network_id, digest=self.digest)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise DatabaseError("write_network", str(e))
+
+
+class CmtTopologySync:
+    """
+    Adds the clusters of the CMT missing from the database, with their networks, gateways and nodes.
+
+    The calls to the CMT, ThingsBoard and TTI APIs run on ``max_workers`` threads sharing keep-alive
+    connections, and the application id of a network is fetched once for the network and all its
+    nodes. Each network is written with its gateways and nodes in one transaction, and a cluster once
+    all its networks are written, so a network that fails is not left half written and is synchronized
+    again by the next run.
+
+    An ``incremental`` run also applies the changes of the clusters already synchronized: the CMT
+    cannot filter its listings by update time, so the gateways and nodes of every network are listed
+    and compared by content hash with the last run. Only the networks whose listings changed get
+    their new gateways and nodes fetched and written, and the removed ones detached; the networks
+    and clusters the CMT no longer lists are deleted.
+    """
+
+    def __init__(self, db: Session, cmt_auth: str, tb_auth: str, deployment_id: str,
+                 max_workers: int = sync_config.max_workers, incremental: bool = False):
+        self.db = db
+        self.cmt_auth = cmt_auth
+        self.tb_auth = tb_auth
+        self.deployment_id = deployment_id
+        self.max_workers = max_workers
+        self.incremental = incremental
+
+    def get_missing_ids(self, column, ids: List[str]) -> List[str]:
+        """The ids, without duplicates, with no row in the database."""
+        ids = list(dict.fromkeys(ids))
+        existing_ids = set()
+        try:
+            for start in range(0, len(ids), DB_LOOKUP_CHUNK_SIZE):
+                existing_ids.update(
+                    self.db.exec(select(column).where(column.in_(ids[start:start + DB_LOOKUP_CHUNK_SIZE]))).all()
+                )
+        except Exception as e:
+            raise DatabaseError("get_missing_ids", str(e))
+        return [entity_id for entity_id in ids if entity_id not in existing_ids]
+
+    def fetch_node_data(self, node_tb_id: str, tti_app_id: str) -> Tuple[dict, str, str]:
+        tb_node_data = get_node_data_from_things_board(
+            CMT_INFRASTRUCTURE_MANAGER_BASE_URL,
+            CMT_INFRASTRUCTURE_MANAGER_TAIL_URL,
+            node_tb_id,
+            self.tb_auth,
+        )
+        return tb_node_data, tti_app_id, get_node_device_addr(tti_app_id, tb_node_data["node_id"])
+
+    def fetch_gateway_data(self, gateway_tb_id: str) -> dict:
+        return get_gateway_data_from_things_board(TB_BASE_URL, TB_TAIL_URL, gateway_tb_id, self.tb_auth)
+
+    def get_networks(self, executor: ThreadPoolExecutor, clusters: List[dict]) -> Dict[str, NetworkSync]:
+        """The networks of the clusters, by network id."""
+        clusters_networks = [
+            executor.submit(
+                lambda cluster_id: get_cmt_data(get_all_cmt_cluster_entity(cluster_id, "networks", self.cmt_auth)),
+                cluster["id"],
+            )
+            for cluster in clusters
+        ]
+        networks = {}
+        for cluster, cluster_networks in zip(clusters, clusters_networks):
+            for network_data in cluster_networks.result():
+                networks.setdefault(network_data["id"], NetworkSync(cluster["id"], network_data))
+        return networks
+
+    def get_existing_networks(self, networks: Dict[str, NetworkSync], new_ids: List[str]) -> List[NetworkSync]:
+        """The networks already in the database, with their application id and the digest of the last run."""
+        new_ids = set(new_ids)
+        existing_ids = [network_id for network_id in networks if network_id not in new_ids]
+        existing = []
+        try:
+            for start in range(0, len(existing_ids), DB_LOOKUP_CHUNK_SIZE):
+                chunk = existing_ids[start:start + DB_LOOKUP_CHUNK_SIZE]
+                digests = dict(self.db.exec(
+                    select(SyncCursor.source, SyncCursor.digest)
+                    .where(col(SyncCursor.source).in_([NETWORK_SOURCE + network_id for network_id in chunk]))
+                ).all())
+                for network_id, application_id in self.db.exec(
+                        select(Network.network_id, Network.application_id).where(col(Network.network_id).in_(chunk))
+                ).all():
+                    network = networks[network_id]
+                    if network.existing:
+                        continue
+                    network.existing = True
+                    network.application_id = completed(application_id)
+                    network.digest = digests.get(NETWORK_SOURCE + network_id)
+                    existing.append(network)
+        except Exception as e:
+            raise DatabaseError("get_existing_networks", str(e))
+        return existing
+
+    def delete_removed(self, clusters: Dict[str, dict], networks: Dict[str, NetworkSync]) -> None:
+        """
+        Deletes the clusters and networks the CMT no longer lists, and detaches the gateways and
+        nodes of the deleted networks.
+        """
+        try:
+            removed_networks = [
+                network_id for network_id in self.db.exec(select(Network.network_id)).all()
+                if network_id not in networks
+            ]
+            for model in (Gateway, Node):
+                for start in range(0, len(removed_networks), DB_LOOKUP_CHUNK_SIZE):
+                    self.db.exec(
+                        update(model)
+                        .where(col(model.network_id).in_(removed_networks[start:start + DB_LOOKUP_CHUNK_SIZE]))
+                        .values(network_id=None)
+                    )
+            delete_rows(self.db, Network, "network_id", removed_networks)
+            delete_rows(self.db, SyncCursor, "source", [NETWORK_SOURCE + network_id for network_id in removed_networks])
+            removed_clusters = [
+                cluster_id for cluster_id in self.db.exec(select(Cluster.cluster_id)).all()
+                if cluster_id not in clusters
+            ]
+            delete_rows(self.db, Cluster, "cluster_id", removed_clusters)
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            raise DatabaseError("delete_removed", str(e))
+        for network_id in removed_networks:
+            get_tti_application_id.invalidate(network_id=network_id)
+        if removed_networks or removed_clusters:
+            logger.info(
+                f"Deleted the networks {', '.join(removed_networks)} and clusters {', '.join(removed_clusters)}"
+            )
+
+    def fetch_networks(self, executor: ThreadPoolExecutor, networks: List[NetworkSync]) -> List[NetworkSync]:
+        """
+        Fetches the application id, gateways and nodes of the networks, and the data of the gateways
+        and nodes that are not in the database. Returns the networks to write: the new networks and
+        the existing ones whose gateways or nodes changed since the last run.
+        """
+        for network in networks:
+            if network.application_id is None:
+                network.application_id = executor.submit(get_tti_application_id, network_id=network.network_id)
+            network.gateways = executor.submit(
+                lambda network_id: get_cmt_data(get_all_cmt_network_entity(network_id, "gateways", self.cmt_auth)),
+                network.network_id,
+            )
+            network.nodes = executor.submit(
+                lambda network_id: get_cmt_data(get_all_cmt_network_entity(network_id, "nodes", self.cmt_auth)),
+                network.network_id,
+            )
+        wait([future for network in networks for future in network.futures()])
+
+        changed = []
+        for network in networks:
+            if network.error() is None:
+                digest = network.listing_digest()
+                if network.existing and digest == network.digest:
+                    continue
+                network.digest = digest
+            changed.append(network)
+        listed = [network for network in changed if network.error() is None]
+        new_gateway_ids = set(self.get_missing_ids(
+            Gateway.gateway_tb_id,
+            [gateway["id"] for network in listed for gateway in network.gateways.result()],
+        ))
+        new_node_ids = set(self.get_missing_ids(
+            Node.node_tb_id,
+            [node["id"] for network in listed for node in network.nodes.result()],
+        ))
+        for network in listed:
+            # A gateway or node listed in several networks belongs to the first one
+            for gateway in network.gateways.result():
+                if gateway["id"] in new_gateway_ids:
+                    new_gateway_ids.discard(gateway["id"])
+                    network.gateways_data[gateway["id"]] = executor.submit(self.fetch_gateway_data, gateway["id"])
+            for node in network.nodes.result():
+                if node["id"] in new_node_ids:
+                    new_node_ids.discard(node["id"])
+                    network.nodes_data[node["id"]] = executor.submit(
+                        self.fetch_node_data, node["id"], network.application_id.result()
+                    )
+        wait([future for network in listed for future in network.futures()])
+        return changed
+
+    def write_rows(self, rows: list) -> None:
+        try:
+            self.db.add_all(rows)
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            raise DatabaseError("write_rows", str(e))
+
+    def run(self) -> None:
+        clusters = {}
+        for cluster in get_cmt_data(get_all_cmt_clusters(self.cmt_auth)):
+            clusters.setdefault(cluster["id"], cluster)
+        new_clusters = [clusters[cluster_id] for cluster_id in self.get_missing_ids(Cluster.cluster_id, list(clusters))]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cmt_sync") as executor:
+            listed_networks = self.get_networks(executor, list(clusters.values()) if self.incremental else new_clusters)
+            new_ids = self.get_missing_ids(Network.network_id, list(listed_networks))
+            networks = [listed_networks[network_id] for network_id in new_ids]
+            if self.incremental:
+                networks += self.get_existing_networks(listed_networks, new_ids)
+            networks = self.fetch_networks(executor, networks)
+
+        failed_networks = {}
+        for network in networks:
+            error = network.error()
+            if error is None:
+                try:
+                    network.write(self.db)
+                except Exception as e:
+                    error = e
+            if error is not None:
+                logger.error(f"Error synchronizing the network {network.network_id}: {str(error)}")
+                failed_networks[network.network_id] = network.cluster_id
+        logger.debug(f"{len(networks) - len(failed_networks)} networks synchronized")
+
+        self.write_rows([
+            Cluster(
+                cluster_id=cluster["id"],
+                name=cluster["name"],
+                description=cluster.get("description"),
+                location=cluster.get("location"),
+                deployment_id=self.deployment_id,
+            )
+            for cluster in new_clusters
+            if cluster["id"] not in failed_networks.values()
+        ])
+        if self.incremental:
+            self.delete_removed(clusters, listed_networks)
+        if failed_networks:
+            raise InternalServerError(f"Failed to synchronize the networks {', '.join(failed_networks)}")
+
+
+def update_data_architecture_from_cmt(db: Session, cmt_auth: str, tb_auth: str, incremental: bool = False):
     logger.debug(f"update_data_architecture_from_cmt")
     deployment_id = str(os.getenv("DEPLOYMENT_ID"))
-    update_cluster(db, deployment_id, cmt_auth, tb_auth)
+    CmtTopologySync(db, cmt_auth, tb_auth, deployment_id, incremental=incremental).run()
     logger.debug("update_data_architecture_from_cmt Done!")
@@ -0,0 +1,173 @@
+"""
+Bulk writes and paginated listings of the topology entities (nodes, gateways, networks, clusters,
+deployments and applications).
+
+A bulk request is applied in one transaction with one statement per chunk of rows, instead of one
+SELECT and one commit per entity. The listings are paginated by keyset on the primary key: a page
+starts after the last row of the previous one, so its cost does not grow with its position.
+"""
+from collections import Counter
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import insert
+from sqlmodel import Session, col, select
+
+from dependencies import utility_functions
+from dependencies.config import collection_config, logger_config
+from dependencies.exceptions import DatabaseError, EntityAlreadyExists, ValidationError
+from models.models import Application, Cluster, Deployment, Gateway, Network, Node
+from services.utility_services import UPSERT_CHUNK_SIZE, delete_rows, upsert_rows
+
+logger = utility_functions.get_logger(logger_config)
+
+
+class EntityCollection:
+    """The table of an entity type and the column identifying its entities in the API."""
+
+    def __init__(self, name: str, model, key: str):
+        self.name = name
+        self.model = model
+        self.key = key
+        self.columns = [column.name for column in model.__table__.columns if column.name != "id"]
+
+
+NODES = EntityCollection("Node", Node, "node_eui")
+GATEWAYS = EntityCollection("Gateway", Gateway, "gateway_tti_id")
+NETWORKS = EntityCollection("Network", Network, "network_id")
+CLUSTERS = EntityCollection("Cluster", Cluster, "cluster_id")
+DEPLOYMENTS = EntityCollection("Deployment", Deployment, "deployment_id")
+APPLICATIONS = EntityCollection("Application", Application, "application_id")
+
+
+def check_batch_size(size: int) -> None:
+    if size > collection_config.bulk_max_items:
+        raise ValidationError(f"At most {collection_config.bulk_max_items} items are accepted per request, got {size}")
+
+
+def check_rows(collection: EntityCollection, rows: List[dict]) -> List[str]:
+    """Returns the ids of ``rows``, each of them must have one."""
+    check_batch_size(len(rows))
+    keys = [row.get(collection.key) for row in rows]
+    missing = keys.count(None) + keys.count("")
+    if missing:
+        raise ValidationError(f"{missing} {collection.name} items have no {collection.key}")
+    return keys
+
+
+def get_existing_keys(db: Session, collection: EntityCollection, keys: Iterable[str]) -> Set[str]:
+    """The ones of ``keys`` identifying a row of ``collection``."""
+    keys = list(set(keys))
+    key_column = getattr(collection.model, collection.key)
+    existing = set()
+    for start in range(0, len(keys), UPSERT_CHUNK_SIZE):
+        existing.update(db.exec(select(key_column).where(col(key_column).in_(keys[start:start + UPSERT_CHUNK_SIZE]))))
+    return existing
+
+
+def bulk_create(db: Session, collection: EntityCollection, rows: List[dict]) -> dict:
+    """
+    Creates the entities of ``rows`` in one transaction. Nothing is created if one of their ids
+    already exists or is repeated in ``rows``.
+
+    :param db: The database session.
+    :param collection: The type of the entities.
+    :param rows: The column values of the entities.
+    :raises ValidationError: If there are too many rows or one of them has no id.
+    :raises EntityAlreadyExists: If an id already exists or is repeated.
+    :raises DatabaseError: If there is an error writing the entities.
+    :return: The number of entities created.
+    """
+    keys = check_rows(collection, rows)
+    try:
+        with db:
+            conflicts = {key for key, count in Counter(keys).items() if count > 1}
+            conflicts.update(get_existing_keys(db, collection, keys))
+            if conflicts:
+                raise EntityAlreadyExists(entity_name=collection.name, entity_id=", ".join(sorted(conflicts)[:10]))
+            rows = [{column: row.get(column) for column in collection.columns} for row in rows]
+            for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                db.execute(insert(collection.model.__table__), rows[start:start + UPSERT_CHUNK_SIZE])
+            db.commit()
+            return {"created": len(rows)}
+    except EntityAlreadyExists:
+        raise  # Re-raise the same exception
+    except Exception as e:
+        raise DatabaseError(func_name="bulk_create", detail=str(e))
+
+
+def bulk_upsert(db: Session, collection: EntityCollection, rows: List[dict]) -> dict:
+    """
+    Creates the entities of ``rows`` whose id does not exist and replaces the others, in one
+    transaction. The last of the rows with the same id wins.
+
+    :param db: The database session.
+    :param collection: The type of the entities.
+    :param rows: The column values of the entities.
+    :raises ValidationError: If there are too many rows or one of them has no id.
+    :raises DatabaseError: If there is an error writing the entities.
+    :return: The numbers of entities created and updated.
+    """
+    keys = set(check_rows(collection, rows))
+    try:
+        with db:
+            existing = get_existing_keys(db, collection, keys)
+            rows = [{column: row.get(column) for column in collection.columns} for row in rows]
+            upsert_rows(db, collection.model, rows, collection.key,
+                        [column for column in collection.columns if column != collection.key])
+            db.commit()
+            return {"created": len(keys - existing), "updated": len(existing)}
+    except Exception as e:
+        raise DatabaseError(func_name="bulk_upsert", detail=str(e))
+
+
+def bulk_delete(db: Session, collection: EntityCollection, keys: List[str]) -> dict:
+    """
+    Deletes the entities identified by ``keys`` in one transaction, the unknown ids are ignored.
+
+    :raises ValidationError: If there are too many ids.
+    :raises DatabaseError: If there is an error deleting the entities.
+    :return: The number of entities deleted.
+    """
+    check_batch_size(len(keys))
+    try:
+        with db:
+            deleted = delete_rows(db, collection.model, collection.key, list(set(keys)))
+            db.commit()
+            return {"deleted": deleted}
+    except Exception as e:
+        raise DatabaseError(func_name="bulk_delete", detail=str(e))
+
+
+def list_page(db: Session, collection: EntityCollection, after: Optional[int] = None, limit: int = 100,
+              fields: Optional[List[str]] = None) -> dict:
+    """
+    Lists a page of the entities of ``collection`` in the order of their primary key.
+
+    :param db: The database session.
+    :param collection: The type of the entities.
+    :param after: The ``next_after`` of the previous page, None for the first page.
+    :param limit: The largest number of entities of the page.
+    :param fields: The columns returned, all of them by default.
+    :raises ValidationError: If the limit is out of range or a field is unknown.
+    :raises DatabaseError: If there is an error reading the entities.
+    :return: The entities as ``items`` and the ``next_after`` of the next page, None on the last page.
+    """
+    if not 1 <= limit <= collection_config.page_max_size:
+        raise ValidationError(f"limit must be between 1 and {collection_config.page_max_size}")
+    fields = fields or collection.columns
+    unknown = [field for field in fields if field not in collection.columns]
+    if unknown:
+        raise ValidationError(f"Unknown {collection.name} fields: {', '.join(unknown)}")
+    model = collection.model
+    statement = select(model.id, *[getattr(model, field) for field in fields]).order_by(model.id).limit(limit)
+    if after is not None:
+        statement = statement.where(model.id > after)
+    try:
+        with db:
+            rows = db.execute(statement).all()
+    except Exception as e:
+        raise DatabaseError(func_name="list_page", detail=str(e))
+    return {
+        "items": [dict(zip(fields, row[1:])) for row in rows],
+        "next_after": rows[-1][0] if len(rows) == limit else None,
+    }
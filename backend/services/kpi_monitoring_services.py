@@ -1,40 +1,50 @@
 import json
 import os
-from typing import List
+import threading
+from typing import List, Optional
 
-import pika
-from sqlmodel import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from dependencies import utility_functions
 from dependencies.config import logger_config
 from dependencies.exceptions import QueueSendError, EntityNotFound
+from dependencies.transport import RabbitMQTransport
 from schemas.help_schemas import ControlCommands
 from schemas.help_schemas import MonitorInfo
-from services.utility_services import get_all_network_gateway, get_gateways_for_application, \
-    get_gateway_from_db_by_tti_id, get_network_from_db, get_all_gateways_from_db, get_application_from_db, \
-    get_all_application_from_db
+from schemas.help_schemas import MonitorInfoList
+from services.topology_services import get_topology
+from services.utility_services import get_gateways_for_application
 
 logger = utility_functions.get_logger(logger_config)
 rabbit_username = os.getenv("RABBITMQ_USERNAME")
 rabbit_password = os.getenv("RABBITMQ_PASSWORD")
 rabbit_host = os.getenv("RABBITMQ_HOST")
-credentials = pika.PlainCredentials(username=rabbit_username, password=rabbit_password)
+rabbit_port = os.getenv("RABBITMQ_PORT")
+# The largest number of ids carried by one bulk control message
+bulk_command_max_ids = int(os.getenv("BULK_COMMAND_MAX_IDS", "500"))
 
+# Control commands are published over one long-lived connection per thread of the threadpool
+# instead of a new connection per command
+control_transport: Optional[RabbitMQTransport] = None
+control_transport_lock = threading.Lock()
 
-def send_data_to_queue(json_data, rabbit_host, queue_name):
+
+def get_control_transport() -> RabbitMQTransport:
+    global control_transport
+    with control_transport_lock:
+        if control_transport is None:
+            control_transport = RabbitMQTransport(
+                rabbit_host, rabbit_username, rabbit_password, port=rabbit_port, logger=logger
+            )
+        return control_transport
+
+
+def send_data_to_queue(json_data, queue_name):
     try:
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=rabbit_host, credentials=credentials)
-        )
-        channel = connection.channel()
-        channel.queue_declare(queue=queue_name, durable=True)
-        channel.basic_publish(
-            exchange="",
-            routing_key=queue_name,
-            body=json.dumps(json_data),
-            properties=pika.BasicProperties(delivery_mode=2),
-        )
-        connection.close()
+        transport = get_control_transport()
+        transport.declare_queue(queue_name)
+        transport.publish(queue_name, json.dumps(json_data))
     except Exception as e:
         logger.error(f" Error in  send_data_to_queue {str(e)}")
         raise QueueSendError(f"Error in  send_data_to_queue {str(e)}")
@@ -49,7 +59,6 @@ def send_data(task_data, queue_name):
 
         send_data_to_queue(
             json_data=payload,
-            rabbit_host=rabbit_host,
             queue_name=queue_name,
         )
 
@@ -61,241 +70,197 @@ def send_data(task_data, queue_name):
         raise QueueSendError(f"Error in  send_data {str(e)}")
 
 
-def start_monitor_gateway(gateway_id: str, db: Session):
+def send_bulk_data(ids: List[str], command: ControlCommands, queue_name: str) -> List[str]:
+    """
+    Send the command for all the ids as bulk control messages of up to ``bulk_command_max_ids`` ids,
+    instead of one message per id.
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    return [
+        send_data(MonitorInfoList(ids=unique_ids[start:start + bulk_command_max_ids], command=command), queue_name)
+        for start in range(0, len(unique_ids), bulk_command_max_ids)
+    ]
+
+
+async def start_monitor_gateway(gateway_id: str, db: AsyncSession):
     """
     Start monitoring the specified gateway.
     """
 
-    db_gateway = get_gateway_from_db_by_tti_id(gateway_id, db)
-    if not db_gateway:
+    topology = await db.run_sync(get_topology)
+    if not topology.get("gateway", gateway_id):
         raise EntityNotFound(entity_name="gateway", entity_id=gateway_id)
 
     task_data = MonitorInfo(id=gateway_id, command=ControlCommands.START)
     queue_name = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_queue")
-    task_status = send_data(task_data, queue_name)
+    task_status = await run_in_threadpool(send_data, task_data, queue_name)
     return {"task_status": task_status}
 
 
-def stop_monitor_gateway(gateway_id: str, db: Session):
+async def stop_monitor_gateway(gateway_id: str, db: AsyncSession):
     """
     Stop monitoring the specified gateway.
     """
-    db_gateway = get_gateway_from_db_by_tti_id(gateway_id, db)
-    if not db_gateway:
+    topology = await db.run_sync(get_topology)
+    if not topology.get("gateway", gateway_id):
         raise EntityNotFound(entity_name="gateway", entity_id=gateway_id)
 
     task_data = MonitorInfo(id=gateway_id, command=ControlCommands.STOP)
     queue_name = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_queue")
-    task_status = send_data(task_data, queue_name)
+    task_status = await run_in_threadpool(send_data, task_data, queue_name)
     return {"task_status": task_status}
 
 
-def stop_monitor_network(network_id: str, db: Session):
+async def stop_monitor_network(network_id: str, db: AsyncSession):
     """
     Stop monitoring the specified network.
     """
-    db_network = get_network_from_db(network_id, db)
-    if not db_network:
+    topology = await db.run_sync(get_topology)
+    if not topology.get("network", network_id):
         raise EntityNotFound(entity_name="network", entity_id=network_id)
 
-    all_gateways = get_all_network_gateway(network_id, db)
+    all_gateways = topology.find("gateway", "network_id", network_id)
     queue_name = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_queue")
-    task_status = []
-    task_data = MonitorInfo(id="", command=ControlCommands.STOP)
-    for gateway in all_gateways:
-        task_data.id = gateway.gateway_tti_id
-        task_status.append(send_data(task_data, queue_name))
-
+    task_status = await run_in_threadpool(
+        send_bulk_data, [gateway["gateway_tti_id"] for gateway in all_gateways], ControlCommands.STOP, queue_name
+    )
     return {"task_status": "\n".join(task_status)}
 
 
-def start_monitor_network(network_id: str, db: Session):
+async def start_monitor_network(network_id: str, db: AsyncSession):
     """
     Start monitoring the specified network.
     """
-    db_network = get_network_from_db(network_id, db)
-    if not db_network:
+    topology = await db.run_sync(get_topology)
+    if not topology.get("network", network_id):
         raise EntityNotFound(entity_name="network", entity_id=network_id)
 
-    all_gateways = get_all_network_gateway(network_id, db)
+    all_gateways = topology.find("gateway", "network_id", network_id)
     queue_name = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_queue")
-    task_status = []
-    task_data = MonitorInfo(id="", command=ControlCommands.START)
-    for gateway in all_gateways:
-        task_data.id = gateway.gateway_tti_id
-        task_status.append(send_data(task_data, queue_name))
-
+    task_status = await run_in_threadpool(
+        send_bulk_data, [gateway["gateway_tti_id"] for gateway in all_gateways], ControlCommands.START, queue_name
+    )
     return {"task_status": "\n".join(task_status)}
 
 
-def stop_monitor_all_gateway(db: Session):
-    all_gateways = get_all_gateways_from_db(db)
+async def stop_monitor_all_gateway(db: AsyncSession):
+    all_gateways = (await db.run_sync(get_topology)).all("gateway")
     if not all_gateways:
         raise EntityNotFound(entity_name="gateway", entity_id="No gateways found")
 
     queue_name = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_queue")
-    task_status = []
-    task_data = MonitorInfo(id="", command=ControlCommands.STOP)
-    for gateway in all_gateways:
-        task_data.id = gateway.gateway_tti_id
-        task_status.append(send_data(task_data, queue_name))
-
+    task_status = await run_in_threadpool(
+        send_bulk_data, [gateway["gateway_tti_id"] for gateway in all_gateways], ControlCommands.STOP, queue_name
+    )
     return {"task_status": "\n".join(task_status)}
 
 
-def start_monitor_all_gateway(db: Session):
-    all_gateways = get_all_gateways_from_db(db)
+async def start_monitor_all_gateway(db: AsyncSession):
+    all_gateways = (await db.run_sync(get_topology)).all("gateway")
     if not all_gateways:
         raise EntityNotFound(entity_name="gateway", entity_id="No gateways found")
 
     queue_name = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_queue")
-    task_status = []
-    task_data = MonitorInfo(id="", command=ControlCommands.START)
-    for gateway in all_gateways:
-        task_data.id = gateway.gateway_tti_id
-        task_status.append(send_data(task_data, queue_name))
-
+    task_status = await run_in_threadpool(
+        send_bulk_data, [gateway["gateway_tti_id"] for gateway in all_gateways], ControlCommands.START, queue_name
+    )
     return {"task_status": "\n".join(task_status)}
 
 
-def start_monitor_application(application_id: str, db: Session):
+async def start_monitor_application(application_id: str, db: AsyncSession):
     logger.debug("start_monitor_application")
-    db_application = get_application_from_db(application_id, db)
-    if not db_application:
+    topology = await db.run_sync(get_topology)
+    if not topology.get("application", application_id):
         raise EntityNotFound(entity_name="application", entity_id=application_id)
 
     queue_name = os.getenv("CONTROL_APPLICATION_QUEUE", "control_application_queue")
     task_data = MonitorInfo(id=application_id, command=ControlCommands.START)
-    task_status = send_data(task_data, queue_name)
+    task_status = await run_in_threadpool(send_data, task_data, queue_name)
     return {"task_status": task_status}
 
 
-def stop_monitor_application(application_id: str, db: Session):
+async def stop_monitor_application(application_id: str, db: AsyncSession):
     logger.debug("stop_monitor_application")
-    db_application = get_application_from_db(application_id, db)
-    if not db_application:
+    topology = await db.run_sync(get_topology)
+    if not topology.get("application", application_id):
         raise EntityNotFound(entity_name="application", entity_id=application_id)
 
     queue_name = os.getenv("CONTROL_APPLICATION_QUEUE", "control_application_queue")
     task_data = MonitorInfo(id=application_id, command=ControlCommands.STOP)
-    task_status = send_data(task_data, queue_name)
+    task_status = await run_in_threadpool(send_data, task_data, queue_name)
     return {"task_status": task_status}
 
 
-def start_monitor_all_application(db: Session):
-    all_applications = get_all_application_from_db(db)
+async def start_monitor_all_application(db: AsyncSession):
+    all_applications = (await db.run_sync(get_topology)).all("application")
     if not all_applications:
         raise EntityNotFound(entity_name="application", entity_id="No application found")
 
-    queue_name = os.getenv("CONTROL_APPLICATION_QUEUE")
-    task_status = []
-    task_data = MonitorInfo(id="", command=ControlCommands.START)
+    queue_name = os.getenv("CONTROL_APPLICATION_QUEUE", "control_application_queue")
     logger.debug(f"all_applications  {all_applications}")
-    for application in all_applications:
-        task_data.id = application.application_id
-        task_status.append(send_data(task_data, queue_name))
-
+    task_status = await run_in_threadpool(
+        send_bulk_data,
+        [application["application_id"] for application in all_applications],
+        ControlCommands.START,
+        queue_name,
+    )
     return {"task_status": "\n".join(task_status)}
 
 
-def stop_monitor_all_application(db: Session):
-    all_applications = get_all_application_from_db(db)
+async def stop_monitor_all_application(db: AsyncSession):
+    all_applications = (await db.run_sync(get_topology)).all("application")
     if not all_applications:
         raise EntityNotFound(entity_name="application", entity_id="No application found")
 
     queue_name = os.getenv("CONTROL_APPLICATION_QUEUE", "control_application_queue")
-    task_status = []
-    task_data = MonitorInfo(id="", command=ControlCommands.STOP)
-    for application in all_applications:
-        task_data.id = application.application_id
-        task_status.append(send_data(task_data, queue_name))
-
+    task_status = await run_in_threadpool(
+        send_bulk_data,
+        [application["application_id"] for application in all_applications],
+        ControlCommands.STOP,
+        queue_name,
+    )
     return {"task_status": "\n".join(task_status)}
 
 
-def stop_monitor_gateways_of_application(application_id: str, db: Session):
-    logger.debug("stop_monitor_gateways_of_application")
-    db_application = get_application_from_db(application_id, db)
-    if not db_application:
-        raise EntityNotFound(entity_name="application", entity_id=application_id)
-    task_status = []
-    application_queue_name = os.getenv("CONTROL_APPLICATION_QUEUE", "control_application_queue")
-    task_status.append(send_data(
-        MonitorInfo(id=application_id, command=ControlCommands.STOP), application_queue_name
-    ))
-
-    application_gateways_ids = get_gateways_for_application(application_id)
-    gw_queue_name = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_queue")
-
-    gw_task_data = MonitorInfo(id="", command=ControlCommands.STOP)
-    for gateway_id in application_gateways_ids:
-        gw_task_data.id = gateway_id
-        task_status.append(send_data(gw_task_data, gw_queue_name))
-    return {"task_status": "\n".join(task_status)}
+async def monitor_gateways_of_applications(application_ids: List[str], command: ControlCommands, db: AsyncSession):
+    """
+    Send the command for the applications and for all their gateways, as one bulk message per queue.
+    All the applications are checked before anything is sent.
+    """
 
+    def get_applications_gateways(session):
+        topology = get_topology(session)
+        gateways_ids = []
+        for application_id in application_ids:
+            if not topology.get("application", application_id):
+                raise EntityNotFound(entity_name="application", entity_id=application_id)
+            gateways_ids.extend(get_gateways_for_application(application_id, session))
+        return gateways_ids
 
-def start_monitor_gateways_of_application(application_id: str, db: Session):
-    logger.debug("start_monitor_gateways_of_application")
-    db_application = get_application_from_db(application_id, db)
-    if not db_application:
-        raise EntityNotFound(entity_name="application", entity_id=application_id)
+    application_gateways_ids = await db.run_sync(get_applications_gateways)
 
-    task_status = []
     application_queue_name = os.getenv("CONTROL_APPLICATION_QUEUE", "control_application_queue")
-    task_status.append(send_data(
-        MonitorInfo(id=application_id, command=ControlCommands.START), application_queue_name
-    ))
-
-    application_gateways_ids = get_gateways_for_application(application_id)
+    task_status = await run_in_threadpool(send_bulk_data, application_ids, command, application_queue_name)
     gw_queue_name = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_queue")
-    gw_task_data = MonitorInfo(id="", command=ControlCommands.START)
-    for gateway_id in application_gateways_ids:
-        gw_task_data.id = gateway_id
-        task_status.append(send_data(gw_task_data, gw_queue_name))
+    task_status.extend(await run_in_threadpool(send_bulk_data, application_gateways_ids, command, gw_queue_name))
     return {"task_status": "\n".join(task_status)}
 
 
-def stop_monitor_gateways_of_all_applications(application_ids: List[str], db):
-    logger.debug("stop_monitor_gateways_of_all_applications")
-    task_status = []
-    for application_id in application_ids:
-        db_application = get_application_from_db(application_id, db)
-        if not db_application:
-            raise EntityNotFound(entity_name="application", entity_id=application_id)
-
-        application_queue_name = os.getenv("CONTROL_APPLICATION_QUEUE", "control_application_queue")
-        task_status.append(send_data(
-            MonitorInfo(id=application_id, command=ControlCommands.STOP), application_queue_name
-        ))
-        application_gateways_ids = get_gateways_for_application(application_id)
-        gw_queue_name = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_queue")
-
-        gw_task_data = MonitorInfo(id="", command=ControlCommands.STOP)
-        for gateway_id in application_gateways_ids:
-            gw_task_data.id = gateway_id
-            task_status.append(send_data(gw_task_data, gw_queue_name))
+async def stop_monitor_gateways_of_application(application_id: str, db: AsyncSession):
+    logger.debug("stop_monitor_gateways_of_application")
+    return await monitor_gateways_of_applications([application_id], ControlCommands.STOP, db)
 
-    return {"task_status": "\n".join(task_status)}
+
+async def start_monitor_gateways_of_application(application_id: str, db: AsyncSession):
+    logger.debug("start_monitor_gateways_of_application")
+    return await monitor_gateways_of_applications([application_id], ControlCommands.START, db)
 
 
-def start_monitor_gateways_of_all_applications(application_ids: List[str], db):
+async def stop_monitor_gateways_of_all_applications(application_ids: List[str], db: AsyncSession):
     logger.debug("stop_monitor_gateways_of_all_applications")
-    task_status = []
-    for application_id in application_ids:
-        db_application = get_application_from_db(application_id, db)
-        if not db_application:
-            raise EntityNotFound(entity_name="application", entity_id=application_id)
-
-        application_queue_name = os.getenv("CONTROL_APPLICATION_QUEUE", "control_application_queue")
-        task_status.append(send_data(
-            MonitorInfo(id=application_id, command=ControlCommands.START), application_queue_name
-        ))
-
-        application_gateways_ids = get_gateways_for_application(application_id)
-        gw_queue_name = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_queue")
-        gw_task_data = MonitorInfo(id="", command=ControlCommands.START)
-        for gateway_id in application_gateways_ids:
-            gw_task_data.id = gateway_id
-            task_status.append(send_data(gw_task_data, gw_queue_name))
+    return await monitor_gateways_of_applications(application_ids, ControlCommands.STOP, db)
 
-    return {"task_status": "\n".join(task_status)}
+
+async def start_monitor_gateways_of_all_applications(application_ids: List[str], db: AsyncSession):
+    logger.debug("start_monitor_gateways_of_all_applications")
+    return await monitor_gateways_of_applications(application_ids, ControlCommands.START, db)
@@ -0,0 +1,159 @@
+"""
+The KPIs written by the KPI calculation service, read from the shared database.
+
+The percentiles of the uplinks and the number of distinct end devices heard over any horizon and
+scope (a gateway, a network, a cluster, ...) come from merging the sketches of the end devices,
+gateways and KPI intervals in it, so reading them never scans the raw uplinks.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+from sqlmodel import Session, select
+
+from dependencies import utility_functions
+from dependencies.config import logger_config
+from dependencies.exceptions import DatabaseError, EntityNotFound, ValidationError
+from dependencies.hyperloglog import merge_hyperloglogs
+from dependencies.sketches import merge_sketches
+from models.models import EndDeviceKPISketches, GatewayDeviceSketches
+from services.topology_services import get_entity_type, get_topology
+
+logger = utility_functions.get_logger(logger_config)
+
+SKETCH_COLUMNS = {
+    "snr": EndDeviceKPISketches.snr_sketch,
+    "rssi": EndDeviceKPISketches.rssi_sketch,
+    "latency": EndDeviceKPISketches.latency_sketch,
+}
+DEFAULT_QUANTILES = [0.05, 0.5, 0.95]
+
+
+def get_scope(session: Session, entity_type: str, entity_id: str) -> dict:
+    """
+    The gateways and end devices of an entity of the topology: a gateway or a node itself, the
+    gateways of a network, cluster, deployment or application.
+
+    :raises ValidationError: If the type is unknown.
+    :raises EntityNotFound: If there is no such entity.
+    :return: The TTI ids of the gateways, or of the end devices for a node.
+    """
+    get_entity_type(entity_type)
+    graph = get_topology(session)
+    entity = graph.get(entity_type, entity_id)
+    if entity is None:
+        raise EntityNotFound(entity_name=entity_type, entity_id=entity_id)
+    if entity_type == "node":
+        return {"device_ids": [entity["node_dev_id"]] if entity.get("node_dev_id") else []}
+    gateways = [entity] if entity_type == "gateway" else graph.descendants(entity_type, entity).get("gateway", [])
+    return {"gateway_ids": [gateway["gateway_tti_id"] for gateway in gateways if gateway.get("gateway_tti_id")]}
+
+
+def get_quantiles(
+        session: Session,
+        metric: str,
+        start_time: datetime,
+        end_time: datetime,
+        quantiles: Optional[List[float]] = None,
+        entity_type: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        device_ids: Optional[List[str]] = None,
+) -> dict:
+    """
+    The approximate percentiles of a metric of the uplinks of the KPI intervals starting between
+    ``start_time`` and ``end_time``.
+
+    :param metric: ``snr``, ``rssi`` or ``latency``.
+    :param quantiles: The quantiles, from 0 to 1.
+    :param entity_type: The type of the entity of the topology whose uplinks are read, all of them
+        when not given.
+    :param entity_id: The id of the entity.
+    :param device_ids: The end devices whose uplinks are read, all of them when not given.
+    :raises ValidationError: If the metric, a quantile or the type of the entity is invalid.
+    :raises EntityNotFound: If there is no such entity.
+    :raises DatabaseError: If the sketches could not be read.
+    """
+    column = SKETCH_COLUMNS.get(metric)
+    if column is None:
+        raise ValidationError(f"Unknown metric {metric}, expected one of {', '.join(SKETCH_COLUMNS)}")
+    quantiles = quantiles or DEFAULT_QUANTILES
+    if any(not 0 <= q <= 1 for q in quantiles):
+        raise ValidationError("The quantiles must be between 0 and 1")
+
+    query = select(column).where(
+        EndDeviceKPISketches.interval_start_time >= start_time,
+        EndDeviceKPISketches.interval_start_time < end_time,
+        column.is_not(None),
+    )
+    if entity_type is not None:
+        scope = get_scope(session, entity_type, entity_id)
+        if "gateway_ids" in scope:
+            query = query.where(EndDeviceKPISketches.gateway_id.in_(scope["gateway_ids"]))
+        else:
+            query = query.where(EndDeviceKPISketches.device_id.in_(scope["device_ids"]))
+    if device_ids:
+        query = query.where(EndDeviceKPISketches.device_id.in_(device_ids))
+    try:
+        sketch = merge_sketches(session.exec(query).all())
+    except Exception as e:
+        logger.error(f"Error in get_quantiles: {str(e)}")
+        raise DatabaseError("get_quantiles", str(e))
+
+    return {
+        "metric": metric,
+        "start_time": start_time,
+        "end_time": end_time,
+        "count": sketch.count,
+        "mean": sketch.mean(),
+        "min": sketch.min if sketch.count else None,
+        "max": sketch.max if sketch.count else None,
+        "quantiles": {str(q): sketch.quantile(q) for q in quantiles},
+    }
+
+
+def get_distinct_devices(
+        session: Session,
+        start_time: datetime,
+        end_time: datetime,
+        entity_type: Optional[str] = None,
+        entity_id: Optional[str] = None,
+) -> dict:
+    """
+    The approximate number of distinct end devices heard in the KPI intervals starting between
+    ``start_time`` and ``end_time``, a device heard by several gateways or in several intervals
+    counted once.
+
+    :param entity_type: The type of the entity of the topology whose gateways are read, all of them
+        when not given. A node is not a scope of gateways.
+    :param entity_id: The id of the entity.
+    :raises ValidationError: If the type of the entity is invalid.
+    :raises EntityNotFound: If there is no such entity.
+    :raises DatabaseError: If the sketches could not be read.
+    :return: The registered devices (by device id) and the unregistered ones (by device address).
+    """
+    query = select(GatewayDeviceSketches.device_sketch, GatewayDeviceSketches.dev_addr_sketch).where(
+        GatewayDeviceSketches.interval_start_time >= start_time,
+        GatewayDeviceSketches.interval_start_time < end_time,
+    )
+    if entity_type is not None:
+        if entity_type == "node":
+            raise ValidationError("The distinct devices are counted over gateways, not over a node")
+        scope = get_scope(session, entity_type, entity_id)
+        query = query.where(GatewayDeviceSketches.gateway_id.in_(scope["gateway_ids"]))
+    try:
+        rows = session.exec(query).all()
+        devices = merge_hyperloglogs(row[0] for row in rows)
+        dev_addrs = merge_hyperloglogs(row[1] for row in rows)
+    except Exception as e:
+        logger.error(f"Error in get_distinct_devices: {str(e)}")
+        raise DatabaseError("get_distinct_devices", str(e))
+
+    registered, unregistered = devices.count(), dev_addrs.count()
+    return {
+        "start_time": start_time,
+        "end_time": end_time,
+        "intervals": len(rows),
+        "devices": registered + unregistered,
+        "registered_devices": registered,
+        "unregistered_devices": unregistered,
+        "relative_error": devices.relative_error,
+    }
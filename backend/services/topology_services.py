@@ -0,0 +1,310 @@
+"""
+In-memory graph of the topology: deployments -> clusters -> networks -> gateways and nodes, and the
+applications of the networks and nodes.
+
+Each entity type is loaded with one query and its entities are indexed by every id (TTI id, TB id,
+EUI, dev_addr) and by the id of their parent, so resolving an id or the ancestors of an entity is a
+few dict lookups, and listing descendants costs the size of the result.
+
+Commits keep the graph up to date: the rows written through the ORM are applied to it, and an entity
+type written by a bulk statement (INSERT ... ON CONFLICT, DELETE ... WHERE) is reloaded on its next
+use. Every type is also reloaded ``TOPOLOGY_GRAPH_TTL`` seconds after its last load, for the writes
+of the other processes. The gateways heard by an application are not in the graph: the TTI message
+consumer writes them.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+
+from dependencies import utility_functions
+from dependencies.config import logger_config, topology_config
+from dependencies.exceptions import DatabaseError, EntityNotFound, ValidationError
+from models.models import Application, Cluster, Deployment, Gateway, Network, Node
+
+logger = utility_functions.get_logger(logger_config)
+
+
+class EntityType:
+    """
+    An entity type of the graph.
+
+    :param name: The name of the type in the API.
+    :param model: The table of the entities.
+    :param ids: The columns identifying an entity, the first one is its id in the API.
+    :param parent: The parent type and the column holding the id of the parent.
+    :param children: The child types and their column holding the id of the entity.
+    """
+
+    def __init__(self, name: str, model, ids: List[str], parent: Optional[Tuple[str, str]] = None,
+                 children: Tuple[Tuple[str, str], ...] = ()):
+        self.name = name
+        self.model = model
+        self.ids = ids
+        self.key = ids[0]
+        self.parent = parent
+        self.children = children
+        # The ids and the columns referencing the parent or the application
+        self.indexed = ids + [column for column in ("deployment_id", "cluster_id", "network_id", "application_id")
+                              if column in model.__table__.columns and column not in ids]
+
+
+ENTITY_TYPES = {entity_type.name: entity_type for entity_type in (
+    EntityType("deployment", Deployment, ["deployment_id"], children=(("cluster", "deployment_id"),)),
+    EntityType("cluster", Cluster, ["cluster_id"], parent=("deployment", "deployment_id"),
+               children=(("network", "cluster_id"),)),
+    EntityType("network", Network, ["network_id"], parent=("cluster", "cluster_id"),
+               children=(("gateway", "network_id"), ("node", "network_id"))),
+    EntityType("gateway", Gateway, ["gateway_tti_id", "gateway_tb_id", "gateway_eui"], parent=("network", "network_id")),
+    EntityType("node", Node, ["node_eui", "node_tb_id", "node_dev_id", "node_dev_addr"], parent=("network", "network_id")),
+    EntityType("application", Application, ["application_id"],
+               children=(("network", "application_id"), ("node", "application_id"))),
+)}
+TABLE_TYPES = {entity_type.model.__tablename__: entity_type for entity_type in ENTITY_TYPES.values()}
+
+
+def get_entity_type(name: str) -> EntityType:
+    entity_type = ENTITY_TYPES.get(name)
+    if entity_type is None:
+        raise ValidationError(f"Unknown entity type {name}, expected one of {', '.join(ENTITY_TYPES)}")
+    return entity_type
+
+
+def public(entity: dict) -> dict:
+    """The fields of ``entity`` returned by the API, without its primary key."""
+    return {field: value for field, value in entity.items() if field != "id"}
+
+
+class TopologyGraph:
+    def __init__(self, ttl: float = topology_config.ttl, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.RLock()
+        # Type -> primary key -> entity
+        self.entities: Dict[str, Dict[int, dict]] = {name: {} for name in ENTITY_TYPES}
+        # Type -> column -> value -> primary keys
+        self.indexes: Dict[str, Dict[str, Dict[Any, Set[int]]]] = {
+            name: {column: {} for column in entity_type.indexed} for name, entity_type in ENTITY_TYPES.items()
+        }
+        # Type -> time of its last load, None until it is loaded again
+        self.loaded_at: Dict[str, Optional[float]] = {name: None for name in ENTITY_TYPES}
+
+    def invalidate(self, *names: str) -> None:
+        """Reloads the types ``names``, all of them by default, on their next use."""
+        with self.lock:
+            for name in names or ENTITY_TYPES:
+                self.loaded_at[name] = None
+
+    def refresh(self, session: Session) -> "TopologyGraph":
+        """Loads from ``session`` the types invalidated or loaded more than ``ttl`` seconds ago."""
+        with self.lock:
+            now = self.clock()
+            for name, loaded_at in self.loaded_at.items():
+                if loaded_at is None or now - loaded_at >= self.ttl:
+                    self.load(session, ENTITY_TYPES[name])
+        return self
+
+    def load(self, session: Session, entity_type: EntityType) -> None:
+        """
+        Replaces the entities of ``entity_type`` by its rows. They are read under the lock, so the
+        changes of a commit are applied to the graph after the rows are swapped, not overwritten.
+        """
+        table = entity_type.model.__table__
+        with self.lock:
+            try:
+                rows = session.execute(select(table).order_by(table.c.id)).mappings().all()
+            except Exception as e:
+                raise DatabaseError("load_topology", str(e))
+            self.entities[entity_type.name] = {}
+            self.indexes[entity_type.name] = {column: {} for column in entity_type.indexed}
+            for row in rows:
+                self.put(entity_type, dict(row))
+            self.loaded_at[entity_type.name] = self.clock()
+        logger.debug(f"Loaded {len(rows)} {entity_type.name} entities in the topology graph")
+
+    def put(self, entity_type: EntityType, entity: dict) -> None:
+        """Adds ``entity`` or replaces the entity with its primary key."""
+        with self.lock:
+            self.remove(entity_type, entity["id"])
+            self.entities[entity_type.name][entity["id"]] = entity
+            indexes = self.indexes[entity_type.name]
+            for column in entity_type.indexed:
+                if entity.get(column) is not None:
+                    indexes[column].setdefault(entity[column], set()).add(entity["id"])
+
+    def remove(self, entity_type: EntityType, entity_id: int) -> None:
+        with self.lock:
+            entity = self.entities[entity_type.name].pop(entity_id, None)
+            if entity is None:
+                return
+            indexes = self.indexes[entity_type.name]
+            for column in entity_type.indexed:
+                ids = indexes[column].get(entity.get(column))
+                if ids is not None:
+                    ids.discard(entity_id)
+                    if not ids:
+                        del indexes[column][entity[column]]
+
+    def apply(self, changes: List[Tuple[str, str, Any]], written_types: Set[str]) -> None:
+        """Applies the changes of a commit: the rows written or deleted and the types written in bulk."""
+        with self.lock:
+            for change, name, value in changes:
+                if self.loaded_at[name] is None:
+                    continue
+                if change == "put":
+                    self.put(ENTITY_TYPES[name], value)
+                else:
+                    self.remove(ENTITY_TYPES[name], value)
+            if written_types:
+                self.invalidate(*written_types)
+
+    def find(self, name: str, column: str, value: Any) -> List[dict]:
+        """The entities of type ``name`` whose ``column`` is ``value``."""
+        with self.lock:
+            entities = self.entities[name]
+            return [entities[entity_id] for entity_id in sorted(self.indexes[name][column].get(value, ()))]
+
+    def get(self, name: str, value: Any) -> Optional[dict]:
+        """The entity of type ``name`` identified by ``value`` in the API, None if there is none."""
+        found = self.find(name, ENTITY_TYPES[name].key, value)
+        return found[0] if found else None
+
+    def all(self, name: str) -> List[dict]:
+        with self.lock:
+            return [self.entities[name][entity_id] for entity_id in sorted(self.entities[name])]
+
+    def resolve(self, value: Any) -> List[dict]:
+        """The entities that any of their ids identifies as ``value``, with their type and that id."""
+        matches = []
+        for entity_type in ENTITY_TYPES.values():
+            for column in entity_type.ids:
+                for entity in self.find(entity_type.name, column, value):
+                    matches.append({"type": entity_type.name, "field": column, "entity": entity})
+        return matches
+
+    def ancestors(self, name: str, entity: dict) -> Dict[str, dict]:
+        """The parent of ``entity``, the parent of its parent, etc., by type."""
+        ancestors = {}
+        parent = ENTITY_TYPES[name].parent
+        while parent is not None:
+            parent_name, column = parent
+            entity = self.get(parent_name, entity.get(column)) if entity.get(column) is not None else None
+            if entity is None:
+                break
+            ancestors[parent_name] = entity
+            parent = ENTITY_TYPES[parent_name].parent
+        return ancestors
+
+    def descendants(self, name: str, entity: dict) -> Dict[str, List[dict]]:
+        """The children of ``entity``, the children of its children, etc., by type."""
+        descendants: Dict[str, Dict[int, dict]] = {}
+        pending = [(name, entity)]
+        while pending:
+            name, entity = pending.pop()
+            key = entity.get(ENTITY_TYPES[name].key)
+            if key is None:
+                continue
+            for child_name, column in ENTITY_TYPES[name].children:
+                for child in self.find(child_name, column, key):
+                    if child["id"] not in descendants.setdefault(child_name, {}):
+                        descendants[child_name][child["id"]] = child
+                        pending.append((child_name, child))
+        return {child_name: list(children.values()) for child_name, children in descendants.items()}
+
+
+topology = TopologyGraph()
+
+CHANGES = "topology_changes"
+WRITTEN_TYPES = "topology_written_types"
+
+
+def get_topology(session: Session) -> TopologyGraph:
+    """The topology graph, with the outdated types loaded from ``session``."""
+    return topology.refresh(session)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def record_flushed_entities(session, flush_context) -> None:
+    changes = session.info.setdefault(CHANGES, [])
+    for instance in list(session.new) + list(session.dirty):
+        entity_type = TABLE_TYPES.get(getattr(instance, "__tablename__", None))
+        if entity_type is not None:
+            entity = {column.name: getattr(instance, column.name) for column in entity_type.model.__table__.columns}
+            changes.append(("put", entity_type.name, entity))
+    for instance in session.deleted:
+        entity_type = TABLE_TYPES.get(getattr(instance, "__tablename__", None))
+        if entity_type is not None:
+            changes.append(("remove", entity_type.name, instance.id))
+
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def record_bulk_statements(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        entity_type = TABLE_TYPES.get(getattr(orm_execute_state.statement.table, "name", None))
+        if entity_type is not None:
+            orm_execute_state.session.info.setdefault(WRITTEN_TYPES, set()).add(entity_type.name)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def apply_committed_changes(session) -> None:
+    changes = session.info.pop(CHANGES, [])
+    written_types = session.info.pop(WRITTEN_TYPES, set())
+    if changes or written_types:
+        topology.apply(changes, written_types)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def discard_rolled_back_changes(session) -> None:
+    session.info.pop(CHANGES, None)
+    session.info.pop(WRITTEN_TYPES, None)
+
+
+def resolve_ids(session: Session, ids: List[str]) -> Dict[str, List[dict]]:
+    """
+    Resolves each of ``ids`` to the entities it identifies, with their type, the field matching the
+    id and the ancestors of the entity.
+
+    :param session: The database session, to load the outdated parts of the graph.
+    :param ids: The ids, of any type and field.
+    :raises DatabaseError: If the graph could not be loaded.
+    :return: The matches of every id, an empty list for an unknown id.
+    """
+    graph = get_topology(session)
+    return {
+        value: [
+            dict(
+                type=match["type"],
+                field=match["field"],
+                entity=public(match["entity"]),
+                ancestors={name: public(ancestor) for name, ancestor in graph.ancestors(match["type"], match["entity"]).items()},
+            )
+            for match in graph.resolve(value)
+        ]
+        for value in dict.fromkeys(ids)
+    }
+
+
+def get_hierarchy(session: Session, name: str, entity_id: str) -> dict:
+    """
+    The entity of type ``name`` identified by ``entity_id``, its ancestors and its descendants.
+
+    :raises ValidationError: If the type is unknown.
+    :raises EntityNotFound: If there is no such entity.
+    :raises DatabaseError: If the graph could not be loaded.
+    """
+    get_entity_type(name)
+    graph = get_topology(session)
+    entity = graph.get(name, entity_id)
+    if entity is None:
+        raise EntityNotFound(entity_name=name, entity_id=entity_id)
+    return {
+        "entity": public(entity),
+        "ancestors": {ancestor_name: public(ancestor) for ancestor_name, ancestor in graph.ancestors(name, entity).items()},
+        "descendants": {
+            child_name: [public(child) for child in children]
+            for child_name, children in graph.descendants(name, entity).items()
+        },
+    }
@@ -1,176 +1,490 @@
+import queue
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
 from fastapi import Depends
 from sqlmodel import Session
+from sqlmodel import col
+from sqlmodel import select
 
 from database.db import get_session
 from dependencies import utility_functions
-from dependencies.config import logger_config
-from dependencies.exceptions import RequestError, DatabaseError, TTIException, EntityAlreadyExists
-from models.models import ApplicationBase
-from schemas.schemas import GatewayCreate
-from schemas.schemas import NodeCreate
-from .application_services import ApplicationService
-from .gateway_services import create_gateway
-from .node_services import create_node
+from dependencies.config import logger_config, sync_config
+from dependencies.exceptions import DatabaseError
+from dependencies.metrics import registry
+from models.models import Application
+from models.models import Gateway
+from models.models import Node
+from models.models import SyncCursor
 from .utility_services import TTI_AUTH
 from .utility_services import TTI_BASE_URL
+from .utility_services import content_digest
+from .utility_services import delete_rows
 from .utility_services import get_node_device_addr
-from .utility_services import make_get_tti_request
+from .utility_services import get_sync_cursor
+from .utility_services import iter_tti_pages
+from .utility_services import parse_timestamp
+from .utility_services import save_sync_cursor
+from .utility_services import upsert_rows
 
 logger = utility_functions.get_logger(logger_config)
 
+IMPORT_PHASE_SECONDS = registry.histogram(
+    "tti_import_phase_seconds", "Time spent in each phase of the TTI registry import", ["phase"]
+)
 
-def get_all_registered_tti_gateways(db: Session) -> str:
-    logger.debug("get_all_registered_tti_gateways")
-    req_url = f"{TTI_BASE_URL}gateways"
+# The fields of the TTI list APIs the import uses besides the ids
+GATEWAY_FIELD_MASK = "created_at,updated_at"
+APPLICATION_FIELD_MASK = "created_at,updated_at"
 
-    try:
-        all_tti_gateways = make_get_tti_request(req_url, TTI_AUTH)["gateways"]
-    except Exception as e:
-        logger.exception(f"Failed to get TTI gateways in the function get_all_registered_tti_gateways: {str(e)}")
-        return f"Failed to get TTI gateways due to an error: {str(e)}"
+# The sources of the synchronization cursors of the TTI registry
+GATEWAYS_SOURCE = "tti:gateways"
+APPLICATIONS_SOURCE = "tti:applications"
+END_DEVICES_SOURCE = "tti:end_devices:"
+
+
+def get_dev_addr(end_device: dict) -> Optional[str]:
+    """The dev_addr of a listed end device, when the listing carries it."""
+    return end_device["ids"].get("dev_addr") or end_device.get("session", {}).get("dev_addr")
+
+
+class TtiRegistryImporter:
+    """
+    Imports the gateways, applications and end devices registered in TTI.
 
-    response_error_info = []
-    for gateway in all_tti_gateways:
+    The TTI list APIs are read one page of ``page_size`` entities at a time, and every page is
+    upserted on the unique key of its rows (INSERT ... ON CONFLICT): the entities already in the
+    database are updated instead of failing the import. The end devices of the applications are
+    listed on ``max_workers`` threads while the pages they return are written; the dev_addr of a
+    device is taken from the listing (``TTI_END_DEVICE_FIELD_MASK``) and only looked up on the
+    network server for the devices the listing does not carry it for.
+
+    An ``incremental`` import only writes what changed since the last run, which is recorded in a
+    ``SyncCursor`` per source. The gateways and applications are listed by descending update time,
+    down to the most recent update of the last run, and the ones the TTI lists as deleted are
+    deleted. The TTI can neither filter the end devices by update time nor list the deleted ones:
+    the devices of each application are listed and compared with the last run by content hash, see
+    ``sync_end_devices``.
+
+    ``timings`` holds the seconds spent in each phase, ``changes`` the number of rows written or
+    deleted, ``errors`` what could not be imported.
+    """
+
+    def __init__(self, db: Session, max_workers: int = sync_config.max_workers,
+                 page_size: int = sync_config.tti_page_size, incremental: bool = False):
+        self.db = db
+        self.max_workers = max_workers
+        self.page_size = page_size
+        self.incremental = incremental
+        self.timings: Dict[str, float] = {}
+        self.changes: Counter = Counter()
+        self.errors: List[str] = []
+        # Source -> updated_at of the most recently updated entity listed
+        self.cursors: Dict[str, Optional[str]] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
         try:
-            gateway_model = GatewayCreate(
-                gateway_tti_id=gateway["ids"].get("gateway_id"),
-                gateway_eui=gateway["ids"].get("eui"),
-                created_at=gateway.get("created_at"),
-                updated_at=gateway.get("updated_at"),
-                gateway_tb_id="None",
-                name=None,
-                description=None,
-                frequency_plan=None,
-                location=None,
-                network_id=None,
-            )
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            IMPORT_PHASE_SECONDS.labels(name).observe(elapsed)
 
-            create_gateway(db, gateway_model)
+    def report(self, task_name: str) -> str:
+        timings = ", ".join(f"{name}={seconds:.3f}s" for name, seconds in self.timings.items())
+        changes = ", ".join(f"{name}={count}" for name, count in self.changes.items() if count)
+        if changes:
+            timings = f"{timings}\nChanges: {changes}"
+        logger.info(f"{task_name} timings: {timings}")
+        if self.errors:
+            error_message = "\n".join(self.errors)
+            return f"{task_name} Task completed with errors:\n{error_message}\nTimings: {timings}"
+        return f"{task_name} Task completed successfully.\nTimings: {timings}"
+
+    def list_changed(self, url: str, list_name: str, field_mask: str, source: str) -> Iterator[List[dict]]:
+        """
+        Yields the pages of a TTI list API by descending update time. Incrementally, the listing
+        stops at the first entity updated before the cursor of ``source``; the entities updated at
+        the cursor itself are listed again, as they may have been updated after the last run read them.
+        """
+        cursor = get_sync_cursor(self.db, source) if self.incremental else None
+        since = parse_timestamp(cursor.cursor) if cursor is not None else None
+        latest, latest_at = (cursor.cursor, since) if cursor is not None else (None, None)
+        try:
+            for page in iter_tti_pages(url, list_name, TTI_AUTH, field_mask, self.page_size, {"order": "-updated_at"}):
+                changed = []
+                for entity in page:
+                    updated_at = parse_timestamp(entity.get("updated_at"))
+                    if since is not None and updated_at is not None and updated_at < since:
+                        break
+                    changed.append(entity)
+                    if updated_at is not None and (latest_at is None or updated_at > latest_at):
+                        latest, latest_at = entity["updated_at"], updated_at
+                if changed:
+                    yield changed
+                if len(changed) < len(page):
+                    return
+        finally:
+            self.cursors[source] = latest
+
+    def save_cursor(self, source: str) -> None:
+        try:
+            save_sync_cursor(self.db, source, cursor=self.cursors.get(source))
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
 
+    def delete_removed(self, url: str, list_name: str, id_field: str, delete: Callable[[List[str]], int]) -> None:
+        """Deletes the rows of the entities the TTI lists as deleted, which it keeps until they are purged."""
+        try:
+            with self.phase(f"list_deleted_{list_name}"):
+                pages = iter_tti_pages(url, list_name, TTI_AUTH, "deleted_at", self.page_size, {"deleted": "true"})
+                deleted_ids = [entity["ids"].get(id_field) for page in pages for entity in page]
         except Exception as e:
-            logger.debug(f"{repr(e)}")
-            response_error_info.append(f"{repr(e)}")
+            logger.error(f"Failed to list the deleted TTI {list_name}: {str(e)}")
+            self.errors.append(f"Failed to list the deleted {list_name}: {str(e)}")
+            return
+        with self.phase(f"delete_{list_name}"):
+            try:
+                self.changes[f"deleted_{list_name}"] += delete(deleted_ids)
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
 
-    if response_error_info:
-        error_message = '\n'.join(response_error_info)
-        return f"Get All Registered TTI Gateways Task completed with errors:\n{error_message}"
-    else:
-        return "Get All Registered TTI Gateways Task completed successfully."
+    def write_pages(self, pages, list_phase: str, upsert_phase: str, upsert) -> List[dict]:
+        """Reads the pages of a list API and upserts each one before reading the next."""
+        entities = []
+        while True:
+            with self.phase(list_phase):
+                page = next(pages, None)
+            if page is None:
+                return entities
+            with self.phase(upsert_phase):
+                try:
+                    upsert(page)
+                    self.db.commit()
+                except Exception:
+                    self.db.rollback()
+                    raise
+            entities.extend(page)
 
+    def upsert_gateways(self, gateways: List[dict]) -> None:
+        rows = [
+            {
+                "gateway_tti_id": gateway["ids"].get("gateway_id"),
+                "gateway_eui": gateway["ids"].get("eui"),
+                "created_at": gateway.get("created_at"),
+                "updated_at": gateway.get("updated_at"),
+                "gateway_tb_id": "None",
+            }
+            for gateway in gateways
+        ]
+        upsert_rows(self.db, Gateway, rows, "gateway_tti_id", ["gateway_eui", "created_at", "updated_at"])
 
-def get_all_registered_tti_end_devices_given_application_id(db: Session, application_id):
-    logger.debug("get_all_registered_tti_end_devices_given_application_id")
-    req_url = f"{TTI_BASE_URL}applications/{application_id}/devices"
-    response_error_info = []
-    try:
-        response_data = make_get_tti_request(req_url, TTI_AUTH)
-        all_end_devices = response_data.get("end_devices", [])
-    except Exception as e:
-        logger.debug(f"Failed to get TTI get_all_registered_tti_end_devices_given_application_id: {str(e)}")
-        return f"Failed to get_all_registered_tti_end_devices_given_application_id due to an error: {str(e)}"
+    def upsert_applications(self, applications: List[dict]) -> None:
+        rows = [
+            {
+                "application_id": application["ids"].get("application_id"),
+                "created_at": application.get("created_at"),
+                "updated_at": application.get("updated_at"),
+            }
+            for application in applications
+        ]
+        upsert_rows(self.db, Application, rows, "application_id", ["created_at", "updated_at"])
 
-    for end_device in all_end_devices:
-        node_dev_id = end_device["ids"].get("device_id")
-        if not node_dev_id:
-            continue
-        try:
-            node_dev_addr = get_node_device_addr(application_id, node_dev_id)
-
-            end_device_model = NodeCreate(
-                node_dev_id=node_dev_id,
-                node_dev_addr=node_dev_addr,
-                created_at=end_device.get("created_at"),
-                updated_at=end_device.get("updated_at"),
-                node_eui=end_device["ids"].get("dev_eui"),
-                join_eui=end_device["ids"].get("join_eui"),
-                application_id=application_id,
+    def upsert_end_devices(self, rows: List[dict]) -> None:
+        upsert_rows(
+            self.db, Node, rows, "node_eui",
+            ["node_dev_id", "node_dev_addr", "created_at", "updated_at", "join_eui", "application_id"],
+        )
+
+    def delete_gateways(self, gateway_ids: List[str]) -> int:
+        return delete_rows(self.db, Gateway, "gateway_tti_id", gateway_ids)
+
+    def delete_applications(self, application_ids: List[str]) -> int:
+        """Deletes the applications with the nodes imported from their end devices."""
+        self.delete_nodes_of_applications(application_ids)
+        delete_rows(
+            self.db, SyncCursor, "source", [END_DEVICES_SOURCE + application_id for application_id in application_ids]
+        )
+        return delete_rows(self.db, Application, "application_id", application_ids)
+
+    def delete_nodes_of_applications(self, application_ids: List[str], node_euis: Optional[List[str]] = None) -> None:
+        """
+        Deletes the nodes of the applications imported from TTI end devices, all of them or the ones of
+        ``node_euis``. The nodes only known from the CMT have no update time of the TTI and are kept.
+        """
+        imported = col(Node.updated_at).isnot(None)
+        if node_euis is None:
+            deleted = delete_rows(self.db, Node, "application_id", application_ids, imported)
+        else:
+            deleted = delete_rows(
+                self.db, Node, "node_eui", node_euis, imported, col(Node.application_id).in_(application_ids)
             )
-            create_node(db, end_device_model)
+        self.changes["deleted_end_devices"] += deleted
 
-        except (ValueError, RequestError, TTIException) as e:
-            logger.error(f"Failed to get TTI get_node_device_addr: {str(e)}")
-            response_error_info.append(f"Failed to get TTI get_node_device_addr = {node_dev_id}")
+    def import_gateways(self) -> List[dict]:
+        url = f"{TTI_BASE_URL}gateways"
+        pages = self.list_changed(url, "gateways", GATEWAY_FIELD_MASK, GATEWAYS_SOURCE)
+        gateways = self.write_pages(pages, "list_gateways", "upsert_gateways", self.upsert_gateways)
+        self.changes["upserted_gateways"] += len(gateways)
+        if self.incremental:
+            self.delete_removed(url, "gateways", "gateway_id", self.delete_gateways)
+        self.save_cursor(GATEWAYS_SOURCE)
+        return gateways
 
-        except EntityAlreadyExists as e:
-            logger.error(f" get_all_registered_tti_end_devices_given_application_id : {str(e)}")
-            response_error_info.append(f" application_id = {node_dev_id} AlreadyExists")
+    def import_applications(self, application_id: Optional[str] = None) -> List[str]:
+        """
+        Imports all the applications, or only ``application_id``, and returns their ids. Incrementally,
+        only the applications updated since the last run are imported and returned.
+        """
+        url = f"{TTI_BASE_URL}applications"
+        if application_id is not None:
+            pages = (
+                [application for application in page if application["ids"].get("application_id") == application_id]
+                for page in iter_tti_pages(url, "applications", TTI_AUTH, APPLICATION_FIELD_MASK, self.page_size)
+            )
+        else:
+            pages = self.list_changed(url, "applications", APPLICATION_FIELD_MASK, APPLICATIONS_SOURCE)
+        applications = self.write_pages(pages, "list_applications", "upsert_applications", self.upsert_applications)
+        self.changes["upserted_applications"] += len(applications)
+        if application_id is None:
+            if self.incremental:
+                self.delete_removed(url, "applications", "application_id", self.delete_applications)
+            self.save_cursor(APPLICATIONS_SOURCE)
+        return [application["ids"].get("application_id") for application in applications]
 
-        except DatabaseError as e:
-            logger.error(f"DatabaseError In function get_all_registered_tti_end_devices_given_application_id: {str(e)}")
-            response_error_info.append(f"DatabaseError while adding node_dev_id   = {node_dev_id}")
-        except Exception as e:
-            logger.debug(f"{repr(e)}")
-            response_error_info.append(f"{repr(e)}")
+    def end_device_rows(self, application_id: str, end_devices: List[dict], lookups: ThreadPoolExecutor):
+        rows = []
+        for end_device in end_devices:
+            node_dev_id = end_device["ids"].get("device_id")
+            if not node_dev_id:
+                continue
+            if not end_device["ids"].get("dev_eui"):
+                # The nodes are identified by their EUI
+                self.errors.append(f"node_dev_id = {node_dev_id} has no dev_eui")
+                continue
+            rows.append({
+                "node_dev_id": node_dev_id,
+                "node_dev_addr": get_dev_addr(end_device),
+                "created_at": end_device.get("created_at"),
+                "updated_at": end_device.get("updated_at"),
+                "node_eui": end_device["ids"].get("dev_eui"),
+                "join_eui": end_device["ids"].get("join_eui"),
+                "application_id": application_id,
+            })
+        missing = [row for row in rows if not row["node_dev_addr"]]
+        for row in missing:
+            # The device may have joined again since its dev_addr was cached
+            get_node_device_addr.invalidate(application_id, row["node_dev_id"])
+        lookup_errors = set()
+        for row, future in [
+            (row, lookups.submit(get_node_device_addr, application_id, row["node_dev_id"])) for row in missing
+        ]:
+            try:
+                row["node_dev_addr"] = future.result()
+            except Exception as e:
+                logger.error(f"Failed to get TTI get_node_device_addr: {str(e)}")
+                self.errors.append(f"Failed to get TTI get_node_device_addr = {row['node_dev_id']}")
+                lookup_errors.add(row["node_dev_id"])
+        return [row for row in rows if row["node_dev_id"] not in lookup_errors]
 
-    if response_error_info:
-        error_message = "\n".join(response_error_info)
-        return f"Get All Registered TTI End Devices Given Application Id Task completed with errors:\n{error_message}"
-    else:
-        return "Get All Registered TTI End Devices Given Application Id Task completed successfully."
+    def import_end_devices(self, application_ids: List[str]) -> int:
+        """
+        Lists the end devices of the applications concurrently and upserts the pages on this
+        thread, which owns the database session, as they arrive.
+        """
+        # Bounded, so the listing waits for the database instead of piling pages up in memory
+        pages = queue.Queue(maxsize=2 * self.max_workers)
 
+        def list_end_devices(application_id: str) -> None:
+            error = None
+            try:
+                for page in iter_tti_pages(
+                        f"{TTI_BASE_URL}applications/{application_id}/devices",
+                        "end_devices",
+                        TTI_AUTH,
+                        sync_config.tti_end_device_field_mask,
+                        self.page_size,
+                ):
+                    pages.put((application_id, self.end_device_rows(application_id, page, lookups), None))
+            except Exception as e:
+                error = e
+            pages.put((application_id, None, error))
 
-def get_all_registered_tti_application(db: Session):
-    req_url = f"{TTI_BASE_URL}applications"
-    try:
-        all_tti_applications = make_get_tti_request(req_url, TTI_AUTH)["applications"]
-    except Exception as e:
-        logger.debug(f"Failed to get_all_registered_tti_application: {str(e)}")
-        return f"Failed to get_all_registered_tti_application due to an error: {str(e)}"
+        imported = 0
+        with self.phase("import_end_devices"), \
+                ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tti_lookup") as lookups, \
+                ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tti_import") as listings:
+            for application_id in application_ids:
+                listings.submit(list_end_devices, application_id)
+            pending = len(application_ids)
+            while pending:
+                application_id, rows, error = pages.get()
+                if rows is None:
+                    pending -= 1
+                    if error is not None:
+                        logger.debug(f"Failed to get TTI end devices of {application_id}: {str(error)}")
+                        self.errors.append(
+                            f"Failed to get the end devices of the application {application_id}: {str(error)}"
+                        )
+                    continue
+                try:
+                    with self.phase("upsert_end_devices"):
+                        self.upsert_end_devices(rows)
+                        self.db.commit()
+                    imported += len(rows)
+                except Exception as e:
+                    self.db.rollback()
+                    logger.error(f"DatabaseError while adding the end devices of {application_id}: {str(e)}")
+                    self.errors.append(f"DatabaseError while adding the end devices of {application_id}: {str(e)}")
+        self.changes["upserted_end_devices"] += imported
+        return imported
 
-    response_error_info = []
-    for application in all_tti_applications:
-        new_application = ApplicationBase(
-            application_id=application["ids"].get("application_id"),
-            created_at=application["created_at"],
-            updated_at=application["updated_at"],
+    def list_end_devices(self, application_id: str) -> List[dict]:
+        return [
+            end_device
+            for page in iter_tti_pages(
+                f"{TTI_BASE_URL}applications/{application_id}/devices",
+                "end_devices",
+                TTI_AUTH,
+                sync_config.tti_end_device_field_mask,
+                self.page_size,
+            )
+            for end_device in page
+        ]
+
+    def apply_end_device_changes(self, application_id: str, end_devices: List[dict], lookups: ThreadPoolExecutor):
+        """
+        Writes the end devices of an application added or updated since the last run, and deletes the
+        nodes imported from the end devices it no longer lists. Nothing is read from the database when
+        the content hash of the listing is the one of the last run.
+        """
+        source = END_DEVICES_SOURCE + application_id
+        digest = content_digest(
+            [end_device["ids"].get("dev_eui"), end_device.get("updated_at"), get_dev_addr(end_device)]
+            for end_device in end_devices
         )
-        response_error_info.append(get_all_registered_tti_end_devices_given_application_id(db,
-                                                                                           new_application.application_id))
+        cursor = get_sync_cursor(self.db, source)
+        if cursor is not None and cursor.digest == digest:
+            self.changes["unchanged_applications"] += 1
+            return
+        stored = {
+            node_eui: (updated_at, node_dev_addr)
+            for node_eui, updated_at, node_dev_addr in self.db.exec(
+                select(Node.node_eui, Node.updated_at, Node.node_dev_addr).where(Node.application_id == application_id)
+            ).all()
+        }
+        changed = [
+            end_device
+            for end_device in end_devices
+            if end_device["ids"].get("dev_eui") not in stored
+            or stored[end_device["ids"]["dev_eui"]][0] != end_device.get("updated_at")
+            or get_dev_addr(end_device) not in (None, stored[end_device["ids"]["dev_eui"]][1])
+        ]
+        rows = self.end_device_rows(application_id, changed, lookups)
+        listed = {end_device["ids"].get("dev_eui") for end_device in end_devices}
+        removed = [node_eui for node_eui in stored if node_eui not in listed]
+        with self.phase("upsert_end_devices"):
+            try:
+                self.upsert_end_devices(rows)
+                self.delete_nodes_of_applications([application_id], removed)
+                # A device whose dev_addr could not be looked up is retried by the next run
+                expected = [end_device for end_device in changed if end_device["ids"].get("device_id")]
+                if len(rows) == len([end_device for end_device in expected if end_device["ids"].get("dev_eui")]):
+                    save_sync_cursor(self.db, source, digest=digest)
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+        self.changes["upserted_end_devices"] += len(rows)
+
+    def sync_end_devices(self, application_ids: List[str]) -> None:
+        """
+        Incremental import of the end devices of the applications: the devices of each application are
+        listed on ``max_workers`` threads and the changes of each listing are applied on this thread,
+        which owns the database session, as they arrive.
+        """
+        with self.phase("sync_end_devices"), \
+                ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tti_lookup") as lookups, \
+                ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tti_import") as listings:
+            listed = {listings.submit(self.list_end_devices, application_id): application_id
+                      for application_id in application_ids}
+            for future in as_completed(listed):
+                application_id = listed[future]
+                try:
+                    self.apply_end_device_changes(application_id, future.result(), lookups)
+                except Exception as e:
+                    logger.error(f"Failed to synchronize the TTI end devices of {application_id}: {str(e)}")
+                    self.errors.append(
+                        f"Failed to synchronize the end devices of the application {application_id}: {str(e)}"
+                    )
+
+    def get_application_ids(self) -> List[str]:
         try:
-            ApplicationService.create_application(db, new_application)
+            return list(self.db.exec(select(Application.application_id)).all())
         except Exception as e:
-            logger.debug(f"{repr(e)}")
-            response_error_info.append(f"{repr(e)}")
+            raise DatabaseError("get_application_ids", str(e))
 
-    if response_error_info:
-        error_message = "\n".join(response_error_info)
-        return f"Get All Registered TTI Application Task completed with errors:\n{error_message}"
+
+def get_all_registered_tti_gateways(db: Session, incremental: bool = False) -> str:
+    logger.debug("get_all_registered_tti_gateways")
+    importer = TtiRegistryImporter(db, incremental=incremental)
+    try:
+        importer.import_gateways()
+    except Exception as e:
+        logger.exception(f"Failed to get TTI gateways in the function get_all_registered_tti_gateways: {str(e)}")
+        return f"Failed to get TTI gateways due to an error: {str(e)}"
+    return importer.report("Get All Registered TTI Gateways")
+
+
+def get_all_registered_tti_end_devices_given_application_id(db: Session, application_id):
+    logger.debug("get_all_registered_tti_end_devices_given_application_id")
+    importer = TtiRegistryImporter(db)
+    importer.import_end_devices([application_id])
+    return importer.report("Get All Registered TTI End Devices Given Application Id")
+
+
+def get_all_registered_tti_application(db: Session, incremental: bool = False):
+    importer = TtiRegistryImporter(db, incremental=incremental)
+    try:
+        application_ids = importer.import_applications()
+        if incremental:
+            # The end devices of an application change without updating it
+            application_ids = importer.get_application_ids()
+    except Exception as e:
+        logger.debug(f"Failed to get_all_registered_tti_application: {str(e)}")
+        return f"Failed to get_all_registered_tti_application due to an error: {str(e)}"
+    if incremental:
+        importer.sync_end_devices(application_ids)
     else:
-        return "Get All Registered TTI Application Task completed successfully."
+        importer.import_end_devices(application_ids)
+    return importer.report("Get All Registered TTI Application")
 
 
 def registered_tti_application(db: Session, application_id):
-    req_url = f"{TTI_BASE_URL}applications"
+    importer = TtiRegistryImporter(db)
     try:
-        all_tti_applications = make_get_tti_request(req_url, TTI_AUTH)["applications"]
+        application_ids = importer.import_applications(application_id)
     except Exception as e:
         logger.debug(f"Failed to get TTI applications: {str(e)}")
         return f"Failed to get registered_tti_application due to an error: {str(e)}"
-    response_error_info = []
-    for application in all_tti_applications:
-        if application["ids"].get("application_id") == application_id:
-            try:
-                new_application = ApplicationBase(
-                    application_id=application["ids"].get("application_id"),
-                    created_at=application["created_at"],
-                    updated_at=application["updated_at"],
-                )
-                get_all_registered_tti_end_devices_given_application_id(
-                    db, new_application.application_id
-                )
-                ApplicationService.create_application(db, new_application)
-            except Exception as e:
-                logger.debug(f"{repr(e)}")
-                response_error_info.append(f"{repr(e)}")
-    if response_error_info:
-        error_message = "\n".join(response_error_info)
-        return f"Get Registered TTI Application Task completed with errors:\n{error_message}"
-    else:
-        return "Get Registered TTI Application Task completed successfully."
+    importer.import_end_devices(application_ids)
+    return importer.report("Get Registered TTI Application")
 
 
-def get_all_registered_tti_resources(db=Depends(get_session)):
-    response_error_info = [get_all_registered_tti_gateways(db), get_all_registered_tti_application(db)]
+def get_all_registered_tti_resources(db=Depends(get_session), incremental: bool = False):
+    response_error_info = [
+        get_all_registered_tti_gateways(db, incremental),
+        get_all_registered_tti_application(db, incremental),
+    ]
     if response_error_info:
         error_message = "\n".join(response_error_info)
         return f"Get All Registered TTI Resources Task completed with errors:\n{error_message}"
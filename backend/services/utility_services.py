@@ -1,20 +1,30 @@
+import hashlib
 import json
 import os
-import urllib.request as request
-from typing import Optional, List
-
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional, List
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlmodel import Session
 from sqlmodel import col
 from sqlmodel import select
 
 from database.db import db_engine
 from dependencies import utility_functions
-from dependencies.config import logger_config
+from dependencies.cache import cached
+from dependencies.config import cache_config, logger_config, sync_config
 from dependencies.exceptions import DatabaseError, TTIException, RequestError
 from models.models import Cluster, Deployment, AllRelation, Application
 from models.models import Gateway
 from models.models import Network
 from models.models import Node
+from models.models import SyncCursor
 from schemas.schemas import DeploymentRead
 
 logger = utility_functions.get_logger(logger_config)
@@ -32,6 +42,25 @@ TB_BASE_URL = os.getenv("TB_BASE_URL")
 TB_TAIL_URL = os.getenv("TB_TAIL_URL")
 
 
+http_session: Optional[requests.Session] = None
+http_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the HTTP session shared by the requests to the CMT, ThingsBoard and TTI APIs. It keeps
+    up to ``CMT_SYNC_MAX_WORKERS`` connections per host alive between requests.
+    """
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            http_session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=sync_config.max_workers)
+            http_session.mount("http://", adapter)
+            http_session.mount("https://", adapter)
+        return http_session
+
+
 def make_request(url: str, method: str, headers: dict, body=None):
     """
     Makes an HTTP request and returns the response body as a string.
@@ -46,12 +75,11 @@ def make_request(url: str, method: str, headers: dict, body=None):
         str: The response body as a string.
     """
     try:
-        request_data = request.Request(
-            url=url, headers=headers, method=method, data=body.encode() if body else None
+        response = get_http_session().request(
+            method, url, headers=headers, data=body.encode() if body else None, timeout=sync_config.http_timeout
         )
-
-        with request.urlopen(request_data) as f:
-            return f.readline().decode("utf-8")
+        response.raise_for_status()
+        return response.text
     except Exception as e:
         logger.error("An error occurred during the request.", exc_info=True)
         raise RequestError("An error occurred during the request.", original_exception=e)
@@ -157,6 +185,7 @@ def construct_tti_application_id_url(base, network_id):
 
 
 # THINGS BOARD REQUESTS
+@cached("things_board_gateway", cache_config.things_board_ttl)
 def get_gateway_data_from_things_board(base, tail, device_id, tb_auth):
     logger.debug(f"get_gateway_data_from_things_board")
     """
@@ -213,6 +242,7 @@ def get_gateway_data_from_things_board(base, tail, device_id, tb_auth):
     }
 
 
+@cached("things_board_node", cache_config.things_board_ttl)
 def get_node_data_from_things_board(base, tail, device_id, tb_auth):
     """
     Retrieves information about a node from ThingsBoard.
@@ -386,6 +416,7 @@ def get_all_cmt_network_entity(network_id, entity_name, auth):
 
 
 # TTI REQUESTS
+@cached("tti_application_id", cache_config.application_id_ttl)
 def get_tti_application_id(network_id):
     try:
         url_app = construct_tti_application_id_url(CMT_INTEGRATION_MANAGER_BASE, network_id)
@@ -405,6 +436,7 @@ def get_tti_application_id(network_id):
                            f"get_tti_application_id: {e}")
 
 
+@cached("tti_dev_addr", cache_config.dev_addr_ttl)
 def get_node_device_addr(tti_app_id, node_dev_id):
     # logger.debug(f"get_node_device_addr")
     try:
@@ -438,10 +470,134 @@ def make_get_tti_request(url, tti_auth):
             f"An error occurred in The Things Stack TTI. Function name make_get_tti_request. detail:{str(e)}")
 
 
+def iter_tti_pages(url: str, list_name: str, tti_auth: str, field_mask: Optional[str] = None,
+                   page_size: int = sync_config.tti_page_size, params: Optional[dict] = None) -> Iterator[List[dict]]:
+    """
+    Yields the entities of a TTI list API one page at a time.
+
+    Args:
+        url (str): The URL of the list API.
+        list_name (str): The key of the entities in the response, e.g. "end_devices".
+        tti_auth (str): The TTI authorization header.
+        field_mask (str, optional): The comma separated fields to return besides the ids.
+        page_size (int): The number of entities per request.
+        params (dict, optional): The other query parameters, e.g. {"order": "-updated_at"}.
+    """
+    page = 1
+    while True:
+        query = dict(params or {}, limit=page_size, page=page)
+        if field_mask:
+            query["field_mask"] = field_mask
+        entities = make_get_tti_request(f"{url}?{urlencode(query)}", tti_auth).get(list_name, [])
+        if entities:
+            yield entities
+        if len(entities) < page_size:
+            return
+        page += 1
+
+
 # DATABASE OPERATIONS
-def get_cluster_from_db(cluster_id):
+UPSERT_CHUNK_SIZE = 500
+
+
+def upsert_rows(session: Session, model, rows: List[dict], key: str, update_columns: List[str]) -> None:
+    """
+    Inserts the rows of ``model`` with one INSERT ... ON CONFLICT statement per chunk, updating
+    ``update_columns`` of the rows whose ``key`` already exists. ``key`` must have a unique index.
+    The caller commits.
+
+    :param session: The database session.
+    :param model: The table model of the rows.
+    :param rows: The column values of the rows.
+    :param key: The column identifying a row.
+    :param update_columns: The columns to update on the existing rows.
+    :raises DatabaseError: If the rows could not be written.
+    """
+    if not rows:
+        return
+    # A statement may update a row once only, the last value of a key wins
+    keyed_rows = {}
+    for index, row in enumerate(rows):
+        keyed_rows[row[key] if row[key] is not None else ("", index)] = row
+    rows = list(keyed_rows.values())
     try:
-        with Session(db_engine) as session:
+        dialect = session.get_bind().dialect.name
+        insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}[dialect]
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            statement = insert(model.__table__).values(rows[start:start + UPSERT_CHUNK_SIZE])
+            session.execute(statement.on_conflict_do_update(
+                index_elements=[key],
+                set_={column: statement.excluded[column] for column in update_columns},
+            ))
+    except Exception as e:
+        raise DatabaseError("upsert_rows", str(e))
+
+
+def delete_rows(session: Session, model, key: str, values: List, *criteria) -> int:
+    """
+    Deletes the rows of ``model`` whose ``key`` is one of ``values`` and that match ``criteria``,
+    with one DELETE statement per chunk, and returns the number of rows deleted. The caller commits.
+
+    :raises DatabaseError: If the rows could not be deleted.
+    """
+    deleted = 0
+    try:
+        for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+            deleted += session.exec(
+                delete(model).where(col(getattr(model, key)).in_(values[start:start + UPSERT_CHUNK_SIZE]), *criteria)
+            ).rowcount
+    except Exception as e:
+        raise DatabaseError("delete_rows", str(e))
+    return deleted
+
+
+# SYNCHRONIZATION CURSORS
+# RFC 3339 timestamps: the TTI gives up to nanoseconds, datetime keeps microseconds
+TIMESTAMP_FRACTION = re.compile(r"\.(\d{1,6})\d*")
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Parse an RFC 3339 timestamp of the TTI, e.g. "2023-01-02T03:04:05.123456789Z"."""
+    if not value:
+        return None
+    value = TIMESTAMP_FRACTION.sub(lambda match: "." + match.group(1).ljust(6, "0"), value.replace("Z", "+00:00"))
+    timestamp = datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def content_digest(values: Iterable) -> str:
+    """The hash of ``values`` regardless of their order, to detect a change of a source that cannot be filtered."""
+    return hashlib.sha256(
+        "\n".join(sorted(json.dumps(value, sort_keys=True) for value in values)).encode()
+    ).hexdigest()
+
+
+def get_sync_cursor(session: Session, source: str) -> Optional[SyncCursor]:
+    try:
+        return session.exec(select(SyncCursor).where(SyncCursor.source == source)).first()
+    except Exception as e:
+        raise DatabaseError("get_sync_cursor", str(e))
+
+
+def save_sync_cursor(session: Session, source: str, cursor: Optional[str] = None, digest: Optional[str] = None) -> None:
+    """Records the synchronization of ``source``. The caller commits, with the changes synchronized."""
+    upsert_rows(
+        session,
+        SyncCursor,
+        [{
+            "source": source,
+            "cursor": cursor,
+            "digest": digest,
+            "synced_at": datetime.now(timezone.utc).isoformat(),
+        }],
+        "source",
+        ["cursor", "digest", "synced_at"],
+    )
+
+
+def get_cluster_from_db(cluster_id, session: Session):
+    try:
+        with session:
             return session.exec(select(Cluster).where(Cluster.cluster_id == cluster_id)).first()
     except Exception as e:
         raise DatabaseError("get_cluster_from_db", str(e))
@@ -489,9 +645,9 @@ def get_all_gateways_from_db(session: Session):
         session.close()
 
 
-def get_node_from_db(node_id):
+def get_node_from_db(node_id, session: Session):
     try:
-        with Session(db_engine) as session:
+        with session:
             return session.exec(select(Node).where(Node.node_tb_id == node_id)).first()
     except Exception as e:
         raise DatabaseError("get_node_from_db", str(e))
@@ -548,10 +704,10 @@ def get_all_network_gateway(network_id: str, session: Session):
         session.close()
 
 
-def get_gateways_for_application(application_id: str) -> List[str]:
+def get_gateways_for_application(application_id: str, session: Session) -> List[str]:
     logger.debug("get_gateways_for_application")
     try:
-        with Session(db_engine) as session:
+        with session:
             query = (
                 select(AllRelation.gateway_tti_id)
                 .distinct()
@@ -0,0 +1,98 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import SQLModel
+from sqlmodel import create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend.dependencies.exceptions import EntityNotFound
+# Imported the way the service imports them, the SQLModel tables can only be defined once
+from database.db import create_db_and_tables, get_async_database_url, get_pool_options
+from dependencies.config import database_config
+from models.models import Gateway
+from schemas.schemas import NodeCreate
+from services import kpi_monitoring_services
+from services.node_services import create_node, read_node
+
+
+def run_with_session(test):
+    """Runs the coroutine ``test(session)`` on a fresh in-memory database."""
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as connection:
+            await connection.run_sync(SQLModel.metadata.create_all)
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                return await test(session)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "database_url, expected",
+    [
+        ("postgresql://user:password@db:5432/lorawan", "postgresql+asyncpg://user:password@db:5432/lorawan"),
+        ("postgresql+psycopg2://user:password@db/lorawan", "postgresql+asyncpg://user:password@db/lorawan"),
+        ("sqlite://", "sqlite+aiosqlite://"),
+    ],
+)
+def test_get_async_database_url(database_url, expected):
+    assert get_async_database_url(database_url) == expected
+
+
+def test_get_pool_options():
+    options = get_pool_options("postgresql://user:password@db/lorawan", is_async=True)
+    assert options["pool_size"] == database_config.pool_size
+    assert options["max_overflow"] == database_config.max_overflow
+    assert options["pool_pre_ping"]
+
+    assert get_pool_options("sqlite://", is_async=True) == {}
+    assert get_pool_options("sqlite:///lorawan.db") == {}
+    sqlite_file_options = get_pool_options("sqlite:///lorawan.db", is_async=True)
+    assert sqlite_file_options["poolclass"] is AsyncAdaptedQueuePool
+    assert sqlite_file_options["pool_size"] == 1
+
+
+def test_services_run_on_async_session():
+    async def test(session):
+        node = NodeCreate(node_eui="70b3d57ed0000001", node_dev_id="device-1")
+        await session.run_sync(lambda sync_session: create_node(sync_session, node))
+
+        db_node = await session.run_sync(lambda sync_session: read_node("70b3d57ed0000001", sync_session))
+        assert db_node.node_dev_id == "device-1"
+        with pytest.raises(EntityNotFound):
+            await session.run_sync(lambda sync_session: read_node("70b3d57ed0000002", sync_session))
+
+    run_with_session(test)
+
+
+def test_start_monitor_gateway_publishes_off_the_event_loop():
+    async def test(session):
+        session.add(Gateway(gateway_tti_id="gateway-1"))
+        await session.commit()
+        with patch.object(kpi_monitoring_services, "send_data", return_value="Task completed") as send_data:
+            result = await kpi_monitoring_services.start_monitor_gateway("gateway-1", session)
+
+        assert result == {"task_status": "Task completed"}
+        task_data, queue_name = send_data.call_args[0]
+        assert task_data.id == "gateway-1"
+
+    run_with_session(test)
+
+
+def test_create_db_and_tables_adds_the_indexes_of_existing_tables():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_node_node_eui"))
+
+    create_db_and_tables(engine)
+
+    assert "ix_node_node_eui" in {index["name"] for index in inspect(engine).get_indexes("node")}
@@ -0,0 +1,119 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.dependencies.cache import TTLCache, cached
+from backend.dependencies.metrics import MetricsRegistry
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def new_cache(ttl=10, max_size=100, clock=None):
+    return TTLCache("test", ttl, max_size, MetricsRegistry(enabled=True), clock or Clock())
+
+
+def test_values_expire_after_their_ttl():
+    clock = Clock()
+    cache = new_cache(ttl=10, clock=clock)
+    loads = []
+
+    def load():
+        loads.append(clock.now)
+        return len(loads)
+
+    assert cache.get_or_load("key", load) == 1
+    clock.now = 9.9
+    assert cache.get_or_load("key", load) == 1
+    clock.now = 10.0
+    assert cache.get_or_load("key", load) == 2
+    assert cache.stats() == {"hit": 1, "miss": 2, "coalesced": 0, "entries": 1, "hit_rate": 1 / 3}
+
+
+def test_the_requests_are_exported_once_suffixed():
+    metrics_registry = MetricsRegistry(enabled=True)
+    cache = TTLCache("test", 10, 100, metrics_registry, Clock())
+
+    cache.get_or_load("key", lambda: 1)
+
+    assert 'upstream_cache_requests_total{cache="test",result="miss"} 1' in metrics_registry.render()
+
+
+def test_least_recently_used_values_are_evicted():
+    cache = new_cache(max_size=2)
+    cache.get_or_load("a", lambda: "a")
+    cache.get_or_load("b", lambda: "b")
+    # "a" becomes the most recently used, "b" is evicted by "c"
+    cache.get_or_load("a", lambda: "reloaded")
+    cache.get_or_load("c", lambda: "c")
+
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get_or_load("b", lambda: "reloaded") == "reloaded"
+
+
+def test_concurrent_calls_load_once():
+    cache = TTLCache("test", 10, 100, MetricsRegistry(enabled=True))
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def load():
+        loads.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        first = executor.submit(cache.get_or_load, "key", load)
+        started.wait(5)
+        others = [executor.submit(cache.get_or_load, "key", load) for _ in range(7)]
+        while cache.stats()["coalesced"] < 7:
+            time.sleep(0.001)
+        release.set()
+        results = [first.result()] + [future.result() for future in others]
+
+    assert results == ["value"] * 8
+    assert len(loads) == 1
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_errors_are_not_cached():
+    cache = new_cache()
+
+    def fail():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("key", fail)
+    assert cache.get_or_load("key", lambda: "value") == "value"
+    assert cache.in_flight == {}
+
+
+def test_value_loaded_across_an_invalidation_is_not_stored():
+    cache = new_cache()
+    cache.get_or_load("key", lambda: cache.invalidate("other") or "stale")
+
+    assert cache.entries == {}
+
+
+def test_cached_function_is_invalidated_by_its_arguments():
+    calls = []
+
+    @cached("test_function", 60)
+    def fetch(network_id, auth=None):
+        calls.append(network_id)
+        return f"app-{network_id}-{len(calls)}"
+
+    assert fetch("network-1") == "app-network-1-1"
+    # By position or by name, the same arguments hit the same entry
+    assert fetch(network_id="network-1") == "app-network-1-1"
+    fetch.invalidate(network_id="network-1")
+    assert fetch("network-1") == "app-network-1-2"
+    fetch.cache_clear()
+    assert fetch("network-1") == "app-network-1-3"
@@ -0,0 +1,44 @@
+import pytest
+
+from backend.dependencies.hyperloglog import HyperLogLog, merge_hyperloglogs
+
+
+@pytest.mark.parametrize("size", [1, 10, 100, 1000, 20000, 100000])
+def test_counts_are_within_a_few_standard_errors(size):
+    sketch = HyperLogLog().extend(f"device-{index}" for index in range(size))
+
+    assert sketch.count() == pytest.approx(size, rel=3 * sketch.relative_error)
+
+
+def test_merged_sketches_count_the_keys_seen_by_several_of_them_once():
+    # Three gateways hearing overlapping devices over a day of windows
+    windows = [
+        HyperLogLog().extend(f"device-{index}" for index in range(gateway * 500, gateway * 500 + 1000))
+        for gateway in range(3) for _ in range(24)
+    ]
+
+    merged = merge_hyperloglogs([window.to_bytes() for window in windows] + [None])
+    whole = HyperLogLog().extend(f"device-{index}" for index in range(2000))
+
+    assert merged.registers == whole.registers
+    assert merged.count() == whole.count() == pytest.approx(2000, rel=0.05)
+
+
+def test_encoding_round_trips_and_is_sparse_for_a_few_keys():
+    few = HyperLogLog().extend(["device-1", "device-2", None, "device-1"])
+    many = HyperLogLog().extend(range(50000))
+
+    assert HyperLogLog.from_bytes(few.to_bytes()).registers == few.registers
+    assert HyperLogLog.from_bytes(many.to_bytes()).registers == many.registers
+    assert few.count() == 2
+    assert len(few.to_bytes()) < 10
+    assert len(many.to_bytes()) == 3 + 4096
+
+
+def test_empty_and_mismatched_sketches():
+    assert HyperLogLog().count() == 0
+    assert merge_hyperloglogs([]).count() == 0
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(10))
+    with pytest.raises(ValueError):
+        HyperLogLog(20)
@@ -0,0 +1,123 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dependencies.transport import InMemoryBroker, InMemoryTransport, RpcClient
+from events.event_receiver import EventReceiver
+
+logger = logging.getLogger("test_event_receiver")
+
+
+class SlowSyncService:
+    """``sync`` blocks until ``release`` is set, every other function answers at once."""
+
+    release = threading.Event()
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    @classmethod
+    def call(cls, body):
+        func_name = json.loads(body)["func_name"]
+        if func_name == "sync":
+            with cls.lock:
+                cls.running += 1
+                cls.max_running = max(cls.max_running, cls.running)
+            cls.release.wait(5)
+            with cls.lock:
+                cls.running -= 1
+        return {"result": func_name}
+
+
+def request(func_name):
+    return json.dumps({"func_name": func_name})
+
+
+def start_receiver(broker, **kwargs):
+    server = InMemoryTransport(broker)
+    thread = threading.Thread(
+        target=EventReceiver,
+        args=(None, None, None, None, "async_queue", SlowSyncService, logger),
+        kwargs=dict(transport=server, **kwargs),
+        daemon=True,
+    )
+    thread.start()
+    while not server.should_run:
+        time.sleep(0.001)
+    return server, thread
+
+
+def test_limited_function_does_not_block_the_other_requests():
+    SlowSyncService.release = threading.Event()
+    SlowSyncService.max_running = 0
+    broker = InMemoryBroker()
+    server, thread = start_receiver(broker, workers=4, concurrency_limits={"sync": 1})
+    client = RpcClient(InMemoryTransport(broker))
+    try:
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            syncs = [
+                executor.submit(client.call, "async_queue", request("sync"), 5) for _ in range(3)
+            ]
+            # The synchronizations hold one worker, the cheap requests are served meanwhile
+            replies = [client.call("async_queue", request("status"), 5) for _ in range(5)]
+            assert all(not sync.done() for sync in syncs)
+            SlowSyncService.release.set()
+            sync_replies = [sync.result() for sync in syncs]
+    finally:
+        server.stop_consuming()
+        thread.join(5)
+        client.close()
+
+    assert replies == [b'{"result": "status"}'] * 5
+    assert sync_replies == [b'{"result": "sync"}'] * 3
+    assert SlowSyncService.max_running == 1
+
+
+def test_requests_over_their_limit_do_not_fill_the_prefetch_window():
+    SlowSyncService.release = threading.Event()
+    SlowSyncService.max_running = 0
+    broker = InMemoryBroker()
+    # 4 requests delivered at most: 1 synchronization running, 2 held, the others requeued
+    server, thread = start_receiver(
+        broker, workers=2, concurrency_limits={"sync": 1}, requeue_delay=0.05
+    )
+    client = RpcClient(InMemoryTransport(broker))
+    try:
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            syncs = [
+                executor.submit(client.call, "async_queue", request("sync"), 10) for _ in range(6)
+            ]
+            while SlowSyncService.running == 0:
+                time.sleep(0.001)
+            time.sleep(0.1)
+            replies = [client.call("async_queue", request("status"), 2) for _ in range(3)]
+            assert all(not sync.done() for sync in syncs)
+            SlowSyncService.release.set()
+            sync_replies = [sync.result() for sync in syncs]
+    finally:
+        server.stop_consuming()
+        thread.join(5)
+        client.close()
+
+    assert replies == [b'{"result": "status"}'] * 3
+    assert sync_replies == [b'{"result": "sync"}'] * 6
+    assert SlowSyncService.max_running == 1
+
+
+def test_single_worker_serves_the_requests_in_order():
+    SlowSyncService.release = threading.Event()
+    SlowSyncService.release.set()
+    broker = InMemoryBroker()
+    server, thread = start_receiver(broker)
+    client = RpcClient(InMemoryTransport(broker))
+    try:
+        replies = [client.call("async_queue", request(name), 5) for name in ("sync", "status")]
+    finally:
+        server.stop_consuming()
+        thread.join(5)
+        client.close()
+
+    assert replies == [b'{"result": "sync"}', b'{"result": "status"}']
+    assert not thread.is_alive()
@@ -0,0 +1,205 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+# Imported the way the service imports them, the SQLModel tables can only be defined once
+from dependencies.cache import clear_caches
+from dependencies.exceptions import InternalServerError
+from models.models import Cluster, Gateway, Network, Node
+from services import cmt_connector_services
+from services import utility_services
+
+# Two clusters; network-2 is listed by both, network-3 holds nothing
+CLUSTERS = {"cluster-1": ["network-1", "network-2"], "cluster-2": ["network-2", "network-3"]}
+NETWORK_GATEWAYS = {"network-1": ["gw-1", "gw-2"], "network-2": ["gw-3"], "network-3": []}
+NETWORK_NODES = {"network-1": ["node-1", "node-2", "node-3"], "network-2": ["node-4"], "network-3": []}
+
+
+class ApiStub(BaseHTTPRequestHandler):
+    """The CMT infrastructure and integration managers, ThingsBoard and the TTI network server."""
+
+    protocol_version = "HTTP/1.1"
+    failing_paths = set()
+    requests = Counter()
+    connections = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.requests[self.path] += 1
+            self.connections.add(self.client_address)
+        parts = self.path.strip("/").split("/")
+        body = None
+        if self.path not in self.failing_paths:
+            if parts == ["cmt", "clusters"]:
+                body = {"data": [{"id": cluster_id, "name": cluster_id} for cluster_id in CLUSTERS]}
+            elif parts[:2] == ["cmt", "clusters"]:
+                body = {"data": [{"id": network_id, "name": network_id} for network_id in CLUSTERS[parts[2]]]}
+            elif parts[:2] == ["cmt", "networks"]:
+                entities = NETWORK_GATEWAYS if parts[3] == "gateways" else NETWORK_NODES
+                body = {"data": [{"id": entity_id} for entity_id in entities[parts[2]]]}
+            elif parts[0] == "cmt":
+                body = {"editable_name": parts[1], "technology_spec": {"devId": f"dev-{parts[1]}"}}
+            elif parts[0] == "tb":
+                body = {"editable_name": parts[1], "technology_spec": {"gwId": f"tti-{parts[1]}"}}
+            elif parts[0] == "integration":
+                body = {"data": [{"serverIdentity": {"applicationId": f"app-{parts[1]}"}}]}
+            elif parts[0] == "tti":
+                body = {"ids": {"dev_addr": f"addr-{parts[3]}"}}
+        payload = json.dumps(body).encode()
+        self.send_response(200 if body is not None else 500)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ApiStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    for module in (utility_services, cmt_connector_services):
+        monkeypatch.setattr(module, "CMT_INFRASTRUCTURE_MANAGER_BASE_URL", f"{base}/cmt/", raising=False)
+        monkeypatch.setattr(module, "CMT_INFRASTRUCTURE_MANAGER_TAIL_URL", "", raising=False)
+        monkeypatch.setattr(module, "TB_BASE_URL", f"{base}/tb/", raising=False)
+        monkeypatch.setattr(module, "TB_TAIL_URL", "", raising=False)
+    monkeypatch.setattr(utility_services, "CMT_INTEGRATION_MANAGER_BASE", f"{base}/integration/")
+    monkeypatch.setattr(utility_services, "BASE_TTI_NS_ADDRESS", f"{base}/tti/")
+    clear_caches()
+    ApiStub.failing_paths = set()
+    ApiStub.requests = Counter()
+    ApiStub.connections = set()
+    yield ApiStub
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def ids(db, column):
+    return sorted(db.exec(select(column)).all())
+
+
+def sync(db, max_workers=4, incremental=False):
+    cmt_connector_services.CmtTopologySync(
+        db, "cmt-token", "tb-token", "deployment-1", max_workers, incremental=incremental
+    ).run()
+
+
+def test_sync_adds_the_topology(api, db):
+    sync(db)
+
+    assert ids(db, Cluster.cluster_id) == ["cluster-1", "cluster-2"]
+    assert ids(db, Network.network_id) == ["network-1", "network-2", "network-3"]
+    assert ids(db, Gateway.gateway_tb_id) == ["gw-1", "gw-2", "gw-3"]
+    assert ids(db, Node.node_tb_id) == ["node-1", "node-2", "node-3", "node-4"]
+    network = db.exec(select(Network).where(Network.network_id == "network-2")).one()
+    assert (network.application_id, network.cluster_id) == ("app-network-2", "cluster-1")
+    node = db.exec(select(Node).where(Node.node_tb_id == "node-4")).one()
+    assert (node.node_dev_id, node.node_dev_addr, node.application_id, node.network_id) == (
+        "dev-node-4", "addr-dev-node-4", "app-network-2", "network-2"
+    )
+    gateway = db.exec(select(Gateway).where(Gateway.gateway_tb_id == "gw-3")).one()
+    assert (gateway.gateway_tti_id, gateway.network_id) == ("tti-gw-3", "network-2")
+
+
+def test_sync_deduplicates_lookups_and_reuses_connections(api, db):
+    sync(db)
+
+    # The application id is fetched once per network, not once more per node
+    application_requests = {path: count for path, count in api.requests.items() if path.startswith("/integration/")}
+    assert application_requests == {f"/integration/network-{index}": 1 for index in (1, 2, 3)}
+    # The network listed by both clusters is fetched once
+    assert api.requests["/cmt/networks/network-2/nodes"] == 1
+    assert len(api.connections) < sum(api.requests.values())
+
+    # Nothing is missing anymore: only the cluster list is requested
+    api.requests.clear()
+    sync(db)
+    assert list(api.requests) == ["/cmt/clusters"]
+
+
+def test_failed_network_is_not_written_and_synchronized_by_the_next_run(api, db):
+    api.failing_paths = {"/tti/app-network-1/devices/dev-node-2"}
+
+    with pytest.raises(InternalServerError):
+        sync(db)
+
+    assert ids(db, Network.network_id) == ["network-2", "network-3"]
+    assert ids(db, Node.node_tb_id) == ["node-4"]
+    assert ids(db, Gateway.gateway_tb_id) == ["gw-3"]
+    # cluster-1 is written once all its networks are
+    assert ids(db, Cluster.cluster_id) == ["cluster-2"]
+
+    api.failing_paths = set()
+    sync(db)
+
+    # The data fetched for the failed network is reused from the cache
+    assert (api.requests["/tb/gw-1"], api.requests["/cmt/node-1"], api.requests["/integration/network-1"]) == (1, 1, 1)
+    assert ids(db, Cluster.cluster_id) == ["cluster-1", "cluster-2"]
+    assert ids(db, Node.node_tb_id) == ["node-1", "node-2", "node-3", "node-4"]
+    assert ids(db, Gateway.gateway_tb_id) == ["gw-1", "gw-2", "gw-3"]
+
+
+def test_sync_completes_the_entities_imported_from_tti(api, db):
+    db.add(Gateway(gateway_tti_id="tti-gw-1", gateway_tb_id="None", created_at="2023-01-01T00:00:00Z"))
+    db.commit()
+
+    sync(db)
+
+    gateways = db.exec(select(Gateway).where(Gateway.gateway_tti_id == "tti-gw-1")).all()
+    assert len(gateways) == 1
+    assert (gateways[0].gateway_tb_id, gateways[0].network_id, gateways[0].created_at) == (
+        "gw-1", "network-1", "2023-01-01T00:00:00Z"
+    )
+
+
+def test_incremental_sync_only_lists_the_unchanged_networks(api, db):
+    sync(db)
+    api.requests.clear()
+
+    sync(db, incremental=True)
+
+    # Nothing is fetched from ThingsBoard, the integration manager or TTI
+    assert all(path.startswith(("/cmt/clusters", "/cmt/networks/")) for path in api.requests)
+    assert api.requests["/cmt/networks/network-1/nodes"] == 1
+
+
+def test_incremental_sync_applies_the_changes_of_the_topology(api, db, monkeypatch):
+    sync(db)
+    monkeypatch.setitem(NETWORK_GATEWAYS, "network-3", ["gw-4"])
+    # node-1 is removed, node-4 moves from network-2 to network-1
+    monkeypatch.setitem(NETWORK_NODES, "network-1", ["node-2", "node-3", "node-4"])
+    monkeypatch.setitem(NETWORK_NODES, "network-2", [])
+    api.requests.clear()
+
+    sync(db, incremental=True)
+
+    assert list(path for path in api.requests if path.startswith("/tb/")) == ["/tb/gw-4"]
+    network_ids = dict(db.exec(select(Node.node_tb_id, Node.network_id)).all())
+    assert network_ids == {"node-1": None, "node-2": "network-1", "node-3": "network-1", "node-4": "network-1"}
+    gateway = db.exec(select(Gateway).where(Gateway.gateway_tb_id == "gw-4")).one()
+    assert gateway.network_id == "network-3"
+
+    monkeypatch.delitem(CLUSTERS, "cluster-2")
+    sync(db, incremental=True)
+
+    assert ids(db, Cluster.cluster_id) == ["cluster-1"]
+    assert ids(db, Network.network_id) == ["network-1", "network-2"]
+    assert db.exec(select(Gateway).where(Gateway.gateway_tb_id == "gw-4")).one().network_id is None
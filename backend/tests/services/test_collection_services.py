@@ -0,0 +1,83 @@
+import json
+
+import pytest
+from fastapi import Request
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+# Imported the way the service imports them, the SQLModel tables can only be defined once
+from api.collection_routes import etag_response
+from dependencies.exceptions import EntityAlreadyExists, ValidationError
+from models.models import Node
+from services.collection_services import NODES, bulk_create, bulk_delete, bulk_upsert, list_page
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def node(index, **values):
+    return dict({"node_eui": f"eui-{index:04d}", "node_dev_id": f"dev-{index}", "name": f"node {index}"}, **values)
+
+
+def test_bulk_create_writes_all_the_nodes_or_none(db):
+    assert bulk_create(db, NODES, [node(index) for index in range(1200)]) == {"created": 1200}
+    assert len(db.exec(select(Node)).all()) == 1200
+
+    with pytest.raises(EntityAlreadyExists):
+        bulk_create(db, NODES, [node(5000), node(0)])
+    with pytest.raises(EntityAlreadyExists):
+        bulk_create(db, NODES, [node(5001), node(5001)])
+    with pytest.raises(ValidationError):
+        bulk_create(db, NODES, [node(5002), node(5003, node_eui=None)])
+    assert len(db.exec(select(Node)).all()) == 1200
+
+
+def test_bulk_upsert_and_delete(db):
+    bulk_create(db, NODES, [node(index) for index in range(3)])
+
+    result = bulk_upsert(db, NODES, [node(1, name="renamed"), node(3), node(3, name="last wins")])
+
+    assert result == {"created": 1, "updated": 1}
+    names = dict(db.exec(select(Node.node_eui, Node.name)).all())
+    assert names == {"eui-0000": "node 0", "eui-0001": "renamed", "eui-0002": "node 2", "eui-0003": "last wins"}
+
+    assert bulk_delete(db, NODES, ["eui-0000", "eui-0003", "unknown"]) == {"deleted": 2}
+    assert sorted(names)[1:3] == sorted(db.exec(select(Node.node_eui)).all())
+
+
+def test_list_pages_by_keyset_with_the_selected_fields(db):
+    bulk_create(db, NODES, [node(index) for index in range(5)])
+
+    first = list_page(db, NODES, limit=2, fields=["node_eui", "name"])
+    second = list_page(db, NODES, after=first["next_after"], limit=2, fields=["node_eui"])
+    last = list_page(db, NODES, after=second["next_after"], limit=2)
+
+    assert first["items"] == [{"node_eui": "eui-0000", "name": "node 0"}, {"node_eui": "eui-0001", "name": "node 1"}]
+    assert second["items"] == [{"node_eui": "eui-0002"}, {"node_eui": "eui-0003"}]
+    assert [item["node_eui"] for item in last["items"]] == ["eui-0004"]
+    assert last["next_after"] is None
+    with pytest.raises(ValidationError):
+        list_page(db, NODES, fields=["password"])
+
+
+def request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/nodes/", "headers": headers})
+
+
+def test_unchanged_content_is_not_modified():
+    content = {"items": [{"node_eui": "eui-0000"}], "next_after": None}
+    response = etag_response(request(), content)
+    etag = response.headers["ETag"]
+
+    assert json.loads(response.body) == content
+    assert etag_response(request(etag), content).status_code == 304
+    assert etag_response(request(f'"other", W/{etag}'), content).status_code == 304
+    content["next_after"] = 1
+    assert etag_response(request(etag), content).status_code == 200
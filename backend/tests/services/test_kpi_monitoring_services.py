@@ -0,0 +1,112 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend.dependencies.transport import InMemoryTransport
+# Imported the way the service imports them, the SQLModel tables can only be defined once
+from dependencies.exceptions import EntityNotFound
+from models.models import AllRelation, Application, Gateway
+from services import kpi_monitoring_services
+from services.topology_services import topology
+
+
+def run_with_session(test, rows):
+    """Runs the coroutine ``test(session)`` on a fresh in-memory database holding ``rows``."""
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as connection:
+            await connection.run_sync(SQLModel.metadata.create_all)
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                session.add_all(rows)
+                await session.commit()
+                return await test(session)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def fresh_topology():
+    # Every test has its own database
+    topology.invalidate()
+
+
+@pytest.fixture
+def transport():
+    transport = InMemoryTransport()
+    with patch.object(kpi_monitoring_services, "control_transport", transport):
+        yield transport
+
+
+def published_commands(transport, queue_name):
+    queue = transport.broker.get_queue(queue_name)
+    commands = []
+    while not queue.empty():
+        # The backend sends the JSON of the command as a JSON string
+        commands.append(json.loads(json.loads(queue.get_nowait().body)))
+    return commands
+
+
+def test_start_monitor_all_gateway_sends_one_bulk_command(transport):
+    gateways = [Gateway(gateway_tti_id=f"gateway-{index}") for index in range(50)]
+    result = run_with_session(kpi_monitoring_services.start_monitor_all_gateway, gateways)
+
+    assert result == {"task_status": "Task completed"}
+    assert published_commands(transport, "control_gateways_queue") == [
+        {"ids": [f"gateway-{index}" for index in range(50)], "command": "start"}
+    ]
+
+
+def test_bulk_commands_are_split_by_bulk_command_max_ids(transport):
+    gateways = [Gateway(gateway_tti_id=f"gateway-{index}", network_id="network-1") for index in range(5)]
+    with patch.object(kpi_monitoring_services, "bulk_command_max_ids", 2):
+        result = run_with_session(kpi_monitoring_services.stop_monitor_all_gateway, gateways)
+
+    assert result == {"task_status": "\n".join(["Task completed"] * 3)}
+    commands = published_commands(transport, "control_gateways_queue")
+    assert [command["ids"] for command in commands] == [
+        ["gateway-0", "gateway-1"], ["gateway-2", "gateway-3"], ["gateway-4"]
+    ]
+    assert {command["command"] for command in commands} == {"stop"}
+
+
+def test_start_monitor_gateways_of_all_applications_deduplicates_gateways(transport):
+    rows = [
+        Application(application_id="app-1"),
+        Application(application_id="app-2"),
+        AllRelation(device_id="device-1", application_id="app-1", gateway_tti_id="gateway-1"),
+        AllRelation(device_id="device-2", application_id="app-1", gateway_tti_id="gateway-2"),
+        AllRelation(device_id="device-3", application_id="app-2", gateway_tti_id="gateway-2"),
+    ]
+    result = run_with_session(
+        lambda session: kpi_monitoring_services.start_monitor_gateways_of_all_applications(["app-1", "app-2"], session),
+        rows,
+    )
+
+    assert result == {"task_status": "Task completed\nTask completed"}
+    assert published_commands(transport, "control_application_queue") == [
+        {"ids": ["app-1", "app-2"], "command": "start"}
+    ]
+    gateway_commands = published_commands(transport, "control_gateways_queue")
+    assert len(gateway_commands) == 1
+    assert sorted(gateway_commands[0]["ids"]) == ["gateway-1", "gateway-2"]
+
+
+def test_unknown_application_is_reported_before_sending(transport):
+    with pytest.raises(EntityNotFound):
+        run_with_session(
+            lambda session: kpi_monitoring_services.stop_monitor_gateways_of_all_applications(
+                ["app-1", "app-2"], session
+            ),
+            [Application(application_id="app-1")],
+        )
+
+    assert published_commands(transport, "control_application_queue") == []
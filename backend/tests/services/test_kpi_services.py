@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+from backend.dependencies.hyperloglog import HyperLogLog
+from backend.dependencies.sketches import DDSketch
+# Imported the way the service imports them, the SQLModel tables can only be defined once
+from dependencies.exceptions import EntityNotFound, ValidationError
+from models.models import EndDeviceKPISketches, Gateway, GatewayDeviceSketches, Network, Node
+from services.kpi_services import get_distinct_devices, get_quantiles
+from services.topology_services import topology
+
+START = datetime(2023, 3, 27)
+
+
+def sketches(device_id, gateway_id, hour, snr_values):
+    return EndDeviceKPISketches(
+        interval_start_time=START + timedelta(hours=hour),
+        interval_end_time=START + timedelta(hours=hour + 1),
+        device_id=device_id,
+        gateway_id=gateway_id,
+        snr_sketch=DDSketch().extend(snr_values).to_bytes(),
+    )
+
+
+def device_sketches(gateway_id, hour, device_ids, dev_addrs=()):
+    return GatewayDeviceSketches(
+        interval_start_time=START + timedelta(hours=hour),
+        interval_end_time=START + timedelta(hours=hour + 1),
+        gateway_id=gateway_id,
+        device_sketch=HyperLogLog().extend(device_ids).to_bytes(),
+        dev_addr_sketch=HyperLogLog().extend(dev_addrs).to_bytes(),
+    )
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    topology.invalidate()
+    with Session(engine) as session:
+        session.add_all([
+            Network(network_id="network-1", name="network 1"),
+            Gateway(gateway_tti_id="gw-1", network_id="network-1"),
+            Gateway(gateway_tti_id="gw-2", network_id="network-1"),
+            Gateway(gateway_tti_id="gw-3"),
+            Node(node_eui="eui-1", node_dev_id="device-1", network_id="network-1"),
+            # Every window of every device and gateway holds 1 to 10, and 100 for gw-3
+            sketches("device-1", "gw-1", 0, range(1, 11)),
+            sketches("device-1", "gw-1", 1, range(1, 11)),
+            sketches("device-2", "gw-2", 0, range(1, 11)),
+            sketches("device-2", "gw-3", 0, [100] * 10),
+            EndDeviceKPISketches(
+                interval_start_time=START, interval_end_time=START + timedelta(hours=1),
+                device_id="device-3", gateway_id="gw-1",
+            ),
+            # gw-1 and gw-2 hear devices 0 to 1499 over the day, gw-3 devices 1000 to 2999
+            *[device_sketches("gw-1", hour, [f"device-{index}" for index in range(1000)], ["addr-1"])
+              for hour in range(24)],
+            device_sketches("gw-2", 0, [f"device-{index}" for index in range(500, 1500)],
+                            ["addr-1", "addr-2"]),
+            device_sketches("gw-3", 0, [f"device-{index}" for index in range(1000, 3000)]),
+        ])
+        session.commit()
+        yield session
+    topology.invalidate()
+    engine.dispose()
+
+
+def test_the_sketches_of_the_windows_devices_and_gateways_are_merged(db):
+    result = get_quantiles(db, "snr", START, START + timedelta(days=1), [0, 0.5, 1])
+
+    assert result["count"] == 40
+    assert result["min"] == 1 and result["max"] == 100
+    assert result["quantiles"]["0"] == 1
+    assert result["quantiles"]["0.5"] == pytest.approx(7, rel=0.01)
+    assert result["quantiles"]["1"] == 100
+
+
+def test_the_quantiles_are_scoped_to_an_entity_of_the_topology(db):
+    end = START + timedelta(days=1)
+
+    network = get_quantiles(db, "snr", START, end, [1], entity_type="network", entity_id="network-1")
+    node = get_quantiles(db, "snr", START, START + timedelta(hours=1), [1], entity_type="node", entity_id="eui-1")
+    devices = get_quantiles(db, "snr", START, end, [1], device_ids=["device-2"])
+
+    assert (network["count"], network["quantiles"]["1"]) == (30, 10)
+    assert node["count"] == 10
+    assert (devices["count"], devices["quantiles"]["1"]) == (20, 100)
+
+
+def test_invalid_requests(db):
+    end = START + timedelta(days=1)
+    assert get_quantiles(db, "rssi", START, end)["count"] == 0
+    assert get_quantiles(db, "rssi", START, end)["quantiles"] == {"0.05": None, "0.5": None, "0.95": None}
+    with pytest.raises(ValidationError):
+        get_quantiles(db, "noise", START, end)
+    with pytest.raises(ValidationError):
+        get_quantiles(db, "snr", START, end, [95])
+    with pytest.raises(EntityNotFound):
+        get_quantiles(db, "snr", START, end, entity_type="network", entity_id="network-2")
+
+
+def test_the_devices_heard_by_several_gateways_and_windows_are_counted_once(db):
+    end = START + timedelta(days=1)
+
+    everything = get_distinct_devices(db, START, end)
+    network = get_distinct_devices(db, START, end, entity_type="network", entity_id="network-1")
+    gateway = get_distinct_devices(
+        db, START, START + timedelta(hours=1), entity_type="gateway", entity_id="gw-1"
+    )
+
+    assert everything["intervals"] == 26
+    assert everything["registered_devices"] == pytest.approx(3000, rel=3 * everything["relative_error"])
+    assert everything["unregistered_devices"] == 2
+    assert network["registered_devices"] == pytest.approx(1500, rel=3 * network["relative_error"])
+    assert network["devices"] == network["registered_devices"] + 2
+    assert (gateway["intervals"], gateway["unregistered_devices"]) == (1, 1)
+    with pytest.raises(ValidationError):
+        get_distinct_devices(db, START, end, entity_type="node", entity_id="eui-1")
@@ -0,0 +1,119 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+# Imported the way the service imports them, the SQLModel tables can only be defined once
+from models.models import Cluster, Deployment, Gateway, Network, Node
+from services import topology_services
+from services.topology_services import ENTITY_TYPES, get_hierarchy, resolve_ids, topology
+from services.utility_services import upsert_rows
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    topology.invalidate()
+    with Session(engine) as session:
+        session.add_all([
+            Deployment(deployment_id="deployment-1", name="deployment 1"),
+            Cluster(cluster_id="cluster-1", name="cluster 1", deployment_id="deployment-1"),
+            Network(network_id="network-1", name="network 1", cluster_id="cluster-1", application_id="app-1"),
+            Gateway(gateway_tti_id="gw-1", gateway_tb_id="tb-gw-1", network_id="network-1"),
+            Node(node_eui="eui-1", node_dev_addr="addr-1", network_id="network-1", application_id="app-1"),
+        ])
+        session.commit()
+        yield session
+    topology.invalidate()
+    engine.dispose()
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    loads = []
+    load = topology.load
+
+    def counting_load(session, entity_type):
+        loads.append(entity_type.name)
+        load(session, entity_type)
+
+    monkeypatch.setattr(topology, "load", counting_load)
+    return loads
+
+
+def test_ids_resolve_to_their_entities_and_ancestors(db):
+    resolved = resolve_ids(db, ["addr-1", "tb-gw-1", "unknown"])
+
+    assert [(match["type"], match["field"]) for match in resolved["addr-1"]] == [("node", "node_dev_addr")]
+    assert resolved["addr-1"][0]["entity"]["node_eui"] == "eui-1"
+    assert {name: ancestor["name"] for name, ancestor in resolved["tb-gw-1"][0]["ancestors"].items()} == {
+        "network": "network 1", "cluster": "cluster 1", "deployment": "deployment 1"
+    }
+    assert resolved["unknown"] == []
+
+
+def test_descendants_of_a_deployment(db):
+    hierarchy = get_hierarchy(db, "deployment", "deployment-1")
+
+    assert {name: len(children) for name, children in hierarchy["descendants"].items()} == {
+        "cluster": 1, "network": 1, "gateway": 1, "node": 1
+    }
+    assert hierarchy["ancestors"] == {}
+
+
+def test_committed_writes_update_the_graph_in_place(db, loads):
+    topology_services.get_topology(db)
+    loads.clear()
+
+    db.add(Gateway(gateway_tti_id="gw-2", network_id="network-1"))
+    node = db.exec(select(Node).where(Node.node_eui == "eui-1")).one()
+    node.node_dev_addr = "addr-2"
+    db.delete(db.exec(select(Cluster)).one())
+    db.commit()
+
+    graph = topology_services.get_topology(db)
+    assert loads == []
+    assert [gateway["gateway_tti_id"] for gateway in graph.find("gateway", "network_id", "network-1")] == ["gw-1", "gw-2"]
+    assert graph.find("node", "node_dev_addr", "addr-1") == []
+    assert graph.find("node", "node_dev_addr", "addr-2")[0]["node_eui"] == "eui-1"
+    assert list(graph.ancestors("network", graph.get("network", "network-1"))) == []
+
+    db.add(Gateway(gateway_tti_id="gw-3"))
+    db.flush()
+    db.rollback()
+    assert graph.get("gateway", "gw-3") is None
+
+
+def test_a_commit_applied_during_a_load_is_not_overwritten(db):
+    topology_services.get_topology(db)
+    gateway = dict(topology.get("gateway", "gw-1"), id=2, gateway_tti_id="gw-2", gateway_tb_id=None)
+    # Committed after the rows were read, its changes are applied meanwhile
+    commit = threading.Thread(target=topology.apply, args=([("put", "gateway", gateway)], set()))
+    execute = db.execute
+
+    def execute_then_commit(*args, **kwargs):
+        rows = execute(*args, **kwargs)
+        commit.start()
+        commit.join(0.1)
+        return rows
+
+    with patch.object(db, "execute", side_effect=execute_then_commit):
+        topology.load(db, ENTITY_TYPES["gateway"])
+    commit.join(5)
+
+    assert topology.get("gateway", "gw-2") == gateway
+
+
+def test_bulk_statements_reload_the_types_they_write(db, loads):
+    topology_services.get_topology(db)
+    loads.clear()
+
+    upsert_rows(db, Gateway, [{"gateway_tti_id": "gw-1", "network_id": None}], "gateway_tti_id", ["network_id"])
+    db.commit()
+
+    graph = topology_services.get_topology(db)
+    assert loads == ["gateway"]
+    assert graph.get("gateway", "gw-1")["network_id"] is None
@@ -0,0 +1,215 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+# Imported the way the service imports them, the SQLModel tables can only be defined once
+from dependencies.cache import clear_caches
+from models.models import Application, Gateway, Node, SyncCursor
+from services import tti_connection_services
+from services import utility_services
+
+
+class TtiStub(BaseHTTPRequestHandler):
+    """The list APIs of the TTI identity server and the end device API of its network server."""
+
+    protocol_version = "HTTP/1.1"
+    gateways = []
+    applications = {}
+    application_updates = {}
+    deleted = {}
+    dev_addrs = {}
+    requests = Counter()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        with self.lock:
+            self.requests[url.path] += 1
+        if parts[0] == "ns":
+            body = {"ids": {"device_id": parts[4], "dev_addr": self.dev_addrs[parts[4]]}}
+        else:
+            assert query["field_mask"]
+            if parts == ["api", "gateways"]:
+                list_name, entities = "gateways", self.gateways
+            elif parts == ["api", "applications"]:
+                list_name = "applications"
+                entities = [
+                    {"ids": {"application_id": application_id},
+                     "updated_at": self.application_updates.get(application_id, "2023-01-01T00:00:00Z")}
+                    for application_id in self.applications
+                ]
+            else:
+                list_name, entities = "end_devices", self.applications[parts[2]]
+            if query.get("deleted") == ["true"]:
+                entities = self.deleted.get(list_name, [])
+            elif query.get("order") == ["-updated_at"]:
+                entities = sorted(entities, key=lambda entity: entity.get("updated_at") or "", reverse=True)
+            limit, page = int(query["limit"][0]), int(query["page"][0])
+            body = {list_name: entities[(page - 1) * limit:page * limit]}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def end_device(device_id, dev_eui, dev_addr=None):
+    ids = {"device_id": device_id, "dev_eui": dev_eui, "join_eui": "0000000000000000"}
+    if dev_addr:
+        ids["dev_addr"] = dev_addr
+    return {"ids": ids, "created_at": "2023-01-01T00:00:00Z", "updated_at": "2023-01-02T00:00:00Z"}
+
+
+@pytest.fixture
+def tti(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TtiStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(tti_connection_services, "TTI_BASE_URL", f"{base}/api/")
+    monkeypatch.setattr(utility_services, "BASE_TTI_NS_ADDRESS", f"{base}/ns/applications/")
+    TtiStub.gateways = [
+        {"ids": {"gateway_id": f"gateway-{index}", "eui": f"eui-{index}"}, "updated_at": f"2023-01-0{index + 1}T00:00:00Z"}
+        for index in range(3)
+    ]
+    TtiStub.applications = {
+        "app-1": [end_device(f"device-{index}", f"dev-eui-{index}", f"addr-{index}") for index in range(5)],
+        "app-2": [end_device("device-5", "dev-eui-5"), end_device("device-6", None)],
+    }
+    clear_caches()
+    TtiStub.application_updates = {}
+    TtiStub.deleted = {}
+    TtiStub.dev_addrs = {"device-5": "addr-5"}
+    TtiStub.requests = Counter()
+    yield TtiStub
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def import_applications(db):
+    importer = tti_connection_services.TtiRegistryImporter(db, max_workers=2, page_size=2)
+    importer.import_end_devices(importer.import_applications())
+    return importer
+
+
+def test_import_pages_through_the_applications_and_their_end_devices(tti, db):
+    importer = import_applications(db)
+
+    assert sorted(db.exec(select(Application.application_id)).all()) == ["app-1", "app-2"]
+    nodes = {node.node_dev_id: node for node in db.exec(select(Node)).all()}
+    assert {node_dev_id: node.node_dev_addr for node_dev_id, node in nodes.items()} == {
+        f"device-{index}": f"addr-{index}" for index in range(6)
+    }
+    assert nodes["device-5"].application_id == "app-2"
+    # 5 devices by pages of 2, and the network server is only asked for the dev_addr missing from the listing
+    assert tti.requests["/api/applications/app-1/devices"] == 3
+    assert [path for path in tti.requests if path.startswith("/ns/")] == ["/ns/applications/app-2/devices/device-5"]
+    assert importer.errors == ["node_dev_id = device-6 has no dev_eui"]
+    assert {"list_applications", "upsert_applications", "import_end_devices", "upsert_end_devices"} <= set(
+        importer.timings
+    )
+
+
+def test_import_updates_the_existing_rows(tti, db):
+    db.add(Node(node_eui="dev-eui-1", name="node from the CMT", node_dev_addr="old-addr"))
+    db.commit()
+
+    import_applications(db)
+    tti.applications["app-1"][0]["ids"]["dev_addr"] = "new-addr-0"
+    import_applications(db)
+
+    nodes = {node.node_eui: node for node in db.exec(select(Node)).all()}
+    assert len(nodes) == 6
+    assert (nodes["dev-eui-1"].name, nodes["dev-eui-1"].node_dev_addr) == ("node from the CMT", "addr-1")
+    assert nodes["dev-eui-0"].node_dev_addr == "new-addr-0"
+    assert len(db.exec(select(Application)).all()) == 2
+
+
+def test_get_all_registered_tti_gateways(tti, db):
+    result = tti_connection_services.get_all_registered_tti_gateways(db)
+    tti_connection_services.get_all_registered_tti_gateways(db)
+
+    assert result.startswith("Get All Registered TTI Gateways Task completed successfully.")
+    assert "list_gateways=" in result and "upsert_gateways=" in result
+    gateways = db.exec(select(Gateway)).all()
+    assert sorted((gateway.gateway_tti_id, gateway.gateway_eui) for gateway in gateways) == [
+        (f"gateway-{index}", f"eui-{index}") for index in range(3)
+    ]
+
+
+def test_incremental_gateway_import_lists_the_updates_since_the_last_run(tti, db):
+    tti_connection_services.get_all_registered_tti_gateways(db)
+    tti.gateways[0]["updated_at"] = "2023-02-01T00:00:00.123456789Z"
+    tti.gateways.append({"ids": {"gateway_id": "gateway-3", "eui": "eui-3"}, "updated_at": "2023-02-02T00:00:00Z"})
+    tti.deleted = {"gateways": [{"ids": {"gateway_id": "gateway-2"}}]}
+    tti.requests.clear()
+
+    importer = tti_connection_services.TtiRegistryImporter(db, page_size=1, incremental=True)
+    importer.import_gateways()
+
+    # gateway-3, gateway-0, then gateway-2 updated at the cursor; the listing stops at gateway-1
+    assert importer.changes == {"upserted_gateways": 3, "deleted_gateways": 1}
+    # 4 pages of the updated gateways, 2 of the deleted ones
+    assert tti.requests["/api/gateways"] == 4 + 2
+    gateways = {gateway.gateway_tti_id: gateway.updated_at for gateway in db.exec(select(Gateway)).all()}
+    assert sorted(gateways) == ["gateway-0", "gateway-1", "gateway-3"]
+    assert gateways["gateway-0"] == "2023-02-01T00:00:00.123456789Z"
+    cursor = db.exec(select(SyncCursor).where(SyncCursor.source == "tti:gateways")).one()
+    assert cursor.cursor == "2023-02-02T00:00:00Z"
+
+
+def test_incremental_end_device_import_applies_the_changes_only(tti, db):
+    db.add(Node(node_eui="cmt-node", name="node from the CMT", application_id="app-1"))
+    db.commit()
+    first = tti_connection_services.get_all_registered_tti_application(db, incremental=True)
+    assert "upserted_end_devices=6" in first
+
+    tti.requests.clear()
+    unchanged = tti_connection_services.get_all_registered_tti_application(db, incremental=True)
+    assert "unchanged_applications=2" in unchanged and "upserted_end_devices" not in unchanged
+    assert not [path for path in tti.requests if path.startswith("/ns/")]
+
+    del tti.applications["app-1"][3]
+    tti.applications["app-1"][0]["updated_at"] = "2023-03-01T00:00:00Z"
+    tti.applications["app-1"][0]["ids"]["dev_addr"] = "new-addr-0"
+    changed = tti_connection_services.get_all_registered_tti_application(db, incremental=True)
+
+    assert "upserted_end_devices=1" in changed and "deleted_end_devices=1" in changed
+    assert "unchanged_applications=1" in changed
+    nodes = {node.node_eui: node.node_dev_addr for node in db.exec(select(Node)).all()}
+    assert "dev-eui-3" not in nodes and nodes["dev-eui-0"] == "new-addr-0"
+    # The nodes only known from the CMT are not deleted
+    assert "cmt-node" in nodes
+
+
+def test_incremental_import_deletes_the_deleted_applications(tti, db):
+    tti_connection_services.get_all_registered_tti_application(db, incremental=True)
+    tti.deleted = {"applications": [{"ids": {"application_id": "app-2"}}]}
+    del tti.applications["app-2"]
+
+    result = tti_connection_services.get_all_registered_tti_application(db, incremental=True)
+
+    assert "deleted_applications=1" in result
+    assert db.exec(select(Application.application_id)).all() == ["app-1"]
+    assert "dev-eui-5" not in db.exec(select(Node.node_eui)).all()
+    assert "tti:end_devices:app-2" not in db.exec(select(SyncCursor.source)).all()
@@ -0,0 +1,139 @@
+"""
+Load test of the backend API: concurrent clients against the node endpoints of a backend served
+by uvicorn in a separate process, reported as requests per second.
+
+Run through ``run_benchmarks.py``, which puts ``backend`` on the path.
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import requests
+
+from benchmarks.harness import REPO_ROOT, create_benchmark_engine, measure, write_results
+from models import models
+
+BACKEND_DIR = os.path.join(REPO_ROOT, "backend")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(database_url: str, workdir: str, port: int) -> subprocess.Popen:
+    """Serves the backend with uvicorn, the way its container does, and waits until it answers."""
+    env = dict(os.environ)
+    env.update(
+        {
+            "POSTGRES_URL": database_url,
+            "PYTHONPATH": os.pathsep.join([REPO_ROOT, BACKEND_DIR]),
+            "LOG_LEVEL": os.getenv("BENCHMARK_LOG_LEVEL", "warning").lower(),
+            "LOG_FILE": os.path.join(workdir, "backend.log"),
+        }
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The backend exited with status {server.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("The backend did not start within 60 seconds")
+
+
+def run_clients(num_requests: int, clients: int, request: Callable[[requests.Session, int], requests.Response]):
+    """Sends ``num_requests`` requests from ``clients`` keep-alive sessions in parallel."""
+
+    def client(offset: int) -> None:
+        with requests.Session() as session:
+            for index in range(offset, num_requests, clients):
+                response = request(session, index)
+                if response.status_code >= 500:
+                    raise RuntimeError(f"{response.request.method} {response.url}: {response.status_code}")
+
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for future in [executor.submit(client, offset) for offset in range(clients)]:
+            future.result()
+
+
+def run(args) -> List[Dict]:
+    workdir = tempfile.mkdtemp(prefix="api_benchmark_")
+    engine = create_benchmark_engine(args.database_url, workdir, "api")
+    database_url = engine.url.render_as_string(hide_password=False)
+    engine.dispose()
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_backend(database_url, workdir, port)
+    try:
+        node_euis = [f"{index:016x}" for index in range(args.nodes)]
+        run_clients(
+            len(node_euis),
+            args.clients,
+            lambda session, index: session.post(
+                f"{base_url}/nodes/", json={"node_eui": node_euis[index], "node_dev_id": f"device-{index}"}
+            ),
+        )
+        randomizer = random.Random(args.seed)
+        targets = [randomizer.choice(node_euis) for _ in range(args.requests)]
+        params = {"clients": args.clients, "requests": args.requests, "nodes": args.nodes,
+                  "database": "postgres" if args.database_url else "sqlite"}
+        scenarios = (
+            ("api_read_node", lambda session, index: session.get(f"{base_url}/nodes/{targets[index]}")),
+            (
+                "api_update_node",
+                lambda session, index: session.patch(
+                    f"{base_url}/nodes/{targets[index]}",
+                    json={"node_eui": targets[index], "description": f"update {index}"},
+                ),
+            ),
+        )
+        return [
+            measure(
+                name,
+                lambda request=request: run_clients(args.requests, args.clients, request),
+                repeat=args.repeat,
+                items=args.requests,
+                params=params,
+            )
+            for name, request in scenarios
+        ]
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    write_results(args.output, run(args))
+
+
+if __name__ == "__main__":
+    main()
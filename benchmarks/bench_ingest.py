@@ -0,0 +1,245 @@
+"""
+Ingest benchmarks of the stream event consumer: event decoding, time on air, DB write paths,
+replica counting and the whole broker -> decode -> DB path over the in-memory transport.
+
+Run through ``run_benchmarks.py``, which puts ``stream_event_consumer`` on the path.
+"""
+import argparse
+import json
+import os
+import tempfile
+from logging.handlers import QueueHandler
+from typing import Dict, List
+
+from sqlmodel import Session, delete
+
+from benchmarks.harness import (
+    create_benchmark_engine,
+    load_traffic_generator,
+    measure,
+    quiet_logger,
+    write_results,
+)
+from dependencies.config import LoggerConfig, database_config, logger_config
+from dependencies.logging_utils import log_slow_queries
+from dependencies.transport import InMemoryBroker, InMemoryTransport
+from dependencies.utility_functions import calculate_toa, get_logger
+from stream_event_consumer.database.models import (
+    AllRelation,
+    NodeMetadataUl,
+    PacketReplicaMetadata,
+)
+from stream_event_consumer_service import MessageConsumer
+
+QUEUE_NAME = "benchmark_stream_events"
+
+
+def build_events(num_events: int, seed: int) -> Dict[str, List[dict]]:
+    traffic_generator = load_traffic_generator()
+    generator = traffic_generator.TrafficGenerator(
+        traffic_generator.TrafficScenario(
+            num_devices=200,
+            num_gateways=8,
+            duration_sec=86400,
+            status_period_sec=60,
+            connection_stats_period_sec=120,
+            seed=seed,
+        )
+    )
+    relations = generator.all_relations()
+    events = {"gs.up.receive": [], "gs.status.receive": [], "gs.gateway.connection.stats": []}
+    for kind, message in generator.messages():
+        if kind != "stream":
+            continue
+        bucket = events[message["result"]["name"]]
+        if len(bucket) < num_events:
+            bucket.append(message)
+        if all(len(bucket) >= num_events for bucket in events.values()):
+            break
+    events["relations"] = relations
+    return events
+
+
+def new_consumer(engine, transport=None, max_threads=1, logger=None) -> MessageConsumer:
+    return MessageConsumer(
+        logger or quiet_logger("ingest"),
+        "guest",
+        "guest",
+        "localhost",
+        QUEUE_NAME,
+        engine,
+        max_threads,
+        transport=transport or InMemoryTransport(),
+    )
+
+
+def wait_for_log_writer(logger) -> None:
+    """Waits until the background log writer has handled every queued record."""
+    for handler in logger.handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue.join()
+
+
+def clear_tables(engine, *models) -> None:
+    with Session(engine) as session:
+        for model in models:
+            session.exec(delete(model))
+        session.commit()
+
+
+def run(args) -> List[Dict]:
+    events = build_events(args.events, args.seed)
+    uplinks = events["gs.up.receive"]
+    workdir = tempfile.mkdtemp(prefix="ingest_benchmark_")
+    engine = create_benchmark_engine(args.database_url, workdir, "ingest")
+    with Session(engine) as session:
+        session.add_all(AllRelation(**relation) for relation in events["relations"])
+        session.commit()
+
+    consumer = new_consumer(engine)
+    decoder = new_consumer(engine)
+    decoder.get_device_id_by_dev_addr_and_gateway_tti_id = lambda dev_addr, f_cnt, gateway_id: None
+    params = {"events": args.events, "seed": args.seed}
+    results = []
+
+    bodies = [json.dumps(json.dumps(event)).encode() for event in uplinks]
+    results.append(
+        measure(
+            "json_decode_stream_body",
+            lambda: [json.loads(json.loads(body)) for body in bodies],
+            repeat=args.repeat,
+            items=len(bodies),
+            params=params,
+        )
+    )
+    for name, decode in (
+            ("gs.up.receive", decoder.decode_gs_up_receive),
+            ("gs.status.receive", decoder.decode_gs_status_receive),
+            ("gs.gateway.connection.stats", decoder.decode_gs_gateway_connection_stats),
+    ):
+        batch = events[name]
+        results.append(
+            measure(
+                f"decode[{name}]",
+                lambda batch=batch, decode=decode: [decode(event) for event in batch],
+                repeat=args.repeat,
+                items=len(batch),
+                params=params,
+            )
+        )
+
+    toa_inputs = [(size, sf) for size in range(1, 51) for sf in range(7, 13)]
+    results.append(
+        measure(
+            "calculate_toa",
+            lambda: [calculate_toa(size, sf) for size, sf in toa_inputs],
+            repeat=args.repeat,
+            items=len(toa_inputs),
+        )
+    )
+
+    results.append(
+        measure(
+            "device_id_lookup",
+            lambda: [
+                consumer.get_device_id_by_dev_addr_and_gateway_tti_id(
+                    relation["dev_addr"], relation["last_f_cnt"], relation["gateway_tti_id"]
+                )
+                for relation in events["relations"][: args.db_rows]
+            ],
+            repeat=args.repeat,
+            items=min(args.db_rows, len(events["relations"])),
+            params=params,
+        )
+    )
+
+    decoded = [consumer.decode_gs_up_receive(event) for event in uplinks[: args.db_rows]]
+    results.append(
+        measure(
+            "store_data[NodeMetadataUl]",
+            lambda: [consumer.store_data(NodeMetadataUl(**row)) for row in decoded],
+            setup=lambda: clear_tables(engine, NodeMetadataUl),
+            repeat=args.repeat,
+            items=len(decoded),
+            params={"rows": len(decoded)},
+        )
+    )
+    results.append(
+        measure(
+            "calculate_pkt_replica_number",
+            lambda: [consumer.calculate_pkt_replica_number(row) for row in decoded],
+            setup=lambda: clear_tables(engine, PacketReplicaMetadata),
+            repeat=args.repeat,
+            items=len(decoded),
+            params={"rows": len(decoded)},
+        )
+    )
+
+    end_to_end_bodies = bodies[: args.db_rows]
+    service_logger = get_logger(
+        LoggerConfig(logfile=os.path.join(workdir, "ingest.log"), logger_name="benchmark_service_logger")
+    )
+    # Built like the service engine: SQL echo and slow query log as configured
+    service_engine = create_benchmark_engine(args.database_url, workdir, "ingest_service")
+    service_engine.echo = database_config.sql_echo
+    log_slow_queries(service_engine, service_logger.getChild("sql"), database_config.slow_query_ms)
+    with Session(service_engine) as session:
+        session.add_all(AllRelation(**relation) for relation in events["relations"])
+        session.commit()
+
+    for name, pipeline_engine, logger in (
+            ("ingest_end_to_end[in_memory_broker]", engine, None),
+            ("ingest_end_to_end[service_logging]", service_engine, service_logger),
+    ):
+        state = {}
+
+        def prepare_pipeline(pipeline_engine=pipeline_engine, logger=logger, state=state):
+            clear_tables(pipeline_engine, NodeMetadataUl, PacketReplicaMetadata)
+            broker = InMemoryBroker()
+            producer = InMemoryTransport(broker)
+            for body in end_to_end_bodies:
+                producer.publish(QUEUE_NAME, body)
+            pipeline = new_consumer(pipeline_engine, InMemoryTransport(broker), args.threads, logger)
+            pipeline.transport.consume(QUEUE_NAME, pipeline.callback, prefetch_count=args.threads)
+            state["consumer"] = pipeline
+
+        def run_pipeline(logger=logger, state=state):
+            pipeline = state["consumer"]
+            pipeline.transport.process_pending()
+            pipeline.thread_pool.shutdown(wait=True)
+            if logger is not None:
+                wait_for_log_writer(logger)
+
+        results.append(
+            measure(
+                name,
+                run_pipeline,
+                setup=prepare_pipeline,
+                repeat=args.repeat,
+                items=len(end_to_end_bodies),
+                params={
+                    "events": len(end_to_end_bodies),
+                    "threads": args.threads,
+                    "log_level": logger_config.loglevel if logger else None,
+                    "sql_echo": database_config.sql_echo if logger else None,
+                },
+            )
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--db-rows", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    write_results(args.output, run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+KPI calculation benchmarks: ``end_device_kpi_calculation_cycle`` and the gateway KPI functions
+against ``NodeMetadataUl`` tables of increasing size, seeded from the traffic generator.
+
+Run through ``run_benchmarks.py``, which puts ``kpi_calculation`` on the path.
+"""
+import argparse
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlmodel import Session
+
+from benchmarks.harness import (
+    create_benchmark_engine,
+    load_traffic_generator,
+    measure,
+    quiet_logger,
+    write_results,
+)
+from kpi_calculation.database.models import (
+    AllRelation,
+    GatewayConnectionStats,
+    GatewayConnectivityInterval,
+    NodeMetadataUl,
+)
+from kpi_calculation_services import EndDeviceKPICalculation, GatewayKPICalculation
+
+ROWS_PER_DEVICE = 250
+BANDWIDTH = 125000
+
+
+def approximate_airtime(payload_size: int, spreading_factor: int) -> float:
+    """LoRa time on air (ms) of an uplink on a 125 kHz channel with CR 4/5 and explicit header."""
+    symbol_time = (2 ** spreading_factor) / BANDWIDTH * 1000
+    payload_symbols = 8 + max((8 * payload_size - 4 * spreading_factor + 28 + 16) // (4 * spreading_factor) * 5, 0)
+    return (12.25 + payload_symbols) * symbol_time
+
+
+class KPIDataset:
+    """
+    ``NodeMetadataUl``, ``AllRelation``, ``GatewayConnectionStats`` and ``GatewayConnectivityInterval``
+    rows of one table size.
+    """
+
+    def __init__(self, num_rows: int, seed: int):
+        traffic_generator = load_traffic_generator()
+        scenario = traffic_generator.TrafficScenario(
+            num_devices=max(num_rows // ROWS_PER_DEVICE, 4),
+            num_gateways=max(num_rows // (ROWS_PER_DEVICE * 20), 3),
+            duration_sec=30 * 86400,
+            sampling_period_sec=(60, 300),
+            seed=seed,
+        )
+        generator = traffic_generator.TrafficGenerator(scenario)
+        self.relations = generator.all_relations()
+        self.uplink_rows: List[Dict] = []
+        last_received_at = scenario.start_time
+        for uplink in generator.uplinks():
+            if len(self.uplink_rows) >= num_rows:
+                break
+            if uplink.is_join:
+                continue
+            payload_size = len(uplink.raw_payload) // 2
+            airtime = approximate_airtime(payload_size, uplink.spreading_factor)
+            for reception in uplink.receptions:
+                self.uplink_rows.append(
+                    {
+                        "device_id": uplink.device_id,
+                        "dev_addr": uplink.dev_addr,
+                        "dev_eui": uplink.dev_eui,
+                        "application_id": uplink.application_id,
+                        "f_cnt": uplink.f_cnt,
+                        "gateway_id": reception.gateway_id,
+                        "rssi": reception.rssi,
+                        "snr": reception.snr,
+                        "channel_index": str(reception.channel_index),
+                        "bandwidth": str(BANDWIDTH),
+                        "spreading_factor": str(uplink.spreading_factor),
+                        "frequency": uplink.frequency,
+                        "consumed_airtime": str(airtime),
+                        "payload_size": payload_size,
+                        "m_type": "UNCONFIRMED_UP",
+                        "event_time": reception.received_at_tti,
+                        "received_at_gw": reception.received_at_gw,
+                        "received_at_tti": reception.received_at_tti,
+                    }
+                )
+                last_received_at = max(last_received_at, reception.received_at_gw)
+        self.start_time = scenario.start_time
+        self.end_time = last_received_at + timedelta(seconds=1)
+        self.connection_stats_rows = [
+            {
+                "event_time": at,
+                "gateway_id": gateway.gateway_id,
+                "gateway_eui": gateway.eui,
+                "connected_at": gateway.connected_at(at, scenario.start_time),
+            }
+            for gateway in generator.gateways
+            for at in self._ticks(scenario.start_time, self.end_time, scenario.connection_stats_period_sec)
+        ]
+        # One connectivity interval per connection, as the stream event consumer records them
+        connections: Dict = {}
+        for row in self.connection_stats_rows:
+            key = (row["gateway_id"], row["connected_at"])
+            connections[key] = max(connections.get(key, row["event_time"]), row["event_time"])
+        self.connectivity_rows = [
+            {"gateway_id": gateway_id, "up_from": connected_at, "up_to": up_to}
+            for (gateway_id, connected_at), up_to in connections.items()
+        ]
+        receptions = Counter((row["device_id"], row["gateway_id"]) for row in self.uplink_rows)
+        self.busiest_gateway_id = Counter(row["gateway_id"] for row in self.uplink_rows).most_common(1)[0][0]
+        self.device_gateway_pairs = [pair for pair, _ in receptions.most_common()]
+
+    @staticmethod
+    def _ticks(start: datetime, end: datetime, period_sec: int):
+        at = start
+        while at < end:
+            yield at
+            at += timedelta(seconds=period_sec)
+
+    def load(self, engine) -> None:
+        with Session(engine) as session:
+            session.bulk_insert_mappings(AllRelation, self.relations)
+            session.bulk_insert_mappings(NodeMetadataUl, self.uplink_rows)
+            session.bulk_insert_mappings(GatewayConnectionStats, self.connection_stats_rows)
+            session.bulk_insert_mappings(GatewayConnectivityInterval, self.connectivity_rows)
+            session.commit()
+
+
+def run_size(args, num_rows: int, workdir: str) -> List[Dict]:
+    dataset = KPIDataset(num_rows, args.seed)
+    engine = create_benchmark_engine(args.database_url, workdir, f"kpi_{num_rows}")
+    dataset.load(engine)
+    logger = quiet_logger("kpi")
+    end_device = EndDeviceKPICalculation(engine, 3, logger)
+    gateway = GatewayKPICalculation(end_device, 3600, engine, logger)
+    start_time, end_time = dataset.start_time, dataset.end_time
+    gateway_id = dataset.busiest_gateway_id
+    pairs = dataset.device_gateway_pairs[: args.devices]
+    params = {"rows": len(dataset.uplink_rows), "devices": len(pairs), "seed": args.seed}
+    results = [
+        measure(
+            f"end_device_kpi_calculation_cycle[{num_rows}]",
+            lambda: [
+                end_device.end_device_kpi_calculation_cycle(device_id, gw_id, start_time, end_time)
+                for device_id, gw_id in pairs
+            ],
+            repeat=args.repeat,
+            items=len(pairs),
+            params=params,
+        )
+    ]
+    gateway_params = {"rows": len(dataset.uplink_rows), "gateway_id": gateway_id, "seed": args.seed}
+    for name, func in (
+            ("get_total_uplink_messages_for_gateway", gateway.get_total_uplink_messages_for_gateway),
+            ("get_connected_nodes_info", gateway.get_connected_nodes_info),
+            ("get_gateway_utilization", gateway.get_gateway_utilization),
+            ("get_jitter_window", gateway.get_jitter_window),
+            ("get_gateway_availability", gateway.get_gateway_availability),
+            ("get_backhaul_latency", gateway.get_backhaul_latency),
+    ):
+        results.append(
+            measure(
+                f"{name}[{num_rows}]",
+                lambda func=func: func(gateway_id, start_time, end_time),
+                repeat=args.repeat,
+                params=gateway_params,
+            )
+        )
+    devices_kpis = [
+        kpis
+        for kpis in (
+            end_device.end_device_kpi_calculation_cycle(device_id, gw_id, start_time, end_time)
+            for device_id, gw_id in pairs
+            if gw_id == gateway_id
+        )
+        if kpis is not None
+    ]
+    results.append(
+        measure(
+            f"calculate_kpis_for_gateway[{num_rows}]",
+            lambda: gateway.calculate_kpis_for_gateway(gateway_id, devices_kpis, start_time, end_time),
+            repeat=args.repeat,
+            params=gateway_params,
+        )
+    )
+    engine.dispose()
+    return results
+
+
+def run(args) -> List[Dict]:
+    workdir = tempfile.mkdtemp(prefix="kpi_benchmark_")
+    results = []
+    for num_rows in args.sizes:
+        results.extend(run_size(args, num_rows, workdir))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=[1000, 10000, 100000])
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    write_results(args.output, run(args))
+
+
+if __name__ == "__main__":
+    main()
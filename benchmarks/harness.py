@@ -0,0 +1,109 @@
+"""
+Helpers shared by the benchmark modules.
+
+Each benchmark module runs in its own interpreter with a single service directory on the path
+(the services all ship their own ``database`` and ``dependencies`` packages), writes its results
+as JSON to the file given by ``run_benchmarks.py`` and leaves the bookkeeping to it.
+"""
+import gc
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel, create_engine
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRAFFIC_GENERATOR_DIR = os.path.join(REPO_ROOT, "stream_event_consumer", "tests", "utils")
+
+
+def quiet_logger(name: str) -> logging.Logger:
+    """
+    A logger that only lets warnings through, so log I/O does not dominate the measurements of
+    the processing code.
+    """
+    logger = logging.getLogger(f"benchmark.{name}")
+    logger.setLevel(os.getenv("BENCHMARK_LOG_LEVEL", "WARNING").upper())
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+    return logger
+
+
+def load_traffic_generator():
+    """Imports the seeded traffic generator that lives with the stream event consumer tests."""
+    if TRAFFIC_GENERATOR_DIR not in sys.path:
+        sys.path.insert(0, TRAFFIC_GENERATOR_DIR)
+    import traffic_generator
+
+    return traffic_generator
+
+
+def create_benchmark_engine(database_url: Optional[str], workdir: str, name: str):
+    """
+    Creates an empty database for one benchmark: the given (local Postgres) URL, or a fresh SQLite
+    file in ``workdir``. Tables of every model imported so far are created.
+    """
+    if database_url:
+        engine = create_engine(database_url, poolclass=NullPool)
+        SQLModel.metadata.drop_all(engine)
+    else:
+        engine = create_engine(f"sqlite:///{os.path.join(workdir, name + '.db')}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def measure(name: str, func: Callable[[], object], repeat: int = 5, number: int = 1,
+            setup: Optional[Callable[[], None]] = None, items: int = 1, params: Optional[Dict] = None) -> Dict:
+    """
+    Times ``func`` ``repeat`` times (each run calls it ``number`` times) and summarises the runs.
+
+    Args:
+        name: Benchmark name, the key used to compare runs.
+        func: The code under test.
+        repeat: Number of timed runs.
+        number: Calls of ``func`` per run.
+        setup: Called, untimed, before every run.
+        items: Number of items (events, rows, ...) processed by one call, used for throughput.
+        params: Extra information stored with the result (dataset size, ...).
+    """
+    timings: List[float] = []
+    cpu_timings: List[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        gc.disable()
+        try:
+            cpu_started = time.process_time()
+            started = time.perf_counter()
+            for _ in range(number):
+                func()
+            timings.append((time.perf_counter() - started) / number)
+            cpu_timings.append((time.process_time() - cpu_started) / number)
+        finally:
+            gc.enable()
+    median = statistics.median(timings)
+    return {
+        "name": name,
+        "repeat": repeat,
+        "number": number,
+        "items": items,
+        "min_sec": min(timings),
+        "median_sec": median,
+        "mean_sec": statistics.mean(timings),
+        "stdev_sec": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        # CPU time of the whole process, background threads (log writer, pools) included
+        "cpu_median_sec": statistics.median(cpu_timings),
+        "items_per_sec": items / median if median else None,
+        "params": params or {},
+    }
+
+
+def write_results(path: str, results: List[Dict]) -> None:
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
@@ -0,0 +1,198 @@
+"""
+Runs the ingest, KPI and API benchmark suites, keeps their results in a JSON history file and compares
+two runs of that history.
+
+    python -m benchmarks.run_benchmarks run --quick --label my-change
+    python -m benchmarks.run_benchmarks compare --threshold 10
+
+``compare`` exits with status 1 when the median time of a benchmark of the candidate run is more
+than ``--threshold`` percent above the one of the baseline run.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from benchmarks.harness import REPO_ROOT
+
+DEFAULT_HISTORY = os.path.join(REPO_ROOT, "benchmarks", "results", "history.json")
+
+SUITES = {
+    "ingest": ("stream_event_consumer", "benchmarks.bench_ingest"),
+    "kpi": ("kpi_calculation", "benchmarks.bench_kpi"),
+    "api": ("backend", "benchmarks.bench_api"),
+}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def suite_arguments(suite: str, args) -> List[str]:
+    arguments = ["--repeat", str(args.repeat)]
+    if args.database_url:
+        arguments += ["--database-url", args.database_url]
+    if suite == "kpi":
+        arguments += ["--sizes", args.sizes]
+    if args.quick and suite == "ingest":
+        arguments += ["--events", "300", "--db-rows", "100"]
+    if args.quick and suite == "api":
+        arguments += ["--requests", "500", "--nodes", "50"]
+    return arguments
+
+
+def run_suite(suite: str, args) -> List[Dict]:
+    """
+    Runs one suite in its own interpreter with the service directory on the path, the way the
+    service itself is started, and returns its results.
+    """
+    service_dir, module = SUITES[suite]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([REPO_ROOT, os.path.join(REPO_ROOT, service_dir)])
+    # The services create their module level engine on import; the benchmarks use their own.
+    env.setdefault("POSTGRES_URL", "sqlite://")
+    with tempfile.TemporaryDirectory() as workdir:
+        output = os.path.join(workdir, f"{suite}.json")
+        subprocess.run(
+            [sys.executable, "-m", module, "--output", output] + suite_arguments(suite, args),
+            cwd=os.path.join(REPO_ROOT, service_dir),
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        with open(output) as file:
+            return json.load(file)
+
+
+def load_history(path: str) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_history(path: str, history: List[Dict]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(history, file, indent=2)
+
+
+def print_results(results: List[Dict]) -> None:
+    print(f"{'benchmark':<58} {'median ms':>12} {'stdev ms':>10} {'cpu ms':>10} {'items/s':>12}")
+    for result in results:
+        items_per_sec = result["items_per_sec"]
+        print(
+            f"{result['name']:<58} {result['median_sec'] * 1000:>12.3f} {result['stdev_sec'] * 1000:>10.3f} "
+            f"{result.get('cpu_median_sec', 0) * 1000:>10.3f} "
+            f"{items_per_sec if items_per_sec is None else round(items_per_sec):>12}"
+        )
+
+
+def run(args) -> int:
+    suites = list(SUITES) if args.suite == "all" else [args.suite]
+    if args.quick:
+        args.sizes = "1000"
+        args.repeat = min(args.repeat, 3)
+    results = []
+    for suite in suites:
+        print(f"Running {suite} benchmarks...", flush=True)
+        results.extend(dict(result, suite=suite) for result in run_suite(suite, args))
+    history = load_history(args.history)
+    history.append(
+        {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "label": args.label,
+            "quick": args.quick,
+            "database": "postgres" if args.database_url else "sqlite",
+            "results": results,
+        }
+    )
+    save_history(args.history, history)
+    print_results(results)
+    print(f"Run {len(history) - 1} saved to {args.history}")
+    return 0
+
+
+def compare_runs(baseline: Dict, candidate: Dict, threshold: float) -> List[Dict]:
+    """Relative change of the median time of every benchmark present in both runs."""
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+    comparison = []
+    for result in candidate["results"]:
+        reference = baseline_results.get(result["name"])
+        if reference is None or not reference["median_sec"]:
+            continue
+        change = (result["median_sec"] - reference["median_sec"]) / reference["median_sec"] * 100
+        comparison.append(
+            {
+                "name": result["name"],
+                "baseline_sec": reference["median_sec"],
+                "candidate_sec": result["median_sec"],
+                "change_percent": change,
+                "regression": change > threshold,
+            }
+        )
+    return comparison
+
+
+def compare(args) -> int:
+    history = load_history(args.history)
+    if len(history) < 2:
+        print(f"Need at least two runs in {args.history} to compare, found {len(history)}")
+        return 2
+    baseline, candidate = history[args.baseline], history[args.candidate]
+    comparison = compare_runs(baseline, candidate, args.threshold)
+    print(
+        f"Baseline {baseline['commit']} ({baseline['timestamp']}) -> "
+        f"candidate {candidate['commit']} ({candidate['timestamp']}), threshold {args.threshold}%"
+    )
+    print(f"{'benchmark':<58} {'baseline ms':>12} {'candidate ms':>13} {'change':>9}")
+    for entry in comparison:
+        print(
+            f"{entry['name']:<58} {entry['baseline_sec'] * 1000:>12.3f} {entry['candidate_sec'] * 1000:>13.3f} "
+            f"{entry['change_percent']:>+8.1f}%{'  REGRESSION' if entry['regression'] else ''}"
+        )
+    regressions = [entry for entry in comparison if entry["regression"]]
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold}%")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest, KPI calculation and API benchmarks")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON file holding the runs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and append the results to the history")
+    run_parser.add_argument("--suite", choices=["all"] + list(SUITES), default="all")
+    run_parser.add_argument("--sizes", default="1000,10000,100000", help="NodeMetadataUl table sizes of the KPI suite")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--quick", action="store_true", help="Smallest dataset only, for a smoke run")
+    run_parser.add_argument("--database-url", default=None,
+                            help="Local Postgres to benchmark against (dropped and recreated); SQLite files by default")
+    run_parser.add_argument("--label", default=None)
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two runs of the history")
+    compare_parser.add_argument("--baseline", type=int, default=-2, help="Index of the baseline run")
+    compare_parser.add_argument("--candidate", type=int, default=-1, help="Index of the candidate run")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="Allowed slowdown of the median time, in percent")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field
 from sqlmodel import SQLModel
 
@@ -244,6 +245,38 @@ class EndDeviceKPIs(SQLModel, table=True):
     frequency_ratios: Optional[str] = None
 
 
+class EndDeviceKPISketches(SQLModel, table=True):
+    """
+    This model represents the quantile sketches of the uplinks of an end device through a gateway over
+    a KPI interval, next to its ``EndDeviceKPIs``. The sketches of any set of devices, gateways and
+    intervals merge into the approximate percentiles of their uplinks (``dependencies.sketches``).
+
+    Fields:
+        id (int, optional): The ID of the sketches.
+        interval_start_time (datetime): The start of the KPI interval.
+        interval_end_time (datetime): The end of the KPI interval.
+        device_id (str): The ID of the end device.
+        gateway_id (str): The ID of the gateway.
+        snr_sketch (bytes, optional): The encoded sketch of the SNR of the uplinks, in dB.
+        rssi_sketch (bytes, optional): The encoded sketch of the RSSI of the uplinks, in dBm.
+        latency_sketch (bytes, optional): The encoded sketch of the time between the reception of the
+            uplinks by the gateway and by TTI, in milliseconds.
+    """
+
+    __table_args__ = (
+        Index("ix_enddevicekpisketches_gateway_interval", "gateway_id", "interval_start_time"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    interval_start_time: datetime = Field(index=True)
+    interval_end_time: datetime
+    device_id: str = Field(index=True)
+    gateway_id: str
+    snr_sketch: Optional[bytes] = None
+    rssi_sketch: Optional[bytes] = None
+    latency_sketch: Optional[bytes] = None
+
+
 class GatewayKPIs(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     interval_start_time: Optional[datetime] = Field(index=True)
@@ -282,3 +315,123 @@ class GatewayKPIs(SQLModel, table=True):
     spreading_factor_ratios: Optional[dict[str, float]] = None
     frequency_distribution: Optional[dict[str, int]] = None
     frequency_ratios: Optional[dict[str, float]] = None
+
+
+class GatewayLatencyKPIs(SQLModel, table=True):
+    """
+    This model represents the backhaul latency of a gateway over a KPI interval: the time between the
+    reception of its uplinks by the gateway and by TTI, in milliseconds.
+
+    Fields:
+        id (int, optional): The ID of the KPIs.
+        interval_start_time (datetime): The start of the KPI interval.
+        interval_end_time (datetime): The end of the KPI interval.
+        gateway_id (str): The ID of the gateway.
+        latency_count (int): The number of uplinks with both reception times.
+        latency_mean (float): The mean latency.
+        latency_p50 (float): The median latency.
+        latency_p95 (float): The 95th percentile of the latency.
+        latency_p99 (float): The 99th percentile of the latency.
+        latency_max (float): The maximum latency.
+        outlier_count (int): The number of uplinks whose latency is far above the median.
+        outlier_ratio (float): The share of the uplinks whose latency is far above the median.
+        negative_count (int): The number of uplinks received by TTI before the gateway, by their clocks.
+        rtt_median (float, optional): The median round trip time between the gateway and TTI, from the
+            connection stats of the gateway.
+        clock_offset (float): The estimated offset of the clock of the gateway behind the clock of TTI,
+            negative when it runs ahead.
+        clock_skew_suspected (bool): Whether the offset is beyond the tolerance, the latencies of the
+            interval are then biased by it.
+        latency_sketch (bytes, optional): The encoded sketch of the latency of the uplinks.
+    """
+
+    __table_args__ = (
+        Index("ix_gatewaylatencykpis_gateway_interval", "gateway_id", "interval_start_time"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    interval_start_time: datetime = Field(index=True)
+    interval_end_time: datetime
+    gateway_id: str
+    latency_count: int
+    latency_mean: float
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+    latency_max: float
+    outlier_count: int
+    outlier_ratio: float
+    negative_count: int
+    rtt_median: Optional[float] = None
+    clock_offset: float
+    clock_skew_suspected: bool
+    latency_sketch: Optional[bytes] = None
+
+
+class GatewayDeviceSketches(SQLModel, table=True):
+    """
+    This model represents the distinct count sketches of the end devices heard by a gateway over a KPI
+    interval. The sketches of any set of gateways and intervals merge into the approximate number of
+    distinct devices they heard, a device heard by several of them counted once
+    (``dependencies.hyperloglog``).
+
+    Fields:
+        id (int, optional): The ID of the sketches.
+        interval_start_time (datetime): The start of the KPI interval.
+        interval_end_time (datetime): The end of the KPI interval.
+        gateway_id (str): The ID of the gateway.
+        device_sketch (bytes, optional): The encoded sketch of the IDs of the registered end devices.
+        dev_addr_sketch (bytes, optional): The encoded sketch of the device addresses of the uplinks
+            without end device ID.
+    """
+
+    __table_args__ = (
+        Index("ix_gatewaydevicesketches_gateway_interval", "gateway_id", "interval_start_time"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    interval_start_time: datetime = Field(index=True)
+    interval_end_time: datetime
+    gateway_id: str
+    device_sketch: Optional[bytes] = None
+    dev_addr_sketch: Optional[bytes] = None
+
+
+class GatewayConnectivityInterval(SQLModel, table=True):
+    """
+    This model represents a period during which a gateway was connected, built by the stream event
+    consumer from the connection stats and status events of the gateway.
+
+    Fields:
+        id (int, optional): The ID of the interval.
+        gateway_id (str): The ID of the gateway.
+        up_from (datetime): The start of the period, in UTC.
+        up_to (datetime): The end of the period, the last time the gateway was seen connected, in UTC.
+    """
+
+    __table_args__ = (Index("ix_gatewayconnectivityinterval_gateway_up_from", "gateway_id", "up_from"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    gateway_id: str
+    up_from: datetime
+    up_to: datetime
+
+
+class KPIBackfillChunk(SQLModel, table=True):
+    """
+    This model records a chunk of a KPI backfill whose KPIs are written, so that an interrupted
+    backfill resumes with the chunks left.
+
+    Fields:
+        job_id (str): The ID of the backfill.
+        gateway_id (str): The ID of the gateway of the chunk.
+        interval_start_time (datetime): The start of the window of the chunk.
+        interval_end_time (datetime): The end of the window of the chunk.
+        completed_at (datetime): When the KPIs of the chunk were written.
+    """
+
+    job_id: str = Field(primary_key=True)
+    gateway_id: str = Field(primary_key=True)
+    interval_start_time: datetime = Field(primary_key=True)
+    interval_end_time: datetime
+    completed_at: datetime
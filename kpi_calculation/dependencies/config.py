@@ -1,3 +1,6 @@
+import os
+
+
 class LoggerConfig:
     def __init__(
         self,
@@ -6,12 +9,20 @@ class LoggerConfig:
         logger_name: str = "kpi_calculation",
         max_bytes: int = 100000,
         backup_count: int = 10,
+        async_logging: bool = True,
+        queue_size: int = 10000,
+        hot_path_sample_every: int = 1,
+        hot_path_max_per_second: float = 10,
     ) -> None:
         self.loglevel = loglevel
         self.logfile = logfile
         self.max_bytes = max_bytes
         self.backup_count = backup_count
         self.logger_name = logger_name
+        self.async_logging = async_logging
+        self.queue_size = queue_size
+        self.hot_path_sample_every = hot_path_sample_every
+        self.hot_path_max_per_second = hot_path_max_per_second
 
 
 class KPIConfig:
@@ -25,5 +36,51 @@ class KPIConfig:
     FROM_BYTE_TO_BITS = 8
 
 
+class DatabaseConfig:
+    def __init__(
+        self,
+        sql_echo: bool = os.environ.get("SQL_ECHO", "false").lower() in ("1", "true", "yes"),
+        slow_query_ms: float = float(os.environ.get("SLOW_QUERY_MS", "200")),
+    ) -> None:
+        self.sql_echo = sql_echo
+        self.slow_query_ms = slow_query_ms
+
+
+class MetricsConfig:
+    def __init__(
+        self,
+        enabled: bool = os.environ.get("METRICS_ENABLED", "false").lower() in ("1", "true", "yes"),
+        port: int = int(os.environ.get("METRICS_PORT", "9100")),
+    ) -> None:
+        self.enabled = enabled
+        self.port = port
+
+
+class BackfillConfig:
+    def __init__(
+        self,
+        workers: int = int(os.environ.get("KPI_BACKFILL_WORKERS", "4")),
+        max_chunks_per_second: float = float(os.environ.get("KPI_BACKFILL_MAX_CHUNKS_PER_SECOND", "0")),
+    ) -> None:
+        self.workers = workers
+        self.max_chunks_per_second = max_chunks_per_second
+
+
+class LatencyConfig:
+    def __init__(
+        self,
+        outlier_mads: float = float(os.environ.get("KPI_LATENCY_OUTLIER_MADS", "5")),
+        outlier_min_ms: float = float(os.environ.get("KPI_LATENCY_OUTLIER_MIN_MS", "1000")),
+        clock_skew_tolerance_ms: float = float(os.environ.get("KPI_CLOCK_SKEW_TOLERANCE_MS", "500")),
+    ) -> None:
+        self.outlier_mads = outlier_mads
+        self.outlier_min_ms = outlier_min_ms
+        self.clock_skew_tolerance_ms = clock_skew_tolerance_ms
+
+
 logger_config = LoggerConfig()
 kpi_calculation_config = KPIConfig()
+database_config = DatabaseConfig()
+metrics_config = MetricsConfig()
+backfill_config = BackfillConfig()
+latency_config = LatencyConfig()
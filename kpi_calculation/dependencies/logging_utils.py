@@ -0,0 +1,153 @@
+"""
+Logging pipeline of the service: records are put on a queue by the calling thread and written by
+a background listener, hot-path messages go through a sampling/rate limiting child logger and
+slow SQL statements are logged instead of echoing every statement.
+"""
+import atexit
+import copy
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+from .config import logger_config
+
+HOT_PATH_LOGGER_SUFFIX = "hot"
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Puts the records on the queue with their arguments merged into the message, the rest of the
+    formatting (time, traceback) is left to the listener thread. A record is only built and merged
+    once the level and filters of the logger let it through, and the arguments cannot change before
+    it is written. Records are dropped, and counted, while the queue is full instead of blocking the
+    hot path.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A copy, like QueueHandler does, the other handlers of the logger get the record as logged
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per message template: lets ``max_per_second`` records through with bursts of
+    ``burst`` records.
+    """
+
+    def __init__(self, max_per_second: float, burst: Optional[int] = None):
+        super().__init__()
+        self.max_per_second = max_per_second
+        self.burst = burst or max(int(max_per_second), 1)
+        # (level, message template) -> [tokens, last refill]
+        self.buckets: Dict[Tuple[int, str], List[float]] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [float(self.burst), now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.max_per_second)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Lets one record out of ``sample_every`` through, per message template."""
+
+    def __init__(self, sample_every: int):
+        super().__init__()
+        self.sample_every = max(int(sample_every), 1)
+        self.counters: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.sample_every == 1:
+            return True
+        key = str(record.msg)
+        with self.lock:
+            count = self.counters.get(key, 0)
+            self.counters[key] = count + 1
+        return count % self.sample_every == 0
+
+
+def start_queue_logging(logger: logging.Logger, handlers: List[logging.Handler],
+                        queue_size: int = 10000) -> QueueListener:
+    """
+    Routes the records of ``logger`` through a bounded queue to ``handlers``, written by a
+    background listener that is stopped, after flushing the queue, at interpreter exit.
+    """
+    log_queue = queue.Queue(maxsize=queue_size)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_queue_logging, listener)
+    return listener
+
+
+def stop_queue_logging(listener: QueueListener) -> None:
+    """Writes the records left on the queue and stops the listener, if it is still running."""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def get_hot_path_logger(logger, sample_every: int = None, max_per_second: float = None):
+    """
+    Child logger for messages logged per event on the hot paths, sampled and rate limited so a
+    burst of events cannot flood the log. It shares the level and handlers of ``logger``.
+    """
+    if not isinstance(logger, logging.Logger):
+        return logger
+    hot_logger = logger.getChild(HOT_PATH_LOGGER_SUFFIX)
+    if not hot_logger.filters:
+        sample_every = logger_config.hot_path_sample_every if sample_every is None else sample_every
+        max_per_second = logger_config.hot_path_max_per_second if max_per_second is None else max_per_second
+        hot_logger.addFilter(SamplingFilter(sample_every))
+        if max_per_second:
+            hot_logger.addFilter(RateLimitFilter(max_per_second))
+    return hot_logger
+
+
+def log_slow_queries(engine, logger: logging.Logger, threshold_ms: float) -> None:
+    """Logs, as warnings, the SQL statements of ``engine`` that take longer than ``threshold_ms``."""
+    if threshold_ms is None or threshold_ms < 0:
+        return
+    # Imported here, the module is shared with services without a database.
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def log_slow_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_started_at"].pop()) * 1000
+        if elapsed_ms >= threshold_ms:
+            logger.warning("Slow query (%.1f ms): %s | parameters: %.500r", elapsed_ms, statement, parameters)
+
+    @event.listens_for(engine, "handle_error")
+    def discard_query_timer(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started_at"):
+            connection.info["query_started_at"].pop()
@@ -0,0 +1,183 @@
+"""
+Mergeable quantile sketches (DDSketch) of the KPI values, e.g. the SNR, RSSI and latency of the
+uplinks of a device through a gateway over a window.
+
+A sketch counts the values in logarithmic buckets: bucket ``i`` holds the values between
+``gamma ** (i - 1)`` and ``gamma ** i``, with ``gamma = (1 + alpha) / (1 - alpha)``, so a quantile read
+back is within a relative error ``alpha`` of the true value. The negative values (RSSI, SNR below
+the noise floor) have their own buckets. Two sketches of the same ``alpha`` merge by adding their
+bucket counts, so the sketches of windows, devices and gateways combine into the sketch of any
+horizon with the same error as if it had seen all the values.
+
+The values of a KPI span a few orders of magnitude at most, so a sketch holds a few hundred buckets
+and encodes in a few hundred bytes.
+"""
+import math
+import struct
+from typing import Dict, Iterable, Optional
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# The values closer to zero than this are counted as zero
+MIN_MAGNITUDE = 1e-9
+
+_VERSION = 1
+_HEADER = struct.Struct("<BdQddd")
+
+
+def _write_varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, offset: int):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"Invalid relative accuracy: {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def key(self, magnitude: float) -> int:
+        return math.ceil(math.log(magnitude) / self.log_gamma)
+
+    def value(self, key: int) -> float:
+        """The estimate of the values of bucket ``key``, within the relative accuracy of all of them."""
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        value = float(value)
+        if math.isnan(value):
+            return
+        if value > MIN_MAGNITUDE:
+            key = self.key(value)
+            self.positive[key] = self.positive.get(key, 0) + count
+        elif value < -MIN_MAGNITUDE:
+            key = self.key(-value)
+            self.negative[key] = self.negative.get(key, 0) + count
+        else:
+            self.zero_count += count
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def extend(self, values: Iterable[float]) -> "DDSketch":
+        for value in values:
+            if value is not None:
+                self.add(value)
+        return self
+
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(
+                f"Cannot merge sketches of relative accuracy {self.relative_accuracy} and {other.relative_accuracy}"
+            )
+        for key, count in other.positive.items():
+            self.positive[key] = self.positive.get(key, 0) + count
+        for key, count in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The value of the quantile ``q`` (0 to 1), None if the sketch is empty."""
+        if not 0 <= q <= 1:
+            raise ValueError(f"Invalid quantile: {q}")
+        if not self.count:
+            return None
+        # The extremes are known exactly
+        if q == 0:
+            return self.min
+        if q == 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = 0
+        # From the lowest value: the negative buckets of the largest magnitude first
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return min(self.max, max(self.min, -self.value(key)))
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return max(self.min, min(self.max, self.value(key)))
+        return self.max
+
+    def to_bytes(self) -> bytes:
+        out = bytearray(_HEADER.pack(_VERSION, self.relative_accuracy, self.zero_count, self.sum, self.min, self.max))
+        for buckets in (self.positive, self.negative):
+            _write_varint(len(buckets), out)
+            previous = 0
+            # The keys are sorted and delta encoded, the deltas are small
+            for key in sorted(buckets):
+                _write_varint(_zigzag(key - previous), out)
+                _write_varint(buckets[key], out)
+                previous = key
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DDSketch":
+        version, relative_accuracy, zero_count, total, minimum, maximum = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unknown sketch version: {version}")
+        sketch = cls(relative_accuracy)
+        sketch.zero_count, sketch.sum, sketch.min, sketch.max = zero_count, total, minimum, maximum
+        offset = _HEADER.size
+        for buckets in (sketch.positive, sketch.negative):
+            size, offset = _read_varint(data, offset)
+            key = 0
+            for _ in range(size):
+                delta, offset = _read_varint(data, offset)
+                count, offset = _read_varint(data, offset)
+                key += _unzigzag(delta)
+                buckets[key] = count
+        sketch.count = zero_count + sum(sketch.positive.values()) + sum(sketch.negative.values())
+        return sketch
+
+
+def merge_sketches(encoded: Iterable[Optional[bytes]],
+                   relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> DDSketch:
+    """The merge of the encoded sketches, the missing ones skipped."""
+    merged = DDSketch(relative_accuracy)
+    for data in encoded:
+        if data:
+            merged.merge(DDSketch.from_bytes(data))
+    return merged
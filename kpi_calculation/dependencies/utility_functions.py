@@ -1,9 +1,10 @@
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
 import logging
 import sys
 from logging.handlers import RotatingFileHandler
 from .config import LoggerConfig
+from .logging_utils import start_queue_logging
 
 UPLINK_FREQUENCY_PLAN = {"EU863_870": [868.1, 868.3, 868.5, 867.1, 867.3, 867.5, 867.7, 867.9]}
 UPLINK_SF = {"EU863_870": [7, 8, 9, 10, 11, 12]}
@@ -33,6 +34,9 @@ def get_logger(logger_config: LoggerConfig) -> logging.Logger:
     if not isinstance(numeric_level, int):
         raise ValueError(f"Invalid log level: {logger_config.loglevel}")
     logger.setLevel(numeric_level)
+    if logger.handlers:
+        # Already set up, the handlers are shared by every caller
+        return logger
 
     # Configure log file handler
     try:
@@ -44,12 +48,17 @@ def get_logger(logger_config: LoggerConfig) -> logging.Logger:
     except IOError as e:
         raise IOError(f"Error opening log file: {e}")
     log_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s: %(message)s"))
-    logger.addHandler(log_handler)
 
     # Configure console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
-    logger.addHandler(console_handler)
+
+    if logger_config.async_logging:
+        # Formatting and writing happen in a background thread, off the hot paths
+        start_queue_logging(logger, [log_handler, console_handler], logger_config.queue_size)
+    else:
+        logger.addHandler(log_handler)
+        logger.addHandler(console_handler)
 
     return logger
 
@@ -128,3 +137,31 @@ def string_to_datetime(s):
         except ValueError:
             pass
     raise ValueError(f"Invalid datetime string: {s}")
+
+
+def union_duration(intervals: Iterable[Tuple[datetime, datetime]], start: datetime, end: datetime) -> timedelta:
+    """
+    The time between ``start`` and ``end`` covered by at least one of the ``(from, to)`` intervals,
+    counting only once the time covered by several of them.
+    """
+    covered = timedelta()
+    covered_to = start
+    for up_from, up_to in sorted(intervals):
+        up_from, up_to = max(up_from, covered_to), min(up_to, end)
+        if up_to > up_from:
+            covered += up_to - up_from
+            covered_to = up_to
+    return covered
+
+
+def parse_duration_ms(duration) -> Optional[float]:
+    """
+    A duration of the TTI API, in seconds with an ``s`` suffix (e.g. ``"0.045s"``), in milliseconds.
+    None if the duration is missing or invalid.
+    """
+    if duration is None:
+        return None
+    try:
+        return float(str(duration).strip().rstrip("s")) * 1000
+    except ValueError:
+        return None
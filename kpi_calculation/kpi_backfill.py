@@ -0,0 +1,256 @@
+"""
+Backfill of the KPIs: recomputes the ``EndDeviceKPIs`` and ``GatewayKPIs``, and the sketches and
+latency rows next to them, of a past time range, e.g. after a change of the KPI logic or a fix of the
+data, where the scheduled calculation only walks forward from ``processed_till_time``.
+
+The range is split into one chunk per gateway and window, run on a pool of workers. Each chunk
+replaces the KPIs of its gateway and window, and records its progress, in one transaction: running
+a chunk twice leaves the same rows, and running an interrupted backfill again with the same
+arguments only runs the chunks left.
+
+Usage:
+    python kpi_backfill.py --start 2023-03-27 --end 2023-04-27 --window-minutes 60 \\
+        [--gateways <gateway id>,<gateway id>] [--workers 4] [--max-chunks-per-second 2] \\
+        [--job-id <id>] [--restart]
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import delete
+from sqlmodel import Session, SQLModel, select
+
+from database.db import create_db_and_tables, db_engine
+from dependencies import utility_functions
+from dependencies.config import backfill_config, latency_config, logger_config
+from dependencies.exceptions import DatabaseError
+from dependencies.metrics import registry
+from kpi_calculation.database.models import EndDeviceKPIs, EndDeviceKPISketches, GatewayKPIs
+from kpi_calculation.database.models import GatewayDeviceSketches, GatewayLatencyKPIs, KPIBackfillChunk
+from kpi_calculation_services import EndDeviceKPICalculation, GatewayKPICalculation
+
+BACKFILL_CHUNKS = registry.counter("kpi_backfill_chunks", "Chunks of the KPI backfills, by outcome", ["outcome"])
+
+
+class BackfillChunk(NamedTuple):
+    gateway_id: str
+    interval_start_time: datetime
+    interval_end_time: datetime
+
+
+def split_windows(start_time: datetime, end_time: datetime, window: timedelta) -> List[Tuple[datetime, datetime]]:
+    """The consecutive windows of ``window`` from ``start_time``, the last one ending at ``end_time``."""
+    windows = []
+    window_start = start_time
+    while window_start < end_time:
+        windows.append((window_start, min(window_start + window, end_time)))
+        window_start += window
+    return windows
+
+
+def backfill_job_id(start_time: datetime, end_time: datetime, window: timedelta,
+                    gateway_ids: Optional[Iterable[str]] = None) -> str:
+    """The ID of the backfill of these arguments, the same for every run of them so that it resumes."""
+    gateways = ",".join(sorted(gateway_ids)) if gateway_ids else "*"
+    key = f"{start_time.isoformat()}|{end_time.isoformat()}|{window.total_seconds()}|{gateways}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+class Throttle:
+    """Spaces the starts of the chunks of all the workers by at least ``1 / max_per_second`` seconds."""
+
+    def __init__(self, max_per_second: float = 0, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.interval = 1 / max_per_second if max_per_second > 0 else 0
+        self.clock = clock
+        self.sleep = sleep
+        self.next_start = None
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self.lock:
+            now = self.clock()
+            start = now if self.next_start is None else max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            self.sleep(start - now)
+
+
+class KPIBackfill:
+    def __init__(self, gateway_kpi_calculation, engine, logger, workers: int = 4, max_chunks_per_second: float = 0,
+                 progress_every: int = 100):
+        """
+        Args:
+            gateway_kpi_calculation: The ``GatewayKPICalculation`` computing the KPIs of the chunks.
+            engine: The engine of the KPI database.
+            logger: A logger object for logging events.
+            workers: The number of chunks run at a time, each with its own database session.
+            max_chunks_per_second: The most chunks started per second over all the workers, 0 for no
+                limit, to bound the load of the backfill on the database.
+            progress_every: The number of chunks between two progress messages.
+        """
+        self.gateway_kpi_calculation = gateway_kpi_calculation
+        self.db_engine = engine
+        self.logger = logger
+        self.workers = workers
+        self.throttle = Throttle(max_chunks_per_second)
+        self.progress_every = progress_every
+
+    @staticmethod
+    def plan(start_time: datetime, end_time: datetime, window: timedelta,
+             gateway_ids: Iterable[str]) -> List[BackfillChunk]:
+        """The chunks of the backfill, window after window so that the range fills from its start."""
+        gateway_ids = sorted(gateway_ids)
+        return [
+            BackfillChunk(gateway_id, window_start, window_end)
+            for window_start, window_end in split_windows(start_time, end_time, window)
+            for gateway_id in gateway_ids
+        ]
+
+    def completed_chunks(self, job_id: str) -> Set[Tuple[str, datetime]]:
+        with Session(self.db_engine) as session:
+            return set(session.exec(
+                select(KPIBackfillChunk.gateway_id, KPIBackfillChunk.interval_start_time)
+                .where(KPIBackfillChunk.job_id == job_id)
+            ).all())
+
+    def forget(self, job_id: str) -> None:
+        """Forgets the progress of the backfill, so that all its chunks run again."""
+        with Session(self.db_engine) as session:
+            session.execute(delete(KPIBackfillChunk).where(KPIBackfillChunk.job_id == job_id))
+            session.commit()
+
+    def replace_window(self, job_id: str, chunk: BackfillChunk, rows: List[SQLModel],
+                       gateway_kpis: Optional[GatewayKPIs]) -> None:
+        """Replaces the KPIs of the gateway and window of the chunk and records it as done, in one transaction."""
+        with Session(self.db_engine) as session:
+            try:
+                for model in (EndDeviceKPIs, EndDeviceKPISketches, GatewayKPIs, GatewayLatencyKPIs,
+                              GatewayDeviceSketches):
+                    session.execute(delete(model).where(
+                        model.gateway_id == chunk.gateway_id,
+                        model.interval_start_time >= chunk.interval_start_time,
+                        model.interval_start_time < chunk.interval_end_time,
+                    ))
+                session.add_all(rows)
+                if gateway_kpis is not None:
+                    session.add(gateway_kpis)
+                session.merge(KPIBackfillChunk(
+                    job_id=job_id,
+                    gateway_id=chunk.gateway_id,
+                    interval_start_time=chunk.interval_start_time,
+                    interval_end_time=chunk.interval_end_time,
+                    completed_at=datetime.utcnow(),
+                ))
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                self.logger.error(f"Error in replace_window: {str(e)}")
+                raise DatabaseError("replace_window ", f"Error replacing the KPIs of {chunk}: {str(e)}")
+
+    def run_chunk(self, job_id: str, chunk: BackfillChunk) -> None:
+        self.throttle.wait()
+        rows, gateway_kpis = self.gateway_kpi_calculation.compute_kpis_for_gateway(
+            chunk.gateway_id, chunk.interval_start_time, chunk.interval_end_time
+        )
+        self.replace_window(job_id, chunk, rows, gateway_kpis)
+
+    def run(self, start_time: datetime, end_time: datetime, window: timedelta,
+            gateway_ids: Optional[Iterable[str]] = None, job_id: Optional[str] = None,
+            restart: bool = False) -> Dict[str, int]:
+        """
+        Recomputes the KPIs of the gateways between ``start_time`` and ``end_time``.
+
+        Args:
+            start_time: The start of the first window.
+            end_time: The end of the last window.
+            window: The duration of the KPI intervals.
+            gateway_ids: The gateways to recompute, all the monitored gateways when empty.
+            job_id: The ID of the backfill, derived from the arguments when not given.
+            restart: Whether to run all the chunks again, instead of the ones left by a previous run.
+
+        Returns:
+            The number of chunks of the backfill, of those skipped as done by a previous run, and of
+            those done and failed by this run. The failed ones run again with the next run.
+        """
+        gateway_ids = sorted(gateway_ids) if gateway_ids else None
+        job_id = job_id or backfill_job_id(start_time, end_time, window, gateway_ids)
+        if gateway_ids is None:
+            gateway_ids = self.gateway_kpi_calculation.get_all_monitor_gateways()
+        if restart:
+            self.forget(job_id)
+        chunks = self.plan(start_time, end_time, window, gateway_ids)
+        completed = self.completed_chunks(job_id)
+        pending = [chunk for chunk in chunks if (chunk.gateway_id, chunk.interval_start_time) not in completed]
+        summary = {"chunks": len(chunks), "skipped": len(chunks) - len(pending), "done": 0, "failed": 0}
+        BACKFILL_CHUNKS.labels("skipped").inc(summary["skipped"])
+        self.logger.info(
+            f"Backfill {job_id}: {len(pending)} of {len(chunks)} chunks to run "
+            f"from {start_time} to {end_time} on {len(gateway_ids)} gateways"
+        )
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.run_chunk, job_id, chunk): chunk for chunk in pending}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                    summary["done"] += 1
+                    BACKFILL_CHUNKS.labels("done").inc()
+                except Exception as e:
+                    summary["failed"] += 1
+                    BACKFILL_CHUNKS.labels("failed").inc()
+                    self.logger.error(f"Backfill {job_id}: chunk {futures[future]} failed: {repr(e)}")
+                finished = summary["done"] + summary["failed"]
+                if finished % self.progress_every == 0:
+                    self.logger.info(f"Backfill {job_id}: {finished} of {len(pending)} chunks run")
+
+        self.logger.info(f"Backfill {job_id}: {summary}")
+        return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Recompute the KPIs of a past time range")
+    parser.add_argument("--start", type=datetime.fromisoformat, required=True, help="Start of the range, in UTC")
+    parser.add_argument("--end", type=datetime.fromisoformat, required=True, help="End of the range, in UTC")
+    parser.add_argument("--window-minutes", type=int, required=True, help="Duration of the KPI intervals")
+    parser.add_argument("--gateways", default="", help="Comma separated gateway IDs, all the monitored ones by default")
+    parser.add_argument("--workers", type=int, default=backfill_config.workers)
+    parser.add_argument("--max-chunks-per-second", type=float, default=backfill_config.max_chunks_per_second,
+                        help="Most chunks started per second, 0 for no limit")
+    parser.add_argument("--job-id", default=None, help="ID of the backfill, derived from the arguments by default")
+    parser.add_argument("--restart", action="store_true", help="Run all the chunks again, ignoring a previous run")
+    args = parser.parse_args(argv)
+
+    logger = utility_functions.get_logger(logger_config)
+    create_db_and_tables(db_engine)
+    end_device_kpi_calculation = EndDeviceKPICalculation(db_engine, 3, logger)
+    gateway_kpi_calculation = GatewayKPICalculation(
+        end_device_kpi_calculation, args.window_minutes, db_engine, logger,
+        latency_outlier_mads=latency_config.outlier_mads,
+        latency_outlier_min_ms=latency_config.outlier_min_ms,
+        clock_skew_tolerance_ms=latency_config.clock_skew_tolerance_ms,
+    )
+    backfill = KPIBackfill(
+        gateway_kpi_calculation, db_engine, logger, workers=args.workers,
+        max_chunks_per_second=args.max_chunks_per_second,
+    )
+    summary = backfill.run(
+        args.start,
+        args.end,
+        timedelta(minutes=args.window_minutes),
+        gateway_ids=[gateway_id.strip() for gateway_id in args.gateways.split(",") if gateway_id.strip()],
+        job_id=args.job_id,
+        restart=args.restart,
+    )
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,26 +7,44 @@ from datetime import timedelta
 
 from typing import Dict
 from typing import List
+from typing import Optional
+from typing import Tuple
 
 import numpy as np
 import schedule
 from sqlalchemy import func
 from sqlmodel import Session
+from sqlmodel import SQLModel
 from sqlmodel import select
 
 from database.db import db_engine
 from dependencies.exceptions import DatabaseError, ProcessError
 from kpi_calculation.database.models import AllRelation
 from kpi_calculation.database.models import EndDeviceKPIs
+from kpi_calculation.database.models import EndDeviceKPISketches
 from kpi_calculation.database.models import GatewayConnectionStats
+from kpi_calculation.database.models import GatewayConnectivityInterval
+from kpi_calculation.database.models import GatewayDeviceSketches
 from kpi_calculation.database.models import GatewayKPIs
+from kpi_calculation.database.models import GatewayLatencyKPIs
 from kpi_calculation.database.models import MonitoredGateways
 from kpi_calculation.database.models import NodeMetadataUl
 from dependencies import utility_functions
-from dependencies.config import logger_config
+from dependencies.config import latency_config, logger_config
+from dependencies.hyperloglog import HyperLogLog
+from dependencies.metrics import registry, start_metrics_server, timed
+from dependencies.sketches import DDSketch
 from dependencies.utility_functions import get_region_freq_plan
+from dependencies.utility_functions import parse_duration_ms
 from dependencies.utility_functions import string_to_datetime
 
+KPI_FUNCTION_SECONDS = registry.histogram(
+    "kpi_function_seconds", "Duration of the KPI functions, by function", ["function"]
+)
+KPI_FUNCTION_ERRORS = registry.counter(
+    "kpi_function_errors", "KPI function calls that raised, by function", ["function"]
+)
+
 
 class EndDeviceKPICalculation:
     def __init__(self, engine, num_tx_replica, logger):
@@ -116,21 +134,22 @@ class EndDeviceKPICalculation:
             raise DatabaseError("get_all_f_cnt_for_device_in_all_gateways ",
                                 f"Error in get_all_f_cnt_for_device_in_all_gateways: {str(e)}")
 
+    @timed(KPI_FUNCTION_SECONDS, "calculate_sampling_rate", errors=KPI_FUNCTION_ERRORS)
     def calculate_sampling_rate(self, device_id, processed_till_time, interval_end_time):
         try:
-            self.logger.debug(f"calculate_sampling_rate device_id= {device_id}")
+            self.logger.debug("calculate_sampling_rate device_id= %s", device_id)
             data_rows = self.get_unique_f_cnt_values(device_id, processed_till_time, interval_end_time)
-            self.logger.debug(f"data_rows data_rows= {data_rows}")
+            self.logger.debug("data_rows data_rows= %s", data_rows)
             data_rows = [row for row in data_rows if row[0] is not None]
-            self.logger.debug(f"data_rows= {data_rows}")
+            self.logger.debug("data_rows= %s", data_rows)
             # Check if data_rows is empty
             if not data_rows:
                 return None
             # Calculate time difference for each f_cnt value
             received_times = [row[1] for row in data_rows]
             f_cnt_values = [row[0] for row in data_rows]
-            self.logger.debug(f"received_times = {received_times}")
-            self.logger.debug(f"f_cnt_values = {f_cnt_values}")
+            self.logger.debug("received_times = %s", received_times)
+            self.logger.debug("f_cnt_values = %s", f_cnt_values)
             time_diffs = [
                 (next_time - curr_time).total_seconds()
                 for curr_time, next_time, curr_f_cnt, next_f_cnt in zip(
@@ -138,7 +157,7 @@ class EndDeviceKPICalculation:
                 )
                 if next_f_cnt - curr_f_cnt == 1
             ]
-            self.logger.debug(f"time_diffs = {time_diffs}")
+            self.logger.debug("time_diffs = %s", time_diffs)
             # Calculate and return the average time difference
             if time_diffs:
                 return math.floor(sum(time_diffs) / len(time_diffs))
@@ -150,6 +169,7 @@ class EndDeviceKPICalculation:
             self.logger.error(f"Failed calculate_sampling_rate: {str(e)}")
             raise ProcessError(f"Error calculate_sampling_rate: {repr(e)}") from e
 
+    @timed(KPI_FUNCTION_SECONDS, "get_total_uplink_messages", errors=KPI_FUNCTION_ERRORS)
     def get_total_uplink_messages(
             self,
             device_id: str,
@@ -177,6 +197,7 @@ class EndDeviceKPICalculation:
             raise DatabaseError("get_total_uplink_messages ",
                                 f"Error in get_total_uplink_messages: {str(e)}")
 
+    @timed(KPI_FUNCTION_SECONDS, "get_total_unique_uplink_messages", errors=KPI_FUNCTION_ERRORS)
     def get_total_unique_uplink_messages(
             self,
             device_id: str,
@@ -205,6 +226,7 @@ class EndDeviceKPICalculation:
             raise DatabaseError("get_total_unique_uplink_messages ",
                                 f"Error in get_total_unique_uplink_messages: {str(e)}")
 
+    @timed(KPI_FUNCTION_SECONDS, "calculate_total_pkt_loss_info_for_gateway", errors=KPI_FUNCTION_ERRORS)
     def calculate_total_pkt_loss_info_for_gateway(
             self,
             device_id: str,
@@ -280,6 +302,7 @@ class EndDeviceKPICalculation:
             self.logger.error(f"Failed calculate_total_pkt_loss_info_for_gateway: {str(e)}")
             raise ProcessError(f"Error calculate_total_pkt_loss_info_for_gateway: {repr(e)}") from e
 
+    @timed(KPI_FUNCTION_SECONDS, "calculate_total_pkt_loss_info", errors=KPI_FUNCTION_ERRORS)
     def calculate_total_pkt_loss_info(
             self,
             device_id: str,
@@ -288,7 +311,7 @@ class EndDeviceKPICalculation:
     ):
         try:
             packets = self.get_all_f_cnt_for_device_in_all_gateways(device_id, processed_till_time, interval_end_time)
-            self.logger.debug(f"packets = {packets}")
+            self.logger.debug("packets = %s", packets)
             # Calculate the number of replicas for each f_cnt using Counter
             f_cnt_counts = Counter(packet for packet in packets)
             if not f_cnt_counts:
@@ -354,6 +377,7 @@ class EndDeviceKPICalculation:
             self.logger.error(f"Failed calculate_total_pkt_loss_info: {str(e)}")
             raise ProcessError(f"Error calculate_total_pkt_loss_info: {repr(e)}") from e
 
+    @timed(KPI_FUNCTION_SECONDS, "calculate_mean_variance_distribution_for_rx_pkt", errors=KPI_FUNCTION_ERRORS)
     def calculate_mean_variance_distribution_for_rx_pkt(
             self,
             device_id: str,
@@ -425,6 +449,18 @@ class EndDeviceKPICalculation:
                 str(freq): count / total_packets for freq, count in frequency_distribution.items()
             }
 
+            # Sketches of the tails, merged later over any set of devices, gateways and intervals
+            latencies = [
+                (packet.received_at_tti - packet.received_at_gw).total_seconds() * 1000
+                for packet in packets
+                if packet.received_at_tti is not None and packet.received_at_gw is not None
+            ]
+            sketches = {
+                "snr_sketch": DDSketch().extend(packet.snr for packet in packets),
+                "rssi_sketch": DDSketch().extend(packet.rssi for packet in packets),
+                "latency_sketch": DDSketch().extend(latencies),
+            }
+
             return {
                 "snr_mean": snr_mean,
                 "rssi_mean": rssi_mean,
@@ -438,6 +474,7 @@ class EndDeviceKPICalculation:
                 "payload_size_var": payload_size_var,
                 "consumed_airtime_mean": consumed_airtime_mean,
                 "consumed_airtime_var": consumed_airtime_var,
+                **{name: sketch.to_bytes() if sketch.count else None for name, sketch in sketches.items()},
             }
         except DatabaseError:
             raise
@@ -445,6 +482,7 @@ class EndDeviceKPICalculation:
             self.logger.error(f"Failed calculate_mean_variance_distribution_for_rx_pkt: {str(e)}")
             raise ProcessError(f"Error calculate_mean_variance_distribution_for_rx_pkt: {repr(e)}") from e
 
+    @timed(KPI_FUNCTION_SECONDS, "calculate_consumed_duty_cycle", errors=KPI_FUNCTION_ERRORS)
     def calculate_consumed_duty_cycle(
             self, device_id: str, processed_till_time: datetime, interval_end_time: datetime
     ):
@@ -468,6 +506,7 @@ class EndDeviceKPICalculation:
             raise DatabaseError("calculate_consumed_duty_cycle ",
                                 f"Error in calculate_consumed_duty_cycle: {str(e)}")
 
+    @timed(KPI_FUNCTION_SECONDS, "end_device_kpi_calculation_cycle", errors=KPI_FUNCTION_ERRORS)
     def end_device_kpi_calculation_cycle(
             self, device_id, gateway_id, processed_till_time, interval_end_time
     ):
@@ -476,7 +515,7 @@ class EndDeviceKPICalculation:
             sampling_rate = self.calculate_sampling_rate(
                 device_id, processed_till_time, interval_end_time
             )
-            self.logger.debug(f"sampling_rate{sampling_rate}")
+            self.logger.debug("sampling_rate%s", sampling_rate)
             # If sampling rate is None, return None
             if sampling_rate is None:
                 return None
@@ -485,28 +524,28 @@ class EndDeviceKPICalculation:
             total_ul_count = self.get_total_uplink_messages(
                 device_id, gateway_id, processed_till_time, interval_end_time
             )
-            self.logger.debug(f"total_ul_count{total_ul_count}")
+            self.logger.debug("total_ul_count%s", total_ul_count)
             if not total_ul_count:
                 return None
             total_unique_ul_count = self.get_total_unique_uplink_messages(
                 device_id, gateway_id, processed_till_time, interval_end_time
             )
-            self.logger.debug(f"total_unique_ul_count{total_unique_ul_count}")
+            self.logger.debug("total_unique_ul_count%s", total_unique_ul_count)
             # Calculate packet loss information
             pkt_loss_info = self.calculate_total_pkt_loss_info(
                 device_id, processed_till_time, interval_end_time
             )
-            self.logger.debug(f"pkt_loss_info{pkt_loss_info}")
+            self.logger.debug("pkt_loss_info%s", pkt_loss_info)
             # Calculate packet loss information for a gateway
             pkt_loss_info_gw = self.calculate_total_pkt_loss_info_for_gateway(
                 device_id, gateway_id, processed_till_time, interval_end_time
             )
-            self.logger.debug(f"pkt_loss_info_gw{pkt_loss_info_gw}")
+            self.logger.debug("pkt_loss_info_gw%s", pkt_loss_info_gw)
             # Calculate mean variance and distribution information
             mvd_info = self.calculate_mean_variance_distribution_for_rx_pkt(
                 device_id, gateway_id, processed_till_time, interval_end_time
             )
-            self.logger.debug(f"mvd_info{mvd_info}")
+            self.logger.debug("mvd_info%s", mvd_info)
             # Calculate consumed duty cycle
             consumed_duty_cycle = self.calculate_consumed_duty_cycle(
                 device_id, processed_till_time, interval_end_time
@@ -554,6 +593,11 @@ class EndDeviceKPICalculation:
                 "spreading_factor_ratios": str(mvd_info["spreading_factor_ratios"]),
                 "frequency_distribution": str(mvd_info["frequency_distribution"]),
                 "frequency_ratios": str(mvd_info["frequency_ratios"]),
+                "sketches": {
+                    "snr_sketch": mvd_info["snr_sketch"],
+                    "rssi_sketch": mvd_info["rssi_sketch"],
+                    "latency_sketch": mvd_info["latency_sketch"],
+                },
             }
         except DatabaseError:
             raise
@@ -572,15 +616,21 @@ class GatewayKPICalculation:
             interval_time,
             engine,
             logger,
+            latency_outlier_mads: float = 5.0,
+            latency_outlier_min_ms: float = 1000.0,
+            clock_skew_tolerance_ms: float = 500.0,
     ):
         self.db_engine = engine
         self.logger = logger
         self.end_device_kpi_calculation = end_device_kpi_calculation
         self.interval_time = interval_time
+        self.latency_outlier_mads = latency_outlier_mads
+        self.latency_outlier_min_ms = latency_outlier_min_ms
+        self.clock_skew_tolerance_ms = clock_skew_tolerance_ms
         self.processed_till_time = "2023-03-27 00:00:00.000000"
 
     def store_data(self, data) -> None:
-        self.logger.debug(f"store_data")
+        self.logger.debug("store_data")
         """
         Stores the given data object in the database by adding it to the session and committing the transaction.
 
@@ -590,7 +640,7 @@ class GatewayKPICalculation:
         Returns:
             None
         """
-        # self.logger.debug(f"store_data - data: {data}")
+        # self.logger.debug("store_data - data: %s", data)
         with Session(self.db_engine) as session:
             try:
                 session.add(data)
@@ -599,13 +649,14 @@ class GatewayKPICalculation:
                 self.logger.error(f"Error storing data in the database: {str(e)}")
                 session.rollback()
 
+    @timed(KPI_FUNCTION_SECONDS, "get_total_uplink_messages_for_gateway", errors=KPI_FUNCTION_ERRORS)
     def get_total_uplink_messages_for_gateway(
             self,
             gateway_id: str,
             processed_till_time: datetime,
             interval_end_time: datetime,
     ) -> int:
-        self.logger.debug(f"get_total_uplink_messages_for_gateway")
+        self.logger.debug("get_total_uplink_messages_for_gateway")
         with Session(self.db_engine) as session:
             query = select(NodeMetadataUl).where(
                 NodeMetadataUl.gateway_id == gateway_id,
@@ -684,11 +735,16 @@ class GatewayKPICalculation:
             except Exception as e:
                 self.logger.error(f"Error in sum_all_devices_kpis: {str(e)}")
 
+    @timed(KPI_FUNCTION_SECONDS, "get_connected_nodes_info", errors=KPI_FUNCTION_ERRORS)
     def get_connected_nodes_info(
             self, gateway_id: str, processed_till_time: datetime, interval_end_time: datetime
     ):
-        self.logger.debug(f"get_connected_nodes_info")
-        # sourcery skip: collection-builtin-to-comprehension
+        """
+        The number of end devices heard by the gateway over the interval, registered (with a device
+        ID) or not (a device address only), and their distinct count sketches, which merge over any
+        set of gateways and intervals.
+        """
+        self.logger.debug("get_connected_nodes_info")
         with Session(self.db_engine) as session:
             query = (
                 select(NodeMetadataUl.dev_addr, NodeMetadataUl.device_id)
@@ -701,40 +757,33 @@ class GatewayKPICalculation:
             )
 
             result = session.exec(query).all()
-            filtered_result = [
-                row for row in result if row[0] is not None and row[1] is not None
-            ]
 
-            unique_device_ids = set()
-            preprocessed_result = []
-
-            for row in filtered_result:
-                if row[1] is None:
-                    preprocessed_result.append(row)
-                elif row[1] not in unique_device_ids:
-                    preprocessed_result = [r for r in preprocessed_result if r[1] != row[1]]
-                    preprocessed_result.append(row)
-                    unique_device_ids.add(row[1])
-
-            num_active_connected_node = len(preprocessed_result)
-            num_active_reg_connected_node = len(unique_device_ids)
-            num_active_not_reg_connected_node = (
-                    num_active_connected_node - num_active_reg_connected_node
-            )
+        unique_device_ids = {
+            device_id for dev_addr, device_id in result if dev_addr is not None and device_id is not None
+        }
+        # A device heard before and after its uplinks were resolved to its device ID counts as registered
+        unregistered_dev_addrs = {
+            dev_addr for dev_addr, device_id in result if dev_addr is not None and device_id is None
+        } - {dev_addr for dev_addr, device_id in result if device_id is not None}
 
-            return {
-                "num_active_connected_node": num_active_connected_node,
-                "num_active_reg_connected_node": num_active_reg_connected_node,
-                "num_active_not_reg_connected_node": num_active_not_reg_connected_node,
-            }
+        return {
+            "num_active_connected_node": len(unique_device_ids) + len(unregistered_dev_addrs),
+            "num_active_reg_connected_node": len(unique_device_ids),
+            "num_active_not_reg_connected_node": len(unregistered_dev_addrs),
+            "sketches": {
+                "device_sketch": HyperLogLog().extend(unique_device_ids).to_bytes(),
+                "dev_addr_sketch": HyperLogLog().extend(unregistered_dev_addrs).to_bytes(),
+            },
+        }
 
+    @timed(KPI_FUNCTION_SECONDS, "get_gateway_utilization", errors=KPI_FUNCTION_ERRORS)
     def get_gateway_utilization(
             self,
             gateway_id: str,
             processed_till_time: datetime,
             interval_end_time: datetime,
     ):
-        self.logger.debug(f"get_gateway_utilization")
+        self.logger.debug("get_gateway_utilization")
         with Session(self.db_engine) as session:
             query = select(NodeMetadataUl.consumed_airtime).where(
                 NodeMetadataUl.gateway_id == gateway_id,
@@ -744,8 +793,8 @@ class GatewayKPICalculation:
             consumed_airtime_rows = session.exec(query).all()
             if not consumed_airtime_rows:
                 return None
-            self.logger.debug(f"total_consumed_airtime{consumed_airtime_rows}")
-            self.logger.debug(f"total_consumed_airtime{type(consumed_airtime_rows)}")
+            self.logger.debug("total_consumed_airtime%s", consumed_airtime_rows)
+            self.logger.debug("total_consumed_airtime%s", type(consumed_airtime_rows))
             total_consumed_airtime = sum(
                 float(consumed_airtime) for consumed_airtime in consumed_airtime_rows
             )
@@ -759,10 +808,11 @@ class GatewayKPICalculation:
                 "utilization": utilization,
             }
 
+    @timed(KPI_FUNCTION_SECONDS, "get_jitter_window", errors=KPI_FUNCTION_ERRORS)
     def get_jitter_window(
             self, gateway_id: str, processed_till_time: datetime, interval_end_time: datetime
     ):
-        self.logger.debug(f"get_jitter_window")
+        self.logger.debug("get_jitter_window")
         with Session(self.db_engine) as session:
             # Query for all packets received by the gateway within the specified time period
             query = (
@@ -798,86 +848,174 @@ class GatewayKPICalculation:
             # Return the jitter statistics as a dictionary
             return {"jitter_mean": avg_jitter, "jitter_variance": std_dev_jitter}
 
+    @timed(KPI_FUNCTION_SECONDS, "get_gateway_availability", errors=KPI_FUNCTION_ERRORS)
     def get_gateway_availability(
             self, gateway_id: str, start_time: datetime, end_time: datetime
-    ) -> float:
-        self.logger.debug(f"get_gateway_availability")
-        with Session(self.db_engine) as session:
-            # Step 1: Determine the total time duration of the measurement period.
+    ) -> Optional[float]:
+        """
+        The percentage of the time between ``start_time`` and ``end_time`` during which the gateway
+        was connected, from its connectivity intervals. None if the gateway has no connectivity
+        recorded at all.
+        """
+        self.logger.debug("get_gateway_availability")
+        return self.get_gateways_availability([gateway_id], start_time, end_time).get(gateway_id)
+
+    @timed(KPI_FUNCTION_SECONDS, "get_gateways_availability", errors=KPI_FUNCTION_ERRORS)
+    def get_gateways_availability(
+            self, gateway_ids: List[str], start_time: datetime, end_time: datetime
+    ) -> Dict[str, Optional[float]]:
+        """
+        The availability of each of the gateways between ``start_time`` and ``end_time``, e.g. for
+        the monthly SLA reports, with one query of the connectivity intervals overlapping the range.
+        """
+        if not isinstance(start_time, datetime):
             start_time = string_to_datetime(str(start_time))
-            self.logger.debug(f"end_time type {type(end_time)}{end_time}")
-            self.logger.debug(f"start_time type {type(start_time)}{start_time}")
-            duration = end_time - start_time
-            """ 
-                 Step 2: Query the database for the connection status
-                 metadata for the gateway during the measurement period. 
-            """
+        if not isinstance(end_time, datetime):
+            end_time = string_to_datetime(str(end_time))
+        duration = end_time - start_time
+        with Session(self.db_engine) as session:
+            rows = session.exec(
+                select(
+                    GatewayConnectivityInterval.gateway_id,
+                    GatewayConnectivityInterval.up_from,
+                    GatewayConnectivityInterval.up_to,
+                ).where(
+                    GatewayConnectivityInterval.gateway_id.in_(gateway_ids),
+                    GatewayConnectivityInterval.up_from < end_time,
+                    GatewayConnectivityInterval.up_to > start_time,
+                )
+            ).all()
+            intervals = {gateway_id: [] for gateway_id in gateway_ids}
+            for gateway_id, up_from, up_to in rows:
+                intervals[gateway_id].append((up_from, up_to))
+            # A gateway without interval in the range was down, unless it was never seen at all
+            tracked = {gateway_id for gateway_id, gateway_intervals in intervals.items() if gateway_intervals}
+            untracked = [gateway_id for gateway_id in gateway_ids if gateway_id not in tracked]
+            if untracked:
+                tracked.update(session.exec(
+                    select(GatewayConnectivityInterval.gateway_id)
+                    .where(GatewayConnectivityInterval.gateway_id.in_(untracked))
+                    .distinct()
+                ).all())
 
-            query = (
-                select(GatewayConnectionStats)
-                .where(
+        availability = {}
+        for gateway_id, gateway_intervals in intervals.items():
+            if gateway_id not in tracked or duration <= timedelta():
+                availability[gateway_id] = None
+            else:
+                uptime = utility_functions.union_duration(gateway_intervals, start_time, end_time)
+                availability[gateway_id] = uptime / duration * 100.0
+        return availability
+
+    @timed(KPI_FUNCTION_SECONDS, "get_round_trip_time", errors=KPI_FUNCTION_ERRORS)
+    def get_round_trip_time(
+            self, gateway_id: str, processed_till_time: datetime, interval_end_time: datetime
+    ) -> Optional[float]:
+        """
+        The median of the median round trip times in the connection stats of the gateway over the
+        interval, in milliseconds. None if there are none.
+        """
+        with Session(self.db_engine) as session:
+            rows = session.exec(
+                select(GatewayConnectionStats.median_round_trip_times).where(
                     GatewayConnectionStats.gateway_id == gateway_id,
-                    GatewayConnectionStats.event_time >= start_time,
-                    GatewayConnectionStats.event_time < end_time,
+                    GatewayConnectionStats.event_time >= processed_till_time,
+                    GatewayConnectionStats.event_time < interval_end_time,
                 )
-                .order_by(GatewayConnectionStats.event_time)
-            )
-            results = session.exec(query).all()
-            """ 
-                Step 3: Calculate the total downtime for the gateway by summing 
-                the durations of all periods where the 
-                gateway was not connected.
-            """
-
-            downtime_diff = [
-                (next_status.connected_at - status.connected_at)
-                for status, next_status in zip(results, results[1:])
-                if (next_status.connected_at and status.connected_at) is not None
-            ]
-            downtime = sum(downtime_diff, timedelta())
-            """ 
-                Step 4: Calculate the total uptime for the gateway by subtracting 
-                the total downtime from the measurement period duration.
-            """
-
-            self.logger.debug(f"duration type {type(duration)} {duration}")
-            self.logger.debug(f"downtime type {type(downtime)}{downtime}")
-            uptime = duration - downtime
-            """ 
-                Step 5: Calculate the availability as the percentage of
-                uptime over the measurement period duration. 
-            """
+            ).all()
+        round_trip_times = [rtt for rtt in map(parse_duration_ms, rows) if rtt is not None]
+        return float(np.median(round_trip_times)) if round_trip_times else None
 
-            availability = uptime / duration
+    @timed(KPI_FUNCTION_SECONDS, "get_backhaul_latency", errors=KPI_FUNCTION_ERRORS)
+    def get_backhaul_latency(
+            self, gateway_id: str, processed_till_time: datetime, interval_end_time: datetime
+    ) -> Optional[Dict]:
+        """
+        The backhaul latency of the gateway over the interval (the fields of ``GatewayLatencyKPIs``),
+        from the reception times of its uplinks by the gateway and by TTI. None if no uplink has both.
+
+        The outliers are the latencies further above the median than ``latency_outlier_mads`` times
+        their scaled median absolute deviation, and than ``latency_outlier_min_ms``. The fastest
+        uplinks take about half a round trip, so the lower envelope of the latencies (their 1st
+        percentile) less half the round trip time estimates the offset of the clock of the gateway.
+        Without round trip time a clock behind cannot be told from a slow backhaul, only a clock
+        ahead (negative latencies) is detected.
+        """
+        self.logger.debug("get_backhaul_latency")
+        with Session(self.db_engine) as session:
+            rows = session.exec(
+                select(NodeMetadataUl.received_at_gw, NodeMetadataUl.received_at_tti).where(
+                    NodeMetadataUl.gateway_id == gateway_id,
+                    NodeMetadataUl.received_at_gw >= processed_till_time,
+                    NodeMetadataUl.received_at_gw < interval_end_time,
+                    NodeMetadataUl.received_at_tti.is_not(None),
+                )
+            ).all()
+        if not rows:
+            return None
+
+        latencies = np.array(
+            [received_at_tti - received_at_gw for received_at_gw, received_at_tti in rows],
+            dtype="timedelta64[us]",
+        ) / np.timedelta64(1, "ms")
+        p1, p50, p95, p99 = np.percentile(latencies, [1, 50, 95, 99])
+        spread = 1.4826 * np.median(np.abs(latencies - p50))
+        outlier_count = int(np.count_nonzero(
+            latencies > p50 + max(self.latency_outlier_mads * spread, self.latency_outlier_min_ms)
+        ))
+        rtt_median = self.get_round_trip_time(gateway_id, processed_till_time, interval_end_time)
+        clock_offset = float(p1) - (rtt_median / 2 if rtt_median is not None else 0.0)
 
-            return availability * 100.0
+        return {
+            "latency_count": len(latencies),
+            "latency_mean": float(latencies.mean()),
+            "latency_p50": float(p50),
+            "latency_p95": float(p95),
+            "latency_p99": float(p99),
+            "latency_max": float(latencies.max()),
+            "outlier_count": outlier_count,
+            "outlier_ratio": outlier_count / len(latencies),
+            "negative_count": int(np.count_nonzero(latencies < 0)),
+            "rtt_median": rtt_median,
+            "clock_offset": clock_offset,
+            "clock_skew_suspected": bool(
+                clock_offset < -self.clock_skew_tolerance_ms
+                or (rtt_median is not None and clock_offset > self.clock_skew_tolerance_ms)
+            ),
+            "latency_sketch": DDSketch().extend(latencies.tolist()).to_bytes(),
+        }
 
+    @timed(KPI_FUNCTION_SECONDS, "calculate_kpis_for_gateway", errors=KPI_FUNCTION_ERRORS)
     def calculate_kpis_for_gateway(
             self, gateway_id, all_devices_kpis, processed_till_time, interval_end_time
     ):
-        self.logger.debug(f"calculate_kpis_for_gateway")
+        self.logger.debug("calculate_kpis_for_gateway")
         all_devices_kpis = self.sum_all_devices_kpis(all_devices_kpis)
-        self.logger.debug(f"all_devices_kpis {all_devices_kpis}")
+        self.logger.debug("all_devices_kpis %s", all_devices_kpis)
         total_gw_ul_count = self.get_total_uplink_messages_for_gateway(
             gateway_id, processed_till_time, interval_end_time
         )
-        self.logger.debug(f"total_gw_ul_count {total_gw_ul_count}")
+        self.logger.debug("total_gw_ul_count %s", total_gw_ul_count)
         connected_nodes_info = self.get_connected_nodes_info(
             gateway_id, processed_till_time, interval_end_time
         )
-        self.logger.debug(f"connected_nodes_info {connected_nodes_info}")
+        self.logger.debug("connected_nodes_info %s", connected_nodes_info)
         gateway_utilization = self.get_gateway_utilization(
             gateway_id, processed_till_time, interval_end_time
         )
-        self.logger.debug(f"gateway_utilization {gateway_utilization}")
+        self.logger.debug("gateway_utilization %s", gateway_utilization)
         gateway_jitter_window = self.get_jitter_window(
             gateway_id, processed_till_time, interval_end_time
         )
-        self.logger.debug(f"gateway_jitter_window {gateway_jitter_window}")
+        self.logger.debug("gateway_jitter_window %s", gateway_jitter_window)
         gateway_availability = self.get_gateway_availability(
             gateway_id, processed_till_time, interval_end_time
         )
-        self.logger.debug(f"gateway_availability {gateway_availability}")
+        self.logger.debug("gateway_availability %s", gateway_availability)
+        backhaul_latency = self.get_backhaul_latency(
+            gateway_id, processed_till_time, interval_end_time
+        )
+        self.logger.debug("backhaul_latency %s", backhaul_latency)
 
         return {
             "interval_start_time": processed_till_time,
@@ -898,6 +1036,9 @@ class GatewayKPICalculation:
             "jitter_mean": (gateway_jitter_window or {}).get("jitter_mean"),
             "jitter_variance": (gateway_jitter_window or {}).get("jitter_variance"),
             "availability": gateway_availability,
+            "latency": (backhaul_latency or {}).get("latency_mean"),
+            "backhaul_latency": backhaul_latency,
+            "device_sketches": (connected_nodes_info or {}).get("sketches"),
             #   "avg_sampling_rate": (all_devices_kpis or {}).get("avg_sampling_rate"),
             "total_dl_pkt_count": (all_devices_kpis or {}).get("total_dl_pkt_count"),
             "total_registered_ul_pkt_count": (all_devices_kpis or {}).get(
@@ -938,30 +1079,100 @@ class GatewayKPICalculation:
             raise DatabaseError("get_all_unique_devices_gateways ",
                                 f"Error in get_all_unique_devices_gateways: {str(e)}")
 
+    @staticmethod
+    def end_device_kpi_rows(end_device_kpi: Dict) -> List[SQLModel]:
+        """The ``EndDeviceKPIs`` row of the KPIs of an end device, and its ``EndDeviceKPISketches`` row."""
+        end_device_kpi = dict(end_device_kpi)
+        sketches = end_device_kpi.pop("sketches", None)
+        rows = [EndDeviceKPIs(**end_device_kpi)]
+        if sketches:
+            rows.append(EndDeviceKPISketches(
+                interval_start_time=end_device_kpi["interval_start_time"],
+                interval_end_time=end_device_kpi["interval_end_time"],
+                device_id=end_device_kpi["device_id"],
+                gateway_id=end_device_kpi["gateway_id"],
+                **sketches,
+            ))
+        return rows
+
+    @staticmethod
+    def gateway_kpi_rows(gateway_kpis: Dict) -> List[SQLModel]:
+        """
+        The ``GatewayKPIs`` row of the KPIs of a gateway, then its ``GatewayLatencyKPIs`` and
+        ``GatewayDeviceSketches`` rows.
+        """
+        gateway_kpis = dict(gateway_kpis)
+        backhaul_latency = gateway_kpis.pop("backhaul_latency", None)
+        device_sketches = gateway_kpis.pop("device_sketches", None)
+        interval = {
+            "interval_start_time": gateway_kpis["interval_start_time"],
+            "interval_end_time": gateway_kpis["interval_end_time"],
+            "gateway_id": gateway_kpis["gateway_id"],
+        }
+        rows = [GatewayKPIs(**gateway_kpis)]
+        if backhaul_latency:
+            rows.append(GatewayLatencyKPIs(**interval, **backhaul_latency))
+        if device_sketches:
+            rows.append(GatewayDeviceSketches(**interval, **device_sketches))
+        return rows
+
+    def compute_end_devices_kpis_for_gateway(
+            self, gateway_id: str, processed_till_time, interval_end_time
+    ) -> List[Dict]:
+        """The KPIs of the end devices of the gateway over the interval, without storing them."""
+        devices_ids = self.get_all_unique_devices_gateways(gateway_id)
+        all_devices_kpis = []
+        for device_id in devices_ids:
+            self.logger.debug("devices_ids :%s", devices_ids)
+            end_device_kpi = self.end_device_kpi_calculation.end_device_kpi_calculation_cycle(
+                device_id,
+                gateway_id,
+                processed_till_time,
+                interval_end_time,
+            )
+            self.logger.debug("end_device_kpi%s", end_device_kpi)
+            if end_device_kpi is not None:
+                all_devices_kpis.append(end_device_kpi)
+        return all_devices_kpis
+
+    @timed(KPI_FUNCTION_SECONDS, "calculate_end_devices_kpis_for_gateway", errors=KPI_FUNCTION_ERRORS)
     def calculate_end_devices_kpis_for_gateway(
             self, gateway_id: str, processed_till_time, interval_end_time
     ):
         try:
-            devices_ids = self.get_all_unique_devices_gateways(gateway_id)
-            all_devices_kpis = []
-            for device_id in devices_ids:
-                self.logger.debug(f"devices_ids :{devices_ids}")
-                end_device_kpi = self.end_device_kpi_calculation.end_device_kpi_calculation_cycle(
-                    device_id,
-                    gateway_id,
-                    processed_till_time,
-                    interval_end_time,
-                )
-                self.logger.debug(f"end_device_kpi{end_device_kpi}")
-                if end_device_kpi is None:
-                    continue
-                device_kpi = EndDeviceKPIs(**end_device_kpi)
-                all_devices_kpis.append(end_device_kpi)
-                self.store_data(device_kpi)
+            all_devices_kpis = self.compute_end_devices_kpis_for_gateway(
+                gateway_id, processed_till_time, interval_end_time
+            )
+            for end_device_kpi in all_devices_kpis:
+                for row in self.end_device_kpi_rows(end_device_kpi):
+                    self.store_data(row)
             return all_devices_kpis
         except Exception as e:
             self.logger.error(f"Error in calculate_end_devices_kpis_for_gateway: {repr(e)}")
 
+    @timed(KPI_FUNCTION_SECONDS, "compute_kpis_for_gateway", errors=KPI_FUNCTION_ERRORS)
+    def compute_kpis_for_gateway(
+            self, gateway_id: str, processed_till_time, interval_end_time
+    ) -> Tuple[List[SQLModel], Optional[GatewayKPIs]]:
+        """
+        The KPI rows of the end devices of the gateway (``EndDeviceKPIs`` and ``EndDeviceKPISketches``)
+        and of its backhaul latency and distinct devices (``GatewayLatencyKPIs``,
+        ``GatewayDeviceSketches``), and the ``GatewayKPIs`` of the gateway over the interval, without
+        storing them, for the backfill. Unlike the scheduled calculation,
+        an error is raised instead of logged.
+        """
+        all_devices_kpis = self.compute_end_devices_kpis_for_gateway(
+            gateway_id, processed_till_time, interval_end_time
+        )
+        gateway_kpis = self.calculate_kpis_for_gateway(
+            gateway_id, all_devices_kpis, processed_till_time, interval_end_time
+        )
+        rows = [row for end_device_kpi in all_devices_kpis for row in self.end_device_kpi_rows(end_device_kpi)]
+        if gateway_kpis is None:
+            return rows, None
+        gateway_kpis, *gateway_rows = self.gateway_kpi_rows(gateway_kpis)
+        return rows + gateway_rows, gateway_kpis
+
     def get_all_monitor_gateways(self):
         try:
             with Session(self.db_engine) as session:
@@ -972,27 +1183,28 @@ class GatewayKPICalculation:
             raise DatabaseError("get_all_monitor_gateways ",
                                 f"Error in get_all_monitor_gateways: {str(e)}")
 
+    @timed(KPI_FUNCTION_SECONDS, "calculate_kpis_for_all_monitor_gateways", errors=KPI_FUNCTION_ERRORS)
     def calculate_kpis_for_all_monitor_gateways(self, processed_till_time, interval_end_time):
         try:
             gateways_ids = self.get_all_monitor_gateways()
             for gateways_id in gateways_ids:
-                self.logger.debug(f"gateways_ids :{gateways_ids}")
+                self.logger.debug("gateways_ids :%s", gateways_ids)
                 all_devices_kpis = self.calculate_end_devices_kpis_for_gateway(
                     gateways_id, processed_till_time, interval_end_time
                 )
-                self.logger.debug(f"all_devices_kpis :{all_devices_kpis}")
+                self.logger.debug("all_devices_kpis :%s", all_devices_kpis)
                 gateway_kpis = self.calculate_kpis_for_gateway(
                     gateways_id, all_devices_kpis, processed_till_time, interval_end_time
                 )
                 if gateway_kpis is None:
                     continue
-                gateway_kpis = GatewayKPIs(**gateway_kpis)
-                self.store_data(gateway_kpis)
+                for row in self.gateway_kpi_rows(gateway_kpis):
+                    self.store_data(row)
         except Exception as e:
             self.logger.error(f"Error in calculate_kpis_for_all_monitor_gateways: {repr(e)}")
 
     def scheduled_func(self):
-        self.logger.debug(f"scheduled_func")
+        self.logger.debug("scheduled_func")
         try:
             _, last_arrival_time = self.get_min_max_arrival_time()
 
@@ -1028,12 +1240,12 @@ class GatewayKPICalculation:
                                 f"Error in get_min_max_arrival_time: {str(e)}")
 
     def gateway_kpis_calculations_cycle(self):
-        self.logger.debug(f"gateway_kpis_calculations_cycle")
+        self.logger.debug("gateway_kpis_calculations_cycle")
         try:
             first_arrival_time, _ = self.get_min_max_arrival_time()
             self.processed_till_time = first_arrival_time
             while not first_arrival_time:
-                self.logger.debug(f"there is no data in the tables")
+                self.logger.debug("there is no data in the tables")
                 first_arrival_time, _ = self.get_min_max_arrival_time()
                 self.processed_till_time = first_arrival_time
                 time.sleep(60)
@@ -1056,12 +1268,16 @@ def run_kpi_calculations():
 
     # Create a logger
     kpi_logger = utility_functions.get_logger(logger_config)
-    kpi_logger.debug(f"run_kpi_calculations start")
+    kpi_logger.debug("run_kpi_calculations start")
+    start_metrics_server()
     # Create an instance of EndDeviceKPICalculation
     end_device_kpi_calculation = EndDeviceKPICalculation(db_engine, num_tx_replica, kpi_logger)
 
     # Create an instance of GatewayKPICalculation
     gateway_kpi_calculation = GatewayKPICalculation(
-        end_device_kpi_calculation, int(kpi_calculation_cycle), db_engine, kpi_logger
+        end_device_kpi_calculation, int(kpi_calculation_cycle), db_engine, kpi_logger,
+        latency_outlier_mads=latency_config.outlier_mads,
+        latency_outlier_min_ms=latency_config.outlier_min_ms,
+        clock_skew_tolerance_ms=latency_config.clock_skew_tolerance_ms,
     )
     gateway_kpi_calculation.gateway_kpis_calculations_cycle()
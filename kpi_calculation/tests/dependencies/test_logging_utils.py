@@ -0,0 +1,111 @@
+import logging
+import queue
+from unittest.mock import Mock
+
+import pytest
+
+from kpi_calculation.dependencies.logging_utils import (
+    DeferredQueueHandler,
+    RateLimitFilter,
+    SamplingFilter,
+    get_hot_path_logger,
+    log_slow_queries,
+    start_queue_logging,
+    stop_queue_logging,
+)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+def make_record(msg, *args):
+    return logging.LogRecord("test", logging.DEBUG, __file__, 1, msg, args, None)
+
+
+def test_rate_limit_filter_drops_records_over_the_burst():
+    rate_limit = RateLimitFilter(max_per_second=0.001, burst=3)
+
+    passed = [rate_limit.filter(make_record("rx_data%s", index)) for index in range(10)]
+
+    assert passed.count(True) == 3
+    # Every message template has its own bucket
+    assert rate_limit.filter(make_record("other message"))
+
+
+def test_sampling_filter_keeps_one_record_out_of_n():
+    sampling = SamplingFilter(sample_every=4)
+
+    passed = [sampling.filter(make_record("event_name =  %s", index)) for index in range(12)]
+
+    assert passed.count(True) == 3
+
+
+def test_queue_logging_formats_records_in_the_listener():
+    logger = logging.getLogger("kpi_calculation.test_queue_logging")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    handler = ListHandler()
+    listener = start_queue_logging(logger, [handler], queue_size=100)
+    try:
+        logger.debug("value = %s", 42)
+    finally:
+        stop_queue_logging(listener)
+        logger.handlers.clear()
+
+    assert handler.messages == ["value = 42"]
+
+
+def test_deferred_queue_handler_merges_the_arguments_of_the_records_it_enqueues():
+    logger = logging.getLogger("kpi_calculation.test_deferred_queue_handler")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    log_queue = queue.Queue()
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    argument = Mock(__str__=Mock(return_value="argument"))
+    state = ["received"]
+    try:
+        logger.debug("skipped %s", argument)
+        logger.info("state = %s", state)
+        state.append("processed")
+    finally:
+        logger.handlers.clear()
+
+    record = log_queue.get_nowait()
+    assert (record.msg, record.args) == ("state = ['received']", None)
+    assert log_queue.empty()
+    assert not argument.__str__.called
+
+
+def test_hot_path_logger_is_rate_limited_child():
+    logger = logging.getLogger("kpi_calculation.test_hot_path")
+
+    hot_logger = get_hot_path_logger(logger, sample_every=1, max_per_second=5)
+
+    assert hot_logger.parent is logger
+    assert any(isinstance(log_filter, RateLimitFilter) for log_filter in hot_logger.filters)
+    assert get_hot_path_logger(logger) is hot_logger
+
+
+def test_hot_path_logger_keeps_non_logging_loggers():
+    logger = Mock()
+
+    assert get_hot_path_logger(logger) is logger
+
+
+def test_log_slow_queries_logs_statements_over_the_threshold():
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    engine = sqlalchemy.create_engine("sqlite://")
+    logger = Mock()
+    log_slow_queries(engine, logger, threshold_ms=0)
+
+    with engine.connect() as connection:
+        connection.execute(sqlalchemy.text("SELECT 1"))
+
+    logger.warning.assert_called_once()
+    assert "SELECT 1" in logger.warning.call_args[0][2]
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from kpi_calculation.dependencies.sketches import DDSketch, merge_sketches
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def test_quantiles_are_within_the_relative_accuracy():
+    rng = random.Random(7)
+    # RSSI-like, negative values only
+    values = [rng.gauss(-110, 8) for _ in range(20000)]
+    sketch = DDSketch(0.01).extend(values)
+
+    for q in (0.01, 0.05, 0.5, 0.95, 0.99):
+        assert sketch.quantile(q) == pytest.approx(exact_quantile(values, q), rel=0.01)
+    assert sketch.quantile(0) == min(values)
+    assert sketch.quantile(1) == max(values)
+    assert sketch.count == len(values)
+    assert sketch.mean() == pytest.approx(sum(values) / len(values))
+
+
+def test_merged_sketches_equal_the_sketch_of_all_the_values():
+    rng = random.Random(11)
+    windows = [[rng.gauss(5, 4) for _ in range(1000)] + [0.0] for _ in range(6)]
+    encoded = [DDSketch().extend(values).to_bytes() for values in windows]
+
+    merged = merge_sketches(encoded + [None])
+    whole = DDSketch().extend(value for values in windows for value in values)
+
+    assert merged.count == whole.count == 6006
+    assert merged.zero_count == 6
+    assert (merged.positive, merged.negative) == (whole.positive, whole.negative)
+    for q in (0.05, 0.5, 0.95):
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_encoding_round_trips_and_is_compact():
+    sketch = DDSketch().extend([-120.5, -80, -3.25, 0, 0.5, 7, 12.75, None])
+
+    decoded = DDSketch.from_bytes(sketch.to_bytes())
+
+    assert decoded.count == 7
+    assert (decoded.positive, decoded.negative, decoded.zero_count) == (sketch.positive, sketch.negative, 1)
+    assert (decoded.min, decoded.max, decoded.sum) == (-120.5, 12.75, sketch.sum)
+    rssi = DDSketch().extend(-140 + index * 0.01 for index in range(14000))
+    assert len(rssi.to_bytes()) < 1024
+
+
+def test_empty_and_mismatched_sketches():
+    assert DDSketch().quantile(0.5) is None
+    assert merge_sketches([]).count == 0
+    with pytest.raises(ValueError):
+        DDSketch(0.01).merge(DDSketch(0.02))
+    with pytest.raises(ValueError):
+        DDSketch().quantile(1.5)
@@ -1,5 +1,8 @@
 import pytest
-from kpi_calculation.dependencies.utility_functions import get_logger, LoggerConfig
+from datetime import datetime, timedelta
+
+from kpi_calculation.dependencies.utility_functions import get_logger, LoggerConfig, union_duration
+from kpi_calculation.dependencies.utility_functions import parse_duration_ms
 import logging
 
 
@@ -32,4 +35,26 @@ def test_get_logger_kpi_calculation(config):
     assert logger.level == getattr(logging, config.loglevel.upper())
 
     # check if the logger name is set correctly
-    assert logger.name == config.logger_name
\ No newline at end of file
+    assert logger.name == config.logger_name
+
+
+def test_union_duration_counts_the_overlaps_once_and_clips_to_the_range():
+    start, end = datetime(2023, 3, 1), datetime(2023, 3, 2)
+    intervals = [
+        (datetime(2023, 2, 28, 20), datetime(2023, 3, 1, 2)),
+        (datetime(2023, 3, 1, 1), datetime(2023, 3, 1, 3)),
+        (datetime(2023, 3, 1, 2), datetime(2023, 3, 1, 2, 30)),
+        (datetime(2023, 3, 1, 12), datetime(2023, 3, 1, 12)),
+        (datetime(2023, 3, 1, 22), datetime(2023, 3, 2, 6)),
+    ]
+
+    assert union_duration(intervals, start, end) == timedelta(hours=5)
+    assert union_duration([], start, end) == timedelta()
+
+
+@pytest.mark.parametrize(
+    "duration,expected",
+    [("0.045s", 45.0), ("2s", 2000.0), (0.5, 500.0), (None, None), ("", None), ("fast", None)],
+)
+def test_parse_duration_ms(duration, expected):
+    assert parse_duration_ms(duration) == expected
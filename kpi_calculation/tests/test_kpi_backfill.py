@@ -0,0 +1,102 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from kpi_backfill import KPIBackfill, Throttle, backfill_job_id, split_windows
+from kpi_calculation.database.models import EndDeviceKPIs, GatewayKPIs
+
+START = datetime(2023, 3, 27)
+
+
+class FakeGatewayKPICalculation:
+    """Computes one device KPI row and one gateway KPI row per chunk, failing the chunks listed once."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    def get_all_monitor_gateways(self):
+        return ["gateway-1", "gateway-2"]
+
+    def compute_kpis_for_gateway(self, gateway_id, interval_start_time, interval_end_time):
+        self.calls.append((gateway_id, interval_start_time))
+        if (gateway_id, interval_start_time) in self.failing:
+            self.failing.remove((gateway_id, interval_start_time))
+            raise RuntimeError("database gone")
+        interval = {"interval_start_time": interval_start_time, "interval_end_time": interval_end_time}
+        return (
+            [EndDeviceKPIs(device_id="device-1", gateway_id=gateway_id, **interval)],
+            GatewayKPIs(gateway_id=gateway_id, total_ul_pkt_count=1, **interval),
+        )
+
+
+def create_engine_with_tables(path):
+    # A file, the workers each have their own connection
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def kpi_rows(engine):
+    with Session(engine) as session:
+        return (
+            sorted((row.gateway_id, row.interval_start_time) for row in session.exec(select(EndDeviceKPIs)).all()),
+            sorted((row.gateway_id, row.interval_start_time) for row in session.exec(select(GatewayKPIs)).all()),
+        )
+
+
+def test_split_windows_clips_the_last_window_to_the_end_of_the_range():
+    assert split_windows(START, START + timedelta(minutes=150), timedelta(hours=1)) == [
+        (START, START + timedelta(hours=1)),
+        (START + timedelta(hours=1), START + timedelta(hours=2)),
+        (START + timedelta(hours=2), START + timedelta(minutes=150)),
+    ]
+    assert split_windows(START, START, timedelta(hours=1)) == []
+
+
+def test_backfill_job_id_depends_on_the_arguments_only():
+    end = START + timedelta(days=7)
+    assert backfill_job_id(START, end, timedelta(hours=1), ["b", "a"]) == backfill_job_id(
+        START, end, timedelta(hours=1), ["a", "b"]
+    )
+    assert backfill_job_id(START, end, timedelta(hours=1)) != backfill_job_id(START, end, timedelta(minutes=30))
+
+
+def test_throttle_spaces_the_chunks():
+    now, sleeps = [100.0], []
+    throttle = Throttle(4, clock=lambda: now[0], sleep=sleeps.append)
+
+    for _ in range(3):
+        throttle.wait()
+
+    assert sleeps == [0.25, 0.5]
+
+
+def test_backfill_replaces_the_windows_and_resumes_after_a_failure(tmp_path):
+    engine = create_engine_with_tables(tmp_path / "kpis.db")
+    end = START + timedelta(hours=3)
+    with Session(engine) as session:
+        # KPIs of the old logic, replaced by the backfill, and of a gateway out of the backfill
+        session.add(GatewayKPIs(gateway_id="gateway-1", interval_start_time=START, interval_end_time=end))
+        session.add(GatewayKPIs(gateway_id="gateway-3", interval_start_time=START, interval_end_time=end))
+        session.commit()
+    calculation = FakeGatewayKPICalculation(failing=[("gateway-2", START + timedelta(hours=1))])
+    backfill = KPIBackfill(calculation, engine, logging.getLogger("test_kpi_backfill"), workers=3)
+
+    first = backfill.run(START, end, timedelta(hours=1))
+    second = backfill.run(START, end, timedelta(hours=1))
+
+    assert first == {"chunks": 6, "skipped": 0, "done": 5, "failed": 1}
+    assert second == {"chunks": 6, "skipped": 5, "done": 1, "failed": 0}
+    assert len(calculation.calls) == 7
+    windows = [START + timedelta(hours=hour) for hour in range(3)]
+    expected = sorted((gateway_id, start) for gateway_id in ("gateway-1", "gateway-2") for start in windows)
+    device_rows, gateway_rows = kpi_rows(engine)
+    assert device_rows == expected
+    assert gateway_rows == sorted(expected + [("gateway-3", START)])
+
+    # Running it again from scratch leaves the same rows
+    assert backfill.run(START, end, timedelta(hours=1), restart=True)["done"] == 6
+    assert kpi_rows(engine) == (device_rows, gateway_rows)
+    engine.dispose()
@@ -0,0 +1,121 @@
+import logging
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+from kpi_calculation.database.models import GatewayConnectionStats, GatewayDeviceSketches, GatewayKPIs
+from kpi_calculation.database.models import GatewayLatencyKPIs, NodeMetadataUl
+from kpi_calculation.dependencies.hyperloglog import HyperLogLog
+from kpi_calculation_services import GatewayKPICalculation
+
+START = datetime(2023, 3, 27)
+END = START + timedelta(hours=1)
+
+
+def uplink(gateway_id, second, latency_ms, dev_addr=None, device_id=None):
+    received_at_gw = START + timedelta(seconds=second)
+    return NodeMetadataUl(
+        gateway_id=gateway_id,
+        received_at_gw=received_at_gw,
+        received_at_tti=received_at_gw + timedelta(milliseconds=latency_ms),
+        dev_addr=dev_addr,
+        device_id=device_id,
+    )
+
+
+@pytest.fixture
+def gateway_kpi_calculation():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            # 100 to 199 ms, and a stalled uplink
+            [uplink("gw-1", index, 100 + index, f"addr-{index % 5}", f"device-{index % 5}")
+             for index in range(100)]
+            + [uplink("gw-1", 200, 5000)]
+            + [GatewayConnectionStats(gateway_id="gw-1", event_time=START + timedelta(minutes=minute),
+                                      median_round_trip_times=rtt)
+               for minute, rtt in ((1, "0.150s"), (2, "0.170s"), (3, None))]
+            # The clock of gw-2 runs 2 seconds ahead of TTI
+            + [uplink("gw-2", index, 60 - 2000, f"addr-{index}") for index in range(10)]
+            + [NodeMetadataUl(gateway_id="gw-3", received_at_gw=START)]
+        )
+        session.commit()
+    yield GatewayKPICalculation(None, 60, engine, logging.getLogger("test"))
+    engine.dispose()
+
+
+def test_backhaul_latency_quantiles_and_outliers(gateway_kpi_calculation):
+    latency = gateway_kpi_calculation.get_backhaul_latency("gw-1", START, END)
+
+    assert latency["latency_count"] == 101
+    assert latency["latency_p50"] == pytest.approx(150)
+    assert latency["latency_max"] == pytest.approx(5000)
+    assert (latency["outlier_count"], latency["negative_count"]) == (1, 0)
+    assert latency["outlier_ratio"] == pytest.approx(1 / 101)
+    assert latency["rtt_median"] == pytest.approx(160)
+    # The lower envelope of about 101 ms, less half the round trip time
+    assert latency["clock_offset"] == pytest.approx(21, abs=1)
+    assert latency["clock_skew_suspected"] is False
+
+
+def test_a_gateway_clock_ahead_of_tti_is_detected(gateway_kpi_calculation):
+    latency = gateway_kpi_calculation.get_backhaul_latency("gw-2", START, END)
+
+    assert latency["negative_count"] == 10
+    assert latency["rtt_median"] is None
+    assert latency["clock_offset"] == pytest.approx(-1940)
+    assert latency["clock_skew_suspected"] is True
+
+
+def test_no_backhaul_latency_without_both_reception_times(gateway_kpi_calculation):
+    assert gateway_kpi_calculation.get_backhaul_latency("gw-3", START, END) is None
+    assert gateway_kpi_calculation.get_backhaul_latency("gw-1", END, END + timedelta(hours=1)) is None
+
+
+def test_connected_nodes_are_counted_once_registered_or_not(gateway_kpi_calculation):
+    registered = gateway_kpi_calculation.get_connected_nodes_info("gw-1", START, END)
+    unregistered = gateway_kpi_calculation.get_connected_nodes_info("gw-2", START, END)
+
+    assert registered["num_active_connected_node"] == registered["num_active_reg_connected_node"] == 5
+    assert registered["num_active_not_reg_connected_node"] == 0
+    assert HyperLogLog.from_bytes(registered["sketches"]["device_sketch"]).count() == 5
+    assert unregistered["num_active_connected_node"] == 10
+    assert unregistered["num_active_not_reg_connected_node"] == 10
+    assert HyperLogLog.from_bytes(unregistered["sketches"]["dev_addr_sketch"]).count() == 10
+
+
+def test_a_dev_addr_seen_with_and_without_its_device_id_is_counted_once(gateway_kpi_calculation):
+    with Session(gateway_kpi_calculation.db_engine) as session:
+        session.add_all([uplink("gw-4", 0, 100, "addr-0"), uplink("gw-4", 1, 100, "addr-0", "device-0"),
+                         uplink("gw-4", 2, 100, "addr-1")])
+        session.commit()
+
+    connected_nodes_info = gateway_kpi_calculation.get_connected_nodes_info("gw-4", START, END)
+
+    assert connected_nodes_info["num_active_connected_node"] == 2
+    assert connected_nodes_info["num_active_reg_connected_node"] == 1
+    assert connected_nodes_info["num_active_not_reg_connected_node"] == 1
+    assert HyperLogLog.from_bytes(connected_nodes_info["sketches"]["dev_addr_sketch"]).count() == 1
+
+
+def test_gateway_kpi_rows_split_the_latency_and_device_sketches_into_rows(gateway_kpi_calculation):
+    interval = {"interval_start_time": START, "interval_end_time": END, "gateway_id": "gw-1"}
+    backhaul_latency = gateway_kpi_calculation.get_backhaul_latency("gw-1", START, END)
+    connected_nodes_info = gateway_kpi_calculation.get_connected_nodes_info("gw-1", START, END)
+
+    gateway_kpis, latency_kpis, device_sketches = GatewayKPICalculation.gateway_kpi_rows({
+        **interval,
+        "latency": backhaul_latency["latency_mean"],
+        "backhaul_latency": backhaul_latency,
+        "device_sketches": connected_nodes_info["sketches"],
+    })
+
+    assert isinstance(gateway_kpis, GatewayKPIs) and isinstance(latency_kpis, GatewayLatencyKPIs)
+    assert gateway_kpis.latency == latency_kpis.latency_mean
+    assert (latency_kpis.gateway_id, latency_kpis.interval_start_time) == ("gw-1", START)
+    assert latency_kpis.latency_sketch
+    assert isinstance(device_sketches, GatewayDeviceSketches) and device_sketches.device_sketch
+    assert GatewayKPICalculation.gateway_kpi_rows({**interval, "backhaul_latency": None})[1:] == []
@@ -1,15 +1,20 @@
+import logging
 import os
 
 from sqlmodel import Session, SQLModel, create_engine
 
 import stream_event_consumer.database.models
+from dependencies.config import database_config, logger_config
+from dependencies.logging_utils import log_slow_queries
 
 
 # The URL of the PostgreSQL database to connect to
 POSTGRES_URL = os.getenv("POSTGRES_URL")
 
 # Create a new engine with the given database URL
-db_engine = create_engine(POSTGRES_URL, echo=True)
+db_engine = create_engine(POSTGRES_URL, echo=database_config.sql_echo)
+# Log the statements slower than SLOW_QUERY_MS instead of echoing every statement
+log_slow_queries(db_engine, logging.getLogger(f"{logger_config.logger_name}.sql"), database_config.slow_query_ms)
 
 
 def create_db_and_tables(engine) -> None:
@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
 
@@ -423,3 +424,23 @@ class AllRelation(SQLModel, table=True):
     last_f_cnt: Optional[str] = None
     application_id: Optional[str] = None
     gateway_tti_id: Optional[str] = None
+
+
+class GatewayConnectivityInterval(SQLModel, table=True):
+    """
+    This model represents a period during which a gateway was connected, built by the stream event
+    consumer from the connection stats and status events of the gateway.
+
+    Fields:
+        id (int, optional): The ID of the interval.
+        gateway_id (str): The ID of the gateway.
+        up_from (datetime): The start of the period, in UTC.
+        up_to (datetime): The end of the period, the last time the gateway was seen connected, in UTC.
+    """
+
+    __table_args__ = (Index("ix_gatewayconnectivityinterval_gateway_up_from", "gateway_id", "up_from"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    gateway_id: str
+    up_from: datetime
+    up_to: datetime
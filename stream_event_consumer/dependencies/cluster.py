@@ -0,0 +1,98 @@
+"""
+Membership of the instances of a service running as a cluster, and the consistent hashing that
+spreads keys (gateways, partitions) over them.
+
+Every instance records a heartbeat in the ``clustermember`` table of the shared database; the
+members of a group are the instances whose last heartbeat is less than ``member_timeout`` seconds
+old. All the members build the same ``HashRing`` from the same member list, so they agree on the
+owner of every key without talking to each other, and a member joining or leaving only moves the
+keys it takes or gives up.
+
+The stream events are partitioned the same way: the events of a gateway always go to the queue of
+the partition of the gateway, and each consumer instance consumes the partitions the ring gives it.
+"""
+import bisect
+import hashlib
+import os
+import socket
+import time
+from typing import Callable, Iterable, List, Optional
+
+from sqlalchemy import delete
+from sqlmodel import Field, Session, SQLModel, select
+
+
+class ClusterMember(SQLModel, table=True):
+    group: str = Field(primary_key=True)
+    instance_id: str = Field(primary_key=True)
+    heartbeat_at: float
+
+
+def stable_hash(value: str) -> int:
+    """A hash of ``value`` that is the same in every process, unlike ``hash``."""
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+def partition_of(key: str, partitions: int) -> int:
+    """The partition of ``key`` among ``partitions``, the same in every process."""
+    return stable_hash(key) % partitions
+
+
+def partition_queue_name(queue_name: str, partition: int) -> str:
+    """The queue of one partition of the events of ``queue_name``."""
+    return f"{queue_name}.{partition}"
+
+
+def default_instance_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class HashRing:
+    """Consistent hashing of keys over members, each member placed ``replicas`` times on the ring."""
+
+    def __init__(self, members: Iterable[str], replicas: int = 64):
+        self.members = sorted(set(members))
+        points = sorted(
+            (stable_hash(f"{member}#{replica}"), member) for member in self.members for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.owners = [member for _, member in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        """The member owning ``key``, None if there is no member."""
+        if not self.hashes:
+            return None
+        index = bisect.bisect(self.hashes, stable_hash(key)) % len(self.hashes)
+        return self.owners[index]
+
+
+class ClusterMembership:
+    def __init__(self, engine, group: str, instance_id: Optional[str] = None, member_timeout: float = 15,
+                 clock: Callable[[], float] = time.time):
+        self.engine = engine
+        self.group = group
+        self.instance_id = instance_id or default_instance_id()
+        self.member_timeout = member_timeout
+        self.clock = clock
+
+    def heartbeat(self) -> List[str]:
+        """Records that this instance is alive and returns the live members of the group, itself included."""
+        now = self.clock()
+        with Session(self.engine) as session:
+            session.merge(ClusterMember(group=self.group, instance_id=self.instance_id, heartbeat_at=now))
+            # The members gone for long are forgotten
+            session.execute(delete(ClusterMember).where(
+                ClusterMember.group == self.group, ClusterMember.heartbeat_at < now - 10 * self.member_timeout
+            ))
+            session.commit()
+            return sorted(session.exec(select(ClusterMember.instance_id).where(
+                ClusterMember.group == self.group, ClusterMember.heartbeat_at >= now - self.member_timeout
+            )).all())
+
+    def leave(self) -> None:
+        """Removes this instance from the group, its keys move to the other members at their next heartbeat."""
+        with Session(self.engine) as session:
+            session.execute(delete(ClusterMember).where(
+                ClusterMember.group == self.group, ClusterMember.instance_id == self.instance_id
+            ))
+            session.commit()
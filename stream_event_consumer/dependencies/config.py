@@ -9,12 +9,20 @@ class LoggerConfig:
         logger_name: str = os.environ.get("LOGGER_NAME", "stream_event_consumer_logger"),
         max_bytes: int = int(os.environ.get("MAX_BYTES", "100000")),
         backup_count: int = int(os.environ.get("BACKUP_COUNT", "10")),
+        async_logging: bool = os.environ.get("LOG_ASYNC", "true").lower() in ("1", "true", "yes"),
+        queue_size: int = int(os.environ.get("LOG_QUEUE_SIZE", "10000")),
+        hot_path_sample_every: int = int(os.environ.get("LOG_HOT_PATH_SAMPLE_EVERY", "1")),
+        hot_path_max_per_second: float = float(os.environ.get("LOG_HOT_PATH_MAX_PER_SECOND", "10")),
     ) -> None:
         self.loglevel = loglevel
         self.logfile = logfile
         self.max_bytes = max_bytes
         self.backup_count = backup_count
         self.logger_name = logger_name
+        self.async_logging = async_logging
+        self.queue_size = queue_size
+        self.hot_path_sample_every = hot_path_sample_every
+        self.hot_path_max_per_second = hot_path_max_per_second
 
 
 class RabbitConfig:
@@ -25,12 +33,42 @@ class RabbitConfig:
         host_rabbit: str = os.environ.get("RABBITMQ_HOST"),
         queue_name: str = os.environ.get("QUEUE_NAME"),
         routing_key: str = os.environ.get("ROUTING_KEY"),
+        partitions: int = int(os.environ.get("STREAM_PARTITIONS", "0")),
+        lanes: str = os.environ.get("STREAM_LANES", ""),
+        lane_weights: str = os.environ.get("STREAM_LANE_WEIGHTS", ""),
+        lane_workers: str = os.environ.get("STREAM_LANE_WORKERS", ""),
     ) -> None:
         self.credentials_username = rabbit_username
         self.credentials_password = rabbit_password
         self.host_rabbit = host_rabbit
         self.queue_name = queue_name
         self.routing_key = routing_key
+        self.partitions = partitions
+        self.lanes = lanes
+        self.lane_weights = lane_weights
+        self.lane_workers = lane_workers
+
+
+class TenantSchedulingConfig:
+    def __init__(
+        self,
+        enabled: bool = os.environ.get("TENANT_FAIR_SCHEDULING", "false").lower() in ("1", "true", "yes"),
+        weights: str = os.environ.get("TENANT_WEIGHTS", ""),
+        rate_limits: str = os.environ.get("TENANT_RATE_LIMITS", ""),
+        max_held: int = int(os.environ.get("TENANT_MAX_HELD", "0")),
+    ) -> None:
+        self.enabled = enabled
+        self.weights = weights
+        self.rate_limits = rate_limits
+        self.max_held = max_held
+
+
+class ConnectivityConfig:
+    def __init__(
+        self,
+        gap_tolerance: float = float(os.environ.get("CONNECTIVITY_GAP_TOLERANCE", "90")),
+    ) -> None:
+        self.gap_tolerance = gap_tolerance
 
 
 class TOAConfig:
@@ -44,6 +82,47 @@ class TOAConfig:
     FROM_BYTE_TO_BITS = 8
 
 
+class DatabaseConfig:
+    def __init__(
+        self,
+        sql_echo: bool = os.environ.get("SQL_ECHO", "false").lower() in ("1", "true", "yes"),
+        slow_query_ms: float = float(os.environ.get("SLOW_QUERY_MS", "200")),
+    ) -> None:
+        self.sql_echo = sql_echo
+        self.slow_query_ms = slow_query_ms
+
+
+class MetricsConfig:
+    def __init__(
+        self,
+        enabled: bool = os.environ.get("METRICS_ENABLED", "false").lower() in ("1", "true", "yes"),
+        port: int = int(os.environ.get("METRICS_PORT", "9100")),
+    ) -> None:
+        self.enabled = enabled
+        self.port = port
+
+
+class ClusterConfig:
+    def __init__(
+        self,
+        enabled: bool = os.environ.get("CLUSTER_MODE", "false").lower() in ("1", "true", "yes"),
+        instance_id: str = os.environ.get("INSTANCE_ID", ""),
+        heartbeat_interval: float = float(os.environ.get("CLUSTER_HEARTBEAT_INTERVAL", "5")),
+        member_timeout: float = float(os.environ.get("CLUSTER_MEMBER_TIMEOUT", "15")),
+        hash_replicas: int = int(os.environ.get("CLUSTER_HASH_REPLICAS", "64")),
+    ) -> None:
+        self.enabled = enabled
+        self.instance_id = instance_id
+        self.heartbeat_interval = heartbeat_interval
+        self.member_timeout = member_timeout
+        self.hash_replicas = hash_replicas
+
+
 kpi_calculation_config = TOAConfig()
 logger_config = LoggerConfig()
 rabbit_config = RabbitConfig()
+database_config = DatabaseConfig()
+metrics_config = MetricsConfig()
+cluster_config = ClusterConfig()
+tenant_scheduling_config = TenantSchedulingConfig()
+connectivity_config = ConnectivityConfig()
@@ -0,0 +1,279 @@
+"""
+Scheduling of the stream events over the worker threads of the consumer.
+
+The events of each lane wait in their own queue. A lane runs at most ``max_workers`` events at a
+time, so a burst of one lane always leaves workers to the others, and the free workers go to the
+lanes with waiting events in proportion of their weight (smooth weighted round robin).
+
+Within a lane the events of each tenant wait in their own queue, served by deficit round robin in
+proportion of the weight of the tenant. A tenant with a rate limit is not served faster than its
+limit, whatever the free workers. The scheduler only orders the events handed to it: keeping a
+flooding or throttled tenant from filling the prefetch of a lane is up to the consumer.
+"""
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from dependencies.metrics import registry
+
+DEFAULT_TENANT = ""
+
+LANE_WAIT_SECONDS = registry.histogram(
+    "stream_event_lane_wait_seconds", "Time an event waits in the consumer for a worker, by lane", ["lane"]
+)
+LANE_PENDING = registry.gauge("stream_event_lane_pending", "Events waiting for a worker, by lane", ["lane"])
+LANE_RUNNING = registry.gauge("stream_event_lane_running", "Events being processed, by lane", ["lane"])
+TENANT_EVENTS = registry.counter("stream_event_tenant_events", "Events processed, by tenant", ["tenant"])
+TENANT_WAIT_SECONDS = registry.histogram(
+    "stream_event_tenant_wait_seconds", "Time an event waits in the consumer for a worker, by tenant", ["tenant"]
+)
+TENANT_THROTTLED = registry.counter(
+    "stream_event_tenant_throttled", "Times a free worker was left idle by a tenant over its rate limit", ["tenant"]
+)
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average, and bursts of ``burst`` events."""
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float]):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> bool:
+        self._refill()
+        return self.tokens >= 1
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    def delay(self) -> float:
+        """Seconds until the next event is allowed."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class FairQueue:
+    """The waiting tasks of a lane, served by deficit round robin over their tenants."""
+
+    def __init__(self, weight_of: Callable[[str], float]):
+        self.weight_of = weight_of
+        self.queues: Dict[str, deque] = {}
+        self.deficits: Dict[str, float] = {}
+        # The tenants with waiting tasks, the one at the head has its turn
+        self.active = deque()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, tenant: str, task) -> None:
+        if tenant not in self.queues:
+            self.queues[tenant] = deque()
+            self.deficits[tenant] = 0
+            self.active.append(tenant)
+        self.queues[tenant].append(task)
+        self.size += 1
+
+    def tenants(self) -> List[str]:
+        return list(self.active)
+
+    def pop(self, allowed: Callable[[str], bool]) -> Optional[Tuple[str, tuple]]:
+        """The next task of the tenants for which ``allowed`` is true, None if they have none."""
+        if not any(allowed(tenant) for tenant in self.active):
+            return None
+        while True:
+            tenant = self.active[0]
+            if allowed(tenant):
+                if self.deficits[tenant] < 1:
+                    # The tenant starts its turn with its quantum
+                    self.deficits[tenant] += self.weight_of(tenant)
+                if self.deficits[tenant] >= 1:
+                    self.deficits[tenant] -= 1
+                    task = self.queues[tenant].popleft()
+                    self.size -= 1
+                    if not self.queues[tenant]:
+                        del self.queues[tenant], self.deficits[tenant]
+                        self.active.popleft()
+                    elif self.deficits[tenant] < 1:
+                        self.active.rotate(-1)
+                    return tenant, task
+            self.active.rotate(-1)
+
+
+class Lane:
+    def __init__(self, name: str, weight: int = 1, max_workers: Optional[int] = None):
+        self.name = name
+        self.weight = weight
+        self.max_workers = max_workers
+        self.pending: Optional[FairQueue] = None
+        self.running = 0
+        # The credit of the lane in the smooth weighted round robin
+        self.current = 0
+
+    def has_worker(self) -> bool:
+        return self.max_workers is None or self.running < self.max_workers
+
+
+class LaneScheduler:
+    def __init__(self, lanes: Iterable[Lane], workers: int, clock: Callable[[], float] = time.perf_counter,
+                 tenant_weights: Optional[Dict[str, float]] = None, tenant_rates: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            lanes: The lanes of the tasks.
+            workers: The number of worker threads shared by the lanes.
+            clock: The clock of the waits and rate limits, in seconds.
+            tenant_weights: The weight of each tenant, ``*`` for the tenants not listed (default 1).
+            tenant_rates: The most tasks per second of each tenant, ``*`` for the tenants not listed
+                (default no limit).
+        """
+        for name, values in (("weight", tenant_weights), ("rate", tenant_rates)):
+            for tenant, value in (values or {}).items():
+                # A tenant of weight 0 would never get a quantum, and pop would rotate forever
+                if not value > 0:
+                    raise ValueError(f"The {name} of tenant {tenant} must be positive, not {value}")
+        self.lanes = {lane.name: lane for lane in lanes}
+        self.workers = workers
+        self.clock = clock
+        self.tenant_weights = tenant_weights or {}
+        self.tenant_rates = tenant_rates or {}
+        self.buckets: Dict[str, Optional[TokenBucket]] = {}
+        self.running = 0
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.wake_timer: Optional[threading.Timer] = None
+        self.closed = False
+        # Never holds more tasks than workers, the waiting ones stay in their lane
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        for lane in self.lanes.values():
+            lane.pending = FairQueue(self.tenant_weight)
+            LANE_PENDING.labels(lane.name).set_function(lambda lane=lane: len(lane.pending))
+            LANE_RUNNING.labels(lane.name).set_function(lambda lane=lane: lane.running)
+
+    def tenant_weight(self, tenant: str) -> float:
+        return self.tenant_weights.get(tenant, self.tenant_weights.get("*", 1))
+
+    def bucket(self, tenant: str) -> Optional[TokenBucket]:
+        if tenant not in self.buckets:
+            rate = self.tenant_rates.get(tenant, self.tenant_rates.get("*"))
+            self.buckets[tenant] = TokenBucket(rate, max(rate, 1), self.clock) if rate else None
+        return self.buckets[tenant]
+
+    def allowed(self, tenant: str) -> bool:
+        bucket = self.bucket(tenant)
+        return bucket is None or bucket.available()
+
+    def throttled(self, tenant: str) -> bool:
+        """Whether the tenant is over its rate limit right now."""
+        with self.lock:
+            return not self.allowed(tenant)
+
+    def submit(self, lane_name: str, func: Callable, *args, tenant: str = DEFAULT_TENANT) -> None:
+        """Runs ``func(*args)`` on a worker once its lane and its tenant get one."""
+        with self.lock:
+            self.lanes[lane_name].pending.append(tenant, (self.clock(), func, args))
+            tasks = self._take_tasks()
+        self._start(tasks)
+
+    def _pick_lane(self, lanes: List[Lane]) -> Lane:
+        for lane in lanes:
+            lane.current += lane.weight
+        chosen = max(lanes, key=lambda lane: lane.current)
+        chosen.current -= sum(lane.weight for lane in lanes)
+        return chosen
+
+    def _take_tasks(self) -> List[Tuple[Lane, str, tuple]]:
+        """The tasks to start on the free workers, called with the lock held."""
+        tasks = []
+        if self.closed:
+            return tasks
+        lanes = [lane for lane in self.lanes.values() if lane.pending and lane.has_worker()]
+        while self.running < self.workers and lanes:
+            lane = self._pick_lane(lanes)
+            task = lane.pending.pop(self.allowed)
+            if task is None:
+                # All the waiting tenants of the lane are over their rate limit
+                for tenant in lane.pending.tenants():
+                    TENANT_THROTTLED.labels(tenant).inc()
+                lanes.remove(lane)
+                continue
+            tenant, task = task
+            if self.bucket(tenant) is not None:
+                self.bucket(tenant).take()
+            lane.running += 1
+            self.running += 1
+            tasks.append((lane, tenant, task))
+            if not (lane.pending and lane.has_worker()):
+                lanes.remove(lane)
+        if self.running < self.workers:
+            self._wake_for_rate_limits()
+        return tasks
+
+    def _wake_for_rate_limits(self) -> None:
+        """Takes the tasks again when the first tenant waiting for its rate limit is allowed."""
+        delays = [
+            self.bucket(tenant).delay()
+            for lane in self.lanes.values() if lane.pending and lane.has_worker()
+            for tenant in lane.pending.tenants() if self.bucket(tenant) is not None
+        ]
+        if not delays or self.wake_timer is not None:
+            return
+        self.wake_timer = threading.Timer(max(min(delays), 0.001), self._wake)
+        self.wake_timer.daemon = True
+        self.wake_timer.start()
+
+    def _wake(self) -> None:
+        with self.lock:
+            self.wake_timer = None
+            tasks = self._take_tasks()
+        self._start(tasks)
+
+    def _start(self, tasks: List[Tuple[Lane, str, tuple]]) -> None:
+        for lane, tenant, task in tasks:
+            self.executor.submit(self._run, lane, tenant, task)
+
+    def _run(self, lane: Lane, tenant: str, task: tuple) -> None:
+        submitted_at, func, args = task
+        wait = self.clock() - submitted_at
+        LANE_WAIT_SECONDS.labels(lane.name).observe(wait)
+        TENANT_WAIT_SECONDS.labels(tenant).observe(wait)
+        try:
+            func(*args)
+        finally:
+            TENANT_EVENTS.labels(tenant).inc()
+            with self.lock:
+                lane.running -= 1
+                self.running -= 1
+                tasks = self._take_tasks()
+                if not self.running and not self.pending_locked():
+                    self.idle.notify_all()
+            self._start(tasks)
+
+    def pending_locked(self) -> int:
+        return sum(len(lane.pending) for lane in self.lanes.values())
+
+    def pending(self) -> int:
+        with self.lock:
+            return self.pending_locked()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops the workers, once all the tasks submitted have run when ``wait``."""
+        if wait:
+            with self.idle:
+                while self.running or self.pending_locked():
+                    self.idle.wait()
+        with self.lock:
+            self.closed = True
+            if self.wake_timer is not None:
+                self.wake_timer.cancel()
+        self.executor.shutdown(wait=wait)
@@ -1,11 +1,15 @@
 import base64
 import math
 import logging
+import re
 import sys
+from datetime import datetime, timedelta, timezone
 from logging.handlers import RotatingFileHandler
+from typing import Optional
 from .config import LoggerConfig
 from .config import kpi_calculation_config
 from .exceptions import CalculationError
+from .logging_utils import start_queue_logging
 
 
 def get_logger(logger_config: LoggerConfig) -> logging.Logger:
@@ -32,6 +36,9 @@ def get_logger(logger_config: LoggerConfig) -> logging.Logger:
     if not isinstance(numeric_level, int):
         raise ValueError(f"Invalid log level: {logger_config.loglevel}")
     logger.setLevel(numeric_level)
+    if logger.handlers:
+        # Already set up, the handlers are shared by every caller
+        return logger
 
     # Configure log file handler
     try:
@@ -43,16 +50,48 @@ def get_logger(logger_config: LoggerConfig) -> logging.Logger:
     except IOError as e:
         raise IOError(f"Error opening log file: {e}")
     log_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s: %(message)s"))
-    logger.addHandler(log_handler)
 
     # Configure console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
-    logger.addHandler(console_handler)
+
+    if logger_config.async_logging:
+        # Formatting and writing happen in a background thread, off the hot paths
+        start_queue_logging(logger, [log_handler, console_handler], logger_config.queue_size)
+    else:
+        logger.addHandler(log_handler)
+        logger.addHandler(console_handler)
 
     return logger
 
 
+_TIMESTAMP = re.compile(
+    r"(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(?:\.(\d+))?(Z|[+-]\d{2}:?\d{2})?$"
+)
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """
+    Parses an RFC 3339 timestamp of TTI, e.g. ``2023-03-27T10:00:00.123456789Z``, into a naive UTC
+    datetime. The fraction is truncated to microseconds. None if ``value`` is not a timestamp.
+    """
+    if isinstance(value, datetime):
+        return value
+    match = _TIMESTAMP.match(str(value or "").strip())
+    if match is None:
+        return None
+    date, time, fraction, offset = match.groups()
+    parsed = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M:%S")
+    if fraction:
+        parsed = parsed.replace(microsecond=int(fraction[:6].ljust(6, "0")))
+    if offset and offset != "Z":
+        sign = 1 if offset[0] == "+" else -1
+        hours, minutes = int(offset[1:3]), int(offset[-2:])
+        parsed = parsed.replace(tzinfo=timezone(sign * timedelta(hours=hours, minutes=minutes)))
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
 def get_payload_size(frm_payload: str) -> int:
     """
     Returns the size of the physical layer payload (PHY payload) of the LoRaWAN packet
@@ -2,7 +2,12 @@ import logging
 
 from database.db import create_db_and_tables, db_engine
 from dependencies import utility_functions
-from dependencies.config import logger_config, rabbit_config
+from dependencies.cluster import ClusterMembership
+from dependencies.config import (
+    cluster_config, connectivity_config, logger_config, rabbit_config, tenant_scheduling_config,
+)
+from dependencies.lanes import parse_lane_values, parse_lanes
+from dependencies.metrics import start_metrics_server
 from stream_event_consumer_service import MessageConsumer
 
 threading_numbers = 10
@@ -20,6 +25,20 @@ def main():
     # Set up a logger for the consumer
     consumer_logger = utility_functions.get_logger(logger_config)
 
+    # Serve /metrics when METRICS_ENABLED is set
+    start_metrics_server()
+
+    # In cluster mode the instances share the partition queues of the stream events
+    cluster = None
+    if cluster_config.enabled:
+        cluster = ClusterMembership(
+            db_engine,
+            "stream_event_consumer",
+            instance_id=cluster_config.instance_id or None,
+            member_timeout=cluster_config.member_timeout,
+        )
+        consumer_logger.info(f"Cluster mode, instance {cluster.instance_id}")
+
     # Create a message consumer instance with the extracted configuration details
     metadata_consumer = MessageConsumer(
         consumer_logger,
@@ -29,6 +48,18 @@ def main():
         consumer_queue_name,
         db_engine,
         threading_numbers,
+        partitions=rabbit_config.partitions,
+        cluster=cluster,
+        heartbeat_interval=cluster_config.heartbeat_interval,
+        hash_replicas=cluster_config.hash_replicas,
+        lanes=parse_lanes(rabbit_config.lanes),
+        lane_weights=parse_lane_values(rabbit_config.lane_weights, int),
+        lane_workers=parse_lane_values(rabbit_config.lane_workers, int),
+        tenant_fairness=tenant_scheduling_config.enabled,
+        tenant_weights=parse_lane_values(tenant_scheduling_config.weights, float),
+        tenant_rates=parse_lane_values(tenant_scheduling_config.rate_limits, float),
+        tenant_max_held=tenant_scheduling_config.max_held or None,
+        connectivity_gap_tolerance=connectivity_config.gap_tolerance,
     )
 
     # Start the RabbitMQ consumer
@@ -1,16 +1,25 @@
 import concurrent
 import concurrent.futures
 import json
-from typing import Any, Dict, List
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
-import pika
 from sqlmodel import Session, select
 
+from dependencies.cluster import ClusterMembership, HashRing, partition_queue_name
 from dependencies.exceptions import RabbitMQConnectionError, RabbitMQConsumingError, ParsingError, DatabaseError
-from dependencies.utility_functions import calculate_toa, get_payload_size
+from dependencies.lanes import DEFAULT_LANE, lane_queue_name, parked_queue_name
+from dependencies.logging_utils import get_hot_path_logger
+from dependencies.metrics import registry
+from dependencies.scheduling import DEFAULT_TENANT, Lane, LaneScheduler
+from dependencies.transport import Message, RabbitMQTransport, Transport
+from dependencies.utility_functions import calculate_toa, get_payload_size, parse_timestamp
 from stream_event_consumer.database.models import (
     AllRelation,
     GatewayConnectionStats,
+    GatewayConnectivityInterval,
     GatewayStatusReceive,
     NodeMetadataDl,
     NodeMetadataUl,
@@ -20,6 +29,36 @@ from stream_event_consumer.database.models import (
 num_tx_replica = 3
 threshold_f_cnt = 3
 
+EVENTS_CONSUMED = registry.counter(
+    "stream_events_consumed", "Stream events taken from the queue, by event name", ["event_name"]
+)
+EVENT_PROCESSING_SECONDS = registry.histogram(
+    "stream_event_processing_seconds", "Time to decode and store one stream event", ["event_name"]
+)
+EVENT_ERRORS = registry.counter(
+    "stream_event_errors", "Stream events that failed, by processing stage", ["stage"]
+)
+QUEUE_WAIT_SECONDS = registry.histogram(
+    "stream_event_queue_wait_seconds", "Time a received event waits for a free worker thread"
+)
+EVENTS_IN_FLIGHT = registry.gauge(
+    "stream_events_in_flight", "Events received from the broker and not processed yet"
+)
+DB_COMMIT_SECONDS = registry.histogram(
+    "stream_event_db_commit_seconds", "Time to add and commit one row, by table", ["table"]
+)
+OWNED_PARTITIONS = registry.gauge("stream_event_consumer_partitions", "Partition queues consumed by this instance")
+CLUSTER_MEMBERS = registry.gauge("stream_event_consumer_cluster_members", "Live instances of the cluster")
+LANE_LAG_SECONDS = registry.histogram(
+    "stream_event_lane_lag_seconds", "Time from the publication of an event to its processing, by lane", ["lane"]
+)
+TENANT_PARKED = registry.counter(
+    "stream_event_tenant_parked", "Events moved to the parked queue of their lane, by tenant", ["tenant"]
+)
+PARTITIONS_MOVED = registry.counter(
+    "stream_event_consumer_partitions_moved", "Partition queues taken or given up by a rebalance, by action", ["action"]
+)
+
 
 class MessageConsumer:
     def __init__(
@@ -31,6 +70,19 @@ class MessageConsumer:
             queue_name,
             db_engine,
             max_threads,
+            transport: Transport = None,
+            partitions: int = 0,
+            cluster: Optional[ClusterMembership] = None,
+            heartbeat_interval: float = 5,
+            hash_replicas: int = 64,
+            lanes: Optional[Dict[str, str]] = None,
+            lane_weights: Optional[Dict[str, int]] = None,
+            lane_workers: Optional[Dict[str, int]] = None,
+            tenant_fairness: bool = False,
+            tenant_weights: Optional[Dict[str, float]] = None,
+            tenant_rates: Optional[Dict[str, float]] = None,
+            tenant_max_held: Optional[int] = None,
+            connectivity_gap_tolerance: float = 90,
     ):
         """
         Initialize a MessageConsumer object with the given parameters.
@@ -42,19 +94,70 @@ class MessageConsumer:
             rabbit_host: The hostname for the RabbitMQ instance.
             queue_name: The name of the RabbitMQ queue to consume messages from.
             db_engine: A SQLAlchemy engine object for connecting to a database.
+            transport: The message transport, a RabbitMQ transport built from the credentials
+                above when not given.
+            partitions: The number of partition queues the events are spread over by the stream
+                event logger, 0 when they all go to ``queue_name``.
+            cluster: The membership of the consumer instances sharing the partitions, None to
+                consume all of them.
+            heartbeat_interval: The seconds between two rebalances of the partitions in a cluster.
+            hash_replicas: The points of each instance on the consistent hashing ring.
+            lanes: The lane of each event name, each lane has its own queue. None to consume
+                ``queue_name`` only.
+            lane_weights: The share of the workers of each lane when several wait for one (default 1).
+            lane_workers: The most workers of each lane at a time (default ``max_threads``).
+            tenant_fairness: Whether the events of each tenant wait in their own queue, served in
+                proportion of the weight of the tenant instead of in their order of arrival.
+            tenant_weights: The weight of each tenant, ``*`` for the others (default 1).
+            tenant_rates: The most events per second of each tenant, ``*`` for the others (default
+                no limit).
+            tenant_max_held: The most events of a tenant held from the queue of a lane at a time,
+                the others are parked (default the workers of the lane, half its prefetch).
+            connectivity_gap_tolerance: The most seconds between two status events of a gateway
+                for it to count as connected in between.
         """
         self.logger = logger
+        self.hot_logger = get_hot_path_logger(logger)
         self.rabbit_username = rabbit_username
         self.rabbit_password = rabbit_password
         self.rabbit_host = rabbit_host
         self.queue_name = queue_name
-        self.credentials = pika.PlainCredentials(
-            username=self.rabbit_username, password=self.rabbit_password
+        self.transport = transport or RabbitMQTransport(
+            rabbit_host, rabbit_username, rabbit_password, logger=logger
         )
         self.rx_event_message = {}
         self.db_engine = db_engine
         self.max_threads = max_threads
         self.thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_threads)
+        self.partitions = partitions
+        self.cluster = cluster
+        self.heartbeat_interval = heartbeat_interval
+        self.hash_replicas = hash_replicas
+        self.ring = HashRing([cluster.instance_id] if cluster else [], hash_replicas)
+        self.owned_partitions: Set[int] = set()
+        # The events of each lane are processed on the workers of the scheduler, acknowledged once done
+        self.lane_names = sorted(set(lanes.values()) | {DEFAULT_LANE}) if lanes else [DEFAULT_LANE]
+        self.lane_workers = lane_workers or {}
+        self.tenant_fairness = tenant_fairness
+        self.tenant_max_held = tenant_max_held
+        # The events of each lane and tenant delivered from the lane queue and not acknowledged yet
+        self.held: Dict[Tuple[str, str], int] = {}
+        self.held_lock = threading.Lock()
+        self.connectivity_gap_tolerance = connectivity_gap_tolerance
+        # The intervals of a gateway are merged by one worker at a time
+        self.connectivity_locks: Dict[str, threading.Lock] = {}
+        self.connectivity_locks_lock = threading.Lock()
+        self.scheduler = None
+        if lanes or tenant_fairness:
+            self.scheduler = LaneScheduler(
+                [Lane(lane, (lane_weights or {}).get(lane, 1), self.lane_workers.get(lane)) for lane in self.lane_names],
+                self.max_threads,
+                tenant_weights=tenant_weights,
+                tenant_rates=tenant_rates,
+            )
+        self.stopped = threading.Event()
+        OWNED_PARTITIONS.set_function(lambda: len(self.owned_partitions))
+        CLUSTER_MEMBERS.set_function(lambda: len(self.ring.members))
         self.logger.debug("initialize - Message logger connector")
 
     @staticmethod
@@ -275,15 +378,87 @@ class MessageConsumer:
         """
         with Session(self.db_engine) as session:
             try:
-                session.add(data)
-                session.commit()
-                self.logger.debug("Data stored successfully in the database.")
+                with DB_COMMIT_SECONDS.labels(type(data).__name__).time():
+                    session.add(data)
+                    session.commit()
+                self.hot_logger.debug("Data stored successfully in the database.")
             except Exception as e:
+                EVENT_ERRORS.labels("store").inc()
                 self.logger.error(f"Error storing data in the database: {str(e)}")
                 raise DatabaseError("store_data ", f"Error storing data in the database: {str(e)}")
             finally:
                 session.close()
 
+    def record_connectivity(self, gateway_id: str, up_from: datetime, up_to: datetime, tolerance: float = 0) -> None:
+        """
+        Records that the gateway was connected from ``up_from`` to ``up_to``. The interval is merged
+        with the intervals of the gateway it overlaps or that are at most ``tolerance`` seconds away,
+        so that each period of connectivity of the gateway is a single row. The merges of a gateway
+        are serialized: by a lock between the workers of the consumer, and by locking the rows read
+        between the instances of a cluster on PostgreSQL.
+
+        Args:
+            gateway_id: The ID of the gateway.
+            up_from: The start of the interval, in UTC.
+            up_to: The end of the interval, in UTC.
+            tolerance: The longest gap, in seconds, bridged between two intervals.
+        """
+        gap = timedelta(seconds=tolerance)
+        with self.connectivity_locks_lock:
+            lock = self.connectivity_locks.setdefault(gateway_id, threading.Lock())
+        with lock, Session(self.db_engine) as session:
+            try:
+                with DB_COMMIT_SECONDS.labels(GatewayConnectivityInterval.__name__).time():
+                    intervals = session.exec(
+                        select(GatewayConnectivityInterval)
+                        .where(
+                            GatewayConnectivityInterval.gateway_id == gateway_id,
+                            GatewayConnectivityInterval.up_from <= up_to + gap,
+                            GatewayConnectivityInterval.up_to >= up_from - gap,
+                        )
+                        .order_by(GatewayConnectivityInterval.up_from)
+                        .with_for_update()
+                    ).all()
+                    if len(intervals) == 1 and intervals[0].up_from <= up_from and intervals[0].up_to >= up_to:
+                        # Already known, e.g. a status event during a connection already recorded
+                        return
+                    if not intervals:
+                        session.add(GatewayConnectivityInterval(gateway_id=gateway_id, up_from=up_from, up_to=up_to))
+                    else:
+                        # The first interval is extended over the others, which are merged into it
+                        merged = intervals[0]
+                        merged.up_from = min([up_from] + [interval.up_from for interval in intervals])
+                        merged.up_to = max([up_to] + [interval.up_to for interval in intervals])
+                        session.add(merged)
+                        for interval in intervals[1:]:
+                            session.delete(interval)
+                    session.commit()
+            except Exception as e:
+                EVENT_ERRORS.labels("connectivity").inc()
+                self.logger.error(f"Error recording the connectivity of {gateway_id}: {str(e)}")
+                raise DatabaseError("record_connectivity ", f"Error recording the connectivity: {str(e)}")
+
+    def update_connectivity(self, event_name: str, rx_event_message) -> None:
+        """
+        Records the connectivity of the gateway of a connection stats or status event: a connection
+        stats event covers the connection up to the event (or to the disconnection when the gateway
+        disconnected), a status event shows the gateway connected at the time of the event.
+        """
+        result = rx_event_message.get("result", {})
+        gateway_id = result.get("identifiers", [{}])[0].get("gateway_ids", {}).get("gateway_id")
+        event_time = parse_timestamp(result.get("time"))
+        if gateway_id is None or event_time is None:
+            return
+        if event_name == "gs.gateway.connection.stats":
+            data = result.get("data") or {}
+            connected_at = parse_timestamp(data.get("connected_at"))
+            if connected_at is None:
+                return
+            up_to = parse_timestamp(data.get("disconnected_at")) or event_time
+            self.record_connectivity(gateway_id, connected_at, max(connected_at, up_to))
+        else:
+            self.record_connectivity(gateway_id, event_time, event_time, self.connectivity_gap_tolerance)
+
     def get_all_packet_replica(self, dev_addr, gateway_id, f_cnt) -> List[PacketReplicaMetadata]:
         """
         Returns all packet replicas from the database for a given device address and frame counter.
@@ -334,16 +509,16 @@ class MessageConsumer:
 
     def update_packet_replica_metadata(self, dev_addr, gateway_id, f_cnt):
         try:
-            self.logger.debug(f" update_packet_replica_metadata ")
+            self.hot_logger.debug(" update_packet_replica_metadata ")
             with Session(self.db_engine) as session:
                 all_replica = self.get_all_packet_replica(dev_addr, gateway_id, f_cnt)
-                self.logger.debug(f" all_replica : {all_replica} ")
+                self.hot_logger.debug(" all_replica : %s ", all_replica)
                 tot_rx_replica = len(list(all_replica))
                 gw_list = [packet_rx_replica.gateway_id for packet_rx_replica in all_replica]
                 num_gws = len(set(gw_list))
                 count_list = [gw_list.count(gw) for gw in set(gw_list)]
                 num_rx_replica = max(count_list)
-                self.logger.debug(f" tot_rx_replica{tot_rx_replica} ")
+                self.hot_logger.debug(" tot_rx_replica%s ", tot_rx_replica)
                 for packet_rx_replica in all_replica:
                     packet_rx_replica.num_rx_replica = num_rx_replica
                     packet_rx_replica.num_loss_replica = max((num_tx_replica - num_rx_replica), 0)
@@ -374,7 +549,7 @@ class MessageConsumer:
             None.
         """
         try:
-            self.logger.debug(f" store_new_packet_replica_metadata ")
+            self.hot_logger.debug(" store_new_packet_replica_metadata ")
             new_packet = {
                 "device_id": pkt_data.get("device_id", None),
                 "dev_addr": pkt_data.get("dev_addr", None),
@@ -402,7 +577,7 @@ class MessageConsumer:
             None.
         """
         try:
-            self.logger.debug(f"calculate_pkt_replica_number")
+            self.hot_logger.debug("calculate_pkt_replica_number")
             dev_addr = pkt_data["dev_addr"]
             gateway_id = pkt_data["gateway_id"]
             f_cnt = pkt_data["f_cnt"]
@@ -422,7 +597,7 @@ class MessageConsumer:
                                 f"Error calculate_pkt_replica_number: {repr(e)}")
 
     def get_device_id_by_dev_addr_and_gateway_tti_id(self, dev_addr, last_f_cnt, gateway_tti_id):
-        self.logger.debug("get_device_id_by_dev_addr_and_gateway_tti_id")
+        self.hot_logger.debug("get_device_id_by_dev_addr_and_gateway_tti_id")
         with Session(self.db_engine) as session:
             statement = select(AllRelation).where(
                 AllRelation.dev_addr == dev_addr,
@@ -521,55 +696,205 @@ class MessageConsumer:
                 decoded_message_json = self.decode_gs_status_receive(rx_event_message)
                 metadata = GatewayStatusReceive(**decoded_message_json)
                 self.store_data(metadata)
+                self.update_connectivity(event_name, rx_event_message)
 
             elif event_name == "gs.gateway.connection.stats":
                 decoded_message_json = self.decode_gs_gateway_connection_stats(rx_event_message)
                 metadata = GatewayConnectionStats(**decoded_message_json)
                 self.store_data(metadata)
+                self.update_connectivity(event_name, rx_event_message)
 
             else:
-                self.logger.debug(f"event not process")
+                self.hot_logger.debug("event not process")
 
         except Exception as e:
+            EVENT_ERRORS.labels("decode").inc()
             self.logger.error(f"Error decode_rx_message: {repr(e)}")
 
-    def consume(self, event_message):
+    def consume(self, event_message, received_at: float = None):
+        if received_at is not None:
+            QUEUE_WAIT_SECONDS.observe(time.perf_counter() - received_at)
+            EVENTS_IN_FLIGHT.dec()
         if len(event_message) > 100:
             try:
                 rx_event_message = json.loads(event_message)
                 rx_event_message = json.loads(rx_event_message)
                 event_name = rx_event_message["result"]["name"]
-                self.logger.debug(f"event_name =  {event_name}")
-                self.decode_rx_message(event_name, rx_event_message)
+                self.hot_logger.debug("event_name =  %s", event_name)
+                EVENTS_CONSUMED.labels(event_name).inc()
+                with EVENT_PROCESSING_SECONDS.labels(event_name).time():
+                    self.decode_rx_message(event_name, rx_event_message)
 
             except Exception as e:
+                EVENT_ERRORS.labels("parse").inc()
                 self.logger.error(f"ERROR in the consuming: {repr(e)}")
 
-    def callback(self, ch, method, properties, body):
+    def callback(self, message: Message):
         try:
-            self.thread_pool.submit(self.consume, body)
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            EVENTS_IN_FLIGHT.inc()
+            self.thread_pool.submit(self.consume, message.body, time.perf_counter())
+            self.transport.ack(message)
         except Exception as e:
             self.logger.error(f"Error in callback function: {repr(e)}")
             raise
 
-    def start_consuming(self):
-        self.logger.debug(f"start stream event consumer service ")
+    def assigned_partitions(self) -> Set[int]:
+        """The partitions this instance should consume: all of them, or the ones the ring gives it in a cluster."""
+        if self.cluster is None:
+            return set(range(self.partitions))
+        ring = HashRing(self.cluster.heartbeat(), self.hash_replicas)
+        if ring.members != self.ring.members:
+            self.logger.info(f"Cluster members changed: {', '.join(ring.members)}")
+        self.ring = ring
+        return {
+            partition for partition in range(self.partitions)
+            if ring.owner(f"partition-{partition}") == self.cluster.instance_id
+        }
+
+    def consume_partitions(self, partitions: Set[int]) -> None:
+        """Consumes the queues of ``partitions`` and stops consuming the queues of the other partitions."""
+        given_up = self.owned_partitions - partitions
+        for partition in sorted(given_up):
+            for queue_name in self.lane_queues(partition).values():
+                self.transport.cancel(queue_name)
+                if self.tenant_fairness:
+                    self.transport.cancel(parked_queue_name(queue_name))
+        taken = partitions - self.owned_partitions
+        for partition in sorted(taken):
+            self.consume_lanes(partition)
+        self.owned_partitions = set(partitions)
+        if given_up or taken:
+            self.logger.info(f"Consumed partitions: {sorted(self.owned_partitions)}")
+            PARTITIONS_MOVED.labels("give_up").inc(len(given_up))
+            PARTITIONS_MOVED.labels("take").inc(len(taken))
+
+    def rebalance(self) -> None:
+        """
+        Heartbeats, then consumes exactly the partitions that the ring gives to this instance. The
+        queues are changed on the consuming thread. The consumers of the partitions given up are
+        cancelled: the events already delivered are processed and acknowledged here, the others stay
+        in their queue for the new owner.
+        """
+        partitions = self.assigned_partitions()
+        self.transport.run_threadsafe(lambda: self.consume_partitions(partitions))
+
+    def run_cluster(self) -> None:
+        """Rebalances every ``heartbeat_interval`` seconds until ``stop``, then leaves the cluster."""
+        while not self.stopped.wait(self.heartbeat_interval):
+            try:
+                self.rebalance()
+            except Exception as e:
+                self.logger.error(f"Error rebalancing the partitions: {repr(e)}")
+        try:
+            self.cluster.leave()
+        except Exception as e:
+            self.logger.error(f"Error leaving the cluster: {repr(e)}")
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.transport.stop_consuming()
+
+    def process_lane_event(self, lane: str, message: Message, received_at: float,
+                           held_tenant: Optional[str] = None) -> None:
+        published_at = message.headers.get("published_at")
+        if published_at is not None:
+            LANE_LAG_SECONDS.labels(lane).observe(time.time() - float(published_at))
         try:
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(host=self.rabbit_host, credentials=self.credentials)
+            self.consume(message.body, received_at)
+        finally:
+            self.transport.ack(message)
+            if held_tenant is not None:
+                with self.held_lock:
+                    self.held[(lane, held_tenant)] -= 1
+
+    def hold(self, lane: str, tenant: str) -> bool:
+        """
+        Whether an event of the tenant delivered from the queue of the lane can wait for a worker in
+        its prefetch: the tenant holds less than its share of the prefetch and is within its rate
+        limit. Otherwise the event would keep a prefetch slot that the other tenants need.
+        """
+        max_held = self.tenant_max_held or self.lane_workers.get(lane, self.max_threads)
+        with self.held_lock:
+            if self.held.get((lane, tenant), 0) >= max_held or self.scheduler.throttled(tenant):
+                return False
+            self.held[(lane, tenant)] = self.held.get((lane, tenant), 0) + 1
+            return True
+
+    def park(self, tenant: str, message: Message) -> None:
+        """
+        Moves an event to the parked queue of its lane queue, then acknowledges it, freeing its
+        prefetch slot. The parked events are processed like the others, at the pace of their tenant.
+        """
+        self.transport.publish(parked_queue_name(message.queue_name), message.body, headers=message.headers)
+        self.transport.ack(message)
+        TENANT_PARKED.labels(tenant).inc()
+
+    def lane_callback(self, lane: str, parked: bool = False) -> Callable[[Message], None]:
+        if self.scheduler is None:
+            return self.callback
+
+        def on_message(message: Message) -> None:
+            tenant = self.get_tenant(message) if self.tenant_fairness else DEFAULT_TENANT
+            held_tenant = None
+            if self.tenant_fairness and not parked:
+                if not self.hold(lane, tenant):
+                    self.park(tenant, message)
+                    return
+                held_tenant = tenant
+            EVENTS_IN_FLIGHT.inc()
+            self.scheduler.submit(
+                lane, self.process_lane_event, lane, message, time.perf_counter(), held_tenant, tenant=tenant
+            )
+
+        return on_message
+
+    @staticmethod
+    def get_tenant(message: Message) -> str:
+        """The tenant of an event, from the header set by the stream event logger or else from the event."""
+        tenant = message.headers.get("tenant_id")
+        if tenant is None:
+            try:
+                tenant = json.loads(json.loads(message.body))["result"].get("context", {}).get("tenant-id")
+            except Exception:
+                tenant = None
+        return tenant or DEFAULT_TENANT
+
+    def lane_queues(self, partition: Optional[int] = None) -> Dict[str, str]:
+        """The queue of each lane, of ``partition`` when the events are partitioned."""
+        return {
+            lane: lane_queue_name(self.queue_name, lane) if partition is None
+            else partition_queue_name(lane_queue_name(self.queue_name, lane), partition)
+            for lane in self.lane_names
+        }
+
+    def consume_lanes(self, partition: Optional[int] = None) -> None:
+        for lane, queue_name in self.lane_queues(partition).items():
+            # The lanes keep a few more events than their workers, so a worker never waits for the broker
+            prefetch_count = self.max_threads if self.scheduler is None else 2 * self.lane_workers.get(
+                lane, self.max_threads
             )
-            channel = connection.channel()
-            channel.queue_declare(queue=self.queue_name, durable=True)
-            channel.basic_qos(prefetch_count=1)
+            self.transport.consume(queue_name, self.lane_callback(lane), prefetch_count=prefetch_count)
+            if self.tenant_fairness:
+                # A flooding or throttled tenant only clogs the parked queue, the lane queue keeps flowing
+                self.transport.consume(
+                    parked_queue_name(queue_name), self.lane_callback(lane, parked=True), prefetch_count=prefetch_count
+                )
+
+    def start_consuming(self):
+        self.logger.debug("start stream event consumer service ")
+        try:
+            if not self.partitions:
+                self.consume_lanes()
+            else:
+                self.consume_partitions(self.assigned_partitions())
+                if self.cluster is not None:
+                    threading.Thread(target=self.run_cluster, name="partition_rebalance", daemon=True).start()
         except Exception as e:
             self.logger.error(f"Failed to connect to RabbitMQ: {repr(e)}")
             raise RabbitMQConnectionError("Failed to connect to RabbitMQ.") from e
 
         try:
-            for _ in range(self.max_threads):
-                channel.basic_consume(queue=self.queue_name, on_message_callback=self.callback)
-            channel.start_consuming()
+            self.transport.start_consuming()
         except Exception as e:
             self.logger.error(f"RabbitMQ channel was closed: {repr(e)}")
             raise RabbitMQConsumingError(f"Error starting RabbitMQ consumer: {repr(e)}") from e
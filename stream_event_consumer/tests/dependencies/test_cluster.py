@@ -0,0 +1,62 @@
+from collections import Counter
+
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, create_engine
+
+from dependencies.cluster import ClusterMembership, HashRing, partition_of, partition_queue_name
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_keys_are_spread_over_the_members():
+    ring = HashRing(["instance-1", "instance-2", "instance-3"])
+
+    owners = Counter(ring.owner(f"gateway-{index}") for index in range(3000))
+
+    assert set(owners) == {"instance-1", "instance-2", "instance-3"}
+    assert min(owners.values()) > 600
+    assert HashRing([]).owner("gateway-1") is None
+
+
+def test_a_joining_member_only_takes_keys():
+    keys = [f"gateway-{index}" for index in range(1000)]
+    before = HashRing(["instance-1", "instance-2"])
+    after = HashRing(["instance-1", "instance-2", "instance-3"])
+
+    moved = [key for key in keys if before.owner(key) != after.owner(key)]
+
+    assert moved
+    assert all(after.owner(key) == "instance-3" for key in moved)
+
+
+def test_keys_are_spread_over_the_partitions():
+    partitions = Counter(partition_of(f"gateway-{index}", 8) for index in range(4000))
+
+    assert set(partitions) == set(range(8))
+    assert min(partitions.values()) > 400
+    assert partition_of("gateway-1", 8) == partition_of("gateway-1", 8)
+    assert partition_queue_name("stream_event_queue", 3) == "stream_event_queue.3"
+
+
+def test_members_are_the_instances_with_a_recent_heartbeat():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    clock = Clock()
+    first = ClusterMembership(engine, "group", "instance-1", member_timeout=15, clock=clock)
+    second = ClusterMembership(engine, "group", "instance-2", member_timeout=15, clock=clock)
+    other_group = ClusterMembership(engine, "other", "instance-3", member_timeout=15, clock=clock)
+
+    first.heartbeat()
+    other_group.heartbeat()
+    assert second.heartbeat() == ["instance-1", "instance-2"]
+
+    clock.now += 16
+    assert second.heartbeat() == ["instance-2"]
+    second.leave()
+    assert first.heartbeat() == ["instance-1"]
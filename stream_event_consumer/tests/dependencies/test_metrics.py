@@ -0,0 +1,91 @@
+import urllib.request
+
+import pytest
+
+from stream_event_consumer.dependencies.metrics import MetricsRegistry, start_metrics_server, timed
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    counter = registry.counter("events", "Events", ["name"])
+    histogram = registry.histogram("duration_seconds", "Duration")
+
+    counter.labels("up").inc()
+    with histogram.time():
+        pass
+
+    assert counter.children == {}
+    assert histogram.children == {}
+    assert start_metrics_server(0, metrics_registry=registry) is None
+
+
+def test_render_counter_and_gauge():
+    registry = MetricsRegistry(enabled=True)
+    counter = registry.counter("events", "Events", ["name"])
+    gauge = registry.gauge("in_flight", "In flight")
+    counter.labels("gs.up.receive").inc()
+    counter.labels("gs.up.receive").inc(2)
+    gauge.set_function(lambda: 7)
+
+    text = registry.render()
+
+    assert "# TYPE events counter" in text
+    assert 'events_total{name="gs.up.receive"} 3.0' in text
+    assert "in_flight 7.0" in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry(enabled=True)
+    histogram = registry.histogram("duration_seconds", "Duration", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    text = registry.render()
+
+    assert 'duration_seconds_bucket{le="0.1"} 1' in text
+    assert 'duration_seconds_bucket{le="1.0"} 2' in text
+    assert 'duration_seconds_bucket{le="+Inf"} 3' in text
+    assert "duration_seconds_count 3" in text
+    assert "duration_seconds_sum 5.55" in text
+
+
+def test_timed_observes_calls_and_counts_errors():
+    registry = MetricsRegistry(enabled=True)
+    histogram = registry.histogram("call_seconds", "Call duration", ["function"])
+    errors = registry.counter("call_errors", "Call errors", ["function"])
+
+    @timed(histogram, "divide", errors=errors)
+    def divide(a, b):
+        return a / b
+
+    assert divide(4, 2) == 2
+    with pytest.raises(ZeroDivisionError):
+        divide(1, 0)
+
+    assert histogram.labels("divide").counts[-1] + sum(histogram.labels("divide").counts[:-1]) == 2
+    assert errors.labels("divide").value == 1
+
+
+def test_register_same_name_returns_same_metric():
+    registry = MetricsRegistry(enabled=True)
+
+    assert registry.counter("events", "Events") is registry.counter("events", "Events")
+    with pytest.raises(ValueError):
+        registry.gauge("events", "Events")
+
+
+def test_metrics_server_serves_metrics():
+    registry = MetricsRegistry(enabled=True)
+    registry.counter("events", "Events").inc()
+    server = start_metrics_server(0, host="127.0.0.1", metrics_registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode()
+            content_type = response.headers["Content-Type"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert "events_total 1.0" in body
+    assert content_type.startswith("text/plain")
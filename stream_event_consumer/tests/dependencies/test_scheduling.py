@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from dependencies.scheduling import Lane, LaneScheduler
+
+
+def test_free_workers_are_shared_by_weight():
+    scheduler = LaneScheduler([Lane("health", weight=3), Lane("uplink", weight=1)], workers=1)
+    release, order = threading.Event(), []
+    # The only worker is busy while the events of both lanes arrive
+    scheduler.submit("uplink", release.wait, 5)
+    for index in range(8):
+        scheduler.submit("uplink", order.append, "uplink")
+        scheduler.submit("health", order.append, "health")
+    release.set()
+    scheduler.shutdown()
+
+    assert order[:8].count("health") == 6
+    assert order[8:12].count("health") == 2
+    assert len(order) == 16
+
+
+def test_a_lane_never_takes_more_than_its_workers():
+    scheduler = LaneScheduler([Lane("health"), Lane("uplink", max_workers=2)], workers=3)
+    release, started = threading.Event(), threading.Semaphore(0)
+
+    def uplink():
+        started.release()
+        release.wait(5)
+
+    for _ in range(10):
+        scheduler.submit("uplink", uplink)
+    started.acquire(timeout=5)
+    started.acquire(timeout=5)
+    assert scheduler.lanes["uplink"].running == 2
+
+    # The burst of uplinks leaves a worker to the health events
+    health_done = threading.Event()
+    scheduler.submit("health", health_done.set)
+    assert health_done.wait(5)
+
+    release.set()
+    scheduler.shutdown()
+    assert scheduler.pending() == 0
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_a_flooding_tenant_does_not_delay_the_others():
+    scheduler = LaneScheduler([Lane("default")], workers=1, tenant_weights={"tenant-b": 2})
+    release, order = threading.Event(), []
+    scheduler.submit("default", release.wait, 5, tenant="tenant-a")
+    for _ in range(20):
+        scheduler.submit("default", order.append, "tenant-a", tenant="tenant-a")
+    for _ in range(4):
+        scheduler.submit("default", order.append, "tenant-b", tenant="tenant-b")
+    release.set()
+    scheduler.shutdown()
+
+    # tenant-b arrived last, twice the weight of tenant-a gives it two events out of three
+    assert order[:6].count("tenant-b") == 4
+    assert len(order) == 24
+
+
+def test_tenants_are_not_served_faster_than_their_rate_limit():
+    clock = Clock()
+    scheduler = LaneScheduler([Lane("default")], workers=4, clock=clock, tenant_rates={"*": 2})
+    done = []
+    for _ in range(5):
+        scheduler.submit("default", done.append, "tenant-a", tenant="tenant-a")
+    scheduler.submit("default", done.append, "tenant-b", tenant="tenant-b")
+    wait_for(lambda: len(done) == 3)
+    assert done.count("tenant-a") == 2
+
+    clock.now += 1
+    wait_for(lambda: len(done) == 5)
+    clock.now += 0.5
+    wait_for(lambda: len(done) == 6)
+    scheduler.shutdown()
+    assert scheduler.pending() == 0
+
+
+@pytest.mark.parametrize("weights,rates", [({"acme": 0}, None), ({"*": -1}, None), (None, {"acme": 0})])
+def test_tenant_weights_and_rates_must_be_positive(weights, rates):
+    with pytest.raises(ValueError):
+        LaneScheduler([Lane("default")], 1, tenant_weights=weights, tenant_rates=rates)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
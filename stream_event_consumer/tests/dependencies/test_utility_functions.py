@@ -1,5 +1,7 @@
 import pytest
-from stream_event_consumer.dependencies.utility_functions import get_logger, LoggerConfig
+from datetime import datetime
+
+from stream_event_consumer.dependencies.utility_functions import get_logger, LoggerConfig, parse_timestamp
 import logging
 
 
@@ -33,3 +35,18 @@ def test_get_logger(config):
 
     # check if the logger name is set correctly
     assert logger.name == config.logger_name
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("2023-03-27T10:00:00Z", datetime(2023, 3, 27, 10, 0, 0)),
+        ("2023-03-27T10:00:00.123456789Z", datetime(2023, 3, 27, 10, 0, 0, 123456)),
+        ("2023-03-27T12:00:00.5+02:00", datetime(2023, 3, 27, 10, 0, 0, 500000)),
+        ("2023-03-27 10:00:00", datetime(2023, 3, 27, 10, 0, 0)),
+        (None, None),
+        ("yesterday", None),
+    ],
+)
+def test_parse_timestamp(value, expected):
+    assert parse_timestamp(value) == expected
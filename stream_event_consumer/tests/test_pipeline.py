@@ -0,0 +1,45 @@
+import logging
+
+from sqlmodel import Session, SQLModel, create_engine, func, select
+
+from stream_event_consumer_service import MessageConsumer, NodeMetadataUl, GatewayConnectionStats
+from stream_event_consumer.dependencies.transport import InMemoryBroker, InMemoryTransport
+from .utils.traffic_generator import TrafficGenerator, TrafficScenario, encode_stream_body
+
+
+def test_logger_to_consumer_to_db_in_a_single_process(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pipeline.db'}")
+    SQLModel.metadata.create_all(engine)
+    broker = InMemoryBroker()
+    logger_transport = InMemoryTransport(broker)
+    consumer = MessageConsumer(
+        logging.getLogger("test_pipeline"),
+        "guest",
+        "guest",
+        "localhost",
+        "stream_events",
+        engine,
+        1,
+        transport=InMemoryTransport(broker),
+    )
+
+    generator = TrafficGenerator(
+        TrafficScenario(num_devices=5, num_gateways=2, duration_sec=600, sampling_period_sec=(60, 120), seed=3)
+    )
+    expected = {"gs.up.receive": 0, "gs.gateway.connection.stats": 0}
+    for kind, message in generator.messages():
+        if kind == "stream":
+            logger_transport.publish("stream_events", encode_stream_body(message))
+            name = message["result"]["name"]
+            if name in expected:
+                expected[name] += 1
+
+    consumer.transport.consume("stream_events", consumer.callback, prefetch_count=1)
+    consumer.transport.process_pending()
+    consumer.thread_pool.shutdown(wait=True)
+
+    with Session(engine) as session:
+        uplinks = session.exec(select(func.count(NodeMetadataUl.id))).one()
+        connection_stats = session.exec(select(func.count(GatewayConnectionStats.id))).one()
+    assert uplinks == expected["gs.up.receive"] > 0
+    assert connection_stats == expected["gs.gateway.connection.stats"] > 0
@@ -1,5 +1,16 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from dependencies.cluster import ClusterMembership
+from dependencies.transport import InMemoryBroker, InMemoryTransport, Message
 from stream_event_consumer_service import MessageConsumer
-from stream_event_consumer_service import PacketReplicaMetadata
+from stream_event_consumer_service import GatewayConnectivityInterval, PacketReplicaMetadata
 from .utils.utilities import generate_gs_gateway_connection_stats_message, generate_gs_down_send_message, \
     generate_gs_status_receive_message
 from unittest.mock import Mock
@@ -310,3 +321,224 @@ def test_decode_gs_status_receive():
     assert decoded_message["rxok"] == message["result"]["data"]["metrics"].get("rxok", None)
     assert decoded_message["rxfw"] == message["result"]["data"]["metrics"].get("rxfw", None)
     assert decoded_message["ackr"] == message["result"]["data"]["metrics"].get("ackr", None)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def create_partition_consumer(engine, broker, instance_id, clock, partitions=16):
+    consumer = MessageConsumer(
+        logging.getLogger("test_stream_event_consumer"),
+        "guest",
+        "guest",
+        "localhost",
+        "stream_event_queue",
+        engine,
+        1,
+        transport=InMemoryTransport(broker),
+        partitions=partitions,
+        cluster=ClusterMembership(engine, "stream_event_consumer", instance_id, member_timeout=15, clock=clock),
+    )
+    consumer.thread_pool = Mock()
+    return consumer
+
+
+def test_consumer_without_cluster_consumes_all_the_partitions():
+    broker = InMemoryBroker()
+    consumer = MessageConsumer(
+        logging.getLogger("test_stream_event_consumer"), "guest", "guest", "localhost", "stream_event_queue",
+        None, 1, transport=InMemoryTransport(broker), partitions=4,
+    )
+
+    consumer.consume_partitions(consumer.assigned_partitions())
+
+    assert consumer.owned_partitions == {0, 1, 2, 3}
+    assert [consumer.transport.consumer_count(f"stream_event_queue.{partition}") for partition in range(4)] == [1] * 4
+    assert consumer.transport.consumer_count("stream_event_queue") == 0
+
+
+def test_cluster_splits_the_partitions_and_rebalances_when_an_instance_dies():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    broker, clock = InMemoryBroker(), Clock()
+    first = create_partition_consumer(engine, broker, "instance-1", clock)
+    second = create_partition_consumer(engine, broker, "instance-2", clock)
+
+    first.rebalance()
+    assert first.owned_partitions == set(range(16))
+    second.rebalance()
+    first.rebalance()
+
+    assert first.owned_partitions and second.owned_partitions
+    assert first.owned_partitions | second.owned_partitions == set(range(16))
+    assert not first.owned_partitions & second.owned_partitions
+    assert all(broker.consumers[f"stream_event_queue.{partition}"] == 1 for partition in range(16))
+    for partition in range(16):
+        first.transport.publish(f"stream_event_queue.{partition}", b"event")
+    assert first.transport.process_pending() == len(first.owned_partitions)
+    assert second.transport.process_pending() == len(second.owned_partitions)
+    assert first.thread_pool.submit.call_count == len(first.owned_partitions)
+
+    # instance-2 stops heartbeating, its partitions move to instance-1
+    second.transport.close()
+    clock.now += 16
+    first.rebalance()
+    assert first.owned_partitions == set(range(16))
+    assert all(broker.consumers[f"stream_event_queue.{partition}"] == 1 for partition in range(16))
+    engine.dispose()
+
+
+def test_lanes_are_consumed_from_their_own_queues_and_acknowledged_once_processed():
+    broker = InMemoryBroker()
+    consumer = MessageConsumer(
+        logging.getLogger("test_stream_event_consumer"), "guest", "guest", "localhost", "stream_event_queue",
+        None, 4, transport=InMemoryTransport(broker),
+        lanes={"gs.status.receive": "health", "gs.up.receive": "uplink"},
+        lane_weights={"health": 4}, lane_workers={"uplink": 2},
+    )
+    consumer.consume = Mock()
+
+    consumer.consume_lanes()
+    for queue_name in ("stream_event_queue.uplink", "stream_event_queue.uplink", "stream_event_queue.health"):
+        consumer.transport.publish(queue_name, b"event", headers={"published_at": 1.0})
+    consumer.transport.process_pending()
+    consumer.scheduler.shutdown()
+
+    assert consumer.lane_queues() == {
+        "default": "stream_event_queue", "health": "stream_event_queue.health", "uplink": "stream_event_queue.uplink",
+    }
+    assert consumer.consume.call_count == 3
+    assert consumer.transport.unacked == {"stream_event_queue.uplink": 0, "stream_event_queue.health": 0}
+    assert consumer.lane_queues(2)["health"] == "stream_event_queue.health.2"
+
+
+def test_the_tenant_of_an_event_is_read_from_its_headers_or_its_body():
+    body = json.dumps(json.dumps({"result": {"name": "gs.up.receive", "context": {"tenant-id": "tenant-2"}}}))
+
+    assert MessageConsumer.get_tenant(Message(b"{}", headers={"tenant_id": "tenant-1"})) == "tenant-1"
+    assert MessageConsumer.get_tenant(Message(body.encode())) == "tenant-2"
+    assert MessageConsumer.get_tenant(Message(b"not json")) == ""
+
+
+def connectivity_event(name, time, data=None):
+    return {"result": {
+        "name": name, "time": time, "identifiers": [{"gateway_ids": {"gateway_id": "gateway-1"}}], "data": data or {},
+    }}
+
+
+def test_connectivity_intervals_are_merged_as_the_events_arrive():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    consumer = MessageConsumer(
+        logging.getLogger("test_stream_event_consumer"), "guest", "guest", "localhost", "stream_event_queue",
+        engine, 1, transport=InMemoryTransport(InMemoryBroker()), connectivity_gap_tolerance=90,
+    )
+
+    consumer.update_connectivity("gs.gateway.connection.stats", connectivity_event(
+        "gs.gateway.connection.stats", "2023-03-27T10:10:00Z", {"connected_at": "2023-03-27T10:00:00Z"},
+    ))
+    # Seen 1 minute after the last stats, then after a gap longer than the tolerance
+    consumer.update_connectivity("gs.status.receive", connectivity_event("gs.status.receive", "2023-03-27T10:11:00Z"))
+    consumer.update_connectivity("gs.status.receive", connectivity_event("gs.status.receive", "2023-03-27T10:20:00Z"))
+    # The gateway reconnected at 10:20 and the stats cover both intervals up to the disconnection
+    consumer.update_connectivity("gs.gateway.connection.stats", connectivity_event(
+        "gs.gateway.connection.stats", "2023-03-27T10:40:00Z",
+        {"connected_at": "2023-03-27T10:05:00Z", "disconnected_at": "2023-03-27T10:30:00Z"},
+    ))
+    consumer.update_connectivity("gs.status.receive", connectivity_event("gs.status.receive", "2023-03-27T11:00:00Z"))
+
+    with Session(engine) as session:
+        intervals = session.exec(select(GatewayConnectivityInterval).order_by(GatewayConnectivityInterval.up_from)).all()
+        assert [(interval.up_from, interval.up_to) for interval in intervals] == [
+            (datetime(2023, 3, 27, 10, 0), datetime(2023, 3, 27, 10, 30)),
+            (datetime(2023, 3, 27, 11, 0), datetime(2023, 3, 27, 11, 0)),
+        ]
+    engine.dispose()
+
+
+def run_tenant_consumer(events, **kwargs):
+    """Publishes the ``(tenant, body)`` events, then consumes them through the broker until ``b`` is processed."""
+    broker = InMemoryBroker()
+    consumer = MessageConsumer(
+        logging.getLogger("test_stream_event_consumer"), "guest", "guest", "localhost", "stream_event_queue",
+        None, 1, transport=InMemoryTransport(broker), tenant_fairness=True, **kwargs,
+    )
+    processed, done = [], threading.Event()
+
+    def consume(body, received_at=None):
+        time.sleep(0.01)
+        processed.append(body)
+        if body == b"b":
+            done.set()
+
+    consumer.consume = consume
+    consumer.consume_lanes()
+    for tenant, body in events:
+        consumer.transport.publish("stream_event_queue", body, headers={"tenant_id": tenant})
+    thread = threading.Thread(target=consumer.transport.start_consuming, daemon=True)
+    thread.start()
+    try:
+        assert done.wait(5)
+    finally:
+        consumer.stop()
+        thread.join(5)
+        consumer.scheduler.shutdown(wait=False)
+    return processed
+
+
+def test_a_flooding_tenant_does_not_fill_the_prefetch_of_the_lane():
+    # One worker, a prefetch of 2: without parking, b would wait behind the 30 events of tenant-a
+    processed = run_tenant_consumer([("tenant-a", f"a-{index}".encode()) for index in range(30)] + [("tenant-b", b"b")])
+
+    assert processed.index(b"b") <= 2
+
+
+def test_a_throttled_tenant_does_not_stall_the_lane():
+    # tenant-a is allowed one event per second, without parking b would wait 30 seconds
+    processed = run_tenant_consumer(
+        [("tenant-a", f"a-{index}".encode()) for index in range(30)] + [("tenant-b", b"b")],
+        tenant_rates={"tenant-a": 1},
+    )
+
+    assert processed.count(b"b") == 1
+    assert len(processed) <= 3
+
+
+def test_connectivity_of_a_gateway_is_merged_by_one_worker_at_a_time(tmp_path):
+    # A file, the workers each have their own connection
+    engine = create_engine(f"sqlite:///{tmp_path / 'connectivity.db'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    consumer = MessageConsumer(
+        logging.getLogger("test_stream_event_consumer"), "guest", "guest", "localhost", "stream_event_queue",
+        engine, 2, transport=InMemoryTransport(InMemoryBroker()),
+    )
+    start, errors = threading.Barrier(2), []
+
+    def record(offset):
+        start.wait()
+        # The status and the connection stats of the same gateway, processed at the same time
+        for minute in range(offset, 60, 2):
+            try:
+                up_from = datetime(2023, 3, 27, 10, minute)
+                consumer.record_connectivity("gateway-1", up_from, up_from + timedelta(seconds=90))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=record, args=(offset,)) for offset in (0, 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with Session(engine) as session:
+        intervals = session.exec(select(GatewayConnectivityInterval)).all()
+        assert [(interval.up_from, interval.up_to) for interval in intervals] == [
+            (datetime(2023, 3, 27, 10, 0), datetime(2023, 3, 27, 11, 0, 30)),
+        ]
+    engine.dispose()
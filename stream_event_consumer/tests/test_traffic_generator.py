@@ -0,0 +1,120 @@
+import json
+from collections import Counter
+from datetime import timedelta
+from unittest.mock import Mock
+
+from stream_event_consumer_service import MessageConsumer
+from .utils.traffic_generator import (
+    F_CNT_MODULO,
+    TrafficGenerator,
+    TrafficScenario,
+    encode_stream_body,
+)
+
+
+def small_scenario(**kwargs):
+    params = dict(num_devices=20, num_gateways=4, duration_sec=1800, sampling_period_sec=(60, 120), seed=7)
+    params.update(kwargs)
+    return TrafficScenario(**params)
+
+
+def test_same_seed_produces_same_workload():
+    first = list(TrafficGenerator(small_scenario()).messages())
+    second = list(TrafficGenerator(small_scenario()).messages())
+
+    assert first == second
+    assert first != list(TrafficGenerator(small_scenario(seed=8)).messages())
+
+
+def test_messages_are_time_ordered_and_of_both_kinds():
+    kinds = Counter()
+    last_time = None
+    for kind, message in TrafficGenerator(small_scenario()).messages():
+        kinds[kind] += 1
+        if kind == "stream":
+            event_time = message["result"]["time"]
+            assert last_time is None or event_time >= last_time
+            last_time = event_time
+
+    assert kinds["stream"] > 0
+    assert kinds["application"] > 0
+
+
+def test_replicas_are_bounded_by_num_tx_replica():
+    generator = TrafficGenerator(small_scenario(loss_probability=0.0, outages_per_gateway=0))
+    coverage = {device.device_id: device.gateway_ids for device in generator.devices}
+
+    for uplink in generator.uplinks():
+        if uplink.is_join:
+            continue
+        per_gateway = Counter(reception.gateway_id for reception in uplink.receptions)
+        assert set(per_gateway.values()) == {3}
+        assert sorted(per_gateway) == coverage[uplink.device_id]
+
+
+def test_full_loss_produces_no_receptions():
+    generator = TrafficGenerator(small_scenario(loss_probability=1.0))
+
+    assert all(not uplink.receptions for uplink in generator.uplinks())
+
+
+def test_f_cnt_rolls_over():
+    scenario = small_scenario(f_cnt_start=(F_CNT_MODULO - 2, F_CNT_MODULO - 1), rejoin_probability=0)
+    f_cnts = [uplink.f_cnt for uplink in TrafficGenerator(scenario).uplinks()]
+
+    assert max(f_cnts) == F_CNT_MODULO - 1
+    assert 0 in f_cnts
+
+
+def test_rejoin_changes_dev_addr_and_resets_f_cnt():
+    scenario = small_scenario(rejoin_probability=0.2)
+    joins = [uplink for uplink in TrafficGenerator(scenario).uplinks() if uplink.is_join]
+
+    assert joins
+    assert all(uplink.f_cnt == 0 for uplink in joins)
+
+
+def test_no_reception_while_gateway_is_disconnected():
+    generator = TrafficGenerator(small_scenario(outages_per_gateway=3, loss_probability=0.0))
+    outages = {gateway.gateway_id: gateway.outages for gateway in generator.gateways}
+
+    assert any(outages.values())
+    for uplink in generator.uplinks():
+        for reception in uplink.receptions:
+            replica_time = uplink.sent_at + (reception.replica * timedelta(seconds=1))
+            for start, end in outages[reception.gateway_id]:
+                assert not start <= replica_time < end
+
+
+def test_stream_events_are_decoded_by_the_consumer():
+    consumer = MessageConsumer(Mock(), "guest", "guest", "localhost", "test_queue", Mock(), 5)
+    consumer.get_device_id_by_dev_addr_and_gateway_tti_id = Mock(return_value="device")
+    generator = TrafficGenerator(small_scenario())
+
+    decoded = Counter()
+    for kind, message in generator.messages():
+        if kind != "stream":
+            continue
+        event = json.loads(json.loads(encode_stream_body(message)))
+        name = event["result"]["name"]
+        if name == "gs.up.receive":
+            result = consumer.decode_gs_up_receive(event)
+            assert result["gateway_id"] == event["result"]["identifiers"][0]["gateway_ids"]["gateway_id"]
+            assert result["consumed_airtime"] > 0
+        elif name == "gs.status.receive":
+            consumer.decode_gs_status_receive(event)
+        elif name == "gs.gateway.connection.stats":
+            consumer.decode_gs_gateway_connection_stats(event)
+        decoded[name] += 1
+
+    assert decoded["gs.up.receive"] > 0
+    assert decoded["gs.status.receive"] > 0
+    assert decoded["gs.gateway.connection.stats"] > 0
+
+
+def test_emit_respects_limit():
+    received = []
+    counts = TrafficGenerator(small_scenario()).emit(lambda kind, message: received.append(kind), limit=25)
+
+    assert len(received) == 25
+    assert counts["stream"] + counts["application"] == 25
@@ -0,0 +1,657 @@
+"""
+Scenario-driven synthetic LoRaWAN traffic.
+
+The generator models a fleet of end devices and gateways instead of single random messages:
+
+* every device has its own sampling period, spreading factor, dev_addr and frame counter,
+* every uplink is transmitted ``num_tx_replica`` times and each replica may be heard by every
+  gateway covering the device, subject to a per-link loss probability,
+* devices occasionally rejoin (new dev_addr, frame counter restarts at 0) and frame counters
+  roll over at 2^16,
+* gateways go offline for configurable windows; nothing is received while a gateway is down and a
+  new ``connected_at`` is reported once it comes back.
+
+From the same ground truth it renders the TTI stream events consumed by the stream event consumer
+(``gs.up.receive``, ``gs.status.receive``, ``gs.gateway.connection.stats``) and the TTI application
+uplink messages consumed by the TTI message consumer. All randomness comes from a single seeded
+``random.Random`` so a scenario always produces exactly the same workload.
+"""
+import base64
+import heapq
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+F_CNT_MODULO = 2 ** 16
+
+DEFAULT_SF_DISTRIBUTION = {7: 0.45, 8: 0.2, 9: 0.15, 10: 0.1, 11: 0.05, 12: 0.05}
+
+UPLINK_FREQUENCIES = [
+    "868100000",
+    "868300000",
+    "868500000",
+    "867100000",
+    "867300000",
+    "867500000",
+    "867700000",
+    "867900000",
+]
+
+
+def format_time(value: datetime) -> str:
+    """Formats a datetime the way the TTI APIs do (RFC 3339, UTC, ``Z`` suffix)."""
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def encode_stream_body(event: dict) -> bytes:
+    """
+    Encodes a stream event exactly as the stream event logger publishes it: the raw event line is
+    JSON-encoded a second time before being sent to the queue.
+    """
+    return json.dumps(json.dumps(event)).encode()
+
+
+def encode_application_body(message: dict) -> bytes:
+    """Encodes a TTI application message as the TTI message logger publishes it."""
+    return json.dumps(message).encode()
+
+
+class TrafficScenario:
+    """
+    Parameters of a synthetic workload.
+
+    Args:
+        num_devices: Number of end devices.
+        num_gateways: Number of gateways.
+        duration_sec: Simulated time span covered by the workload.
+        start_time: Simulated time of the first event.
+        sampling_period_sec: ``(min, max)`` range the per-device sampling period is drawn from.
+        sf_distribution: Mapping of spreading factor to its probability.
+        gateways_per_device: ``(min, max)`` number of gateways covering each device.
+        loss_probability: Probability that a single replica is lost on a device-gateway link.
+        num_tx_replica: Number of times every uplink is transmitted.
+        replica_interval_sec: Time between two replicas of the same uplink.
+        rejoin_probability: Probability that a device rejoins before an uplink.
+        f_cnt_start: ``(min, max)`` range of the initial frame counters, useful to force rollovers.
+        payload_size: ``(min, max)`` size in bytes of the application payload.
+        outages_per_gateway: Expected number of disconnections per gateway over the scenario.
+        outage_duration_sec: ``(min, max)`` duration of a gateway disconnection.
+        status_period_sec: Period of ``gs.status.receive`` events per connected gateway.
+        connection_stats_period_sec: Period of ``gs.gateway.connection.stats`` events.
+        num_applications: Number of TTI applications the devices are spread over.
+        tenant_id: TTI tenant identifier.
+        seed: Seed of the random generator.
+    """
+
+    def __init__(
+            self,
+            num_devices: int = 100,
+            num_gateways: int = 3,
+            duration_sec: float = 3600,
+            start_time: datetime = datetime(2023, 3, 27, 8, 0, 0),
+            sampling_period_sec: Tuple[float, float] = (60, 600),
+            sf_distribution: Optional[Dict[int, float]] = None,
+            gateways_per_device: Tuple[int, int] = (1, 3),
+            loss_probability: float = 0.1,
+            num_tx_replica: int = 3,
+            replica_interval_sec: float = 1.0,
+            rejoin_probability: float = 0.001,
+            f_cnt_start: Tuple[int, int] = (0, 1000),
+            payload_size: Tuple[int, int] = (8, 32),
+            outages_per_gateway: float = 0.5,
+            outage_duration_sec: Tuple[float, float] = (60, 600),
+            status_period_sec: float = 30,
+            connection_stats_period_sec: float = 60,
+            num_applications: int = 1,
+            tenant_id: str = "CgxleGFtcGxl",
+            seed: int = 0,
+    ):
+        self.num_devices = num_devices
+        self.num_gateways = num_gateways
+        self.duration_sec = duration_sec
+        self.start_time = start_time
+        self.sampling_period_sec = sampling_period_sec
+        self.sf_distribution = sf_distribution or DEFAULT_SF_DISTRIBUTION
+        self.gateways_per_device = gateways_per_device
+        self.loss_probability = loss_probability
+        self.num_tx_replica = num_tx_replica
+        self.replica_interval_sec = replica_interval_sec
+        self.rejoin_probability = rejoin_probability
+        self.f_cnt_start = f_cnt_start
+        self.payload_size = payload_size
+        self.outages_per_gateway = outages_per_gateway
+        self.outage_duration_sec = outage_duration_sec
+        self.status_period_sec = status_period_sec
+        self.connection_stats_period_sec = connection_stats_period_sec
+        self.num_applications = num_applications
+        self.tenant_id = tenant_id
+        self.seed = seed
+
+    @property
+    def end_time(self) -> datetime:
+        return self.start_time + timedelta(seconds=self.duration_sec)
+
+
+class GatewayProfile:
+    def __init__(self, gateway_id: str, eui: str, latitude: float, longitude: float):
+        self.gateway_id = gateway_id
+        self.eui = eui
+        self.latitude = latitude
+        self.longitude = longitude
+        self.outages: List[Tuple[datetime, datetime]] = []
+
+    def is_connected(self, at: datetime) -> bool:
+        return not any(start <= at < end for start, end in self.outages)
+
+    def connected_at(self, at: datetime, default: datetime) -> datetime:
+        """Returns the start of the connection session that is active at ``at``."""
+        connected_at = default
+        for _, end in self.outages:
+            if end <= at:
+                connected_at = max(connected_at, end)
+        return connected_at
+
+
+class DeviceProfile:
+    def __init__(
+            self,
+            device_id: str,
+            dev_eui: str,
+            join_eui: str,
+            dev_addr: str,
+            application_id: str,
+            sampling_period_sec: float,
+            spreading_factor: int,
+            f_cnt: int,
+            gateway_ids: List[str],
+    ):
+        self.device_id = device_id
+        self.dev_eui = dev_eui
+        self.join_eui = join_eui
+        self.dev_addr = dev_addr
+        self.application_id = application_id
+        self.sampling_period_sec = sampling_period_sec
+        self.spreading_factor = spreading_factor
+        self.f_cnt = f_cnt
+        self.gateway_ids = gateway_ids
+        self.dev_nonce = 0
+
+
+class Reception:
+    """A single replica of an uplink as heard by one gateway."""
+
+    def __init__(self, gateway_id: str, replica: int, received_at_gw: datetime,
+                 received_at_tti: datetime, rssi: int, snr: float, channel_index: int):
+        self.gateway_id = gateway_id
+        self.replica = replica
+        self.received_at_gw = received_at_gw
+        self.received_at_tti = received_at_tti
+        self.rssi = rssi
+        self.snr = snr
+        self.channel_index = channel_index
+
+
+class UplinkRecord:
+    """Ground truth of one uplink transmission (all of its replicas)."""
+
+    def __init__(self, device: DeviceProfile, sent_at: datetime, f_cnt: int, is_join: bool,
+                 raw_payload: str, frm_payload: str, f_port: int, frequency: str,
+                 receptions: List[Reception]):
+        self.device_id = device.device_id
+        self.dev_eui = device.dev_eui
+        self.join_eui = device.join_eui
+        self.dev_addr = device.dev_addr
+        self.application_id = device.application_id
+        self.spreading_factor = device.spreading_factor
+        self.dev_nonce = device.dev_nonce
+        self.sent_at = sent_at
+        self.f_cnt = f_cnt
+        self.is_join = is_join
+        self.raw_payload = raw_payload
+        self.frm_payload = frm_payload
+        self.f_port = f_port
+        self.frequency = frequency
+        self.receptions = receptions
+
+    @property
+    def gateway_ids(self) -> List[str]:
+        return sorted({reception.gateway_id for reception in self.receptions})
+
+
+class TrafficGenerator:
+    """
+    Renders a :class:`TrafficScenario` into time ordered stream events and application messages.
+
+    Rendering advances the device state (frame counters, rejoins), so an instance renders its
+    scenario once; build a new generator from the same scenario to replay the identical workload.
+    """
+
+    def __init__(self, scenario: TrafficScenario):
+        self.scenario = scenario
+        self.random = random.Random(scenario.seed)
+        self.gateways = self._build_gateways()
+        self.gateways_by_id = {gateway.gateway_id: gateway for gateway in self.gateways}
+        self.devices = self._build_devices()
+
+    def _hex(self, length: int) -> str:
+        return "".join(self.random.choices("0123456789ABCDEF", k=length))
+
+    def _build_gateways(self) -> List[GatewayProfile]:
+        scenario = self.scenario
+        gateways = []
+        for index in range(scenario.num_gateways):
+            gateway = GatewayProfile(
+                gateway_id=f"gw-{index:04d}",
+                eui=self._hex(16),
+                latitude=round(self.random.uniform(51.4, 51.6), 6),
+                longitude=round(self.random.uniform(-0.5, -0.3), 6),
+            )
+            num_outages = self._poisson(scenario.outages_per_gateway)
+            for _ in range(num_outages):
+                start = scenario.start_time + timedelta(
+                    seconds=self.random.uniform(0, scenario.duration_sec)
+                )
+                duration = self.random.uniform(*scenario.outage_duration_sec)
+                gateway.outages.append((start, start + timedelta(seconds=duration)))
+            gateway.outages.sort()
+            gateways.append(gateway)
+        return gateways
+
+    def _build_devices(self) -> List[DeviceProfile]:
+        scenario = self.scenario
+        spreading_factors = list(scenario.sf_distribution.keys())
+        weights = list(scenario.sf_distribution.values())
+        gateway_ids = [gateway.gateway_id for gateway in self.gateways]
+        devices = []
+        for index in range(scenario.num_devices):
+            low, high = scenario.gateways_per_device
+            coverage = self.random.randint(min(low, len(gateway_ids)), min(high, len(gateway_ids)))
+            devices.append(
+                DeviceProfile(
+                    device_id=f"eui-{index:016x}",
+                    dev_eui=self._hex(16),
+                    join_eui=self._hex(16),
+                    dev_addr=self._hex(8),
+                    application_id=f"app-{index % scenario.num_applications:02d}",
+                    sampling_period_sec=self.random.uniform(*scenario.sampling_period_sec),
+                    spreading_factor=self.random.choices(spreading_factors, weights)[0],
+                    f_cnt=self.random.randint(*scenario.f_cnt_start) % F_CNT_MODULO,
+                    gateway_ids=sorted(self.random.sample(gateway_ids, coverage)),
+                )
+            )
+        return devices
+
+    def _poisson(self, expected: float) -> int:
+        count, threshold, product = 0, math.exp(-expected), self.random.random()
+        while product > threshold:
+            count += 1
+            product *= self.random.random()
+        return count
+
+    def gateway(self, gateway_id: str) -> GatewayProfile:
+        return self.gateways_by_id[gateway_id]
+
+    def all_relations(self) -> List[Dict[str, str]]:
+        """
+        Rows of the ``AllRelation`` table as the TTI message consumer would have populated them
+        for the initial device addresses, so the stream consumer can resolve device ids. Call it
+        before rendering the workload.
+        """
+        return [
+            {
+                "device_id": device.device_id,
+                "dev_addr": device.dev_addr,
+                "last_f_cnt": str(device.f_cnt),
+                "application_id": device.application_id,
+                "gateway_tti_id": gateway_id,
+            }
+            for device in self.devices
+            for gateway_id in device.gateway_ids
+        ]
+
+    def uplinks(self) -> Iterator[UplinkRecord]:
+        """Yields the ground truth uplinks of the scenario ordered by transmission time."""
+        scenario = self.scenario
+        schedule = []
+        for index, device in enumerate(self.devices):
+            first = self.random.uniform(0, device.sampling_period_sec)
+            schedule.append((scenario.start_time + timedelta(seconds=first), index))
+        heapq.heapify(schedule)
+
+        while schedule:
+            sent_at, index = heapq.heappop(schedule)
+            if sent_at >= scenario.end_time:
+                continue
+            device = self.devices[index]
+            is_join = self.random.random() < scenario.rejoin_probability
+            if is_join:
+                device.dev_addr = self._hex(8)
+                device.f_cnt = 0
+                device.dev_nonce += 1
+            yield self._build_uplink(device, sent_at, is_join)
+            if not is_join:
+                device.f_cnt = (device.f_cnt + 1) % F_CNT_MODULO
+            jitter = self.random.uniform(-0.05, 0.05) * device.sampling_period_sec
+            heapq.heappush(
+                schedule,
+                (sent_at + timedelta(seconds=device.sampling_period_sec + jitter), index),
+            )
+
+    def _build_uplink(self, device: DeviceProfile, sent_at: datetime, is_join: bool) -> UplinkRecord:
+        scenario = self.scenario
+        frm_payload = self._hex(2 * self.random.randint(*scenario.payload_size))
+        raw_payload = base64.b64encode(bytes.fromhex(frm_payload)).decode()
+        frequency = self.random.choice(UPLINK_FREQUENCIES)
+        receptions = []
+        num_replicas = 1 if is_join else scenario.num_tx_replica
+        for replica in range(num_replicas):
+            replica_time = sent_at + timedelta(seconds=replica * scenario.replica_interval_sec)
+            for gateway_id in device.gateway_ids:
+                if not self.gateways_by_id[gateway_id].is_connected(replica_time):
+                    continue
+                if self.random.random() < scenario.loss_probability:
+                    continue
+                received_at_gw = replica_time + timedelta(milliseconds=self.random.uniform(0, 50))
+                receptions.append(
+                    Reception(
+                        gateway_id=gateway_id,
+                        replica=replica,
+                        received_at_gw=received_at_gw,
+                        received_at_tti=received_at_gw
+                        + timedelta(milliseconds=self.random.uniform(20, 400)),
+                        rssi=self.random.randint(-125, -60),
+                        snr=round(self.random.uniform(-15, 12), 2),
+                        channel_index=UPLINK_FREQUENCIES.index(frequency),
+                    )
+                )
+        return UplinkRecord(
+            device=device,
+            sent_at=sent_at,
+            f_cnt=device.f_cnt,
+            is_join=is_join,
+            raw_payload=raw_payload,
+            frm_payload=frm_payload,
+            f_port=1,
+            frequency=frequency,
+            receptions=receptions,
+        )
+
+    def _gateway_event(self, name: str, gateway: GatewayProfile, at: datetime, data: dict,
+                       rights: List[str]) -> dict:
+        return {
+            "result": {
+                "name": name,
+                "time": format_time(at),
+                "identifiers": [{"gateway_ids": {"gateway_id": gateway.gateway_id, "eui": gateway.eui}}],
+                "data": data,
+                "correlation_ids": [f"gs:conn:{self._hex(26)}"],
+                "origin": "synthetic-traffic-generator",
+                "context": {"tenant-id": self.scenario.tenant_id},
+                "visibility": {"rights": rights},
+                "unique_id": self._hex(26),
+            }
+        }
+
+    def up_receive_event(self, uplink: UplinkRecord, reception: Reception) -> dict:
+        """Renders one received replica as a ``gs.up.receive`` stream event."""
+        gateway = self.gateway(reception.gateway_id)
+        if uplink.is_join:
+            payload = {
+                "m_hdr": {"m_type": "JOIN_REQUEST"},
+                "join_request_payload": {
+                    "join_eui": uplink.join_eui,
+                    "dev_eui": uplink.dev_eui,
+                    "dev_nonce": f"{uplink.dev_nonce:04X}",
+                },
+            }
+        else:
+            payload = {
+                "m_hdr": {"m_type": "UNCONFIRMED_UP"},
+                "mac_payload": {
+                    "f_hdr": {"dev_addr": uplink.dev_addr, "f_ctrl": {"adr": True}, "f_cnt": uplink.f_cnt},
+                    "f_port": uplink.f_port,
+                    "frm_payload": uplink.frm_payload,
+                },
+            }
+        timestamp = int(reception.received_at_gw.timestamp() * 1e6) % 2 ** 32
+        data = {
+            "@type": "type.googleapis.com/ttn.lorawan.v3.GatewayUplinkMessage",
+            "message": {
+                "raw_payload": uplink.raw_payload,
+                "payload": payload,
+                "settings": {
+                    "data_rate": {
+                        "lora": {
+                            "bandwidth": 125000,
+                            "spreading_factor": uplink.spreading_factor,
+                            "coding_rate": "4/5",
+                        }
+                    },
+                    "frequency": uplink.frequency,
+                    "timestamp": timestamp,
+                    "time": format_time(reception.received_at_gw),
+                },
+                "rx_metadata": [
+                    {
+                        "gateway_ids": {"gateway_id": gateway.gateway_id, "eui": gateway.eui},
+                        "time": format_time(reception.received_at_gw),
+                        "timestamp": timestamp,
+                        "rssi": reception.rssi,
+                        "channel_rssi": reception.rssi,
+                        "snr": reception.snr,
+                        "channel_index": reception.channel_index,
+                        "received_at": format_time(reception.received_at_gw),
+                    }
+                ],
+                "received_at": format_time(reception.received_at_tti),
+            },
+            "band_id": "EU_863_870",
+        }
+        return self._gateway_event(
+            "gs.up.receive", gateway, reception.received_at_gw, data, ["RIGHT_GATEWAY_TRAFFIC_READ"]
+        )
+
+    def status_receive_event(self, gateway: GatewayProfile, at: datetime) -> dict:
+        data = {
+            "@type": "type.googleapis.com/ttn.lorawan.v3.GatewayStatus",
+            "time": format_time(at),
+            "boot_time": format_time(gateway.connected_at(at, self.scenario.start_time)),
+            "versions": {"fpga": "31", "hal": "5.0.1", "ttn-lw-gateway-server": "3.23.1"},
+            "antenna_locations": [
+                {
+                    "latitude": gateway.latitude,
+                    "longitude": gateway.longitude,
+                    "altitude": 40,
+                    "source": "SOURCE_GPS",
+                }
+            ],
+            "ip": ["192.168.0.1"],
+            "metrics": {"rxfw": 0, "ackr": 100, "txin": 0, "txok": 0, "lpps": 0, "rxin": 0, "rxok": 0},
+        }
+        return self._gateway_event(
+            "gs.status.receive", gateway, at, data, ["RIGHT_GATEWAY_STATUS_READ"]
+        )
+
+    def connection_stats_event(self, gateway: GatewayProfile, at: datetime) -> dict:
+        connected_at = gateway.connected_at(at, self.scenario.start_time)
+        data = {
+            "@type": "type.googleapis.com/ttn.lorawan.v3.GatewayConnectionStats",
+            "connected_at": format_time(connected_at),
+            "protocol": "udp",
+            "last_status_received_at": format_time(at),
+            "last_status": {
+                "time": format_time(at),
+                "boot_time": format_time(connected_at),
+                "versions": {"fpga": "31", "hal": "5.0.1", "ttn-lw-gateway-server": "3.23.1"},
+                "antenna_locations": [
+                    {
+                        "latitude": gateway.latitude,
+                        "longitude": gateway.longitude,
+                        "altitude": 40,
+                        "source": "SOURCE_GPS",
+                    }
+                ],
+                "ip": ["192.168.0.1"],
+                "metrics": {"txin": 0, "txok": 0, "lpps": 0, "rxin": 0, "rxok": 0, "rxfw": 0, "ackr": 100},
+            },
+            "round_trip_times": {
+                "min": f"{self.random.uniform(0.02, 0.05):.9f}s",
+                "max": f"{self.random.uniform(0.2, 0.5):.9f}s",
+                "median": f"{self.random.uniform(0.05, 0.2):.9f}s",
+                "count": 20,
+            },
+            "sub_bands": [
+                {
+                    "min_frequency": "865000000",
+                    "max_frequency": "868000000",
+                    "downlink_utilization_limit": 0.01,
+                }
+            ],
+            "gateway_remote_address": {"ip": "192.168.0.1"},
+        }
+        return self._gateway_event(
+            "gs.gateway.connection.stats",
+            gateway,
+            at,
+            data,
+            ["RIGHT_GATEWAY_LINK", "RIGHT_GATEWAY_STATUS_READ"],
+        )
+
+    @staticmethod
+    def _first_replica_receptions(uplink: UplinkRecord) -> List[Reception]:
+        first_replica = min(reception.replica for reception in uplink.receptions)
+        return [reception for reception in uplink.receptions if reception.replica == first_replica]
+
+    def application_message(self, uplink: UplinkRecord) -> Optional[dict]:
+        """
+        Renders an uplink as the TTI application message the network server forwards once the
+        replicas are deduplicated. Returns ``None`` when no gateway received the uplink or when it
+        is a join request.
+        """
+        if uplink.is_join or not uplink.receptions:
+            return None
+        receptions = self._first_replica_receptions(uplink)
+        received_at = max(reception.received_at_tti for reception in receptions)
+        return {
+            "end_device_ids": {
+                "device_id": uplink.device_id,
+                "application_ids": {"application_id": uplink.application_id},
+                "dev_eui": uplink.dev_eui,
+                "join_eui": uplink.join_eui,
+                "dev_addr": uplink.dev_addr,
+            },
+            "correlation_ids": [f"as:up:{self._hex(26)}"],
+            "received_at": format_time(received_at),
+            "uplink_message": {
+                "f_port": uplink.f_port,
+                "f_cnt": uplink.f_cnt,
+                "frm_payload": uplink.raw_payload,
+                "rx_metadata": [
+                    {
+                        "gateway_ids": {
+                            "gateway_id": reception.gateway_id,
+                            "eui": self.gateway(reception.gateway_id).eui,
+                        },
+                        "time": format_time(reception.received_at_gw),
+                        "timestamp": int(reception.received_at_gw.timestamp() * 1e6) % 2 ** 32,
+                        "rssi": reception.rssi,
+                        "channel_rssi": reception.rssi,
+                        "snr": reception.snr,
+                        "channel_index": reception.channel_index,
+                        "received_at": format_time(reception.received_at_gw),
+                    }
+                    for reception in receptions
+                ],
+                # The TTI message consumer reads the data rate fields from this level.
+                "settings": {
+                    "data_rate": {
+                        "bandwidth": 125000,
+                        "spreading_factor": uplink.spreading_factor,
+                        "coding_rate": "4/5",
+                    },
+                    "frequency": uplink.frequency,
+                    "time": format_time(uplink.sent_at),
+                },
+                "received_at": format_time(received_at),
+            },
+        }
+
+    def _periodic_events(self) -> Iterator[Tuple[datetime, str, dict]]:
+        scenario = self.scenario
+        streams = []
+        for gateway in self.gateways:
+            for period, render in (
+                (scenario.status_period_sec, self.status_receive_event),
+                (scenario.connection_stats_period_sec, self.connection_stats_event),
+            ):
+                if period:
+                    streams.append(self._ticks(gateway, period, render))
+        return heapq.merge(*streams, key=lambda item: item[0])
+
+    def _ticks(self, gateway: GatewayProfile, period: float, render: Callable):
+        at = self.scenario.start_time
+        while at < self.scenario.end_time:
+            if gateway.is_connected(at):
+                yield at, "stream", render(gateway, at)
+            at += timedelta(seconds=period)
+
+    def _uplink_messages(self) -> Iterator[Tuple[datetime, str, dict]]:
+        # Replicas of an uplink overlap with the next uplinks of other devices, so the rendered
+        # messages are buffered until no later uplink can produce an earlier message.
+        pending = []
+        sequence = 0
+        for uplink in self.uplinks():
+            while pending and pending[0][0] < uplink.sent_at:
+                at, _, kind, message = heapq.heappop(pending)
+                yield at, kind, message
+            for reception in uplink.receptions:
+                event = self.up_receive_event(uplink, reception)
+                heapq.heappush(pending, (reception.received_at_gw, sequence, "stream", event))
+                sequence += 1
+            application_message = self.application_message(uplink)
+            if application_message is not None:
+                receptions = self._first_replica_receptions(uplink)
+                received_at = max(reception.received_at_tti for reception in receptions)
+                heapq.heappush(pending, (received_at, sequence, "application", application_message))
+                sequence += 1
+        while pending:
+            at, _, kind, message = heapq.heappop(pending)
+            yield at, kind, message
+
+    def messages(self) -> Iterator[Tuple[str, dict]]:
+        """
+        Yields ``(kind, message)`` tuples in simulated time order, where ``kind`` is ``"stream"``
+        for TTI stream events and ``"application"`` for TTI application uplink messages.
+        """
+        merged = heapq.merge(self._uplink_messages(), self._periodic_events(), key=lambda item: item[0])
+        for _, kind, message in merged:
+            yield kind, message
+
+    def emit(self, sink: Callable[[str, dict], None], rate: Optional[float] = None,
+             limit: Optional[int] = None) -> Dict[str, int]:
+        """
+        Feeds the workload to ``sink(kind, message)``.
+
+        Args:
+            sink: Called once per message.
+            rate: Target number of messages per second, unthrottled when ``None``.
+            limit: Maximum number of messages to emit.
+
+        Returns:
+            The number of messages emitted per kind.
+        """
+        counts = {"stream": 0, "application": 0}
+        started = time.monotonic()
+        for emitted, (kind, message) in enumerate(self.messages()):
+            if limit is not None and emitted >= limit:
+                break
+            if rate:
+                delay = started + emitted / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            sink(kind, message)
+            counts[kind] += 1
+        return counts
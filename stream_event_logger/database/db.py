@@ -1,20 +1,33 @@
+import logging
 import os
 
 from sqlmodel import Field
 from sqlmodel import SQLModel
 from sqlmodel import Session
 from sqlmodel import create_engine
+from dependencies.config import database_config, logger_config
+from dependencies.logging_utils import log_slow_queries
 
 
 class MonitoredGateways(SQLModel, table=True):
     gateway_id_tti: str = Field(primary_key=True)
 
 
+class GatewayLease(SQLModel, table=True):
+    """The instance streaming the events of a gateway in cluster mode, until ``expires_at`` unless renewed."""
+
+    gateway_id_tti: str = Field(primary_key=True)
+    owner: str = Field(index=True)
+    expires_at: float
+
+
 # The URL of the PostgreSQL database to connect to
 POSTGRES_URL = os.getenv("POSTGRES_URL")
 
 # Create a new engine with the given database URL
-db_engine = create_engine(POSTGRES_URL, echo=True)
+db_engine = create_engine(POSTGRES_URL, echo=database_config.sql_echo)
+# Log the statements slower than SLOW_QUERY_MS instead of echoing every statement
+log_slow_queries(db_engine, logging.getLogger(f"{logger_config.logger_name}.sql"), database_config.slow_query_ms)
 
 
 def create_db_and_tables(engine) -> None:
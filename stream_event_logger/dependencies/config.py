@@ -9,12 +9,20 @@ class LoggerConfig:
         logger_name: str = os.environ.get("LOGGER_NAME", "stream_event_logger"),
         max_bytes: int = int(os.environ.get("MAX_BYTES", "100000")),
         backup_count: int = int(os.environ.get("BACKUP_COUNT", "10")),
+        async_logging: bool = os.environ.get("LOG_ASYNC", "true").lower() in ("1", "true", "yes"),
+        queue_size: int = int(os.environ.get("LOG_QUEUE_SIZE", "10000")),
+        hot_path_sample_every: int = int(os.environ.get("LOG_HOT_PATH_SAMPLE_EVERY", "1")),
+        hot_path_max_per_second: float = float(os.environ.get("LOG_HOT_PATH_MAX_PER_SECOND", "10")),
     ) -> None:
         self.loglevel = loglevel
         self.logfile = logfile
         self.max_bytes = max_bytes
         self.backup_count = backup_count
         self.logger_name = logger_name
+        self.async_logging = async_logging
+        self.queue_size = queue_size
+        self.hot_path_sample_every = hot_path_sample_every
+        self.hot_path_max_per_second = hot_path_max_per_second
 
 
 class RabbitConfig:
@@ -25,13 +33,77 @@ class RabbitConfig:
         host_rabbit: str = os.environ.get("RABBITMQ_HOST"),
         queue_name: str = os.environ.get("QUEUE_NAME"),
         routing_key: str = os.environ.get("ROUTING_KEY"),
+        partitions: int = int(os.environ.get("STREAM_PARTITIONS", "0")),
+        lanes: str = os.environ.get("STREAM_LANES", ""),
     ) -> None:
         self.credentials_username = rabbit_username
         self.credentials_password = rabbit_password
         self.host_rabbit = host_rabbit
         self.queue_name = queue_name
         self.routing_key = routing_key
+        self.partitions = partitions
+        self.lanes = lanes
+
+
+class StreamFilterConfig:
+    def __init__(
+        self,
+        event_names: str = os.environ.get(
+            "STREAM_EVENT_NAMES", "gs.up.receive,gs.down.send,gs.status.receive,gs.gateway.connection.stats"
+        ),
+        event_fields: str = os.environ.get(
+            "STREAM_EVENT_FIELDS", "name,time,identifiers,context,visibility,unique_id,data"
+        ),
+        filters_file: str = os.environ.get("STREAM_EVENT_FILTERS_FILE", ""),
+    ) -> None:
+        self.event_names = [name.strip() for name in event_names.split(",") if name.strip()]
+        self.event_fields = [field.strip() for field in event_fields.split(",") if field.strip()]
+        self.filters_file = filters_file
+
+
+class DatabaseConfig:
+    def __init__(
+        self,
+        sql_echo: bool = os.environ.get("SQL_ECHO", "false").lower() in ("1", "true", "yes"),
+        slow_query_ms: float = float(os.environ.get("SLOW_QUERY_MS", "200")),
+    ) -> None:
+        self.sql_echo = sql_echo
+        self.slow_query_ms = slow_query_ms
+
+
+class MetricsConfig:
+    def __init__(
+        self,
+        enabled: bool = os.environ.get("METRICS_ENABLED", "false").lower() in ("1", "true", "yes"),
+        port: int = int(os.environ.get("METRICS_PORT", "9100")),
+    ) -> None:
+        self.enabled = enabled
+        self.port = port
+
+
+class ClusterConfig:
+    def __init__(
+        self,
+        enabled: bool = os.environ.get("CLUSTER_MODE", "false").lower() in ("1", "true", "yes"),
+        instance_id: str = os.environ.get("INSTANCE_ID", ""),
+        heartbeat_interval: float = float(os.environ.get("CLUSTER_HEARTBEAT_INTERVAL", "5")),
+        member_timeout: float = float(os.environ.get("CLUSTER_MEMBER_TIMEOUT", "15")),
+        lease_ttl: float = float(os.environ.get("GATEWAY_LEASE_TTL", "20")),
+        hash_replicas: int = int(os.environ.get("CLUSTER_HASH_REPLICAS", "64")),
+        stream_stop_timeout: float = float(os.environ.get("STREAM_STOP_TIMEOUT", "2")),
+    ) -> None:
+        self.enabled = enabled
+        self.instance_id = instance_id
+        self.heartbeat_interval = heartbeat_interval
+        self.member_timeout = member_timeout
+        self.lease_ttl = lease_ttl
+        self.hash_replicas = hash_replicas
+        self.stream_stop_timeout = stream_stop_timeout
 
 
 logger_config = LoggerConfig()
 rabbit_config = RabbitConfig()
+database_config = DatabaseConfig()
+metrics_config = MetricsConfig()
+cluster_config = ClusterConfig()
+stream_filter_config = StreamFilterConfig()
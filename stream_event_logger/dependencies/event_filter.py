@@ -0,0 +1,107 @@
+"""
+Filtering and projection of the TTI stream events before they are published.
+
+TTI only streams the events whose name is requested in the body of the stream request, and the
+logger drops the keep-alive lines and any event left that is not in the allowlist, then keeps
+only the projected fields of the events published. The stream event consumers receive the events
+they decode and the fields they read, nothing else.
+"""
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# The outcomes of a line of the stream
+PUBLISHED = "published"
+KEEP_ALIVE = "keep_alive"
+FILTERED = "filtered"
+INVALID = "invalid"
+
+
+class EventFilter:
+    def __init__(self, names: Optional[Iterable[str]] = None, fields: Optional[Iterable[str]] = None):
+        """
+        Args:
+            names: The names of the events streamed, all of them when empty.
+            fields: The dotted paths of the fields of the event ``result`` that are published, e.g.
+                ``data.message``, the whole event when empty.
+        """
+        self.names = sorted(set(names)) if names else []
+        self.fields = [field.split(".") for field in fields] if fields else []
+
+    def request_body(self, gateway_id: str) -> dict:
+        """The body of the TTI stream request of the events of ``gateway_id``."""
+        body = {"identifiers": [{"gateway_ids": {"gateway_id": gateway_id}}]}
+        if self.names:
+            body["names"] = self.names
+        return body
+
+    def project(self, result: dict) -> dict:
+        if not self.fields:
+            return result
+        projected = {}
+        for path in self.fields:
+            value = result
+            for key in path:
+                if not isinstance(value, dict) or key not in value:
+                    break
+                value = value[key]
+            else:
+                target = projected
+                for key in path[:-1]:
+                    target = target.setdefault(key, {})
+                target[path[-1]] = value
+        return projected
+
+    def select(self, line: str) -> Tuple[Optional[dict], str]:
+        """
+        Filters and projects one line of the stream.
+
+        Returns:
+            The projected ``result`` of the event, None when the line is dropped, and the outcome of
+            the line.
+        """
+        if not line.strip():
+            return None, KEEP_ALIVE
+        try:
+            result = json.loads(line)["result"]
+            name = result["name"]
+        except (ValueError, KeyError, TypeError):
+            return None, INVALID
+        if self.names and name not in self.names:
+            return None, FILTERED
+        return self.project(result), PUBLISHED
+
+    def apply(self, line: str) -> Tuple[Optional[str], str]:
+        """Like ``select``, with the event to publish encoded."""
+        result, outcome = self.select(line)
+        return (encode_event(result) if result is not None else None), outcome
+
+
+def encode_event(result: dict) -> str:
+    return json.dumps({"result": result}, separators=(",", ":"))
+
+
+class EventFilters:
+    """The filter of each gateway: its own one if it has one, the default one otherwise."""
+
+    def __init__(self, default: EventFilter, gateways: Optional[Dict[str, EventFilter]] = None):
+        self.default = default
+        self.gateways = gateways or {}
+
+    def for_gateway(self, gateway_id: str) -> EventFilter:
+        return self.gateways.get(gateway_id, self.default)
+
+    @classmethod
+    def load(cls, names: List[str], fields: List[str], path: Optional[str] = None) -> "EventFilters":
+        """
+        The default filter of ``names`` and ``fields``, with the filters of the gateways of the JSON
+        file at ``path``: ``{"<gateway id>": {"names": [...], "fields": [...]}}``. A gateway without
+        ``names`` or ``fields`` in the file uses the default ones.
+        """
+        gateways = {}
+        if path:
+            with open(path) as file:
+                for gateway_id, gateway_filter in json.load(file).items():
+                    gateways[gateway_id] = EventFilter(
+                        gateway_filter.get("names", names), gateway_filter.get("fields", fields)
+                    )
+        return cls(EventFilter(names, fields), gateways)
@@ -0,0 +1,38 @@
+"""
+Lanes of the stream events: each class of events (e.g. the gateway health events and the uplinks)
+is published to its own queue and processed with its own share of the consumer workers, so that a
+burst of one class does not delay the others.
+
+The lanes are given as ``lane=event name|event name`` pairs separated by commas, e.g.
+``health=gs.status.receive|gs.gateway.connection.stats,uplink=gs.up.receive``. The events of no
+lane are in the default lane, whose queue is the stream event queue itself.
+"""
+from typing import Callable, Dict, TypeVar
+
+DEFAULT_LANE = "default"
+
+T = TypeVar("T")
+
+
+def parse_lanes(spec: str) -> Dict[str, str]:
+    """The lane of each event name of ``spec``."""
+    lanes = {}
+    for item in filter(None, (item.strip() for item in spec.split(","))):
+        lane, _, event_names = item.partition("=")
+        for event_name in filter(None, (name.strip() for name in event_names.split("|"))):
+            lanes[event_name] = lane.strip()
+    return lanes
+
+
+def parse_lane_values(spec: str, cast: Callable[[str], T]) -> Dict[str, T]:
+    """The values of ``lane=value`` pairs separated by commas, e.g. the weights of the lanes."""
+    values = {}
+    for item in filter(None, (item.strip() for item in spec.split(","))):
+        lane, _, value = item.partition("=")
+        values[lane.strip()] = cast(value.strip())
+    return values
+
+
+def lane_queue_name(queue_name: str, lane: str) -> str:
+    """The queue of the events of ``lane``."""
+    return queue_name if lane == DEFAULT_LANE else f"{queue_name}.{lane}"
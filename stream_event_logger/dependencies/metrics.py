@@ -0,0 +1,340 @@
+"""
+Counters, gauges and latency histograms exposed in the Prometheus text format.
+
+Metrics are registered once at import time of the module using them and updated on the hot
+paths. While the registry is disabled (``METRICS_ENABLED`` unset) every update returns after a
+single attribute check, so the instrumentation can stay in place when nobody scrapes the service.
+"""
+import functools
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dependencies.config import metrics_config
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from sub-millisecond decoding up to the duration of a KPI cycle.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _NoOpChild:
+    """Returned by ``labels()`` while the registry is disabled."""
+
+    def inc(self, amount: float = 1.0) -> None:
+        pass
+
+    def dec(self, amount: float = 1.0) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        pass
+
+    def time(self):
+        return _Timer(self)
+
+
+_NO_OP = _NoOpChild()
+
+
+class _Timer:
+    """Context manager observing the elapsed time of its block."""
+
+    def __init__(self, child):
+        self.child = child
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    def __init__(self):
+        super().__init__()
+        self.function: Optional[Callable[[], float]] = None
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self.lock:
+            self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Reads the value from ``function`` when the metrics are rendered."""
+        self.function = function
+
+    def get(self) -> float:
+        return float(self.function()) if self.function is not None else self.value
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str,
+                 labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """The time series of the given label values, in the order of ``labelnames``."""
+        if not self.registry.enabled:
+            return _NO_OP
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterable[str]:
+        for key, child in list(self.children.items()):
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        if self.registry.enabled:
+            self.labels().set_function(function)
+
+    def samples(self) -> Iterable[str]:
+        for key, child in list(self.children.items()):
+            try:
+                value = child.get()
+            except Exception:
+                value = math.nan
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str,
+                 labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def samples(self) -> Iterable[str]:
+        bucket_names = self.labelnames + ("le",)
+        for key, child in list(self.children.items()):
+            with child.lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(bucket_names, key + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, *args, **kwargs) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = metric_class(self, name, *args, **kwargs)
+                self.metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        """All the metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry(enabled=metrics_config.enabled)
+
+
+def timed(histogram: Histogram, *label_values, errors: Optional[Counter] = None):
+    """
+    Decorator observing the duration of every call in ``histogram`` and counting the calls that
+    raise in ``errors``. Calls go straight to the function while the registry is disabled.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not histogram.registry.enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.labels(*label_values).inc()
+                raise
+            finally:
+                histogram.labels(*label_values).observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = registry
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = None, host: str = "0.0.0.0",
+                         metrics_registry: MetricsRegistry = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Serves ``/metrics`` from a daemon thread. Does nothing and returns None while the registry is
+    disabled.
+    """
+    metrics_registry = metrics_registry or registry
+    if not metrics_registry.enabled:
+        return None
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": metrics_registry})
+    server = ThreadingHTTPServer((host, metrics_config.port if port is None else port), handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
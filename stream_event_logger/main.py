@@ -5,8 +5,14 @@ from database.db import create_db_and_tables
 from database.db import drop_db_and_tables
 from database.db import db_engine
 from dependencies import utility_functions
+from dependencies.cluster import ClusterMembership
+from dependencies.config import cluster_config
 from dependencies.config import logger_config
 from dependencies.config import rabbit_config
+from dependencies.config import stream_filter_config
+from dependencies.event_filter import EventFilters
+from dependencies.lanes import parse_lanes
+from dependencies.metrics import start_metrics_server
 from stream_event_logger_service import StreamEventLogger
 
 rabbit_username = rabbit_config.credentials_username
@@ -22,6 +28,16 @@ control_gateways_queue = os.getenv("CONTROL_GATEWAYS_QUEUE", "control_gateways_q
 
 def main():
     try:
+        start_metrics_server()
+        cluster = None
+        if cluster_config.enabled:
+            cluster = ClusterMembership(
+                db_engine,
+                "stream_event_logger",
+                instance_id=cluster_config.instance_id or None,
+                member_timeout=cluster_config.member_timeout,
+            )
+            service_logger.info(f"Cluster mode, instance {cluster.instance_id}")
         service = StreamEventLogger(
             logger=service_logger,
             rabbit_username=rabbit_username,
@@ -31,6 +47,18 @@ def main():
             rabbit_message_queue_name=rabbit_queue_name,
             rabbit_message_routing_key=rabbit_routing_key,
             db_engine=db_engine,
+            cluster=cluster,
+            heartbeat_interval=cluster_config.heartbeat_interval,
+            lease_ttl=cluster_config.lease_ttl,
+            hash_replicas=cluster_config.hash_replicas,
+            stream_stop_timeout=cluster_config.stream_stop_timeout,
+            partitions=rabbit_config.partitions,
+            event_filters=EventFilters.load(
+                stream_filter_config.event_names,
+                stream_filter_config.event_fields,
+                stream_filter_config.filters_file or None,
+            ),
+            lanes=parse_lanes(rabbit_config.lanes),
         )
         start_rabbit_thread = threading.Thread(target=service.start_rabbit)
         start_rabbit_thread.start()
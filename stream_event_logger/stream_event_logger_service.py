@@ -2,19 +2,46 @@ import json
 import threading
 import time
 import urllib.request
-import pika
 import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session
 from sqlmodel import select
-from database.db import MonitoredGateways
+from database.db import GatewayLease, MonitoredGateways
+from dependencies.cluster import ClusterMembership, HashRing, partition_of, partition_queue_name
+from dependencies.event_filter import PUBLISHED, EventFilter, EventFilters, encode_event
+from dependencies.lanes import DEFAULT_LANE, lane_queue_name
 from dependencies.exceptions import RabbitMQConnectionError, RabbitMQConsumingError, DatabaseError
+from dependencies.logging_utils import get_hot_path_logger
+from dependencies.metrics import registry, timed
+from dependencies.transport import Message, RabbitMQTransport, Transport
 
 tti_event_url = os.getenv("TTI_EVENT_URL")
 tti_auth_token = os.getenv("TTI_AUTH_TOKEN")
 
+EVENTS_PUBLISHED = registry.counter(
+    "stream_events_published", "Stream event lines published to the queue, by gateway", ["gateway_id"]
+)
+PUBLISH_ERRORS = registry.counter("stream_event_publish_errors", "Stream event lines that failed to publish")
+PUBLISH_SECONDS = registry.histogram("stream_event_publish_seconds", "Time to publish one stream event line")
+STREAM_BYTES = registry.counter(
+    "stream_event_bytes", "Bytes of the event stream received from TTI and published, by gateway", ["gateway_id", "stage"]
+)
+LINES_DROPPED = registry.counter(
+    "stream_event_lines_dropped", "Lines of the event stream not published, by gateway and reason", ["gateway_id", "reason"]
+)
+MONITORED_GATEWAYS = registry.gauge("monitored_gateways", "Gateways with a running event stream")
+CLUSTER_MEMBERS = registry.gauge("stream_event_logger_cluster_members", "Live instances of the cluster")
+GATEWAYS_MOVED = registry.counter(
+    "stream_event_logger_gateways_moved", "Gateway streams started or stopped by a rebalance, by action", ["action"]
+)
+
 
-def init_get_streaming(gateway_id):
-    data_body = '{"identifiers": [{"gateway_ids": {"gateway_id": "' + gateway_id + '"}}]}'
+def init_get_streaming(gateway_id, event_filter: Optional[EventFilter] = None):
+    data_body = json.dumps((event_filter or EventFilter()).request_body(gateway_id))
     data = bytes(data_body, "utf-8")
     headers = {
         "Authorization": tti_auth_token,
@@ -34,53 +61,94 @@ class MessageSubscriptor(threading.Thread):
             rabbit_host,
             queue_name,
             routing_key,
+            transport: Transport = None,
+            partitions: int = 0,
+            event_filter: Optional[EventFilter] = None,
+            lanes: Optional[Dict[str, str]] = None,
     ):
         super().__init__()
         self.logger = logger
         self.gateway_id = gateway_id
+        self.hot_logger = get_hot_path_logger(logger)
         self.rabbit_username = rabbit_username
         self.rabbit_password = rabbit_password
         self.rabbit_host = rabbit_host
         self.queue_name = queue_name
         self.routing_key = routing_key
-        self.credentials = pika.PlainCredentials(
-            username=self.rabbit_username, password=self.rabbit_password
+        # The events of a gateway always go to the queues of its partition, which one consumer owns
+        self.partition = partition_of(gateway_id, partitions) if partitions else None
+        if self.partition is not None:
+            self.queue_name = self.routing_key = partition_queue_name(queue_name, self.partition)
+        # The lane of each event name, the events of no lane go to the queue above
+        self.lanes = lanes or {}
+        self.lane_queues = {
+            lane: lane_queue_name(queue_name, lane) if self.partition is None
+            else partition_queue_name(lane_queue_name(queue_name, lane), self.partition)
+            for lane in set(self.lanes.values()) - {DEFAULT_LANE}
+        }
+        # None publishes every line of the stream as it is
+        self.event_filter = event_filter
+        self.transport = transport or RabbitMQTransport(
+            rabbit_host, rabbit_username, rabbit_password, logger=logger
         )
         self.should_run = True  # Flag to indicate whether the thread should continue running
 
         self.logger.debug("initialize - Message logger connector")
 
     def run(self):
-        self.logger.debug(f" start monitoring gateway id =: {self.gateway_id}")
+        self.logger.debug(" start monitoring gateway id =: %s", self.gateway_id)
         try:
-            req = init_get_streaming(self.gateway_id)
+            req = init_get_streaming(self.gateway_id, self.event_filter)
             with urllib.request.urlopen(req) as f:
                 while (
                         self.should_run
                 ):  # Check the flag to see if the thread should continue running
                     msg = f.readline().decode("utf-8")
-                    self.logger.debug(f"rx_data{msg}")
-                    self.send_data(msg)
+                    if not self.should_run:
+                        # Stopped while waiting for the line: the next owner of the gateway streams it
+                        break
+                    self.hot_logger.debug("rx_data%s", msg)
+                    self.forward(msg)
                     time.sleep(1)
 
         except Exception as e:
             self.logger.error(f"ERROR gateway id =: {self.gateway_id} >>>>>>>>>>>>>> {str(e)}")
 
-    def send_data(self, json_data):
-        # set [rabbit] configuration
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=self.rabbit_host, credentials=self.credentials)
-        )
-        channel = connection.channel()
-        channel.queue_declare(queue=self.queue_name, durable=True)
-        channel.basic_publish(
-            exchange="",
-            routing_key=self.routing_key,
-            body=json.dumps(json_data),
-            properties=pika.BasicProperties(delivery_mode=2),
-        )
-        self.logger.debug(" rx_data sent to the queue")
-        connection.close()
+    def forward(self, line: str) -> None:
+        """Publishes one line of the stream once filtered and projected, unless it is dropped."""
+        STREAM_BYTES.labels(self.gateway_id, "received").inc(len(line.encode("utf-8")))
+        tenant_id = None
+        if self.event_filter is None and not self.lanes:
+            event, event_name, outcome = line, None, PUBLISHED
+        else:
+            result, outcome = (self.event_filter or EventFilter()).select(line)
+            event = encode_event(result) if result is not None else None
+            event_name = result["name"] if result is not None else None
+            if result is not None and isinstance(result.get("context"), dict):
+                tenant_id = result["context"].get("tenant-id")
+        if event is None:
+            LINES_DROPPED.labels(self.gateway_id, outcome).inc()
+            return
+        self.send_data(event, event_name, tenant_id)
+        STREAM_BYTES.labels(self.gateway_id, "published").inc(len(event.encode("utf-8")))
+
+    @timed(PUBLISH_SECONDS, errors=PUBLISH_ERRORS)
+    def send_data(self, json_data, event_name: Optional[str] = None, tenant_id: Optional[str] = None):
+        headers = None
+        queue_name, routing_key = self.queue_name, self.routing_key
+        if event_name is not None:
+            # The consumers measure the lag of each lane from the publication time, and schedule the
+            # events of each tenant fairly without decoding them
+            headers = {"event_name": event_name, "published_at": time.time()}
+            if tenant_id:
+                headers["tenant_id"] = tenant_id
+            lane = self.lanes.get(event_name, DEFAULT_LANE)
+            if lane in self.lane_queues:
+                queue_name = routing_key = self.lane_queues[lane]
+        self.transport.declare_queue(queue_name)
+        self.transport.publish(routing_key, json.dumps(json_data), headers=headers)
+        EVENTS_PUBLISHED.labels(self.gateway_id).inc()
+        self.hot_logger.debug(" rx_data sent to the queue")
 
     def stop(self):
         self.should_run = False
@@ -97,6 +165,15 @@ class StreamEventLogger(object):
             rabbit_message_queue_name,
             rabbit_message_routing_key,
             db_engine,
+            transport: Transport = None,
+            cluster: Optional[ClusterMembership] = None,
+            heartbeat_interval: float = 5,
+            lease_ttl: float = 20,
+            hash_replicas: int = 64,
+            partitions: int = 0,
+            event_filters: Optional[EventFilters] = None,
+            lanes: Optional[Dict[str, str]] = None,
+            stream_stop_timeout: float = 2,
     ):
         self.logger = logger
         self.rabbit_username = rabbit_username
@@ -105,54 +182,285 @@ class StreamEventLogger(object):
         self.control_gateways_queue = control_gateways_queue
         self.rabbit_message_queue_name = rabbit_message_queue_name
         self.rabbit_message_routing_key = rabbit_message_routing_key
-
-        self.credentials = pika.PlainCredentials(
-            username=self.rabbit_username, password=self.rabbit_password
+        self.partitions = partitions
+        self.event_filters = event_filters
+        self.lanes = lanes
+        self.transport = transport or RabbitMQTransport(
+            rabbit_host, rabbit_username, rabbit_password, logger=logger
         )
         self.engine = db_engine
         self.all_monitored_gws = []
+        # The control messages are handled on their own threads, one command is applied at a time
+        self.monitor_lock = threading.RLock()
+        # In cluster mode the gateways are spread over the live instances by consistent hashing, and
+        # an instance streams a gateway only while it holds its lease
+        self.cluster = cluster
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_ttl = lease_ttl
+        self.hash_replicas = hash_replicas
+        # A stopped stream may still be waiting for its next line, its lease is released (and renewed
+        # until then) once its thread exited
+        self.stream_stop_timeout = stream_stop_timeout
+        self.stopping_gws = []
+        self.ring = HashRing([cluster.instance_id] if cluster else [], hash_replicas)
+        self.stopped = threading.Event()
+        MONITORED_GATEWAYS.set_function(lambda: len(self.all_monitored_gws))
+        CLUSTER_MEMBERS.set_function(lambda: len(self.ring.members))
         self.logger.debug("initialize - MetadataLoggerService")
 
     def call(self, data):
         try:
             data_json = json.loads(data)
-            gateway_id = data_json["id"]
-            command = data_json["command"]
-            if not gateway_id or not command:
+            # A bulk command carries the list of gateways in "ids", a single command its gateway in "id"
+            gateway_ids = data_json.get("ids") or ([data_json["id"]] if data_json.get("id") else [])
+            command = data_json.get("command")
+            if not gateway_ids or not command:
                 self.logger.error(f"Invalid data received: {data}")
                 return
 
-            if command == "start":
-                self.start_monitor_gw(gateway_id, self.engine)
+            if data_json.get("routed"):
+                # Sent by the instance that received the command, to the owner of the gateways
+                self.apply_owned_command(command, gateway_ids)
+            elif command == "start":
+                self.start_monitor_gws(gateway_ids, self.engine)
             elif command == "stop":
-                self.stop_monitor_gw(gateway_id, self.engine)
+                self.stop_monitor_gws(gateway_ids, self.engine)
             else:
                 self.logger.error(f"Invalid command received: {command}")
         except json.JSONDecodeError as e:
             self.logger.error(f"Error in call: {data}")
+        except DatabaseError as e:
+            self.logger.error(f"Error in call: {str(e)}")
 
     def start_monitor_gw(self, gateway_id: str, db_engine):
-        with Session(db_engine) as session:
-            gateway_exists = self.check_if_gateway_exists(gateway_id)
-            if not gateway_exists:
-                monitoredGateway = MonitoredGateways(gateway_id_tti=gateway_id)
-                session.add(monitoredGateway)
-                session.commit()
+        self.start_monitor_gws([gateway_id], db_engine)
 
-                gw_monitored_thread = MessageSubscriptor(
-                    self.logger,
-                    gateway_id,
-                    self.rabbit_username,
-                    self.rabbit_password,
-                    self.rabbit_host,
-                    self.rabbit_message_queue_name,
-                    self.rabbit_message_routing_key,
-                )
-                gw_monitored_thread.start()
-                self.all_monitored_gws.append(gw_monitored_thread)
-                self.logger.debug("start_monitor gateway added Done!")
+    def start_monitor_gws(self, gateway_ids: List[str], db_engine):
+        """
+        Record the gateways that are not monitored yet in one transaction, then start their event streams.
+        """
+        with self.monitor_lock:
+            try:
+                with Session(db_engine) as session:
+                    gateway_id_column = MonitoredGateways.gateway_id_tti
+                    monitored_ids = set(session.exec(
+                        select(gateway_id_column).where(gateway_id_column.in_(gateway_ids))
+                    ).all())
+                    new_gateway_ids = [gateway_id for gateway_id in dict.fromkeys(gateway_ids)
+                                       if gateway_id not in monitored_ids]
+                    session.add_all([MonitoredGateways(gateway_id_tti=gateway_id) for gateway_id in new_gateway_ids])
+                    session.commit()
+            except Exception as e:
+                self.logger.error(f"Error start_monitor_gws: {str(e)}")
+                raise DatabaseError("start_monitor_gws ", f"Error start_monitor_gws: {str(e)}")
+
+            if self.cluster is not None:
+                self.dispatch_command("start", new_gateway_ids)
             else:
-                self.logger.debug(f"start_monitor_gw = {gateway_id} exists!")
+                for gateway_id in new_gateway_ids:
+                    self.start_gateway_stream(gateway_id)
+        if monitored_ids:
+            self.logger.debug("start_monitor_gws = %s exist!", sorted(monitored_ids))
+        self.logger.debug("start_monitor_gws %d gateways added Done!", len(new_gateway_ids))
+
+    def start_gateway_stream(self, gateway_id: str):
+        gw_monitored_thread = MessageSubscriptor(
+            self.logger,
+            gateway_id,
+            self.rabbit_username,
+            self.rabbit_password,
+            self.rabbit_host,
+            self.rabbit_message_queue_name,
+            self.rabbit_message_routing_key,
+            self.transport,
+            self.partitions,
+            self.event_filters.for_gateway(gateway_id) if self.event_filters else None,
+            self.lanes,
+        )
+        gw_monitored_thread.start()
+        self.all_monitored_gws.append(gw_monitored_thread)
+
+    def stop_gateway_streams(self, gateway_ids: Iterable[str]) -> List[MessageSubscriptor]:
+        """Stops the streams of the gateways, returns their threads."""
+        gateway_ids = set(gateway_ids)
+        with self.monitor_lock:
+            running_gws, stopped_gws = [], []
+            for gw_monitored_thread in self.all_monitored_gws:
+                if gw_monitored_thread.gateway_id in gateway_ids:
+                    gw_monitored_thread.stop()  # Stop the thread
+                    stopped_gws.append(gw_monitored_thread)
+                else:
+                    running_gws.append(gw_monitored_thread)
+            self.all_monitored_gws = running_gws
+        return stopped_gws
+
+    def running_gateway_ids(self) -> Set[str]:
+        with self.monitor_lock:
+            return {gw_monitored_thread.gateway_id for gw_monitored_thread in self.all_monitored_gws}
+
+    # CLUSTER MODE
+    def instance_queue(self, instance_id: str) -> str:
+        """The control queue of one instance, for the commands on the gateways it owns."""
+        return f"{self.control_gateways_queue}.{instance_id}"
+
+    def dispatch_command(self, command: str, gateway_ids: Iterable[str]) -> None:
+        """
+        Applies the command to the gateways this instance owns and sends it to the owners of the
+        others, once the monitored gateways are recorded.
+        """
+        by_owner: Dict[str, List[str]] = defaultdict(list)
+        for gateway_id in gateway_ids:
+            by_owner[self.ring.owner(gateway_id) or self.cluster.instance_id].append(gateway_id)
+        for owner, owned_ids in by_owner.items():
+            if owner == self.cluster.instance_id:
+                self.apply_owned_command(command, owned_ids)
+                continue
+            try:
+                queue_name = self.instance_queue(owner)
+                self.transport.declare_queue(queue_name, durable=False)
+                # Encoded like the commands of the backend: the JSON of the command as a JSON string
+                self.transport.publish(queue_name, json.dumps(json.dumps(
+                    {"ids": owned_ids, "command": command, "routed": True}
+                )))
+            except Exception as e:
+                # The owner applies it at its next rebalance anyway
+                self.logger.error(f"Error routing the {command} command to {owner}: {repr(e)}")
+
+    def apply_owned_command(self, command: str, gateway_ids: List[str]) -> None:
+        with self.monitor_lock:
+            if command == "start":
+                # The gateways of a stream still stopping are started by a later rebalance
+                started_ids = self.running_gateway_ids() | self.stopping_gateway_ids()
+                new_ids = [id_ for id_ in gateway_ids if id_ not in started_ids]
+                for gateway_id in sorted(self.acquire_leases(new_ids)):
+                    self.start_gateway_stream(gateway_id)
+            elif command == "stop":
+                self.release_stopped_leases(self.stop_gateway_streams(gateway_ids))
+
+    def acquire_leases(self, gateway_ids: List[str]) -> Set[str]:
+        """Takes the leases of the gateways that are free, expired or already held, returns the ones held."""
+        if not gateway_ids:
+            return set()
+        now = self.cluster.clock()
+        owner = self.cluster.instance_id
+        expires_at = now + self.lease_ttl
+        with Session(self.engine) as session:
+            session.execute(update(GatewayLease).where(
+                GatewayLease.gateway_id_tti.in_(gateway_ids),
+                or_(GatewayLease.owner == owner, GatewayLease.expires_at < now),
+            ).values(owner=owner, expires_at=expires_at))
+            leased_ids = set(session.exec(
+                select(GatewayLease.gateway_id_tti).where(GatewayLease.gateway_id_tti.in_(gateway_ids))
+            ).all())
+            session.commit()
+            free_ids = [gateway_id for gateway_id in gateway_ids if gateway_id not in leased_ids]
+            try:
+                session.add_all([GatewayLease(gateway_id_tti=id_, owner=owner, expires_at=expires_at) for id_ in free_ids])
+                session.commit()
+            except IntegrityError:
+                # Another instance took one of them meanwhile, the others are taken one by one
+                session.rollback()
+                for gateway_id in free_ids:
+                    try:
+                        session.add(GatewayLease(gateway_id_tti=gateway_id, owner=owner, expires_at=expires_at))
+                        session.commit()
+                    except IntegrityError:
+                        session.rollback()
+            return set(session.exec(select(GatewayLease.gateway_id_tti).where(
+                GatewayLease.gateway_id_tti.in_(gateway_ids), GatewayLease.owner == owner
+            )).all())
+
+    def renew_leases(self, gateway_ids: Iterable[str]) -> Set[str]:
+        """Extends the leases this instance holds on the gateways, returns the ones still held."""
+        now = self.cluster.clock()
+        owner = self.cluster.instance_id
+        gateway_ids = list(gateway_ids)
+        with Session(self.engine) as session:
+            session.execute(update(GatewayLease).where(
+                GatewayLease.owner == owner, GatewayLease.gateway_id_tti.in_(gateway_ids)
+            ).values(expires_at=now + self.lease_ttl))
+            held = set(session.exec(select(GatewayLease.gateway_id_tti).where(
+                GatewayLease.owner == owner, GatewayLease.gateway_id_tti.in_(gateway_ids)
+            )).all())
+            session.commit()
+        return held
+
+    def release_leases(self, gateway_ids: Iterable[str]) -> None:
+        with Session(self.engine) as session:
+            session.execute(delete(GatewayLease).where(
+                GatewayLease.owner == self.cluster.instance_id, GatewayLease.gateway_id_tti.in_(list(gateway_ids))
+            ))
+            session.commit()
+
+    def release_stopped_leases(self, stopped_gws: List[MessageSubscriptor]) -> None:
+        """
+        Releases the leases of the stopped streams whose thread exited within ``stream_stop_timeout``
+        seconds, or since an earlier call. The others keep their lease until a later rebalance finds
+        their thread exited: a thread still waiting for a line of the stream must not publish it while
+        the next owner of the gateway streams it too.
+        """
+        deadline = time.monotonic() + self.stream_stop_timeout
+        for gw_monitored_thread in stopped_gws:
+            gw_monitored_thread.join(max(deadline - time.monotonic(), 0))
+        with self.monitor_lock:
+            stopping_gws = self.stopping_gws + stopped_gws
+            self.stopping_gws = [thread for thread in stopping_gws if thread.is_alive()]
+            exited_ids = {thread.gateway_id for thread in stopping_gws} - self.stopping_gateway_ids()
+            if exited_ids:
+                self.release_leases(exited_ids)
+
+    def stopping_gateway_ids(self) -> Set[str]:
+        with self.monitor_lock:
+            return {gw_monitored_thread.gateway_id for gw_monitored_thread in self.stopping_gws}
+
+    def rebalance(self) -> None:
+        """
+        Heartbeats, then streams exactly the monitored gateways that the ring gives to this instance:
+        the streams of the gateways owned by another instance are stopped and their leases released
+        once their thread exited, the leases of the others are renewed, and the missing streams are
+        started once their lease is free (the previous owner released it or is dead and it expired)
+        and the thread of their previous stream here exited.
+        """
+        members = self.cluster.heartbeat()
+        ring = HashRing(members, self.hash_replicas)
+        if ring.members != self.ring.members:
+            self.logger.info(f"Cluster members changed: {', '.join(ring.members)}")
+        self.ring = ring
+        with Session(self.engine) as session:
+            monitored_ids = set(session.exec(select(MonitoredGateways.gateway_id_tti)).all())
+        owned_ids = {gateway_id for gateway_id in monitored_ids if ring.owner(gateway_id) == self.cluster.instance_id}
+        with self.monitor_lock:
+            running_ids = self.running_gateway_ids()
+            given_up = running_ids - owned_ids
+            if given_up:
+                GATEWAYS_MOVED.labels("stop").inc(len(given_up))
+            # Taken over while this instance could not renew them, e.g. after a long pause
+            lost = (running_ids & owned_ids) - self.renew_leases(running_ids & owned_ids)
+            self.release_stopped_leases(self.stop_gateway_streams(given_up | lost))
+            stopping_ids = self.stopping_gateway_ids()
+            self.renew_leases(stopping_ids)
+            started = self.acquire_leases(sorted(owned_ids - (running_ids - lost) - stopping_ids))
+            for gateway_id in sorted(started):
+                self.start_gateway_stream(gateway_id)
+            GATEWAYS_MOVED.labels("start").inc(len(started))
+
+    def run_cluster(self) -> None:
+        """Rebalances every ``heartbeat_interval`` seconds until ``stop_cluster``, then leaves the cluster."""
+        while not self.stopped.is_set():
+            try:
+                self.rebalance()
+            except Exception as e:
+                self.logger.error(f"Error rebalancing the gateways: {repr(e)}")
+            self.stopped.wait(self.heartbeat_interval)
+        try:
+            # The leases of the streams still running after the timeout expire
+            self.release_stopped_leases(self.stop_gateway_streams(self.running_gateway_ids()))
+            self.cluster.leave()
+        except Exception as e:
+            self.logger.error(f"Error leaving the cluster: {repr(e)}")
+
+    def stop_cluster(self) -> None:
+        self.stopped.set()
 
     def check_if_gateway_exists(self, gateway_id):
         try:
@@ -168,24 +476,38 @@ class StreamEventLogger(object):
             session.close()
 
     def stop_monitor_gw(self, gateway_id: str, db_engine):
-        self.logger.debug("stop_monitor_gw")
-        with Session(db_engine) as session:
-            monitored_gateway = self.check_if_gateway_exists(gateway_id)
-            if not monitored_gateway:
-                self.logger.error(f"No monitored gateway with id {gateway_id} found in the database")
+        self.stop_monitor_gws([gateway_id], db_engine)
+
+    def stop_monitor_gws(self, gateway_ids: List[str], db_engine):
+        """
+        Remove the monitored gateways in one transaction, then stop their event streams.
+        """
+        self.logger.debug("stop_monitor_gws")
+        with self.monitor_lock:
+            try:
+                with Session(db_engine) as session:
+                    gateway_id_column = MonitoredGateways.gateway_id_tti
+                    stopped_ids = set(session.exec(
+                        select(gateway_id_column).where(gateway_id_column.in_(gateway_ids))
+                    ).all())
+                    session.execute(delete(MonitoredGateways).where(gateway_id_column.in_(stopped_ids)))
+                    session.commit()
+            except Exception as e:
+                self.logger.error(f"Error stop_monitor_gws: {str(e)}")
+                raise DatabaseError("stop_monitor_gws ", f"Error stop_monitor_gws: {str(e)}")
+
+            if self.cluster is not None:
+                self.dispatch_command("stop", stopped_ids)
             else:
-                session.delete(monitored_gateway)
-                session.commit()
+                self.stop_gateway_streams(stopped_ids)
 
-                for i, gw_monitored_thread in enumerate(self.all_monitored_gws):
-                    if gw_monitored_thread.gateway_id == gateway_id:
-                        gw_monitored_thread.stop()  # Stop the thread
-                        self.all_monitored_gws.pop(i)  # Remove the thread from the list
-                        break
+        missing_ids = [gateway_id for gateway_id in gateway_ids if gateway_id not in stopped_ids]
+        if missing_ids:
+            self.logger.error(f"No monitored gateway with id {', '.join(missing_ids)} found in the database")
 
     def get_all_monitor_gateways(self):
         try:
-            self.logger.debug(f"get_all_monitore_gateways")
+            self.logger.debug("get_all_monitore_gateways")
             with Session(self.engine) as session:
                 return session.exec(select(MonitoredGateways)).all()
 
@@ -197,51 +519,37 @@ class StreamEventLogger(object):
             session.close()
 
     def init_start_monitoring(self):
+        if self.cluster is not None:
+            self.run_cluster()
+            return
         try:
             gateways_ids = self.get_all_monitor_gateways()
-            self.logger.debug(f"init_start_monitoring")
+            self.logger.debug("init_start_monitoring")
             for gw in gateways_ids:
-                gw_monitored_thread = MessageSubscriptor(
-                    self.logger,
-                    gw.gateway_id_tti,
-                    self.rabbit_username,
-                    self.rabbit_password,
-                    self.rabbit_host,
-                    self.rabbit_message_queue_name,
-                    self.rabbit_message_routing_key,
-                )
-                gw_monitored_thread.start()
-                self.all_monitored_gws.append(gw_monitored_thread)
+                self.start_gateway_stream(gw.gateway_id_tti)
         except Exception as e:
             self.logger.error(f"Error init_start_monitoring: {repr(e)}")
 
-    def callback(self, ch, method, properties, body):
+    def callback(self, message: Message):
         try:
             self.logger.debug("start callback ")
-            t = threading.Thread(target=self.call, args=(json.loads(body.decode("utf-8")),))
+            t = threading.Thread(target=self.call, args=(json.loads(message.body.decode("utf-8")),))
             t.start()
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            self.transport.ack(message)
         except Exception as e:
             self.logger.error(f"Error in callback function: {repr(e)}")
 
     def start_rabbit(self) -> None:
         try:
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(host=self.rabbit_host, credentials=self.credentials)
-            )
-            channel = connection.channel()
-            channel.queue_declare(queue=self.control_gateways_queue, durable=True)
-            channel.basic_qos(prefetch_count=1)
+            self.transport.consume(self.control_gateways_queue, self.callback)
+            if self.cluster is not None:
+                self.transport.consume(self.instance_queue(self.cluster.instance_id), self.callback, durable=False)
         except Exception as e:
             self.logger.error(f"Failed to connect to RabbitMQ: {e}")
             raise RabbitMQConnectionError("Failed to connect to RabbitMQ.") from e
 
         try:
-            while True:
-                channel.basic_consume(
-                    queue=self.control_gateways_queue, on_message_callback=self.callback
-                )
-                channel.start_consuming()
+            self.transport.start_consuming()
         except Exception as e:
             self.logger.error(f"RabbitMQ channel was closed: {repr(e)}")
             raise RabbitMQConsumingError(f"Error RabbitMQ consumer: {repr(e)}") from e
@@ -0,0 +1,60 @@
+import json
+
+from dependencies.event_filter import FILTERED, INVALID, KEEP_ALIVE, PUBLISHED, EventFilter, EventFilters
+
+
+def stream_line(name, **data):
+    return json.dumps({"result": {
+        "name": name,
+        "time": "2024-01-01T00:00:00Z",
+        "identifiers": [{"gateway_ids": {"gateway_id": "gateway-1"}}],
+        "correlation_ids": ["gs:conn:1", "gs:uplink:2"],
+        "origin": "ip-10-0-0-1",
+        "data": data,
+    }}) + "\n"
+
+
+def test_only_the_allowed_events_are_kept():
+    event_filter = EventFilter(names=["gs.up.receive"])
+
+    assert event_filter.apply("\n") == (None, KEEP_ALIVE)
+    assert event_filter.apply("{not json\n") == (None, INVALID)
+    assert event_filter.apply(stream_line("gs.txack.receive")) == (None, FILTERED)
+    event, outcome = event_filter.apply(stream_line("gs.up.receive", message={"raw_payload": "QAE="}))
+    assert outcome == PUBLISHED
+    assert json.loads(event)["result"]["data"] == {"message": {"raw_payload": "QAE="}}
+
+
+def test_only_the_projected_fields_are_published():
+    event_filter = EventFilter(fields=["name", "identifiers", "data.message.rx_metadata", "data.missing"])
+    line = stream_line("gs.up.receive", message={"raw_payload": "QAE=", "rx_metadata": [{"snr": 7.5}]})
+
+    event, outcome = event_filter.apply(line)
+
+    assert outcome == PUBLISHED
+    assert json.loads(event) == {"result": {
+        "name": "gs.up.receive",
+        "identifiers": [{"gateway_ids": {"gateway_id": "gateway-1"}}],
+        "data": {"message": {"rx_metadata": [{"snr": 7.5}]}},
+    }}
+    assert len(event) < len(line)
+
+
+def test_the_event_names_are_requested_from_tti():
+    assert EventFilter(names=["gs.up.receive", "gs.down.send"]).request_body("gateway-1") == {
+        "identifiers": [{"gateway_ids": {"gateway_id": "gateway-1"}}],
+        "names": ["gs.down.send", "gs.up.receive"],
+    }
+    assert "names" not in EventFilter().request_body("gateway-1")
+
+
+def test_gateways_can_have_their_own_filter(tmp_path):
+    path = tmp_path / "filters.json"
+    path.write_text(json.dumps({"gateway-2": {"names": ["gs.status.receive"]}}))
+
+    filters = EventFilters.load(["gs.up.receive"], ["name"], str(path))
+
+    assert filters.for_gateway("gateway-1").names == ["gs.up.receive"]
+    assert filters.for_gateway("gateway-2").names == ["gs.status.receive"]
+    # The fields of the default filter are kept
+    assert filters.for_gateway("gateway-2").fields == [["name"]]
@@ -0,0 +1,298 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from unittest.mock import Mock, patch
+
+import pika
+import pytest
+
+from stream_event_logger.dependencies.transport import (
+    InMemoryBroker,
+    InMemoryTransport,
+    NoConsumerError,
+    RabbitMQTransport,
+    RPCTimeoutError,
+    RpcClient,
+    TransportError,
+)
+
+
+def test_publish_and_consume():
+    transport = InMemoryTransport()
+    received = []
+
+    def on_message(message):
+        received.append(message.body)
+        transport.ack(message)
+
+    transport.consume("test_queue", on_message)
+    transport.publish("test_queue", "first")
+    transport.publish("test_queue", b"second")
+
+    assert transport.process_pending() == 2
+    assert received == [b"first", b"second"]
+
+
+def test_cancelled_queue_is_not_delivered_anymore():
+    transport = InMemoryTransport()
+    received = []
+    transport.consume("first_queue", lambda message: received.append(message.body))
+    transport.consume("second_queue", lambda message: received.append(message.body))
+
+    transport.cancel("first_queue")
+    transport.publish("first_queue", "first")
+    transport.publish("second_queue", "second")
+
+    assert transport.process_pending() == 1
+    assert received == [b"second"]
+    assert transport.consumer_count("first_queue") == 0
+
+
+def test_transports_on_the_same_broker_share_queues():
+    broker = InMemoryBroker()
+    producer = InMemoryTransport(broker)
+    consumer = InMemoryTransport(broker)
+    received = []
+    consumer.consume("test_queue", lambda message: received.append(message.body))
+
+    producer.publish("test_queue", "payload")
+    consumer.process_pending()
+
+    assert received == [b"payload"]
+    assert broker.queue_size("test_queue") == 0
+
+
+def test_prefetch_count_limits_unacked_deliveries():
+    transport = InMemoryTransport()
+    received = []
+    transport.consume("test_queue", received.append, prefetch_count=2)
+    for i in range(5):
+        transport.publish("test_queue", str(i))
+
+    assert transport.process_pending() == 2
+
+    transport.ack(received[0])
+    assert transport.process_pending() == 1
+    assert [message.body for message in received] == [b"0", b"1", b"2"]
+
+
+def test_call_returns_the_reply():
+    broker = InMemoryBroker()
+    server = InMemoryTransport(broker)
+    client = InMemoryTransport(broker)
+
+    def on_request(message):
+        server.reply(message, message.body.upper())
+        server.ack(message)
+
+    server.consume("rpc_queue", on_request, durable=False)
+    thread = threading.Thread(target=server.start_consuming)
+    thread.start()
+    try:
+        assert client.call("rpc_queue", "ping", timeout=5) == b"PING"
+    finally:
+        server.stop_consuming()
+        thread.join()
+
+
+def test_call_without_consumer_raises():
+    with pytest.raises(NoConsumerError):
+        InMemoryTransport().call("rpc_queue", "ping", timeout=1)
+
+
+def test_call_times_out_without_reply():
+    transport = InMemoryTransport()
+    transport.consume("rpc_queue", lambda message: None)
+
+    with pytest.raises(RPCTimeoutError):
+        transport.call("rpc_queue", "ping", timeout=0.1)
+
+
+def serve(transport, on_request):
+    transport.consume("rpc_queue", on_request, prefetch_count=100, durable=False)
+    thread = threading.Thread(target=transport.start_consuming)
+    thread.start()
+    return thread
+
+
+def test_rpc_client_multiplexes_concurrent_calls_over_one_reply_queue():
+    broker = InMemoryBroker()
+    server = InMemoryTransport(broker)
+    client = RpcClient(InMemoryTransport(broker))
+    requests = []
+
+    def on_request(message):
+        server.ack(message)
+        requests.append(message)
+        # Replies out of order, once all the calls are in flight
+        if len(requests) == 8:
+            for request in reversed(requests):
+                server.reply(request, request.body.upper())
+
+    thread = serve(server, on_request)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            replies = list(executor.map(lambda index: client.call("rpc_queue", f"ping {index}", 5), range(8)))
+    finally:
+        server.stop_consuming()
+        thread.join()
+        client.close()
+
+    assert replies == [f"PING {index}".encode() for index in range(8)]
+    assert len({request.reply_to for request in requests}) == 1
+    assert client.in_flight() == 0
+
+
+def test_rpc_client_drops_the_replies_arriving_after_the_timeout():
+    broker = InMemoryBroker()
+    server = InMemoryTransport(broker)
+    client = RpcClient(InMemoryTransport(broker))
+    requests = []
+
+    def on_request(message):
+        server.ack(message)
+        requests.append(message)
+        if message.body == b"pong":
+            server.reply(message, b"PONG")
+
+    thread = serve(server, on_request)
+    try:
+        with pytest.raises(RPCTimeoutError):
+            client.call("rpc_queue", "ping", timeout=0.1)
+        server.reply(requests[0], b"late")
+        assert client.call("rpc_queue", "pong", timeout=5) == b"PONG"
+        assert client.in_flight() == 0
+    finally:
+        server.stop_consuming()
+        thread.join()
+        client.close()
+
+
+def test_rpc_client_fails_the_pending_calls_when_the_replies_stop():
+    broker = InMemoryBroker()
+    server = InMemoryTransport(broker)
+    client_transport = InMemoryTransport(broker)
+    client = RpcClient(client_transport)
+    requests = []
+
+    def on_request(message):
+        server.ack(message)
+        requests.append(message)
+        if message.body == b"stop":
+            client_transport.stop_consuming()
+        else:
+            server.reply(message, b"ok")
+
+    thread = serve(server, on_request)
+    try:
+        assert client.call("rpc_queue", "start", timeout=5) == b"ok"
+        with pytest.raises(TransportError):
+            client.call("rpc_queue", "stop", timeout=5)
+        # The next call consumes the replies again
+        assert client.call("rpc_queue", "again", timeout=5) == b"ok"
+    finally:
+        server.stop_consuming()
+        thread.join()
+        client.close()
+
+
+def test_rpc_client_call_without_consumer_raises():
+    with pytest.raises(NoConsumerError):
+        RpcClient(InMemoryTransport()).call("rpc_queue", "ping", timeout=1)
+
+
+class FakeChannel:
+    """
+    A pika channel of ``FakeConnection``: the requests published to ``rpc_queue`` are answered at
+    once, and a passive declaration of a missing queue closes the channel like RabbitMQ does.
+    """
+
+    def __init__(self, queues):
+        self.queues = queues
+        self.is_closed = False
+        self.consumers = []
+
+    def check_open(self):
+        if self.is_closed:
+            raise pika.exceptions.ChannelWrongStateError("Channel is closed.")
+
+    def queue_declare(self, queue, passive=False, durable=False, exclusive=False):
+        self.check_open()
+        if passive and queue not in self.queues:
+            self.is_closed = True
+            raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue}'")
+        queue = queue or f"amq.gen-{len(self.queues)}"
+        self.queues.setdefault(queue, Queue())
+        return Mock(method=Mock(queue=queue, consumer_count=1))
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.check_open()
+        if routing_key == "rpc_queue":
+            self.queues[properties.reply_to].put((properties.correlation_id, b"pong"))
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False):
+        self.consumers.append((queue, on_message_callback))
+
+    def start_consuming(self):
+        queue_name, on_message_callback = self.consumers[0]
+        while True:
+            correlation_id, body = self.queues[queue_name].get()
+            if correlation_id is None:
+                return
+            on_message_callback(self, Mock(delivery_tag=1), Mock(correlation_id=correlation_id), body)
+
+    def stop_consuming(self):
+        for queue_name, _ in self.consumers:
+            self.queues[queue_name].put((None, None))
+
+
+class FakeConnection:
+    def __init__(self, queues):
+        self.queues = queues
+        self.is_closed = False
+
+    @property
+    def is_open(self):
+        return not self.is_closed
+
+    def channel(self):
+        return FakeChannel(self.queues)
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+    def close(self):
+        self.is_closed = True
+
+
+def test_rpc_client_calls_again_once_the_missing_queue_closed_the_channel():
+    queues = {"rpc_queue": Queue()}
+    with patch.object(pika, "BlockingConnection", side_effect=lambda parameters: FakeConnection(queues)):
+        client = RpcClient(RabbitMQTransport("localhost", "guest", "guest"))
+        try:
+            with pytest.raises(NoConsumerError):
+                client.call("missing_queue", "ping", timeout=1)
+
+            assert client.call("rpc_queue", "ping", timeout=1) == b"pong"
+            assert client.call("rpc_queue", "ping", timeout=1) == b"pong"
+        finally:
+            client.close()
+
+
+def test_a_channel_closed_by_the_broker_is_reopened_on_the_same_connection():
+    queues = {"rpc_queue": Queue()}
+    connections = []
+
+    def connect(parameters):
+        connections.append(FakeConnection(queues))
+        return connections[-1]
+
+    with patch.object(pika, "BlockingConnection", side_effect=connect):
+        transport = RabbitMQTransport("localhost", "guest", "guest")
+        with pytest.raises(pika.exceptions.ChannelClosedByBroker):
+            transport.consumer_count("missing_queue")
+
+        assert transport.consumer_count("rpc_queue") == 1
+        transport.declare_queue("other_queue")
+        assert "other_queue" in queues
+        assert len(connections) == 1
@@ -0,0 +1,340 @@
+import json
+import logging
+import threading
+import time
+from unittest.mock import MagicMock, Mock, patch
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import stream_event_logger_service
+from database.db import MonitoredGateways
+from dependencies.cluster import ClusterMembership, partition_of
+from dependencies.event_filter import EventFilter
+from dependencies.transport import InMemoryBroker, InMemoryTransport
+from stream_event_logger_service import MessageSubscriptor, StreamEventLogger
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def subscriptors():
+    """Replaces the event stream threads with mocks, keyed by gateway id."""
+    created = {}
+
+    def create(logger, gateway_id, *args):
+        created[gateway_id] = Mock(gateway_id=gateway_id, **{"is_alive.return_value": False})
+        return created[gateway_id]
+
+    with patch.object(stream_event_logger_service, "MessageSubscriptor", side_effect=create):
+        yield created
+
+
+def create_service(engine):
+    return StreamEventLogger(
+        logging.getLogger("test_stream_event_logger"),
+        "guest",
+        "guest",
+        "localhost",
+        "control_gateways_queue",
+        "stream_event_queue",
+        "stream_event_queue",
+        engine,
+        InMemoryTransport(),
+    )
+
+
+def monitored_gateway_ids(engine):
+    with Session(engine) as session:
+        return sorted(session.exec(select(MonitoredGateways.gateway_id_tti)).all())
+
+
+def test_bulk_start_records_new_gateways_and_starts_their_streams(engine, subscriptors):
+    with Session(engine) as session:
+        session.add(MonitoredGateways(gateway_id_tti="gateway-1"))
+        session.commit()
+    service = create_service(engine)
+
+    service.call(json.dumps({"ids": ["gateway-1", "gateway-2", "gateway-3", "gateway-3"], "command": "start"}))
+
+    assert monitored_gateway_ids(engine) == ["gateway-1", "gateway-2", "gateway-3"]
+    assert sorted(subscriptors) == ["gateway-2", "gateway-3"]
+    assert all(subscriptor.start.call_count == 1 for subscriptor in subscriptors.values())
+    assert [thread.gateway_id for thread in service.all_monitored_gws] == ["gateway-2", "gateway-3"]
+
+
+def test_bulk_stop_removes_gateways_and_stops_their_streams(engine, subscriptors):
+    service = create_service(engine)
+    service.call(json.dumps({"ids": ["gateway-1", "gateway-2", "gateway-3"], "command": "start"}))
+
+    service.call(json.dumps({"ids": ["gateway-1", "gateway-3", "gateway-4"], "command": "stop"}))
+
+    assert monitored_gateway_ids(engine) == ["gateway-2"]
+    assert subscriptors["gateway-1"].stop.called and subscriptors["gateway-3"].stop.called
+    assert not subscriptors["gateway-2"].stop.called
+    assert [thread.gateway_id for thread in service.all_monitored_gws] == ["gateway-2"]
+
+
+def test_single_gateway_commands(engine, subscriptors):
+    service = create_service(engine)
+
+    service.call(json.dumps({"id": "gateway-1", "command": "start"}))
+    assert monitored_gateway_ids(engine) == ["gateway-1"]
+
+    service.call(json.dumps({"id": "gateway-1", "command": "stop"}))
+    assert monitored_gateway_ids(engine) == []
+    assert subscriptors["gateway-1"].stop.called
+    assert service.all_monitored_gws == []
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def create_cluster_service(engine, broker, instance_id, clock):
+    return StreamEventLogger(
+        logging.getLogger("test_stream_event_logger"),
+        "guest",
+        "guest",
+        "localhost",
+        "control_gateways_queue",
+        "stream_event_queue",
+        "stream_event_queue",
+        engine,
+        InMemoryTransport(broker),
+        cluster=ClusterMembership(engine, "stream_event_logger", instance_id, member_timeout=15, clock=clock),
+        lease_ttl=20,
+    )
+
+
+def running(service):
+    return {thread.gateway_id for thread in service.all_monitored_gws}
+
+
+def test_cluster_spreads_the_gateways_and_rebalances_when_an_instance_dies(engine, subscriptors):
+    broker, clock = InMemoryBroker(), Clock()
+    first = create_cluster_service(engine, broker, "instance-1", clock)
+    second = create_cluster_service(engine, broker, "instance-2", clock)
+    gateway_ids = [f"gateway-{index}" for index in range(40)]
+    first.rebalance()
+    second.rebalance()
+
+    first.call(json.dumps({"ids": gateway_ids, "command": "start"}))
+    first.rebalance()
+    second.rebalance()
+
+    # Every gateway is streamed once, by its owner
+    assert running(first) and running(second)
+    assert running(first) | running(second) == set(gateway_ids)
+    assert not running(first) & running(second)
+
+    # instance-2 stops heartbeating: its gateways move once its leases expire
+    clock.now += 16
+    first.rebalance()
+    assert running(first) != set(gateway_ids)
+    clock.now += 5
+    first.rebalance()
+    assert running(first) == set(gateway_ids)
+
+
+def test_cluster_routes_the_commands_to_the_owning_instance(engine, subscriptors):
+    broker, clock = InMemoryBroker(), Clock()
+    first = create_cluster_service(engine, broker, "instance-1", clock)
+    second = create_cluster_service(engine, broker, "instance-2", clock)
+    second.transport.consume(second.instance_queue("instance-2"), second.callback, durable=False)
+    second.rebalance()
+    first.rebalance()
+    gateway_id = next(f"gateway-{index}" for index in range(100) if first.ring.owner(f"gateway-{index}") == "instance-2")
+
+    first.call(json.dumps({"id": gateway_id, "command": "start"}))
+    assert monitored_gateway_ids(engine) == [gateway_id]
+    assert running(first) == set()
+    threads = threading.active_count()
+    # The callback applies the command on a thread of its own
+    second.transport.process_pending()
+    wait_for(lambda: threading.active_count() == threads)
+    assert running(second) == {gateway_id}
+
+    first.call(json.dumps({"id": gateway_id, "command": "stop"}))
+    second.transport.process_pending()
+    wait_for(lambda: threading.active_count() == threads)
+    assert running(second) == set()
+    assert monitored_gateway_ids(engine) == []
+    assert subscriptors[gateway_id].stop.called
+
+
+def test_a_lease_is_released_once_the_stopped_stream_exited(engine, subscriptors):
+    broker, clock = InMemoryBroker(), Clock()
+    first = create_cluster_service(engine, broker, "instance-1", clock)
+    second = create_cluster_service(engine, broker, "instance-2", clock)
+    gateway_ids = [f"gateway-{index}" for index in range(20)]
+    first.rebalance()
+    first.call(json.dumps({"ids": gateway_ids, "command": "start"}))
+    second.rebalance()
+    moved = {gateway_id for gateway_id in gateway_ids if second.ring.owner(gateway_id) == "instance-2"}
+    assert moved and running(second) == set()
+    # The streams given up are still waiting for their next line
+    for gateway_id in moved:
+        subscriptors[gateway_id].is_alive.return_value = True
+
+    first.rebalance()
+    assert running(first) == set(gateway_ids) - moved
+    assert all(subscriptors[gateway_id].stop.called for gateway_id in moved)
+    # The leases are kept and renewed while the threads run
+    for _ in range(2):
+        clock.now += 15
+        first.rebalance()
+        second.rebalance()
+    assert running(second) == set()
+
+    for gateway_id in moved:
+        subscriptors[gateway_id].is_alive.return_value = False
+    first.rebalance()
+    second.rebalance()
+    assert running(second) == moved
+    assert first.stopping_gws == []
+
+
+def test_a_lost_gateway_is_streamed_again_once_its_stopped_stream_exited(engine, subscriptors):
+    broker, clock = InMemoryBroker(), Clock()
+    first = create_cluster_service(engine, broker, "instance-1", clock)
+    second = create_cluster_service(engine, broker, "instance-2", clock)
+    gateway_ids = [f"gateway-{index}" for index in range(20)]
+    first.rebalance()
+    first.call(json.dumps({"ids": gateway_ids, "command": "start"}))
+    # The streams of instance-1 are waiting for their next line
+    first_streams = list(first.all_monitored_gws)
+    for stream in first_streams:
+        stream.is_alive.return_value = True
+
+    # instance-1 pauses: its leases expire and instance-2 takes every gateway
+    clock.now += 21
+    second.rebalance()
+    assert running(second) == set(gateway_ids)
+    first.rebalance()
+    assert running(first) == set()
+    assert all(stream.stop.called for stream in first_streams)
+    owned = {gateway_id for gateway_id in gateway_ids if first.ring.owner(gateway_id) == "instance-1"}
+    assert owned
+
+    # instance-2 gives the gateways of instance-1 back, they wait for the old streams to exit
+    second.rebalance()
+    assert running(second) == set(gateway_ids) - owned
+    first.rebalance()
+    assert running(first) == set()
+
+    for stream in first_streams:
+        stream.is_alive.return_value = False
+    first.rebalance()
+    assert running(first) == owned
+    assert first.stopping_gws == []
+
+
+def test_a_line_read_after_the_stream_stopped_is_not_published():
+    broker = InMemoryBroker()
+    subscriptor = MessageSubscriptor(
+        logging.getLogger("test_stream_event_logger"), "gateway-1", "guest", "guest", "localhost",
+        "stream_event_queue", "stream_event_queue", InMemoryTransport(broker),
+    )
+    reading, line_received = threading.Event(), threading.Event()
+
+    def readline():
+        reading.set()
+        line_received.wait(5)
+        return json.dumps({"result": {"name": "gs.up.receive"}}).encode("utf-8")
+
+    response = MagicMock(**{"readline.side_effect": readline})
+    response.__enter__.return_value = response
+    with patch.object(stream_event_logger_service, "tti_event_url", "http://localhost/api/v3/events"), \
+            patch.object(stream_event_logger_service.urllib.request, "urlopen", return_value=response):
+        subscriptor.start()
+        assert reading.wait(5)
+        subscriptor.stop()
+        line_received.set()
+        subscriptor.join(5)
+
+    assert not subscriptor.is_alive()
+    assert broker.get_queue("stream_event_queue").empty()
+
+
+def test_partitioned_events_go_to_the_queue_of_the_gateway_partition():
+    broker = InMemoryBroker()
+    gateway_ids = [f"gateway-{index}" for index in range(20)]
+    for gateway_id in gateway_ids:
+        subscriptor = MessageSubscriptor(
+            logging.getLogger("test_stream_event_logger"), gateway_id, "guest", "guest", "localhost",
+            "stream_event_queue", "stream_event_queue", InMemoryTransport(broker), partitions=4,
+        )
+        subscriptor.send_data(f"event of {gateway_id}")
+
+    assert broker.queue_size("stream_event_queue") == 0
+    for partition in range(4):
+        expected = [gateway_id for gateway_id in gateway_ids if partition_of(gateway_id, 4) == partition]
+        assert broker.queue_size(f"stream_event_queue.{partition}") == len(expected)
+
+
+def test_filtered_lines_are_not_published():
+    broker = InMemoryBroker()
+    subscriptor = MessageSubscriptor(
+        logging.getLogger("test_stream_event_logger"), "gateway-1", "guest", "guest", "localhost",
+        "stream_event_queue", "stream_event_queue", InMemoryTransport(broker),
+        event_filter=EventFilter(names=["gs.up.receive"], fields=["name"]),
+    )
+
+    for line in ["\n", '{"result": {"name": "gs.txack.receive"}}\n', '{"result": {"name": "gs.up.receive", "data": {}}}\n']:
+        subscriptor.forward(line)
+
+    assert broker.queue_size("stream_event_queue") == 1
+    body = broker.get_queue("stream_event_queue").get_nowait().body
+    assert json.loads(json.loads(body)) == {"result": {"name": "gs.up.receive"}}
+
+
+def test_events_are_published_to_the_queue_of_their_lane():
+    broker = InMemoryBroker()
+    subscriptor = MessageSubscriptor(
+        logging.getLogger("test_stream_event_logger"), "gateway-1", "guest", "guest", "localhost",
+        "stream_event_queue", "stream_event_queue", InMemoryTransport(broker), 4, None,
+        {"gs.status.receive": "health", "gs.up.receive": "uplink"},
+    )
+    partition = partition_of("gateway-1", 4)
+
+    for name in ("gs.status.receive", "gs.up.receive", "gs.up.receive", "gs.down.send"):
+        subscriptor.forward(json.dumps({"result": {"name": name}}) + "\n")
+
+    assert broker.queue_size(f"stream_event_queue.health.{partition}") == 1
+    assert broker.queue_size(f"stream_event_queue.uplink.{partition}") == 2
+    assert broker.queue_size(f"stream_event_queue.{partition}") == 1
+    message = broker.get_queue(f"stream_event_queue.health.{partition}").get_nowait()
+    assert message.headers["event_name"] == "gs.status.receive"
+    assert message.headers["published_at"] > 0
+    assert "tenant_id" not in message.headers
+
+
+def test_the_tenant_of_the_events_is_sent_in_their_headers():
+    broker = InMemoryBroker()
+    subscriptor = MessageSubscriptor(
+        logging.getLogger("test_stream_event_logger"), "gateway-1", "guest", "guest", "localhost",
+        "stream_event_queue", "stream_event_queue", InMemoryTransport(broker), event_filter=EventFilter(),
+    )
+
+    subscriptor.forward(json.dumps({"result": {"name": "gs.up.receive", "context": {"tenant-id": "tenant-1"}}}))
+
+    assert broker.get_queue("stream_event_queue").get_nowait().headers["tenant_id"] == "tenant-1"
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
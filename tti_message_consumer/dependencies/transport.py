@@ -0,0 +1,603 @@
+"""
+Message transport shared by the services.
+
+The services only need a handful of broker primitives: publish a message to a queue, consume a
+queue, acknowledge a delivery and make a request/reply call. ``Transport`` defines these
+primitives and two implementations are provided:
+
+* ``RabbitMQTransport`` talks to RabbitMQ through pika and is what the services use in production.
+* ``InMemoryTransport`` keeps the queues in process. Transports attached to the same
+  ``InMemoryBroker`` see the same queues, so a whole pipeline (logger -> consumer -> DB) can run in
+  a single process for tests, profiling and end-to-end throughput measurements.
+
+``RpcClient`` multiplexes the request/reply calls of many threads over one reply queue of a
+transport.
+"""
+import itertools
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional
+
+import pika
+
+
+class TransportError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class NoConsumerError(TransportError):
+    def __init__(self, queue_name):
+        super().__init__(f"No consumer available on queue {queue_name}")
+
+
+class RPCTimeoutError(TransportError):
+    def __init__(self, queue_name, timeout):
+        super().__init__(f"Timeout after {timeout}s waiting for a reply from queue {queue_name}")
+
+
+class Message:
+    """A message delivered to a consumer, independent of the transport that delivered it."""
+
+    def __init__(
+            self,
+            body: bytes,
+            queue_name: Optional[str] = None,
+            delivery_tag=None,
+            correlation_id: Optional[str] = None,
+            reply_to: Optional[str] = None,
+            headers: Optional[dict] = None,
+    ):
+        self.body = body
+        self.queue_name = queue_name
+        self.delivery_tag = delivery_tag
+        self.correlation_id = correlation_id
+        self.reply_to = reply_to
+        self.headers = headers or {}
+
+
+def to_bytes(body) -> bytes:
+    return body if isinstance(body, bytes) else str(body).encode("utf-8")
+
+
+class Transport:
+    """Publish/consume/ack/RPC primitives used by the services."""
+
+    def declare_queue(self, queue_name: str, durable: bool = True) -> None:
+        raise NotImplementedError
+
+    def publish(
+            self,
+            queue_name: str,
+            body,
+            correlation_id: Optional[str] = None,
+            reply_to: Optional[str] = None,
+            headers: Optional[dict] = None,
+            persistent: bool = True,
+    ) -> None:
+        raise NotImplementedError
+
+    def consume(
+            self,
+            queue_name: str,
+            on_message: Callable[[Message], None],
+            prefetch_count: int = 1,
+            durable: bool = True,
+    ) -> None:
+        """Registers ``on_message`` for the queue; deliveries start with ``start_consuming``."""
+        raise NotImplementedError
+
+    def cancel(self, queue_name: str) -> None:
+        """
+        Stops the deliveries of a queue registered with ``consume``. The messages already delivered
+        can still be acknowledged.
+        """
+        raise NotImplementedError
+
+    def run_threadsafe(self, func: Callable[[], None]) -> None:
+        """Runs ``func`` on the consuming thread, e.g. to ``consume`` or ``cancel`` from another thread."""
+        func()
+
+    def ack(self, message: Message) -> None:
+        raise NotImplementedError
+
+    def start_consuming(self) -> None:
+        """Dispatches deliveries to the registered callbacks until ``stop_consuming`` is called."""
+        raise NotImplementedError
+
+    def stop_consuming(self) -> None:
+        raise NotImplementedError
+
+    def consumer_count(self, queue_name: str) -> int:
+        raise NotImplementedError
+
+    def reset_publisher(self) -> None:
+        """
+        Drops the publishing connection of the calling thread, which the next publication opens
+        again, e.g. once the broker closed its channel.
+        """
+
+    def call(self, queue_name: str, body, timeout: float) -> bytes:
+        """Sends a request to ``queue_name`` and blocks until the reply arrives."""
+        raise NotImplementedError
+
+    def consume_replies(self, on_message: Callable[[Message], None]) -> str:
+        """
+        Declares an exclusive reply queue, deleted with the consuming connection, registers
+        ``on_message`` for it without acknowledgements and returns its name.
+        """
+        raise NotImplementedError
+
+    def reply(self, message: Message, body) -> None:
+        """Sends ``body`` as the reply to a request received through ``consume``."""
+        self.publish(message.reply_to, body, correlation_id=message.correlation_id, persistent=False)
+
+    def close(self) -> None:
+        pass
+
+
+class RabbitMQTransport(Transport):
+    """
+    RabbitMQ transport over pika blocking connections.
+
+    Connections are opened lazily. Publishing and RPC calls use one long-lived connection per
+    thread, since pika connections must not be shared between threads; consuming uses a dedicated
+    connection driven by ``start_consuming``. Acknowledgements and replies issued from worker
+    threads are handed over to the consuming connection thread safely.
+    """
+
+    def __init__(self, host, username, password, port=None, logger=None):
+        self.parameters = pika.ConnectionParameters(
+            host=host,
+            port=int(port) if port else pika.ConnectionParameters.DEFAULT_PORT,
+            credentials=pika.PlainCredentials(username=username, password=password),
+        )
+        self.logger = logger
+        self.local = threading.local()
+        self.consumer_connection = None
+        self.consumer_channel = None
+        self.consumer_thread_id = None
+        self.consumer_tags: Dict[str, str] = {}
+
+    def _publisher(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None or connection.is_closed:
+            connection = pika.BlockingConnection(self.parameters)
+            self.local.connection = connection
+            self.local.channel = None
+            self.local.declared = set()
+        if self.local.channel is None or self.local.channel.is_closed:
+            # A channel error closes the channel only, e.g. a passive declaration of a missing queue
+            self.local.channel = connection.channel()
+            self.local.reply_queue = None
+        return self.local.channel
+
+    def reset_publisher(self) -> None:
+        connection = getattr(self.local, "connection", None)
+        self.local.connection = None
+        # The reply queue of ``call`` is consumed on that connection
+        self.local.reply_queue = None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def declare_queue(self, queue_name: str, durable: bool = True) -> None:
+        channel = self._publisher()
+        if queue_name not in self.local.declared:
+            channel.queue_declare(queue=queue_name, durable=durable)
+            self.local.declared.add(queue_name)
+
+    def publish(self, queue_name, body, correlation_id=None, reply_to=None, headers=None, persistent=True):
+        properties = pika.BasicProperties(
+            delivery_mode=2 if persistent else None,
+            correlation_id=correlation_id,
+            reply_to=reply_to,
+            headers=headers,
+        )
+        if self._in_consumer_thread():
+            self.consumer_channel.basic_publish(
+                exchange="", routing_key=queue_name, body=to_bytes(body), properties=properties
+            )
+            return
+        # A long-lived connection may have been dropped by the broker; retry once on a new one.
+        for attempt in range(2):
+            try:
+                self._publisher().basic_publish(
+                    exchange="", routing_key=queue_name, body=to_bytes(body), properties=properties
+                )
+                return
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError):
+                self.reset_publisher()
+                if attempt:
+                    raise
+
+    def _in_consumer_thread(self) -> bool:
+        return self.consumer_thread_id == threading.get_ident()
+
+    def _consumer(self):
+        if self.consumer_connection is None or self.consumer_connection.is_closed:
+            self.consumer_connection = pika.BlockingConnection(self.parameters)
+            self.consumer_channel = self.consumer_connection.channel()
+        return self.consumer_channel
+
+    def consume(self, queue_name, on_message, prefetch_count=1, durable=True):
+        channel = self._consumer()
+        channel.queue_declare(queue=queue_name, durable=durable)
+        channel.basic_qos(prefetch_count=prefetch_count)
+
+        def on_delivery(ch, method, properties, body):
+            on_message(
+                Message(
+                    body=body,
+                    queue_name=queue_name,
+                    delivery_tag=method.delivery_tag,
+                    correlation_id=properties.correlation_id,
+                    reply_to=properties.reply_to,
+                    headers=properties.headers,
+                )
+            )
+
+        self.consumer_tags[queue_name] = channel.basic_consume(queue=queue_name, on_message_callback=on_delivery)
+
+    def cancel(self, queue_name: str) -> None:
+        consumer_tag = self.consumer_tags.pop(queue_name, None)
+        if consumer_tag is not None:
+            self._consumer().basic_cancel(consumer_tag)
+
+    def consume_replies(self, on_message):
+        channel = self._consumer()
+        queue_name = channel.queue_declare(queue="", exclusive=True).method.queue
+
+        def on_delivery(ch, method, properties, body):
+            on_message(Message(body=body, queue_name=queue_name, correlation_id=properties.correlation_id))
+
+        channel.basic_consume(queue=queue_name, on_message_callback=on_delivery, auto_ack=True)
+        return queue_name
+
+    def _run_in_consumer_thread(self, func: Callable[[], None]) -> None:
+        if self._in_consumer_thread():
+            func()
+        else:
+            self.consumer_connection.add_callback_threadsafe(func)
+
+    def run_threadsafe(self, func: Callable[[], None]) -> None:
+        if self.consumer_connection is None or self.consumer_thread_id is None:
+            # Not consuming yet
+            func()
+        else:
+            self._run_in_consumer_thread(func)
+
+    def ack(self, message: Message) -> None:
+        channel = self.consumer_channel
+        self._run_in_consumer_thread(lambda: channel.basic_ack(delivery_tag=message.delivery_tag))
+
+    def reply(self, message: Message, body) -> None:
+        channel = self.consumer_channel
+        properties = pika.BasicProperties(correlation_id=message.correlation_id)
+        self._run_in_consumer_thread(
+            lambda: channel.basic_publish(
+                exchange="", routing_key=message.reply_to, body=to_bytes(body), properties=properties
+            )
+        )
+
+    def start_consuming(self) -> None:
+        self.consumer_thread_id = threading.get_ident()
+        self._consumer().start_consuming()
+
+    def stop_consuming(self) -> None:
+        if self.consumer_connection is not None and self.consumer_connection.is_open:
+            self._run_in_consumer_thread(self.consumer_channel.stop_consuming)
+
+    def consumer_count(self, queue_name: str) -> int:
+        state = self._publisher().queue_declare(queue=queue_name, passive=True)
+        return state.method.consumer_count
+
+    def _rpc_channel(self):
+        channel = self._publisher()
+        if getattr(self.local, "reply_queue", None) is None:
+            result = channel.queue_declare(queue="", exclusive=True)
+            self.local.reply_queue = result.method.queue
+            self.local.replies = {}
+
+            def on_reply(ch, method, properties, body):
+                self.local.replies[properties.correlation_id] = body
+
+            channel.basic_consume(
+                queue=self.local.reply_queue, on_message_callback=on_reply, auto_ack=True
+            )
+        return channel
+
+    def call(self, queue_name: str, body, timeout: float) -> bytes:
+        try:
+            if self.consumer_count(queue_name) == 0:
+                raise NoConsumerError(queue_name)
+        except NoConsumerError:
+            raise
+        except Exception as e:
+            self.reset_publisher()
+            raise NoConsumerError(queue_name) from e
+
+        self._rpc_channel()
+        correlation_id = str(uuid.uuid4())
+        self.local.channel.basic_publish(
+            exchange="",
+            routing_key=queue_name,
+            body=to_bytes(body),
+            properties=pika.BasicProperties(
+                reply_to=self.local.reply_queue, correlation_id=correlation_id
+            ),
+        )
+        deadline = time.monotonic() + timeout
+        while correlation_id not in self.local.replies:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RPCTimeoutError(queue_name, timeout)
+            self.local.connection.process_data_events(time_limit=min(remaining, 1))
+        return self.local.replies.pop(correlation_id)
+
+    def close(self) -> None:
+        self.reset_publisher()
+        if self.consumer_connection is not None and self.consumer_connection.is_open:
+            self.consumer_connection.close()
+
+
+class InMemoryBroker:
+    """Process-local queues shared by all the ``InMemoryTransport`` instances attached to it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.queues: Dict[str, queue.Queue] = {}
+        self.consumers: Dict[str, int] = {}
+        self.published = 0
+
+    def get_queue(self, queue_name: str) -> queue.Queue:
+        with self.lock:
+            return self._get_queue(queue_name)
+
+    def _get_queue(self, queue_name: str) -> queue.Queue:
+        if queue_name not in self.queues:
+            self.queues[queue_name] = queue.Queue()
+        return self.queues[queue_name]
+
+    def put(self, queue_name: str, message: Message) -> None:
+        with self.condition:
+            self._get_queue(queue_name).put(message)
+            self.published += 1
+            self.condition.notify_all()
+
+    def queue_size(self, queue_name: str) -> int:
+        return self.get_queue(queue_name).qsize()
+
+
+class InMemoryTransport(Transport):
+    """
+    In-process transport. Deliveries are dispatched on the thread that calls
+    ``start_consuming`` (or ``process_pending``), like pika's blocking connection does.
+    """
+
+    def __init__(self, broker: Optional[InMemoryBroker] = None):
+        self.broker = broker or InMemoryBroker()
+        self.subscriptions: List[tuple] = []
+        self.unacked: Dict[str, int] = {}
+        self.delivery_tags = itertools.count(1)
+        self.lock = threading.Lock()
+        self.should_run = False
+
+    def declare_queue(self, queue_name: str, durable: bool = True) -> None:
+        self.broker.get_queue(queue_name)
+
+    def publish(self, queue_name, body, correlation_id=None, reply_to=None, headers=None, persistent=True):
+        message = Message(
+            body=to_bytes(body),
+            queue_name=queue_name,
+            correlation_id=correlation_id,
+            reply_to=reply_to,
+            headers=dict(headers) if headers else None,
+        )
+        self.broker.put(queue_name, message)
+
+    def consume(self, queue_name, on_message, prefetch_count=1, durable=True):
+        self.declare_queue(queue_name)
+        with self.broker.lock:
+            self.broker.consumers[queue_name] = self.broker.consumers.get(queue_name, 0) + 1
+        self.subscriptions = self.subscriptions + [(queue_name, on_message, prefetch_count)]
+
+    def cancel(self, queue_name: str) -> None:
+        with self.broker.lock:
+            if any(subscription[0] == queue_name for subscription in self.subscriptions):
+                self.broker.consumers[queue_name] -= 1
+        self.subscriptions = [subscription for subscription in self.subscriptions if subscription[0] != queue_name]
+
+    def consume_replies(self, on_message):
+        queue_name = f"amq.gen-{uuid.uuid4()}"
+        self.declare_queue(queue_name)
+        # Without a prefetch count: the replies are not acknowledged
+        self.subscriptions = self.subscriptions + [(queue_name, on_message, None)]
+        return queue_name
+
+    def ack(self, message: Message) -> None:
+        with self.lock:
+            self.unacked[message.queue_name] -= 1
+
+    def _next_delivery(self):
+        for queue_name, on_message, prefetch_count in self.subscriptions:
+            with self.lock:
+                if prefetch_count is not None and self.unacked.get(queue_name, 0) >= prefetch_count:
+                    continue
+            try:
+                message = self.broker.get_queue(queue_name).get_nowait()
+            except queue.Empty:
+                continue
+            if prefetch_count is not None:
+                with self.lock:
+                    self.unacked[queue_name] = self.unacked.get(queue_name, 0) + 1
+            message.delivery_tag = next(self.delivery_tags)
+            return on_message, message
+        return None
+
+    def process_pending(self, max_messages: Optional[int] = None) -> int:
+        """
+        Dispatches the messages that are already queued on the calling thread and returns how
+        many were delivered. Convenient for deterministic tests and benchmarks.
+        """
+        delivered = 0
+        while max_messages is None or delivered < max_messages:
+            delivery = self._next_delivery()
+            if delivery is None:
+                break
+            on_message, message = delivery
+            on_message(message)
+            delivered += 1
+        return delivered
+
+    def start_consuming(self) -> None:
+        self.should_run = True
+        while self.should_run:
+            delivery = self._next_delivery()
+            if delivery is None:
+                with self.broker.condition:
+                    self.broker.condition.wait(timeout=0.1)
+                continue
+            on_message, message = delivery
+            on_message(message)
+
+    def stop_consuming(self) -> None:
+        self.should_run = False
+        with self.broker.condition:
+            self.broker.condition.notify_all()
+
+    def consumer_count(self, queue_name: str) -> int:
+        with self.broker.lock:
+            return self.broker.consumers.get(queue_name, 0)
+
+    def call(self, queue_name: str, body, timeout: float) -> bytes:
+        if self.consumer_count(queue_name) == 0:
+            raise NoConsumerError(queue_name)
+        reply_queue = f"amq.gen-{uuid.uuid4()}"
+        correlation_id = str(uuid.uuid4())
+        self.publish(queue_name, body, correlation_id=correlation_id, reply_to=reply_queue)
+        replies = self.broker.get_queue(reply_queue)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RPCTimeoutError(queue_name, timeout)
+                try:
+                    message = replies.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+                if message.correlation_id == correlation_id:
+                    return message.body
+        finally:
+            with self.broker.lock:
+                self.broker.queues.pop(reply_queue, None)
+
+    def close(self) -> None:
+        self.stop_consuming()
+        with self.broker.lock:
+            for queue_name, _, prefetch_count in self.subscriptions:
+                if prefetch_count is None:
+                    self.broker.queues.pop(queue_name, None)
+                else:
+                    self.broker.consumers[queue_name] -= 1
+        self.subscriptions = []
+
+
+class RpcClient:
+    """
+    Request/reply calls of many threads multiplexed over one reply queue.
+
+    The replies are consumed by a background thread that owns the consuming connection of
+    ``transport``, and handed to the caller waiting on the future of their correlation id; the
+    requests are published from the calling threads. A caller blocks on its future only, until
+    the reply arrives or ``timeout`` expires; a reply arriving after the timeout is dropped. When
+    the consuming connection is lost the pending calls fail with ``TransportError`` and the next
+    call starts consuming again on a new reply queue.
+    """
+
+    def __init__(self, transport: Transport, start_timeout: float = 30):
+        self.transport = transport
+        self.start_timeout = start_timeout
+        self.pending: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.reply_queue: Optional[str] = None
+        self.thread: Optional[threading.Thread] = None
+        self.started: Optional[Future] = None
+
+    def start(self) -> str:
+        """Starts consuming the replies, unless already started, and returns the reply queue."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.started = Future()
+                self.thread = threading.Thread(target=self._consume, name="rpc_client", daemon=True)
+                self.thread.start()
+            started = self.started
+        return started.result(timeout=self.start_timeout)
+
+    def _consume(self) -> None:
+        started = self.started
+        try:
+            self.reply_queue = self.transport.consume_replies(self._on_reply)
+            started.set_result(self.reply_queue)
+            self.transport.start_consuming()
+        except BaseException as e:
+            if not started.done():
+                started.set_exception(e)
+        finally:
+            self.reply_queue = None
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(TransportError("The connection consuming the replies was closed"))
+
+    def _on_reply(self, message: Message) -> None:
+        with self.lock:
+            future = self.pending.pop(message.correlation_id, None)
+        if future is not None and not future.done():
+            future.set_result(message.body)
+
+    def in_flight(self) -> int:
+        return len(self.pending)
+
+    def call(self, queue_name: str, body, timeout: float) -> bytes:
+        """Sends a request to ``queue_name`` and waits for its reply."""
+        try:
+            if self.transport.consumer_count(queue_name) == 0:
+                raise NoConsumerError(queue_name)
+        except NoConsumerError:
+            raise
+        except Exception as e:
+            # The broker closes the channel of a passive declaration of a missing queue
+            self.transport.reset_publisher()
+            raise NoConsumerError(queue_name) from e
+        reply_queue = self.start()
+        correlation_id = str(uuid.uuid4())
+        future = Future()
+        with self.lock:
+            self.pending[correlation_id] = future
+        try:
+            self.transport.publish(
+                queue_name, body, correlation_id=correlation_id, reply_to=reply_queue, persistent=False
+            )
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise RPCTimeoutError(queue_name, timeout)
+        finally:
+            with self.lock:
+                self.pending.pop(correlation_id, None)
+
+    def close(self) -> None:
+        thread = self.thread
+        self.transport.stop_consuming()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.start_timeout)
+        self.transport.close()
@@ -1,7 +1,6 @@
 import concurrent.futures
 import json
 
-import pika
 from sqlmodel import Session
 from sqlmodel import select
 
@@ -10,6 +9,9 @@ from dependencies import utility_functions
 from dependencies.config import logger_config
 from dependencies.config import rabbit_config
 from dependencies.exceptions import RabbitMQConnectionError, RabbitMQConsumingError, DatabaseError, ProcessError
+from dependencies.logging_utils import get_hot_path_logger
+from dependencies.metrics import registry, start_metrics_server, timed
+from dependencies.transport import Message, RabbitMQTransport, Transport
 from tti_message_consumer.database.models import AllRelation
 from tti_message_consumer.database.models import TTIUplinkMessage
 
@@ -23,6 +25,18 @@ num_tx_replica = 3
 num_of_threads = 5
 
 
+MESSAGES_RECEIVED = registry.counter("tti_messages_received", "Application messages taken from the queue")
+MESSAGE_ERRORS = registry.counter(
+    "tti_message_errors", "Application messages that failed, by processing stage", ["stage"]
+)
+PROCESS_MESSAGE_SECONDS = registry.histogram(
+    "tti_message_processing_seconds", "Time to update the device relations of one application message"
+)
+DB_COMMIT_SECONDS = registry.histogram(
+    "tti_message_db_commit_seconds", "Time to add and commit one row, by table", ["table"]
+)
+
+
 class TtiMessageConsumer:
     def __init__(
             self,
@@ -33,55 +47,48 @@ class TtiMessageConsumer:
             queue_name,
             db_engine,
             max_threads,
+            transport: Transport = None,
     ):
         self.logger = logger
-        self.credentials = pika.PlainCredentials(username=rabbit_username, password=rabbit_password)
-        self.parameters = pika.ConnectionParameters(
-            host=rabbit_host,
-            credentials=self.credentials,
+        self.hot_logger = get_hot_path_logger(logger)
+        self.transport = transport or RabbitMQTransport(
+            rabbit_host, rabbit_username, rabbit_password, logger=logger
         )
         self.queue_name = queue_name
         self.db_engine = db_engine
-        self.connection = None
-        self.channel = None
         self.max_threads = max_threads
         self.thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_threads)
 
     def start_consuming(self):
         try:
-            self.connection = pika.BlockingConnection(self.parameters)
-            self.channel = self.connection.channel()
-            self.channel.queue_declare(queue=self.queue_name, durable=True)
-            self.channel.basic_qos(prefetch_count=1)
+            self.transport.consume(
+                self.queue_name, self.on_message_received, prefetch_count=self.max_threads
+            )
         except Exception as e:
             self.logger.error(f"Failed to connect to RabbitMQ: {e}")
             raise RabbitMQConnectionError("Failed to connect to RabbitMQ.") from e
 
         try:
-
-            for _ in range(self.max_threads):
-                self.channel.basic_consume(
-                    queue=self.queue_name, on_message_callback=self.on_message_received
-                )
-            self.channel.start_consuming()
+            self.transport.start_consuming()
         except Exception as e:
             self.logger.error(f"RabbitMQ channel was closed: {repr(e)}")
             raise RabbitMQConsumingError(f"Error starting RabbitMQ consumer: {repr(e)}") from e
 
-    def on_message_received(self, channel, method, properties, body):
+    def on_message_received(self, message: Message):
         # self.logger.debug("Received message from queue")
         try:
-            message = json.loads(body)
-            self.thread_pool.submit(self.process_message, message)
+            MESSAGES_RECEIVED.inc()
+            self.thread_pool.submit(self.process_message, json.loads(message.body))
         except Exception as e:
+            MESSAGE_ERRORS.labels("parse").inc()
             self.logger.error(f"{repr(e)}")
         finally:
-            channel.basic_ack(delivery_tag=method.delivery_tag)
+            self.transport.ack(message)
 
     def get_device_relation(self, dev_addr, gateway_tti_id):
         try:
             with Session(self.db_engine) as session:
-                self.logger.debug(f"update_or_add_end_device_relation")
+                self.hot_logger.debug("update_or_add_end_device_relation")
                 statement = select(AllRelation).where(
                     AllRelation.dev_addr == dev_addr,
                     AllRelation.gateway_tti_id == gateway_tti_id,
@@ -105,7 +112,7 @@ class TtiMessageConsumer:
 
         try:
             with Session(self.db_engine) as session:
-                self.logger.debug(f"update_or_add_end_device_relation")
+                self.hot_logger.debug("update_or_add_end_device_relation")
                 existing_metadata = self.get_device_relation(dev_addr, gateway_tti_id)
                 if not existing_metadata:
                     self.store_data(AllRelation(**end_device_relation))
@@ -126,6 +133,7 @@ class TtiMessageConsumer:
             raise DatabaseError("update_or_add_end_device_relation ",
                                 f"Error in update_or_add_end_device_relation: {str(e)}")
 
+    @timed(PROCESS_MESSAGE_SECONDS)
     def process_message(self, message):
         try:
             packet_rx_data = TTIUplinkMessage.from_json(message)
@@ -138,8 +146,10 @@ class TtiMessageConsumer:
                     packet_rx_data.application_id,
                 )
         except DatabaseError:
+            MESSAGE_ERRORS.labels("database").inc()
             raise
         except Exception as e:
+            MESSAGE_ERRORS.labels("process").inc()
             self.logger.error(f"Failed to parse message in process_message: {str(e)}")
             raise ProcessError(f"Error process_message: {repr(e)}") from e
 
@@ -156,9 +166,10 @@ class TtiMessageConsumer:
         """
         with Session(self.db_engine) as session:
             try:
-                session.add(data)
-                session.commit()
-                self.logger.debug("Data stored successfully in the database.")
+                with DB_COMMIT_SECONDS.labels(type(data).__name__).time():
+                    session.add(data)
+                    session.commit()
+                self.hot_logger.debug("Data stored successfully in the database.")
             except Exception as e:
                 self.logger.error(f"Error storing data in the database store_data: {str(e)}")
                 raise DatabaseError("store_data ",
@@ -166,6 +177,7 @@ class TtiMessageConsumer:
 
 
 def tti_message_consumer():
+    start_metrics_server()
     tti_msg_consumer = TtiMessageConsumer(
         tti_message_logger,
         rabbit_username,
@@ -9,12 +9,20 @@ class LoggerConfig:
         logger_name: str = os.environ.get("LOGGER_NAME", "tti_message_logger"),
         max_bytes: int = int(os.environ.get("MAX_BYTES", "100000")),
         backup_count: int = int(os.environ.get("BACKUP_COUNT", "10")),
+        async_logging: bool = os.environ.get("LOG_ASYNC", "true").lower() in ("1", "true", "yes"),
+        queue_size: int = int(os.environ.get("LOG_QUEUE_SIZE", "10000")),
+        hot_path_sample_every: int = int(os.environ.get("LOG_HOT_PATH_SAMPLE_EVERY", "1")),
+        hot_path_max_per_second: float = float(os.environ.get("LOG_HOT_PATH_MAX_PER_SECOND", "10")),
     ) -> None:
         self.loglevel = loglevel
         self.logfile = logfile
         self.max_bytes = max_bytes
         self.backup_count = backup_count
         self.logger_name = logger_name
+        self.async_logging = async_logging
+        self.queue_size = queue_size
+        self.hot_path_sample_every = hot_path_sample_every
+        self.hot_path_max_per_second = hot_path_max_per_second
 
 
 class RabbitConfig:
@@ -40,13 +48,37 @@ class MqttConfig:
         mqtt_port: str = os.environ.get("MQTT_PORT"),
         mqtt_sensor_data_sub_topic: str = os.environ.get("MQTT_SENSOR_DATA_SUB_TOPIC"),
         mqtt_pass: str = os.environ.get("MQTT_PASS_TTI"),
+        mqtt_connect_workers: int = int(os.environ.get("MQTT_CONNECT_WORKERS", "16")),
     ) -> None:
         self.mqtt_host = mqtt_host
         self.mqtt_port = mqtt_port
         self.mqtt_sensor_data_sub_topic = mqtt_sensor_data_sub_topic
         self.mqtt_pass = mqtt_pass
+        self.mqtt_connect_workers = mqtt_connect_workers
+
+
+class DatabaseConfig:
+    def __init__(
+        self,
+        sql_echo: bool = os.environ.get("SQL_ECHO", "false").lower() in ("1", "true", "yes"),
+        slow_query_ms: float = float(os.environ.get("SLOW_QUERY_MS", "200")),
+    ) -> None:
+        self.sql_echo = sql_echo
+        self.slow_query_ms = slow_query_ms
+
+
+class MetricsConfig:
+    def __init__(
+        self,
+        enabled: bool = os.environ.get("METRICS_ENABLED", "false").lower() in ("1", "true", "yes"),
+        port: int = int(os.environ.get("METRICS_PORT", "9100")),
+    ) -> None:
+        self.enabled = enabled
+        self.port = port
 
 
 logger_config = LoggerConfig()
 rabbit_config = RabbitConfig()
 mqtt_config = MqttConfig()
+database_config = DatabaseConfig()
+metrics_config = MetricsConfig()
@@ -7,6 +7,7 @@ from dependencies import utility_functions
 from dependencies.config import logger_config
 from dependencies.config import mqtt_config
 from dependencies.config import rabbit_config
+from dependencies.metrics import start_metrics_server
 from tti_message_logger_service import TtiMessageLoggerService
 
 
@@ -26,6 +27,7 @@ def main(
         mqtt_user_tail,
 ):
     try:
+        start_metrics_server()
         service = TtiMessageLoggerService(
             logger=service_logger,
             rabbit_username=rabbit_username,
@@ -40,6 +42,7 @@ def main(
             mqtt_port=mqtt_port,
             mqtt_sensor_data_sub_topic=mqtt_sensor_data_sub_topic,
             mqtt_user_tail=mqtt_user_tail,
+            mqtt_connect_workers=mqtt_config.mqtt_connect_workers,
         )
         start_rabbit_thread = threading.Thread(target=service.start_rabbit)
         start_rabbit_thread.start()
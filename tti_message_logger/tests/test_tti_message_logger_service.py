@@ -0,0 +1,110 @@
+import json
+import logging
+from unittest.mock import Mock, patch
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import tti_message_logger_service
+from database.db import MonitoredApplications
+from dependencies.transport import InMemoryTransport
+from tti_message_logger_service import TtiMessageLoggerService
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def message_loggers():
+    """Replaces the MQTT message loggers with mocks, keyed by application id. "unreachable" fails to connect."""
+    created = {}
+
+    def create(logger, application_id, *args):
+        if application_id == "unreachable":
+            raise ConnectionRefusedError("Connection refused")
+        created[application_id] = Mock(application_id=application_id)
+        return created[application_id]
+
+    with patch.object(tti_message_logger_service, "TtiMessageLogger", side_effect=create):
+        yield created
+
+
+def create_service(engine):
+    return TtiMessageLoggerService(
+        logging.getLogger("test_tti_message_logger"),
+        "guest",
+        "guest",
+        "localhost",
+        "control_application_queue",
+        "tti_message_queue",
+        "tti_message_queue",
+        engine,
+        "mqtt_pass",
+        "localhost",
+        "1883",
+        "#",
+        "@tenant",
+        InMemoryTransport(),
+        mqtt_connect_workers=4,
+    )
+
+
+def monitored_application_ids(engine):
+    with Session(engine) as session:
+        return sorted(session.exec(select(MonitoredApplications.application_id)).all())
+
+
+def test_bulk_start_subscribes_to_new_applications(engine, message_loggers):
+    with Session(engine) as session:
+        session.add(MonitoredApplications(application_id="app-1"))
+        session.commit()
+    service = create_service(engine)
+
+    service.call(json.dumps({"ids": ["app-1", "app-2", "unreachable", "app-3"], "command": "start"}))
+
+    # Only the applications that connected are recorded, so a later start retries the others
+    assert monitored_application_ids(engine) == ["app-1", "app-2", "app-3"]
+    assert sorted(message_loggers) == ["app-2", "app-3"]
+    assert all(message_logger.start.call_count == 1 for message_logger in message_loggers.values())
+    assert sorted(item.application_id for item in service.all_monitored_applications) == ["app-2", "app-3"]
+
+
+def test_bulk_stop_removes_applications_and_stops_their_subscriptions(engine, message_loggers):
+    service = create_service(engine)
+    service.call(json.dumps({"ids": ["app-1", "app-2", "app-3"], "command": "start"}))
+
+    service.call(json.dumps({"ids": ["app-1", "app-3", "app-4"], "command": "stop"}))
+
+    assert monitored_application_ids(engine) == ["app-2"]
+    assert message_loggers["app-1"].stop.called and message_loggers["app-3"].stop.called
+    assert not message_loggers["app-2"].stop.called
+    assert [item.application_id for item in service.all_monitored_applications] == ["app-2"]
+
+
+def test_single_application_commands(engine, message_loggers):
+    service = create_service(engine)
+
+    service.call(json.dumps({"id": "app-1", "command": "start"}))
+    assert monitored_application_ids(engine) == ["app-1"]
+
+    service.call(json.dumps({"id": "app-1", "command": "stop"}))
+    assert monitored_application_ids(engine) == []
+    assert service.all_monitored_applications == []
+
+
+def test_init_start_monitoring_restarts_the_recorded_applications(engine, message_loggers):
+    with Session(engine) as session:
+        session.add_all([MonitoredApplications(application_id="app-1"), MonitoredApplications(application_id="app-2")])
+        session.commit()
+    service = create_service(engine)
+
+    service.init_start_monitoring()
+
+    assert sorted(message_loggers) == ["app-1", "app-2"]
+    assert len(service.all_monitored_applications) == 2
@@ -3,15 +3,31 @@ import re
 import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 import paho.mqtt.client as mqtt
-import pika
+from sqlalchemy import delete
 from sqlmodel import Session
 from sqlmodel import select
 
 from database.db import MonitoredApplications
-from dependencies.exceptions import RabbitMQConnectionError, RabbitMQConsumingError, DatabaseError, \
-    TTIMessageLoggerError
+from dependencies.exceptions import RabbitMQConnectionError, RabbitMQConsumingError, DatabaseError
+from dependencies.logging_utils import get_hot_path_logger
+from dependencies.metrics import registry, timed
+from dependencies.transport import Message, RabbitMQTransport, Transport
+
+MESSAGES_RECEIVED = registry.counter(
+    "tti_mqtt_messages_received", "Application messages received over MQTT, by topic", ["topic"]
+)
+MESSAGE_ERRORS = registry.counter(
+    "tti_mqtt_message_errors", "Application messages that failed, by processing stage", ["stage"]
+)
+ON_MESSAGE_SECONDS = registry.histogram(
+    "tti_mqtt_message_handling_seconds", "Time to parse and publish one MQTT message"
+)
+PUBLISH_SECONDS = registry.histogram("tti_message_publish_seconds", "Time to publish one application message")
+MONITORED_APPLICATIONS = registry.gauge("monitored_applications", "Applications with a running MQTT subscription")
 
 
 class TtiMessageLogger(threading.Thread):
@@ -29,17 +45,19 @@ class TtiMessageLogger(threading.Thread):
             mqtt_user,
             mqtt_pass,
             mqtt_sensor_data_sub_topic,
+            transport: Transport = None,
     ):
         super().__init__()
         self.logger = logger
         self.application_id = application_id
+        self.hot_logger = get_hot_path_logger(logger)
         self.rabbit_username = rabbit_username
         self.rabbit_password = rabbit_password
         self.rabbit_host = rabbit_host
         self.queue_name = queue_name
         self.routing_key = routing_key
-        self.credentials = pika.PlainCredentials(
-            username=self.rabbit_username, password=self.rabbit_password
+        self.transport = transport or RabbitMQTransport(
+            rabbit_host, rabbit_username, rabbit_password, logger=logger
         )
         self.mqtt_host = mqtt_host
         self.mqtt_port = mqtt_port
@@ -51,7 +69,7 @@ class TtiMessageLogger(threading.Thread):
         self.mqtt_connect()
 
     def run(self):
-        self.logger.debug(f" start monitoring application_id =: {self.application_id}")
+        self.logger.debug(" start monitoring application_id =: %s", self.application_id)
         try:
             self.mqttclient.loop_forever()
         except Exception as e:
@@ -77,58 +95,53 @@ class TtiMessageLogger(threading.Thread):
             raise
 
     def mqtt_reconnect(self):
-        self.logger.debug(f"mqtt_reconnect")
+        self.logger.debug("mqtt_reconnect")
         self.logger.debug("[MQTT] Reconnecting...")
         time.sleep(3)
         self.mqtt_connect()
 
     def on_connect(self, mqttc, obj, flags, rc):
-        self.logger.debug(f"on_connect")
+        self.logger.debug("on_connect")
         if rc == 0:
             # Subscribe to topics
-            self.logger.debug(f"[MQTT] Subscribing to topic:  {self.mqtt_sensor_data_sub_topic}")
+            self.logger.debug("[MQTT] Subscribing to topic:  %s", self.mqtt_sensor_data_sub_topic)
             self.mqttclient.subscribe(self.mqtt_sensor_data_sub_topic, 0)
         else:
-            self.logger.debug(f"[MQTT] Bad connection: rc . Will auto-reconnect  {rc}")
+            self.logger.debug("[MQTT] Bad connection: rc . Will auto-reconnect  %s", rc)
             self.mqtt_reconnect()
 
     def send_data(self, json_data):
-        self.logger.debug(f"send_data")
+        self.hot_logger.debug("send_data")
         try:
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(host=self.rabbit_host, credentials=self.credentials)
-            )
-            channel = connection.channel()
-            channel.queue_declare(queue=self.queue_name, durable=True)
-            channel.basic_publish(
-                exchange="",
-                routing_key=self.routing_key,
-                body=json.dumps(json_data),
-                properties=pika.BasicProperties(delivery_mode=2),
-            )
-            connection.close()
+            with PUBLISH_SECONDS.time():
+                self.transport.declare_queue(self.queue_name)
+                self.transport.publish(self.routing_key, json.dumps(json_data))
         except Exception as e:
+            MESSAGE_ERRORS.labels("publish").inc()
             self.logger.error(f"Error sending message to RabbitMQ: {e}")
 
+    @timed(ON_MESSAGE_SECONDS)
     def on_message(self, mqttc, obj, msg):
-        self.logger.debug(f"on_message")
+        self.hot_logger.debug("on_message")
         try:
             topic = re.split("/", msg.topic)[-1]
+            MESSAGES_RECEIVED.labels(topic).inc()
             json_msg = json.loads(msg.payload)
             if topic in ["up", "join"]:
                 self.send_data(json_msg)
         except Exception as e:
+            MESSAGE_ERRORS.labels("parse").inc()
             self.logger.error(f"ERROR parsing message {str(e)}")
             self.logger.error(traceback.format_exc())
 
     def on_publish(self, mqttc, obj, mid):
-        self.logger.debug(f"on_publish")
+        self.hot_logger.debug("on_publish")
 
     def on_subscribe(self, mqttc, obj, mid, granted_qos):
-        self.logger.debug(f"on_subscribe")
+        self.logger.debug("on_subscribe")
 
     def on_disconnect(self, mqttc, userdata, rc):
-        self.logger.debug(f"on_disconnect")
+        self.logger.debug("on_disconnect")
         if rc != 0:
             self.logger.debug("[MQTT] Unexpected MQTT disconnection")  # . Will auto-reconnect")
             self.mqtt_reconnect()
@@ -136,7 +149,7 @@ class TtiMessageLogger(threading.Thread):
             self.logger.debug("[MQTT] Disconnecting MQTT")
 
     def stop(self):
-        self.logger.debug(f" stop monitoring application_id =: {self.application_id}")
+        self.logger.debug(" stop monitoring application_id =: %s", self.application_id)
         try:
             self.mqttclient.disconnect()
             self.mqttclient.loop_stop()
@@ -160,6 +173,8 @@ class TtiMessageLoggerService(object):
             mqtt_port,
             mqtt_sensor_data_sub_topic,
             mqtt_user_tail,
+            transport: Transport = None,
+            mqtt_connect_workers: int = 16,
     ):
         self.logger = logger
         self.rabbit_username = rabbit_username
@@ -168,8 +183,8 @@ class TtiMessageLoggerService(object):
         self.queue_control_command_name = queue_control_command_name
         self.rabbit_message_queue_name = rabbit_message_queue_name
         self.rabbit_message_routing_key = rabbit_message_routing_key
-        self.credentials = pika.PlainCredentials(
-            username=self.rabbit_username, password=self.rabbit_password
+        self.transport = transport or RabbitMQTransport(
+            rabbit_host, rabbit_username, rabbit_password, logger=logger
         )
         self.engine = db_engine
         self.mqtt_pass = mqtt_pass
@@ -177,7 +192,11 @@ class TtiMessageLoggerService(object):
         self.mqtt_port = mqtt_port
         self.mqtt_sensor_data_sub_topic = mqtt_sensor_data_sub_topic
         self.mqtt_user_tail = mqtt_user_tail
+        self.mqtt_connect_workers = mqtt_connect_workers
         self.all_monitored_applications = []
+        # The control commands are applied one at a time
+        self.monitor_lock = threading.Lock()
+        MONITORED_APPLICATIONS.set_function(lambda: len(self.all_monitored_applications))
         self.logger.debug("initialize - MetadataLoggerService")
 
     def get_monitored_application(self, application_id):
@@ -193,133 +212,165 @@ class TtiMessageLoggerService(object):
             raise DatabaseError("check_if_application_exists ",
                                 f"Error in check_if_application_exists: {str(e)}")
 
-    def add_application_to_monitored_table(self, application_id):
-        try:
-            with Session(self.engine) as session:
-                session.add(MonitoredApplications(application_id=application_id))
-                session.commit()
-        except Exception as e:
-            self.logger.error(f"Error in add_application_to_monitored_table: {str(e)}")
-            raise DatabaseError("add_application_to_monitored_table ",
-                                f"Error in add_application_to_monitored_table: {str(e)}")
-
-    def delete_application_from_monitored_table(self, application_id):
-        try:
-            with Session(self.engine) as session:
-                monitored_application = session.exec(select(MonitoredApplications).where(
-                    MonitoredApplications.application_id == application_id)).first()
-                session.delete(monitored_application)
-                session.commit()
-        except Exception as e:
-            self.logger.error(f"Error in delete_application_from_monitored_table: {str(e)}")
-            raise DatabaseError("delete_application_from_monitored_table ",
-                                f"Error in delete_application_from_monitored_table: {str(e)}")
-
     def stop_monitor_application(self, application_id: str):
-        try:
-            self.logger.debug("stop_monitor_application")
-            monitored_application = self.get_monitored_application(application_id)
-            if not monitored_application:
-                self.logger.debug(f"No monitored application with id {application_id} found in the database")
-                return
-            self.delete_application_from_monitored_table(application_id)
-
-            for i, application_tti_message_logger in enumerate(self.all_monitored_applications):
-                if application_tti_message_logger.application_id == application_id:
+        self.stop_monitor_applications([application_id])
+
+    def stop_monitor_applications(self, application_ids: List[str]):
+        """
+        Remove the monitored applications in one transaction, then stop their MQTT subscriptions.
+        """
+        self.logger.debug("stop_monitor_applications")
+        with self.monitor_lock:
+            try:
+                with Session(self.engine) as session:
+                    application_id_column = MonitoredApplications.application_id
+                    stopped_ids = set(session.exec(
+                        select(application_id_column).where(application_id_column.in_(application_ids))
+                    ).all())
+                    session.execute(delete(MonitoredApplications).where(application_id_column.in_(stopped_ids)))
+                    session.commit()
+            except Exception as e:
+                self.logger.error(f"Error in stop_monitor_applications: {str(e)}")
+                raise DatabaseError("stop_monitor_applications ", f"Error in stop_monitor_applications: {str(e)}")
+
+            running_applications = []
+            for application_tti_message_logger in self.all_monitored_applications:
+                if application_tti_message_logger.application_id in stopped_ids:
                     application_tti_message_logger.stop()  # Stop the thread
-                    self.all_monitored_applications.pop(i)  # Remove the thread from the list
-                    break
-        except DatabaseError:
-            raise
-        except Exception as e:
-            self.logger.error(f"Error stop_monitor_application: {str(e)}")
-            raise TTIMessageLoggerError(f"Error stop_monitor_application: {str(e)}") from e
+                else:
+                    running_applications.append(application_tti_message_logger)
+            self.all_monitored_applications = running_applications
+
+        missing_ids = [application_id for application_id in application_ids if application_id not in stopped_ids]
+        if missing_ids:
+            self.logger.debug("No monitored application with id %s found in the database", missing_ids)
 
     def start_monitor_application(self, application_id: str):
-        self.logger.debug("start_monitor_application!")
-        try:
-            monitored_application = self.get_monitored_application(application_id)
-            if not monitored_application:
-                self.add_application_to_monitored_table(application_id)
-
-                mqtt_user = f"{application_id}{self.mqtt_user_tail}"
-                application_tti_message_logger = TtiMessageLogger(
-                    self.logger,
-                    application_id,
-                    self.rabbit_username,
-                    self.rabbit_password,
-                    self.rabbit_host,
-                    self.rabbit_message_queue_name,
-                    self.rabbit_message_routing_key,
-                    self.mqtt_host,
-                    self.mqtt_port,
-                    mqtt_user,
-                    self.mqtt_pass,
-                    self.mqtt_sensor_data_sub_topic,
-                )
+        self.start_monitor_applications([application_id])
+
+    def start_monitor_applications(self, application_ids: List[str]):
+        """
+        Subscribe to the applications that are not monitored yet and record the subscribed ones
+        in one transaction.
+        """
+        self.logger.debug("start_monitor_applications!")
+        with self.monitor_lock:
+            try:
+                with Session(self.engine) as session:
+                    application_id_column = MonitoredApplications.application_id
+                    monitored_ids = set(session.exec(
+                        select(application_id_column).where(application_id_column.in_(application_ids))
+                    ).all())
+            except Exception as e:
+                self.logger.error(f"Error in start_monitor_applications: {str(e)}")
+                raise DatabaseError("start_monitor_applications ", f"Error in start_monitor_applications: {str(e)}")
+            if monitored_ids:
+                self.logger.debug("  start_monitor_applications = %s exist!", sorted(monitored_ids))
+
+            tti_message_loggers = self.create_tti_message_loggers(
+                [application_id for application_id in dict.fromkeys(application_ids)
+                 if application_id not in monitored_ids]
+            )
+            try:
+                with Session(self.engine) as session:
+                    session.add_all([
+                        MonitoredApplications(application_id=tti_message_logger.application_id)
+                        for tti_message_logger in tti_message_loggers
+                    ])
+                    session.commit()
+            except Exception as e:
+                for tti_message_logger in tti_message_loggers:
+                    tti_message_logger.stop()
+                self.logger.error(f"Error in start_monitor_applications: {str(e)}")
+                raise DatabaseError("start_monitor_applications ", f"Error in start_monitor_applications: {str(e)}")
+
+            self.start_tti_message_loggers(tti_message_loggers)
+        self.logger.debug("start_monitor_applications %d applications added Done!", len(tti_message_loggers))
+
+    def create_tti_message_logger(self, application_id: str) -> TtiMessageLogger:
+        mqtt_user = f"{application_id}{self.mqtt_user_tail}"
+        return TtiMessageLogger(
+            self.logger,
+            application_id,
+            self.rabbit_username,
+            self.rabbit_password,
+            self.rabbit_host,
+            self.rabbit_message_queue_name,
+            self.rabbit_message_routing_key,
+            self.mqtt_host,
+            self.mqtt_port,
+            mqtt_user,
+            self.mqtt_pass,
+            self.mqtt_sensor_data_sub_topic,
+            self.transport,
+        )
 
-                application_tti_message_logger.start()
-                self.all_monitored_applications.append(application_tti_message_logger)
-                self.logger.debug(f"start_monitor_application = {application_id} added Done!")
-            else:
-                self.logger.debug(f"  start_monitor_application = {application_id} exists!")
-        except DatabaseError:
-            raise
-        except Exception as e:
-            self.logger.error(f"Error start_monitor_application: {str(e)}")
-            raise TTIMessageLoggerError(f"Error start_monitor_application: {str(e)}") from e
+    def create_tti_message_loggers(self, application_ids: List[str]) -> List[TtiMessageLogger]:
+        """
+        Create the message loggers of the applications, connecting to the MQTT broker concurrently.
+        The applications that fail to connect are logged and left out.
+        """
+        if not application_ids:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.mqtt_connect_workers, len(application_ids))) as executor:
+            futures = {
+                application_id: executor.submit(self.create_tti_message_logger, application_id)
+                for application_id in application_ids
+            }
+        tti_message_loggers = []
+        for application_id, future in futures.items():
+            try:
+                tti_message_loggers.append(future.result())
+            except Exception as e:
+                self.logger.error(f"Error start_monitor_application {application_id}: {str(e)}")
+        return tti_message_loggers
+
+    def start_tti_message_loggers(self, tti_message_loggers: List[TtiMessageLogger]):
+        for tti_message_logger in tti_message_loggers:
+            tti_message_logger.start()
+            self.all_monitored_applications.append(tti_message_logger)
 
     def call(self, data):
         try:
             data_json = json.loads(data)
-            application_id = data_json.get("id")
+            # A bulk command carries the list of applications in "ids", a single command its application in "id"
+            application_ids = data_json.get("ids") or ([data_json["id"]] if data_json.get("id") else [])
             command = data_json.get("command")
-            if not application_id or not command:
+            if not application_ids or not command:
                 self.logger.error(f"Invalid data received: {data}")
                 return
 
             if command == "start":
-                self.start_monitor_application(application_id)
+                self.start_monitor_applications(application_ids)
             elif command == "stop":
-                self.stop_monitor_application(application_id)
+                self.stop_monitor_applications(application_ids)
             else:
                 self.logger.error(f"Invalid command received: {command}")
 
         except Exception as e:
             self.logger.error(f"{repr(e)}")
 
-    def callback(self, ch, method, properties, body):
+    def callback(self, message: Message):
         self.logger.debug("start callback ")
-        self.call(json.loads(body.decode("utf-8")))
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        self.call(json.loads(message.body.decode("utf-8")))
+        self.transport.ack(message)
 
     def start_rabbit(self) -> None:
         try:
             self.logger.debug("start callback ")
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(host=self.rabbit_host, credentials=self.credentials)
-            )
-            # Declare the queue
-            channel = connection.channel()
-            channel.queue_declare(queue=self.queue_control_command_name, durable=True)
-            channel.basic_qos(prefetch_count=1)
-
+            self.transport.consume(self.queue_control_command_name, self.callback)
         except Exception as e:
             self.logger.error(f"Failed to connect to RabbitMQ: {e}")
             raise RabbitMQConnectionError("Failed to connect to RabbitMQ.") from e
 
         try:
-            while True:
-                channel.basic_consume(
-                    queue=self.queue_control_command_name, on_message_callback=self.callback
-                )
-                channel.start_consuming()
+            self.transport.start_consuming()
         except Exception as e:
             self.logger.error(f"RabbitMQ channel was closed in start_rabbit function: {repr(e)}")
             raise RabbitMQConsumingError(f"Error starting RabbitMQ consumer in start_rabbit function: {repr(e)}") from e
 
     def get_all_monitor_applications_ids(self):
-        self.logger.debug(f"get_all_monitor_applications_ids")
+        self.logger.debug("get_all_monitor_applications_ids")
         try:
             with Session(self.engine) as session:
                 return session.exec(select(MonitoredApplications)).all()
@@ -329,10 +380,12 @@ class TtiMessageLoggerService(object):
                                 f"Error in get_all_monitor_applications_ids: {str(e)}")
 
     def init_start_monitoring(self):
-        self.logger.debug(f"init_start_monitoring")
+        self.logger.debug("init_start_monitoring")
         try:
             applications_ids = self.get_all_monitor_applications_ids()
-            for application in applications_ids:
-                self.start_monitor_application(application.application_id)
+            with self.monitor_lock:
+                self.start_tti_message_loggers(
+                    self.create_tti_message_loggers([application.application_id for application in applications_ids])
+                )
         except Exception as e:
             self.logger.error(f"Error in init_start_monitoring: {repr(e)}")